@@ -44,6 +44,44 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 # DELVE_ENABLE_EXTRACTIONS_ON_UPDATE: Boolean flag to enable/disable extractions on update. Default: 'True'.
 # DELVE_ENABLE_PROCESSORSS_ON_UPDATE: Boolean flag to enable/disable processors on update. Default: 'True'.
 # DELVE_STRICT_VALIDATION: Boolean flag to enable/disable strict validation. Default: 'False'.
+# DELVE_STREAMING_PIPELINES: Boolean flag to enable/disable passing lazy iterators to streaming search commands. Default: 'True'.
+# DELVE_STREAMING_BATCH_SIZE: Number of rows fetched from the database per round trip when streaming. Default: 2000.
+# DELVE_QUERY_PUSHDOWN: Boolean flag to enable/disable folding filter, sort and head into database queries. Default: 'True'.
+# DELVE_QUERY_PROJECTION: Boolean flag to enable/disable reading only the columns (and keys of extracted_fields) later search commands use. Default: 'True'.
+# DELVE_QUERY_PLAN_CACHE_SIZE: Maximum number of compiled query plans kept in memory per process. Default: 256.
+# DELVE_RESULT_CACHE: Boolean flag to enable/disable sharing query results between processes through the cache. Default: 'False'.
+# DELVE_RESULT_CACHE_TIMEOUT: Number of seconds cached query results are kept. Default: 300.
+# DELVE_RESULT_CACHE_BACKEND: Django cache backend used for cached query results. Default: 'django.core.cache.backends.filebased.FileBasedCache'.
+# DELVE_RESULT_CACHE_LOCATION: Location of the cache used for cached query results. Default: 'cache'.
+# DELVE_QUERY_JOB_PAGE_SIZE: Number of result rows stored per page for asynchronous query jobs. Default: 1000.
+# DELVE_QUERY_JOB_PREVIEW_SIZE: Number of rows of partial results kept for running query jobs. Default: 100.
+# DELVE_QUERY_MAX_SECONDS: Maximum wall time of a query in seconds, 0 for unlimited. Default: 0.
+# DELVE_QUERY_MAX_ROWS: Maximum number of rows output by any stage of a query, 0 for unlimited. Default: 0.
+# DELVE_QUERY_MAX_MEMORY: Maximum memory growth of a query in MiB, 0 for unlimited. Default: 0.
+# DELVE_QUERY_MEMORY_METHOD: How query memory is measured, 'rss' or 'tracemalloc'. Default: 'rss'.
+# DELVE_JOIN_MEMORY_LIMIT: Estimated size in MiB of the hash table of a join above which it is spilled to disk. Default: 256.
+# DELVE_JOIN_SPILL_PARTITIONS: Number of partitions (temporary files) a join spills each side to. Default: 16.
+# DELVE_JOIN_SPILL_DIRECTORY: Directory for the temporary files of joins spilled to disk. Default: The system temporary directory.
+# DELVE_JOIN_KEY_BATCH_SIZE: Number of join keys pushed down to the database per query by join. Default: 500.
+# DELVE_JOIN_MAX_KEY_BATCHES: Maximum number of batches of join keys pushed down before join reads the whole right side instead. Default: 20.
+# DELVE_SORT_MEMORY_LIMIT: Estimated size in MiB of the events sort keeps in memory, beyond which sorted runs are spilled to disk. Default: 256.
+# DELVE_SORT_SPILL_DIRECTORY: Directory for the sorted runs spilled to disk by sort. Default: The system temporary directory.
+# DELVE_DEDUP_BLOOM_CAPACITY: Default number of distinct events the Bloom filter of dedup --bloom is sized for. Default: 10000000.
+# DELVE_DEDUP_BLOOM_ERROR: Default false positive rate of the Bloom filter of dedup --bloom at capacity. Default: 0.001.
+# DELVE_MAX_PROCESSES: Maximum number of worker processes a single search command may start. Default: The number of CPUs.
+# DELVE_REX_PROCESSES: Default number of worker processes rex extracts in when its input is larger than DELVE_REX_CHUNK_SIZE events, 0 for none. Default: 0.
+# DELVE_REX_CHUNK_SIZE: Number of events rex sends to a worker process at a time. Default: 10000.
+# DELVE_READ_FILE_PROCESSES: Default number of worker processes read_file parses CSV and JSON Lines files larger than DELVE_READ_FILE_SPLIT_SIZE in, 0 for none. Default: 0.
+# DELVE_READ_FILE_SPLIT_SIZE: Size in MiB of the parts of a file read_file sends to a worker process at a time. Default: 16.
+# DELVE_STATS_ESTDC_ERROR: Default relative standard error of the estdc (HyperLogLog) aggregate of stats. Default: 0.01.
+# DELVE_STATS_TDIGEST_COMPRESSION: Default compression of the t-digests of the estpNN and estmedian aggregates of stats. Default: 100.
+# DELVE_STATS_TOP_COUNT: Default number of values returned by the top (Count-Min sketch) aggregate of stats. Default: 10.
+# DELVE_STATS_TOP_ERROR: Maximum overcount of the top aggregate of stats, as a fraction of the number of values. Default: 0.01.
+# DELVE_STATS_TOP_CONFIDENCE: Probability that the counts of the top aggregate of stats are within DELVE_STATS_TOP_ERROR. Default: 0.99.
+# DELVE_TABLE_SERVER_SIDE_ROWS: Number of rows above which table keeps its rows on the server and sends them a page at a time, 0 to only do so with --server-side. Default: 10000.
+# DELVE_TABLE_STORE_SIZE: Maximum number of server-side tables kept in memory per process, 0 to disable server-side tables. Default: 16.
+# DELVE_TABLE_STORE_TIMEOUT: Number of seconds a server-side table is kept after it was last read. Default: 1800.
+# DELVE_CHART_MAX_POINTS: Default maximum number of points of each series of chart --aggregate (and of chart --downsample), beyond which series are downsampled, 0 for no maximum. Default: 1000.
 # DELVE_DOCUMENTATION_DIRECTORY: Directory for storing documentation. Default: 'doc'.
 # DELVE_Q_CLUSTER_NAME: Name of the Django Q cluster. Default: 'DjangORM'.
 # DELVE_Q_CLUSTER_CATCH_UP: Boolean flag to enable/disable catch-up for the Q cluster. Default: 'False'.
@@ -191,6 +229,21 @@ DATABASES = {
     }
 }
 
+# Caches
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+#
+# The query_results cache is shared by every process serving Delve,
+# so it must not be process local (ie. LocMemCache).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'query_results': {
+        'BACKEND': os.getenv('DELVE_RESULT_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('DELVE_RESULT_CACHE_LOCATION', str(BASE_DIR / "cache")),
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -333,6 +386,42 @@ DELVE_ENABLE_PROCESSORSS_ON_CREATE = os.getenv('DELVE_ENABLE_PROCESSORSS_ON_CREA
 DELVE_ENABLE_EXTRACTIONS_ON_UPDATE = os.getenv('DELVE_ENABLE_EXTRACTIONS_ON_UPDATE', 'True') == 'True'
 DELVE_ENABLE_PROCESSORSS_ON_UPDATE = os.getenv('DELVE_ENABLE_PROCESSORSS_ON_UPDATE', 'True') == 'True'
 DELVE_STRICT_VALIDATION = os.getenv('DELVE_STRICT_VALIDATION', 'False') == 'True'
+DELVE_STREAMING_PIPELINES = os.getenv('DELVE_STREAMING_PIPELINES', 'True') == 'True'
+DELVE_STREAMING_BATCH_SIZE = int(os.getenv('DELVE_STREAMING_BATCH_SIZE', 2000))
+DELVE_QUERY_PUSHDOWN = os.getenv('DELVE_QUERY_PUSHDOWN', 'True') == 'True'
+DELVE_QUERY_PROJECTION = os.getenv('DELVE_QUERY_PROJECTION', 'True') == 'True'
+DELVE_QUERY_PLAN_CACHE_SIZE = int(os.getenv('DELVE_QUERY_PLAN_CACHE_SIZE', 256))
+DELVE_RESULT_CACHE = os.getenv('DELVE_RESULT_CACHE', 'False') == 'True'
+DELVE_RESULT_CACHE_TIMEOUT = int(os.getenv('DELVE_RESULT_CACHE_TIMEOUT', 300))
+DELVE_QUERY_JOB_PAGE_SIZE = int(os.getenv('DELVE_QUERY_JOB_PAGE_SIZE', 1000))
+DELVE_QUERY_JOB_PREVIEW_SIZE = int(os.getenv('DELVE_QUERY_JOB_PREVIEW_SIZE', 100))
+DELVE_QUERY_MAX_SECONDS = int(os.getenv('DELVE_QUERY_MAX_SECONDS', 0))
+DELVE_QUERY_MAX_ROWS = int(os.getenv('DELVE_QUERY_MAX_ROWS', 0))
+DELVE_QUERY_MAX_MEMORY = int(os.getenv('DELVE_QUERY_MAX_MEMORY', 0))
+DELVE_QUERY_MEMORY_METHOD = os.getenv('DELVE_QUERY_MEMORY_METHOD', 'rss')
+DELVE_JOIN_MEMORY_LIMIT = int(os.getenv('DELVE_JOIN_MEMORY_LIMIT', 256))
+DELVE_JOIN_SPILL_PARTITIONS = int(os.getenv('DELVE_JOIN_SPILL_PARTITIONS', 16))
+DELVE_JOIN_SPILL_DIRECTORY = os.getenv('DELVE_JOIN_SPILL_DIRECTORY', '')
+DELVE_JOIN_KEY_BATCH_SIZE = int(os.getenv('DELVE_JOIN_KEY_BATCH_SIZE', 500))
+DELVE_JOIN_MAX_KEY_BATCHES = int(os.getenv('DELVE_JOIN_MAX_KEY_BATCHES', 20))
+DELVE_SORT_MEMORY_LIMIT = int(os.getenv('DELVE_SORT_MEMORY_LIMIT', 256))
+DELVE_SORT_SPILL_DIRECTORY = os.getenv('DELVE_SORT_SPILL_DIRECTORY', '')
+DELVE_DEDUP_BLOOM_CAPACITY = int(os.getenv('DELVE_DEDUP_BLOOM_CAPACITY', 10000000))
+DELVE_DEDUP_BLOOM_ERROR = float(os.getenv('DELVE_DEDUP_BLOOM_ERROR', 0.001))
+DELVE_MAX_PROCESSES = int(os.getenv('DELVE_MAX_PROCESSES', os.cpu_count() or 1))
+DELVE_REX_PROCESSES = int(os.getenv('DELVE_REX_PROCESSES', 0))
+DELVE_REX_CHUNK_SIZE = int(os.getenv('DELVE_REX_CHUNK_SIZE', 10000))
+DELVE_READ_FILE_PROCESSES = int(os.getenv('DELVE_READ_FILE_PROCESSES', 0))
+DELVE_READ_FILE_SPLIT_SIZE = int(os.getenv('DELVE_READ_FILE_SPLIT_SIZE', 16))
+DELVE_STATS_ESTDC_ERROR = float(os.getenv('DELVE_STATS_ESTDC_ERROR', 0.01))
+DELVE_STATS_TDIGEST_COMPRESSION = int(os.getenv('DELVE_STATS_TDIGEST_COMPRESSION', 100))
+DELVE_STATS_TOP_COUNT = int(os.getenv('DELVE_STATS_TOP_COUNT', 10))
+DELVE_STATS_TOP_ERROR = float(os.getenv('DELVE_STATS_TOP_ERROR', 0.01))
+DELVE_STATS_TOP_CONFIDENCE = float(os.getenv('DELVE_STATS_TOP_CONFIDENCE', 0.99))
+DELVE_TABLE_SERVER_SIDE_ROWS = int(os.getenv('DELVE_TABLE_SERVER_SIDE_ROWS', 10000))
+DELVE_TABLE_STORE_SIZE = int(os.getenv('DELVE_TABLE_STORE_SIZE', 16))
+DELVE_TABLE_STORE_TIMEOUT = int(os.getenv('DELVE_TABLE_STORE_TIMEOUT', 1800))
+DELVE_CHART_MAX_POINTS = int(os.getenv('DELVE_CHART_MAX_POINTS', 1000))
 
 DELVE_DOCUMENTATION_DIRECTORY = BASE_DIR.joinpath(os.getenv('DELVE_DOCUMENTATION_DIRECTORY', 'doc'))
 
@@ -418,6 +507,59 @@ DELVE_SEARCH_COMMANDS = {
     'qs_limit': 'events.search_commands.qs.limit',
 }
 
+# The search commands which are read-only and deterministic. Only queries
+# made up entirely of these search commands have their results cached.
+DELVE_RESULT_CACHE_COMMANDS = [
+    'autocast',
+    'chart',
+    'dedup',
+    'distinct',
+    'drop_fields',
+    'echo',
+    'ensure_list',
+    'eval',
+    'event_split',
+    'explode',
+    'explode_timestamp',
+    'filter',
+    'head',
+    'mark_timestamp',
+    'merge',
+    'rename',
+    'replace',
+    'rex',
+    'search',
+    'select',
+    'sort',
+    'stats',
+    'table',
+    'transpose',
+    'value_list',
+    'qs_aggregate',
+    'qs_alias',
+    'qs_annotate',
+    'qs_count',
+    'qs_dates',
+    'qs_datetimes',
+    'qs_defer',
+    'qs_distinct',
+    'qs_earliest',
+    'qs_exclude',
+    'qs_exists',
+    'qs_filter',
+    'qs_first',
+    'qs_last',
+    'qs_latest',
+    'qs_only',
+    'qs_order_by',
+    'qs_reverse',
+    'qs_select_related',
+    'qs_values',
+    'qs_group_by',
+    'qs_having',
+    'qs_limit',
+]
+
 
 # Django Q cluster settings
 Q_CLUSTER = {
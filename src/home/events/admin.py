@@ -6,6 +6,7 @@ from django.contrib import admin
 
 from .models import (
     Query,
+    QueryJob,
     Event,
     GlobalContext,
     LocalContext,
@@ -106,3 +107,22 @@ class QueryAdmin(admin.ModelAdmin):
         "modified",
         "text",
     )
+
+@admin.register(QueryJob)
+class QueryJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "created",
+        "user",
+        "name",
+        "status",
+        "stages_done",
+        "stages_total",
+        "result_count",
+    )
+    search_fields = (
+        "id",
+        "name",
+        "text",
+        "status",
+    )
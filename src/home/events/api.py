@@ -11,13 +11,17 @@ from django.utils.module_loading import import_string
 from django.utils.text import Truncator
 
 from rest_framework.views import APIView
+from rest_framework import mixins
 from rest_framework import viewsets
+from rest_framework.decorators import action
 from rest_framework import status
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 
 from .serializers import (
     EventSerializer,
     QuerySerializer,
+    QueryJobSerializer,
     GlobalContextSerializer,
     LocalContextSerializer,
     FileUploadSerializer,
@@ -26,14 +30,26 @@ from .serializers import (
 from .models import (
     Event,
     Query,
+    QueryJob,
     GlobalContext,
     LocalContext,
     FileUpload,
 )
 from .util import resolve
+from .profiling import QueryProfile
+from .search_commands.table import encode
+from . import result_cache
+from . import table_store
+from . import jobs
 
 log = logging.getLogger(__name__)
 
+def is_true(value):
+    """
+    Interpret a boolean flag sent either as JSON or as form data.
+    """
+    return str(value).lower() in ("true", "on", "1")
+
 class FileUploadViewSet(viewsets.ModelViewSet):
     """
     A simple ViewSet for uploading files for use as data sources.
@@ -272,20 +288,48 @@ class ResolveQueryView(APIView):
                 query.save()
                 log.debug(f"Save completed")
 
+            if is_true(request.data.get("async")):
+                log.debug(f"Submitting {query=} as a job")
+                try:
+                    job = jobs.submit(request, query, context=local_context)
+                except ValueError as exception:
+                    return Response(
+                        [{"exception": str(exception)}],
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+                return Response(
+                    QueryJobSerializer(job).data,
+                    status=status.HTTP_202_ACCEPTED,
+                )
+
+            if is_true(request.data.get("profile")):
+                log.debug(f"Profiling {query=}")
+                profile = QueryProfile()
+            else:
+                profile = None
+
             try:
-                events = query.resolve(request, context=local_context)
+                events = query.resolve(request, context=local_context, profile=profile)
             except Exception as exception:
                 str_exception = str(exception)
                 if len(str_exception) > 4096:
                     str_exception = Truncator(str_exception).chars(2048)
+                events = [
+                    {
+                        # "__traceback__": traceback.format_exc(),
+                        "exception": str_exception,
+                        # "exception": "HERE",
+                    }
+                ]
+                if profile is None:
+                    return Response(events)
+                profile.stop()
+            if profile is not None:
                 return Response(
-                    [
-                        {
-                            # "__traceback__": traceback.format_exc(),
-                            "exception": str_exception,
-                            # "exception": "HERE",
-                        }
-                    ]
+                    {
+                        "results": resolve(events),
+                        "profile": profile.as_dict(),
+                    }
                 )
             return Response(resolve(events))
         else:
@@ -294,3 +338,151 @@ class ResolveQueryView(APIView):
                 query_serialized.errors,
                 status=status.HTTP_400_BAD_REQUEST,
             )
+
+
+class ResultCacheStatsView(APIView):
+    """
+    Report the hit, miss and invalidation counts of the query result cache.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, format=None):
+        return Response(result_cache.stats())
+
+
+class TablePageView(APIView):
+    """
+    One page of the rows of a server-side table (see events.table_store),
+    sorted and searched as requested by datatables' server-side processing.
+    """
+    def get(self, request, token, format=None):
+        params = request.query_params
+        try:
+            draw = int(params.get("draw", 0))
+        except ValueError:
+            draw = 0
+        table = table_store.tables.get(token, request.user.pk)
+        if table is None:
+            message = "This table is no longer available, run the query again."
+            return Response(
+                {"draw": draw, "detail": message, "error": message},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        try:
+            start = max(int(params.get("start", 0)), 0)
+            length = int(params.get("length", 10))
+            # The columns as displayed, which colReorder may have moved,
+            # by the index of their data in the rows
+            columns = []
+            while f"columns[{len(columns)}][data]" in params:
+                columns.append(int(params[f"columns[{len(columns)}][data]"]))
+            if not columns:
+                columns = list(range(len(table.fields)))
+            if any(not 0 <= column < len(table.fields) for column in columns):
+                raise ValueError(f"Invalid column, the table has {len(table.fields)} columns")
+            order = []
+            while f"order[{len(order)}][column]" in params:
+                position = int(params[f"order[{len(order)}][column]"])
+                descending = params.get(f"order[{len(order)}][dir]") == "desc"
+                order.append((columns[position], descending))
+        except (ValueError, IndexError) as exception:
+            return Response(
+                {"draw": draw, "detail": str(exception), "error": str(exception)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        search = [(None, params.get("search[value]", ""))]
+        search.extend(
+            (column, params.get(f"columns[{position}][search][value]", ""))
+            for position, column in enumerate(columns)
+        )
+        searchable = [
+            column for position, column in enumerate(columns)
+            if params.get(f"columns[{position}][searchable]", "true") != "false"
+        ]
+        count, rows = table.page(start, length, order, search, searchable)
+        return Response(
+            {
+                "draw": draw,
+                "recordsTotal": len(table),
+                "recordsFiltered": count,
+                "data": [[encode(value) for value in row] for row in rows],
+            }
+        )
+
+
+class QueryJobViewSet(mixins.RetrieveModelMixin,
+                      mixins.ListModelMixin,
+                      mixins.DestroyModelMixin,
+                      viewsets.GenericViewSet):
+    """
+    Status, progress, partial results, results and cancellation of
+    queries submitted asynchronously (POST /api/query/ with async=true).
+    """
+    queryset = QueryJob.objects.all().order_by("-created")
+    serializer_class = QueryJobSerializer
+
+    def get_queryset(self):
+        return self.queryset.filter(user=self.request.user)
+
+    @action(detail=True, methods=["get"])
+    def partial(self, request, pk=None):
+        """
+        The first rows output by the most recently completed stage.
+        """
+        job = self.get_object()
+        return Response(
+            {
+                "status": job.status,
+                "stages_done": job.stages_done,
+                "stages_total": job.stages_total,
+                "rows": job.rows,
+                "results": job.partial_results,
+            }
+        )
+
+    @action(detail=True, methods=["get"])
+    def results(self, request, pk=None):
+        """
+        One page (?page=, starting from 1) of the results of a finished job.
+        """
+        job = self.get_object()
+        if job.status != QueryJob.FINISHED:
+            return Response(
+                {"detail": f"Query job is {job.status}."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        try:
+            number = int(request.query_params.get("page", 1))
+        except ValueError:
+            return Response(
+                {"detail": "page must be an integer."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        rows = [] if number == 1 and not job.result_count else jobs.get_page(job, number)
+        if rows is None:
+            return Response(
+                {"detail": "No such page."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response(
+            {
+                "page": number,
+                "pages": job.pages,
+                "count": job.result_count,
+                "results": rows,
+            }
+        )
+
+    @action(detail=True, methods=["post"])
+    def cancel(self, request, pk=None):
+        """
+        Cancel a queued or running job. Running jobs stop before their next stage.
+        """
+        job = self.get_object()
+        if not jobs.cancel(job):
+            return Response(
+                {"detail": f"Query job is already {job.status}."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        job.refresh_from_db()
+        return Response(QueryJobSerializer(job).data)
@@ -0,0 +1,73 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+import math
+import hashlib
+from typing import Any, Iterator
+
+from .util import canonical
+
+
+def digest(value: Any) -> bytes:
+    """
+    Return a 16 byte digest of value (ie. a whole event or a tuple of the
+    values of some fields), equal for values which are equal in Python
+    (see events.util.canonical) like the keys dedup keeps in a set.
+    """
+    return hashlib.blake2b(canonical(value), digest_size=16).digest()
+
+
+class BloomFilter:
+    """
+    A fixed size set of digests which may answer that a digest it has
+    never seen is present (a false positive), but never the opposite.
+
+    The number of bits and hash functions are chosen so that, once
+    capacity digests have been added, the false positive rate is error.
+    The filter uses about 1.44 * capacity * log2(1 / error) bits whatever
+    the number of digests added, but beyond capacity the false positive
+    rate grows.
+
+    Args:
+        capacity (int): The number of digests the filter is sized for.
+        error (float): The false positive rate at capacity, between 0 and 1.
+    """
+    __slots__ = ("size", "hashes", "bits")
+
+    def __init__(self, capacity: int, error: float) -> None:
+        if capacity < 1:
+            raise ValueError(f"Invalid capacity {capacity}, must be at least 1")
+        if not 0 < error < 1:
+            raise ValueError(f"Invalid error {error}, must be between 0 and 1")
+        self.size = max(8, math.ceil(-capacity * math.log(error) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _indices(self, value: bytes) -> Iterator[int]:
+        # Double hashing, see Kirsch and Mitzenmacher
+        first = int.from_bytes(value[:8], "little")
+        second = int.from_bytes(value[8:16], "little") | 1
+        size = self.size
+        return ((first + number * second) % size for number in range(self.hashes))
+
+    def __contains__(self, value: bytes) -> bool:
+        bits = self.bits
+        return all(bits[index >> 3] & (1 << (index & 7)) for index in self._indices(value))
+
+    def add(self, value: bytes) -> bool:
+        """
+        Add a digest (see digest()), returning whether it was (probably)
+        already present.
+        """
+        bits = self.bits
+        present = True
+        for index in self._indices(value):
+            byte, mask = index >> 3, 1 << (index & 7)
+            if not bits[byte] & mask:
+                bits[byte] |= mask
+                present = False
+        return present
+
+    def nbytes(self) -> int:
+        return len(self.bits)
@@ -0,0 +1,107 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+import io
+import sys
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, NamedTuple, Optional, TextIO
+
+log = logging.getLogger(__name__)
+
+
+class Capture(NamedTuple):
+    """
+    The output written to stdout and stderr while capturing.
+    """
+    stdout: io.StringIO
+    stderr: io.StringIO
+
+
+# The capture of the query being resolved in the current thread (or task).
+current_capture: ContextVar[Optional[Capture]] = ContextVar("current_capture", default=None)
+
+_install_lock = threading.Lock()
+
+
+class ContextStream(io.TextIOBase):
+    """
+    Stands in for sys.stdout or sys.stderr. Writes go to the buffer of the
+    current capture if there is one and to the original stream otherwise,
+    so every thread (or task) sees only its own output.
+
+    Args:
+        name (str): Which stream this replaces, "stdout" or "stderr".
+        stream (TextIO): The original stream.
+    """
+    def __init__(self, name: str, stream: TextIO) -> None:
+        self.name = name
+        self.stream = stream
+
+    def target(self) -> TextIO:
+        capture = current_capture.get()
+        if capture is None:
+            return self.stream
+        return getattr(capture, self.name)
+
+    def write(self, s: str) -> int:
+        return self.target().write(s)
+
+    def writelines(self, lines) -> None:
+        self.target().writelines(lines)
+
+    def flush(self) -> None:
+        self.target().flush()
+
+    def writable(self) -> bool:
+        return True
+
+    def isatty(self) -> bool:
+        return self.target().isatty()
+
+    def fileno(self) -> int:
+        return self.stream.fileno()
+
+    @property
+    def encoding(self):
+        return getattr(self.stream, "encoding", "utf-8")
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def install() -> None:
+    """
+    Replace sys.stdout and sys.stderr with ContextStreams. This only
+    swaps the process-global streams if they are not ContextStreams
+    already (ie. the first time or after something else replaced them).
+    """
+    with _install_lock:
+        for name in ("stdout", "stderr"):
+            stream = getattr(sys, name)
+            if not isinstance(stream, ContextStream):
+                log.debug(f"Installing ContextStream for sys.{name}")
+                setattr(sys, name, ContextStream(name, stream))
+
+
+@contextmanager
+def capture() -> Iterator[Capture]:
+    """
+    Capture everything written to sys.stdout and sys.stderr by the
+    current thread (or task) for the duration of the with block.
+
+    Unlike swapping sys.stdout and sys.stderr, this is safe when several
+    queries are resolved at the same time, each one only captures its own
+    output. Captures can be nested, the innermost one receives the output.
+    """
+    if not isinstance(sys.stdout, ContextStream) or not isinstance(sys.stderr, ContextStream):
+        install()
+    captured = Capture(io.StringIO(), io.StringIO())
+    token = current_capture.set(captured)
+    try:
+        yield captured
+    finally:
+        current_capture.reset(token)
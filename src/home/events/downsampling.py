@@ -0,0 +1,89 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+"""
+Downsampling of series of (x, y) points to a number of points a chart
+can draw, keeping their visual shape.
+
+Both functions take the x and y values of a series sorted by x, as
+numbers, and return the indices of the points to keep, in order. Series
+of no more than threshold points are kept whole.
+"""
+import math
+from typing import List, Sequence
+
+
+def lttb(xs: Sequence[float], ys: Sequence[float], threshold: int) -> List[int]:
+    """
+    Largest-Triangle-Three-Buckets (Steinarsson, 2013): the first and last
+    points are kept and the others are split into threshold - 2 buckets of
+    (about) the same number of points. From each bucket, the point kept is
+    the one forming the largest triangle with the point kept from the
+    previous bucket and the average of the next bucket.
+    """
+    length = len(xs)
+    if threshold >= length:
+        return list(range(length))
+    if threshold < 3:
+        return [0, length - 1][:max(threshold, 1)]
+    ret = [0]
+    every = (length - 2) / (threshold - 2)
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        # The average of the next bucket, the last point for the last bucket
+        next_start = end
+        next_end = min(int((bucket + 2) * every) + 1, length)
+        if next_start >= next_end:
+            average_x, average_y = xs[length - 1], ys[length - 1]
+        else:
+            count = next_end - next_start
+            average_x = math.fsum(xs[next_start:next_end]) / count
+            average_y = math.fsum(ys[next_start:next_end]) / count
+        previous_x, previous_y = xs[previous], ys[previous]
+        largest = -1.0
+        selected = start
+        for index in range(start, end):
+            # Twice the area of the triangle, the factor does not matter
+            area = abs(
+                (previous_x - average_x) * (ys[index] - previous_y)
+                - (previous_x - xs[index]) * (average_y - previous_y)
+            )
+            if area > largest:
+                largest = area
+                selected = index
+        ret.append(selected)
+        previous = selected
+    ret.append(length - 1)
+    return ret
+
+
+def min_max(xs: Sequence[float], ys: Sequence[float], threshold: int) -> List[int]:
+    """
+    Split the points into threshold // 2 buckets of (about) the same number
+    of points and keep the points with the smallest and largest y of each
+    bucket, in order, so every peak and trough of the series is drawn.
+    """
+    length = len(xs)
+    if threshold >= length:
+        return list(range(length))
+    buckets = max(threshold // 2, 1)
+    every = length / buckets
+    ret = []
+    for bucket in range(buckets):
+        start = int(bucket * every)
+        end = int((bucket + 1) * every)
+        if start >= end:
+            continue
+        lowest = min(range(start, end), key=ys.__getitem__)
+        highest = max(range(start, end), key=ys.__getitem__)
+        ret.extend(sorted({lowest, highest}))
+    return ret
+
+
+DOWNSAMPLERS = {
+    "lttb": lttb,
+    "minmax": min_max,
+}
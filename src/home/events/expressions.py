@@ -0,0 +1,855 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+"""
+A small expression language for computing values from the fields of
+events, as used by the eval search command, ie.
+
+    round($bytes / 1024, 1)
+    coalesce($user, $client_ip, "unknown")
+    case($status >= 500, "error", $status >= 400, "warning", "ok")
+    lower($host) if contains($host, ".") else $host + ".local"
+
+Expressions use Python syntax, with fields referenced as $name (or
+$path__into__nested__fields) and a fixed set of functions (see
+FUNCTIONS). Attributes, keywords, lambdas, comprehensions and any other
+name are rejected. Expressions are parsed once with ast, type checked
+where the types are known ahead of time (ie. "a" - 1 or join(1) are
+errors) and compiled into a code object. Operations which fail at run
+time (ie. adding a string to a number, dividing by zero or anything
+involving a missing field) give None rather than an error.
+"""
+import ast
+import re
+import math
+import operator
+import datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from events.util import field_value
+
+NAME = re.compile(r"[A-Za-z_]\w*")
+
+NUMBER = "number"
+STRING = "string"
+BOOLEAN = "boolean"
+NULL = "null"
+LIST = "list"
+DICT = "dict"
+DATETIME = "datetime"
+ANY = "any"
+
+# The longest string or list an operation may build, and the most bits
+# of an integer raised to a power, so that an expression cannot exhaust
+# memory or time
+MAX_LENGTH = 1_000_000
+MAX_POWER_BITS = 1_000_000
+# A conversion specifier of printf-style (%) string formatting
+FORMAT_SPECIFIER = re.compile(r"%(?:\([^)]*\))?[#0\- +]*(\*|\d+)?(?:\.(\*|\d+))?[hlL]?(.?)", re.DOTALL)
+
+
+def _text(value: Any) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).decode("utf-8", errors="replace")
+    return str(value)
+
+
+def _number(value: Any) -> Any:
+    if value is None or isinstance(value, (int, float)):
+        return value
+    try:
+        text = str(value).strip()
+        return int(text) if re.fullmatch(r"[-+]?\d+", text) else float(text)
+    except ValueError:
+        return None
+
+
+def _binary(function: Callable[[Any, Any], Any]) -> Callable[[Any, Any], Any]:
+    def wrapper(left: Any, right: Any) -> Any:
+        if left is None or right is None:
+            return None
+        try:
+            return function(left, right)
+        except (TypeError, ValueError, ArithmeticError):
+            return None
+    return wrapper
+
+
+def _too_long(left: Any, right: Any) -> bool:
+    for sequence, count in ((left, right), (right, left)):
+        if isinstance(sequence, (str, list)) and isinstance(count, int) and len(sequence) * count > MAX_LENGTH:
+            return True
+    return False
+
+
+def _multiply(left: Any, right: Any) -> Any:
+    if _too_long(left, right):
+        raise ValueError("Result too long")
+    return left * right
+
+
+def _power(left: Any, right: Any) -> Any:
+    # The result of an integer power has about this many bits, past which
+    # it is computed as a float (which overflows to None instead)
+    if isinstance(left, int) and isinstance(right, int) and max(abs(left).bit_length(), 1) * abs(right) > MAX_POWER_BITS:
+        return float(left) ** right
+    return left ** right
+
+
+def _format_length(template: str, values: Any) -> int:
+    """
+    Return an upper bound of the length of template % values: the
+    template, plus the width and precision of every conversion and the
+    longest value for each of them (a mapping may be used more than once).
+    """
+    if isinstance(values, dict):
+        arguments = list(values.values())
+    elif isinstance(values, tuple):
+        arguments = list(values)
+    else:
+        arguments = [values]
+    longest = max((len(str(argument)) for argument in arguments), default=0)
+    ret = len(template)
+    for width, precision, conversion in FORMAT_SPECIFIER.findall(template):
+        if conversion == "%":
+            continue
+        if "*" in (width, precision):
+            # The width is taken from the values
+            return MAX_LENGTH + 1
+        ret += int(width or 0) + int(precision or 0) + longest
+    return ret
+
+
+def _modulo(left: Any, right: Any) -> Any:
+    if isinstance(left, str) and _format_length(left, right) > MAX_LENGTH:
+        raise ValueError("Result too long")
+    return left % right
+
+
+def _ordering(function: Callable[[Any, Any], bool]) -> Callable[[Any, Any], Optional[bool]]:
+    def wrapper(left: Any, right: Any) -> Optional[bool]:
+        if left is None or right is None:
+            return None
+        try:
+            return function(left, right)
+        except TypeError:
+            return None
+    return wrapper
+
+
+def _contains(container: Any, item: Any) -> Optional[bool]:
+    if container is None:
+        return None
+    try:
+        return item in container
+    except TypeError:
+        return None
+
+
+def _getitem(value: Any, key: Any) -> Any:
+    try:
+        return value[key]
+    except (TypeError, KeyError, IndexError, ValueError):
+        return None
+
+
+def _negate(value: Any) -> Any:
+    try:
+        return -value
+    except TypeError:
+        return None
+
+
+def _positive(value: Any) -> Any:
+    try:
+        return +value
+    except TypeError:
+        return None
+
+
+def _strings(function: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Wrap a function of a string and optional other arguments: None gives
+    None and other values are converted to strings first.
+    """
+    def wrapper(value: Any, *args: Any) -> Any:
+        if value is None or any(arg is None for arg in args):
+            return None
+        try:
+            return function(_text(value), *args)
+        except (TypeError, ValueError, IndexError, re.error):
+            return None
+    return wrapper
+
+
+def _guarded(function: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Wrap a function so that the values it cannot convert, ie. an integer
+    too long for str(), give None.
+    """
+    def wrapper(*args: Any) -> Any:
+        try:
+            return function(*args)
+        except (TypeError, ValueError):
+            return None
+    return wrapper
+
+
+def _numbers(function: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Wrap a function of a number: None (or a value which is not a number)
+    gives None and strings holding numbers are converted first.
+    """
+    def wrapper(value: Any, *args: Any) -> Any:
+        value = _number(value)
+        if value is None or any(arg is None for arg in args):
+            return None
+        try:
+            return function(value, *args)
+        except (TypeError, ValueError, ArithmeticError):
+            return None
+    return wrapper
+
+
+def _path(row: Dict[str, Any], field: str) -> Any:
+    try:
+        return field_value(row, field)
+    except (KeyError, TypeError):
+        return None
+
+
+def _length(value: Any) -> Optional[int]:
+    if value is None:
+        return None
+    if isinstance(value, (str, list, tuple, dict)):
+        return len(value)
+    return len(_text(value))
+
+
+def _substr(value: str, start: int, length: Optional[int] = None) -> str:
+    return value[start:] if length is None else value[start:start + max(0, length)]
+
+
+def _replace(value: str, old: str, new: str) -> str:
+    if old and value.count(old) * len(new) > MAX_LENGTH:
+        raise ValueError("Result too long")
+    return value.replace(old, new)
+
+
+def _extract(value: str, pattern: str, group: Any = 1) -> Optional[str]:
+    match = re.search(pattern, value)
+    return match[group] if match else None
+
+
+def _join(values: Any, separator: Any = ",") -> Optional[str]:
+    if values is None:
+        return None
+    if not isinstance(values, (list, tuple)):
+        values = [values]
+    return str(separator).join(_text(value) for value in values if value is not None)
+
+
+def _concat(*values: Any) -> str:
+    return "".join(_text(value) for value in values if value is not None)
+
+
+def _dict(keys: List[Any], values: List[Any]) -> Optional[Dict[Any, Any]]:
+    try:
+        return dict(zip(keys, values))
+    except TypeError:
+        return None
+
+
+def _round(value: Any, digits: int = 0) -> Any:
+    return round(value, digits) if digits else round(value)
+
+
+def _coalesce(*values: Any) -> Any:
+    for value in values:
+        if value is not None:
+            return value
+    return None
+
+
+def _least(*values: Any) -> Any:
+    values = [value for value in values if value is not None]
+    try:
+        return min(values) if values else None
+    except TypeError:
+        return None
+
+
+def _greatest(*values: Any) -> Any:
+    values = [value for value in values if value is not None]
+    try:
+        return max(values) if values else None
+    except TypeError:
+        return None
+
+
+def _nullif(value: Any, other: Any) -> Any:
+    return None if value == other else value
+
+
+def _tostring(value: Any) -> Optional[str]:
+    return _text(value)
+
+
+def _tobool(value: Any) -> Optional[bool]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        lowered = value.strip().lower()
+        if lowered in ("true", "yes", "on", "1"):
+            return True
+        if lowered in ("false", "no", "off", "0", ""):
+            return False
+        return None
+    return bool(value)
+
+
+def _typeof(value: Any) -> str:
+    if value is None:
+        return NULL
+    if isinstance(value, bool):
+        return BOOLEAN
+    if isinstance(value, (int, float)):
+        return NUMBER
+    if isinstance(value, str):
+        return STRING
+    if isinstance(value, (list, tuple)):
+        return LIST
+    if isinstance(value, dict):
+        return DICT
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return DATETIME
+    return type(value).__name__
+
+
+def _time(value: Any) -> Optional[datetime.datetime]:
+    """
+    Return value as a datetime: datetimes as they are, dates at midnight,
+    numbers as seconds since the epoch (in UTC) and strings parsed with
+    dateutil, otherwise None.
+    """
+    if value is None or isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime(value.year, value.month, value.day)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            return datetime.datetime.fromtimestamp(value, datetime.timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            return None
+    if isinstance(value, str):
+        from dateutil.parser import parse
+        try:
+            return parse(value)
+        except (ValueError, OverflowError):
+            return None
+    return None
+
+
+def _epoch(value: Any) -> Optional[float]:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    value = _time(value)
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.timestamp()
+
+
+def _strftime(value: Any, format: Any) -> Optional[str]:
+    value = _time(value)
+    if value is None or format is None:
+        return None
+    try:
+        return value.strftime(str(format))
+    except ValueError:
+        return None
+
+
+def _strptime(value: Any, format: Any) -> Optional[datetime.datetime]:
+    if value is None or format is None:
+        return None
+    try:
+        return datetime.datetime.strptime(_text(value), str(format))
+    except ValueError:
+        return None
+
+
+class Function(NamedTuple):
+    """
+    A function of the expression language.
+
+    Args:
+        helper (str): The name of its implementation in NAMESPACE.
+        minimum (int): The least number of arguments.
+        maximum (Optional[int]): The most arguments, None for any number.
+        parameters (Tuple[Optional[frozenset], ...]): The types accepted by
+            each argument (the last one for any further arguments), None for any.
+        returns (str): The type of the result.
+        deterministic (bool): Whether the result depends on the arguments
+            alone, rather than ie. the time of the search.
+    """
+    helper: str
+    minimum: int
+    maximum: Optional[int]
+    parameters: Tuple[Optional[frozenset], ...]
+    returns: str
+    deterministic: bool = True
+
+
+TEXT = frozenset({STRING, NUMBER, BOOLEAN, DATETIME})
+NUMERIC = frozenset({NUMBER, BOOLEAN, STRING})
+INTEGER = frozenset({NUMBER})
+TIME = frozenset({DATETIME, NUMBER, STRING})
+
+FUNCTIONS: Dict[str, Function] = {
+    # Strings, any value other than None is converted with str()
+    "lower": Function("_lower", 1, 1, (TEXT,), STRING),
+    "upper": Function("_upper", 1, 1, (TEXT,), STRING),
+    "trim": Function("_trim", 1, 2, (TEXT, frozenset({STRING})), STRING),
+    "ltrim": Function("_ltrim", 1, 2, (TEXT, frozenset({STRING})), STRING),
+    "rtrim": Function("_rtrim", 1, 2, (TEXT, frozenset({STRING})), STRING),
+    "substr": Function("_substr", 2, 3, (TEXT, INTEGER, INTEGER), STRING),
+    "replace": Function("_replace", 3, 3, (TEXT, frozenset({STRING}), frozenset({STRING})), STRING),
+    "split": Function("_split", 1, 2, (TEXT, frozenset({STRING})), LIST),
+    "join": Function("_join", 1, 2, (frozenset({LIST}), frozenset({STRING})), STRING),
+    "concat": Function("_concat", 1, None, (None,), STRING),
+    "startswith": Function("_startswith", 2, 2, (TEXT, frozenset({STRING})), BOOLEAN),
+    "endswith": Function("_endswith", 2, 2, (TEXT, frozenset({STRING})), BOOLEAN),
+    "contains": Function("_contains_text", 2, 2, (TEXT, frozenset({STRING})), BOOLEAN),
+    "match": Function("_match", 2, 2, (TEXT, frozenset({STRING})), BOOLEAN),
+    "extract": Function("_extract", 2, 3, (TEXT, frozenset({STRING}), frozenset({NUMBER, STRING})), STRING),
+    "len": Function("_len", 1, 1, (frozenset({STRING, LIST, DICT}),), NUMBER),
+    # Numbers, strings holding numbers are converted first
+    "abs": Function("_abs", 1, 1, (NUMERIC,), NUMBER),
+    "round": Function("_round", 1, 2, (NUMERIC, INTEGER), NUMBER),
+    "floor": Function("_floor", 1, 1, (NUMERIC,), NUMBER),
+    "ceil": Function("_ceil", 1, 1, (NUMERIC,), NUMBER),
+    "sqrt": Function("_sqrt", 1, 1, (NUMERIC,), NUMBER),
+    "log": Function("_log", 1, 2, (NUMERIC, INTEGER), NUMBER),
+    "least": Function("_least", 1, None, (None,), ANY),
+    "greatest": Function("_greatest", 1, None, (None,), ANY),
+    # Types
+    "tonumber": Function("_number", 1, 1, (None,), NUMBER),
+    "tostring": Function("_tostring", 1, 1, (None,), STRING),
+    "tobool": Function("_tobool", 1, 1, (None,), BOOLEAN),
+    "typeof": Function("_typeof", 1, 1, (None,), STRING),
+    # Nulls and conditionals (case is compiled to nested conditional expressions)
+    "coalesce": Function("_coalesce", 1, None, (None,), ANY),
+    "nullif": Function("_nullif", 2, 2, (None, None), ANY),
+    "isnull": Function("_isnull", 1, 1, (None,), BOOLEAN),
+    "isnotnull": Function("_isnotnull", 1, 1, (None,), BOOLEAN),
+    "case": Function("", 2, None, (None,), ANY),
+    # Time, see _time for the values accepted as times
+    "now": Function("_now", 0, 0, (), DATETIME, deterministic=False),
+    "parse_time": Function("_time", 1, 1, (TIME,), DATETIME),
+    "strptime": Function("_strptime", 2, 2, (frozenset({STRING}), frozenset({STRING})), DATETIME),
+    "strftime": Function("_strftime", 2, 2, (TIME, frozenset({STRING})), STRING),
+    "epoch": Function("_epoch", 1, 1, (TIME,), NUMBER),
+    "from_epoch": Function("_time", 1, 1, (NUMERIC,), DATETIME),
+}
+
+NAMESPACE: Dict[str, Any] = {
+    "__builtins__": {},
+    "_add": _binary(operator.add),
+    "_sub": _binary(operator.sub),
+    "_mul": _binary(_multiply),
+    "_div": _binary(operator.truediv),
+    "_floordiv": _binary(operator.floordiv),
+    "_mod": _binary(_modulo),
+    "_pow": _binary(_power),
+    "_lt": _ordering(operator.lt),
+    "_le": _ordering(operator.le),
+    "_gt": _ordering(operator.gt),
+    "_ge": _ordering(operator.ge),
+    "_in": lambda item, container: _contains(container, item),
+    "_not_in": lambda item, container: None if _contains(container, item) is None else not _contains(container, item),
+    "_getitem": _getitem,
+    "_slice": slice,
+    "_neg": _negate,
+    "_pos": _positive,
+    "_path": _path,
+    "_dict": _dict,
+    "_lower": _strings(str.lower),
+    "_upper": _strings(str.upper),
+    "_trim": _strings(str.strip),
+    "_ltrim": _strings(str.lstrip),
+    "_rtrim": _strings(str.rstrip),
+    "_substr": _strings(_substr),
+    "_replace": _strings(_replace),
+    "_split": _strings(lambda value, separator=None: value.split(separator or None)),
+    "_join": _guarded(_join),
+    "_concat": _guarded(_concat),
+    "_startswith": _strings(str.startswith),
+    "_endswith": _strings(str.endswith),
+    "_contains_text": _strings(lambda value, part: part in value),
+    "_match": _strings(lambda value, pattern: re.search(pattern, value) is not None),
+    "_extract": _strings(_extract),
+    "_len": _guarded(_length),
+    "_abs": _numbers(abs),
+    "_round": _numbers(_round),
+    "_floor": _numbers(math.floor),
+    "_ceil": _numbers(math.ceil),
+    "_sqrt": _numbers(math.sqrt),
+    "_log": _numbers(lambda value, base=math.e: math.log(value, base)),
+    "_least": _least,
+    "_greatest": _greatest,
+    "_number": _number,
+    "_tostring": _guarded(_tostring),
+    "_tobool": _tobool,
+    "_typeof": _typeof,
+    "_coalesce": _coalesce,
+    "_nullif": _nullif,
+    "_isnull": lambda value: value is None,
+    "_isnotnull": lambda value: value is not None,
+    "_time": _time,
+    "_strptime": _strptime,
+    "_strftime": _strftime,
+    "_epoch": _epoch,
+}
+
+
+def substitute_fields(text: str) -> Tuple[str, List[str]]:
+    """
+    Replace the field references ($name) of an expression, outside of
+    string literals, with the names of positional parameters (_0, _1...).
+
+    Returns:
+        Tuple[str, List[str]]: The Python source and the fields referenced,
+            in the order of their parameters.
+
+    Raises:
+        ValueError: If a $ is not followed by a field name or a name
+            starts with an underscore.
+    """
+    fields: List[str] = []
+    source: List[str] = []
+    quote = None
+    index = 0
+    length = len(text)
+    while index < length:
+        character = text[index]
+        if quote is not None:
+            if character == "\\":
+                source.append(text[index:index + 2])
+                index += 2
+                continue
+            if text.startswith(quote, index):
+                source.append(quote)
+                index += len(quote)
+                quote = None
+                continue
+            source.append(character)
+        elif character in "'\"":
+            quote = text[index:index + 3] if text[index:index + 3] in ('"""', "'''") else character
+            source.append(quote)
+            index += len(quote)
+            continue
+        elif character == "$":
+            match = NAME.match(text, index + 1)
+            if match is None:
+                raise ValueError(f"Expected a field name after $ at position {index} of {text!r}")
+            if match[0] not in fields:
+                fields.append(match[0])
+            source.append(f" _{fields.index(match[0])} ")
+            index = match.end()
+            continue
+        elif character == "_" and (index == 0 or not (text[index - 1].isalnum() or text[index - 1] == "_")):
+            raise ValueError(f"Invalid name at position {index} of {text!r}, names may not start with _")
+        else:
+            source.append(character)
+        index += 1
+    return "".join(source), fields
+
+
+def _name(name: str) -> ast.Name:
+    return ast.Name(id=name, ctx=ast.Load())
+
+
+def _call(name: str, *args: ast.expr) -> ast.Call:
+    return ast.Call(func=_name(name), args=list(args), keywords=[])
+
+
+def _constant_type(value: Any) -> str:
+    if value is None:
+        return NULL
+    if isinstance(value, bool):
+        return BOOLEAN
+    if isinstance(value, (int, float)):
+        return NUMBER
+    if isinstance(value, str):
+        return STRING
+    raise ValueError(f"Unsupported constant {value!r}")
+
+
+BINARY_OPERATORS = {
+    ast.Add: ("+", "_add"),
+    ast.Sub: ("-", "_sub"),
+    ast.Mult: ("*", "_mul"),
+    ast.Div: ("/", "_div"),
+    ast.FloorDiv: ("//", "_floordiv"),
+    ast.Mod: ("%", "_mod"),
+    ast.Pow: ("**", "_pow"),
+}
+ORDERINGS = {ast.Lt: "_lt", ast.LtE: "_le", ast.Gt: "_gt", ast.GtE: "_ge"}
+KNOWN = frozenset({NUMBER, STRING, BOOLEAN, LIST, DICT, DATETIME})
+
+
+def _binary_type(symbol: str, left: str, right: str) -> str:
+    """
+    Return the type of left symbol right, or raise ValueError if both
+    types are known and the operation can never succeed.
+    """
+    numbers = {NUMBER, BOOLEAN}
+    if left in numbers and right in numbers:
+        return NUMBER
+    if left not in KNOWN or right not in KNOWN:
+        return ANY
+    if symbol == "+" and left == right and left in (STRING, LIST):
+        return left
+    if symbol == "*" and {left, right} in ({STRING, NUMBER}, {LIST, NUMBER}):
+        return STRING if STRING in (left, right) else LIST
+    if symbol == "%" and left == STRING:
+        return STRING
+    if DATETIME in (left, right) and symbol in ("+", "-"):
+        return ANY
+    raise ValueError(f"Unsupported operand types for {symbol}: {left} and {right}")
+
+
+class _Compiler:
+    """
+    Translates the ast of an expression (after substitute_fields) into an
+    ast which only calls the functions of NAMESPACE, checking it along
+    the way.
+
+    Args:
+        fields (Sequence[str]): The fields referenced, by parameter.
+        field (Callable[[int], ast.expr]): Builds the expression reading a field.
+    """
+    def __init__(self, fields: Sequence[str], field: Callable[[int], ast.expr]) -> None:
+        self.fields = fields
+        self.field = field
+        self.deterministic = True
+
+    def unparse(self, node: ast.AST) -> str:
+        """
+        Return the source of node, with fields referenced as $name again.
+        """
+        return re.sub(r"\b_(\d+)\b", lambda match: "$" + self.fields[int(match[1])], ast.unparse(node))
+
+    def compile(self, node: ast.AST) -> Tuple[ast.expr, str]:
+        method = getattr(self, f"visit_{type(node).__name__}", None)
+        if method is None:
+            raise ValueError(f"Unsupported syntax in expression: {self.unparse(node)!r}")
+        return method(node)
+
+    def visit_Constant(self, node: ast.Constant) -> Tuple[ast.expr, str]:
+        return ast.Constant(node.value), _constant_type(node.value)
+
+    def visit_Name(self, node: ast.Name) -> Tuple[ast.expr, str]:
+        if re.fullmatch(r"_\d+", node.id):
+            return self.field(int(node.id[1:])), ANY
+        if node.id in FUNCTIONS:
+            raise ValueError(f"Function {node.id} must be called, ie. {node.id}(...)")
+        raise ValueError(f"Unknown name {node.id!r}, fields are referenced as ${node.id}")
+
+    def visit_List(self, node: ast.List) -> Tuple[ast.expr, str]:
+        return ast.List([self.compile(element)[0] for element in node.elts], ast.Load()), LIST
+
+    visit_Tuple = visit_List
+
+    def visit_Dict(self, node: ast.Dict) -> Tuple[ast.expr, str]:
+        if any(key is None for key in node.keys):
+            raise ValueError("Unpacking is not supported in expressions")
+        # Built by _dict, as a key may turn out to be unhashable (ie. a list)
+        return _call(
+            "_dict",
+            ast.List([self.compile(key)[0] for key in node.keys], ast.Load()),
+            ast.List([self.compile(value)[0] for value in node.values], ast.Load()),
+        ), DICT
+
+    def visit_BinOp(self, node: ast.BinOp) -> Tuple[ast.expr, str]:
+        if type(node.op) not in BINARY_OPERATORS:
+            raise ValueError(f"Unsupported operator in expression: {self.unparse(node)!r}")
+        symbol, helper = BINARY_OPERATORS[type(node.op)]
+        left, left_type = self.compile(node.left)
+        right, right_type = self.compile(node.right)
+        return _call(helper, left, right), _binary_type(symbol, left_type, right_type)
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> Tuple[ast.expr, str]:
+        operand, operand_type = self.compile(node.operand)
+        if isinstance(node.op, ast.Not):
+            return ast.UnaryOp(ast.Not(), operand), BOOLEAN
+        if isinstance(node.op, ast.Invert):
+            raise ValueError(f"Unsupported operator in expression: {self.unparse(node)!r}")
+        if operand_type in KNOWN - {NUMBER, BOOLEAN}:
+            raise ValueError(f"Unsupported operand type for unary {'-' if isinstance(node.op, ast.USub) else '+'}: {operand_type}")
+        return _call("_neg" if isinstance(node.op, ast.USub) else "_pos", operand), NUMBER
+
+    def visit_BoolOp(self, node: ast.BoolOp) -> Tuple[ast.expr, str]:
+        values = [self.compile(value) for value in node.values]
+        types = {value_type for _, value_type in values}
+        return ast.BoolOp(node.op, [value for value, _ in values]), types.pop() if len(types) == 1 else ANY
+
+    def visit_Compare(self, node: ast.Compare) -> Tuple[ast.expr, str]:
+        operands = [self.compile(operand) for operand in [node.left, *node.comparators]]
+        tests = []
+        for operator_, (left, left_type), (right, right_type) in zip(node.ops, operands, operands[1:]):
+            if isinstance(operator_, (ast.Eq, ast.NotEq)):
+                tests.append(ast.Compare(left, [operator_], [right]))
+            elif type(operator_) in ORDERINGS:
+                numbers = {NUMBER, BOOLEAN}
+                if left_type in KNOWN and right_type in KNOWN and left_type != right_type and not {left_type, right_type} <= numbers:
+                    raise ValueError(f"Cannot compare {left_type} and {right_type} in {self.unparse(node)!r}")
+                tests.append(_call(ORDERINGS[type(operator_)], left, right))
+            elif isinstance(operator_, (ast.In, ast.NotIn)):
+                tests.append(_call("_in" if isinstance(operator_, ast.In) else "_not_in", left, right))
+            else:
+                raise ValueError(f"Unsupported comparison in expression: {self.unparse(node)!r}")
+        return (tests[0] if len(tests) == 1 else ast.BoolOp(ast.And(), tests)), BOOLEAN
+
+    def visit_IfExp(self, node: ast.IfExp) -> Tuple[ast.expr, str]:
+        test, _ = self.compile(node.test)
+        body, body_type = self.compile(node.body)
+        orelse, orelse_type = self.compile(node.orelse)
+        return ast.IfExp(test, body, orelse), body_type if body_type == orelse_type else ANY
+
+    def visit_Subscript(self, node: ast.Subscript) -> Tuple[ast.expr, str]:
+        value, _ = self.compile(node.value)
+        if isinstance(node.slice, ast.Slice):
+            bounds = [
+                self.compile(bound)[0] if bound is not None else ast.Constant(None)
+                for bound in (node.slice.lower, node.slice.upper, node.slice.step)
+            ]
+            key = _call("_slice", *bounds)
+        else:
+            key, _ = self.compile(node.slice)
+        return _call("_getitem", value, key), ANY
+
+    def visit_Call(self, node: ast.Call) -> Tuple[ast.expr, str]:
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+            name = node.func.id if isinstance(node.func, ast.Name) else ast.unparse(node.func)
+            raise ValueError(f"Unknown function {name!r}, choose one of {', '.join(sorted(FUNCTIONS))}")
+        name = node.func.id
+        function = FUNCTIONS[name]
+        self.deterministic = self.deterministic and function.deterministic
+        if node.keywords or any(isinstance(arg, ast.Starred) for arg in node.args):
+            raise ValueError(f"{name}() only takes positional arguments")
+        count = len(node.args)
+        if count < function.minimum or (function.maximum is not None and count > function.maximum):
+            expected = (
+                str(function.minimum) if function.minimum == function.maximum
+                else f"at least {function.minimum}" if function.maximum is None
+                else f"{function.minimum} to {function.maximum}"
+            )
+            plural = "" if expected == "1" else "s"
+            raise ValueError(f"{name}() takes {expected} argument{plural}, got {count}")
+        args = []
+        for position, arg in enumerate(node.args):
+            value, value_type = self.compile(arg)
+            accepted = function.parameters[min(position, len(function.parameters) - 1)] if function.parameters else None
+            if accepted is not None and value_type in KNOWN and value_type not in accepted:
+                raise ValueError(
+                    f"Argument {position + 1} of {name}() must be {' or '.join(sorted(accepted))}, not {value_type}"
+                )
+            args.append(value)
+        if name == "case":
+            return self._case(args), ANY
+        return _call(function.helper, *args), function.returns
+
+    @staticmethod
+    def _case(args: List[ast.expr]) -> ast.expr:
+        """
+        case(test, value, test, value..., [default]) as nested conditional
+        expressions, so that only the value of the first true test is evaluated.
+        """
+        default = args.pop() if len(args) % 2 else ast.Constant(None)
+        for test, value in reversed(list(zip(args[::2], args[1::2]))):
+            default = ast.IfExp(test, value, default)
+        return default
+
+
+def _lambda(parameters: Sequence[str], body: ast.expr) -> ast.Expression:
+    arguments = ast.arguments(
+        posonlyargs=[],
+        args=[ast.arg(arg=parameter) for parameter in parameters],
+        kwonlyargs=[],
+        kw_defaults=[],
+        defaults=[],
+    )
+    return ast.fix_missing_locations(ast.Expression(ast.Lambda(arguments, body)))
+
+
+class CompiledExpression:
+    """
+    An expression compiled into two code objects: a function of an event
+    (a dict) and a function of the values of the fields it references, in
+    the order of fields, to map over columns.
+
+    Args:
+        text (str): The expression.
+        fields (List[str]): The fields the expression references.
+        type (str): The type of its value, if known ahead of time, otherwise "any".
+        row_code: The code of the function of an event.
+        column_code: The code of the function of the values of fields.
+        deterministic (bool): Whether its value depends on the fields alone,
+            False if it calls now().
+    """
+    def __init__(self, text: str, fields: List[str], type: str, row_code: Any, column_code: Any, deterministic: bool = True) -> None:
+        self.text = text
+        self.fields = fields
+        self.type = type
+        self.row_code = row_code
+        self.column_code = column_code
+        self.deterministic = deterministic
+
+    def bind(self, now: Optional[datetime.datetime] = None) -> Tuple[Callable[[Dict[str, Any]], Any], Callable[..., Any]]:
+        """
+        Return the function of an event and the function of the values of
+        fields, with now() returning now (default the current time in UTC).
+        """
+        namespace = dict(NAMESPACE)
+        moment = now or datetime.datetime.now(datetime.timezone.utc)
+        namespace["_now"] = lambda: moment
+        return eval(self.row_code, namespace), eval(self.column_code, namespace)
+
+
+@lru_cache(maxsize=256)
+def compile_expression(text: str) -> CompiledExpression:
+    """
+    Parse, check and compile an expression, once per process.
+
+    Raises:
+        ValueError: If text is not a valid expression.
+    """
+    source, fields = substitute_fields(text)
+    try:
+        tree = ast.parse(source.strip(), mode="eval")
+    except SyntaxError as error:
+        raise ValueError(f"Invalid expression {text!r}: {error.msg}") from error
+
+    def row_field(index: int) -> ast.expr:
+        field = fields[index]
+        if "__" in field:
+            return _call("_path", _name("row"), ast.Constant(field))
+        return ast.Call(
+            func=ast.Attribute(value=_name("row"), attr="get", ctx=ast.Load()),
+            args=[ast.Constant(field)],
+            keywords=[],
+        )
+
+    compiler = _Compiler(fields, row_field)
+    row_body, value_type = compiler.compile(tree.body)
+    column_body, _ = _Compiler(fields, lambda index: _name(f"_{index}")).compile(tree.body)
+    row_code = compile(_lambda(["row"], row_body), f"<expression {text}>", "eval")
+    column_code = compile(_lambda([f"_{index}" for index in range(len(fields))], column_body), f"<expression {text}>", "eval")
+    return CompiledExpression(text, fields, value_type, row_code, column_code, compiler.deterministic)
@@ -0,0 +1,154 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+import heapq
+import pickle
+import logging
+import tempfile
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from django.conf import settings
+
+from .hash_join import estimate_size
+from .util import ResultSet, sort_key
+
+log = logging.getLogger(__name__)
+
+Row = Dict[str, Any]
+
+
+class Descending:
+    """
+    Wraps a sort key so that it sorts in descending order, for keys
+    which mix ascending and descending fields.
+    """
+    __slots__ = ("key",)
+
+    def __init__(self, key: Any) -> None:
+        self.key = key
+
+    def __lt__(self, other: "Descending") -> bool:
+        return other.key < self.key
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Descending) and self.key == other.key
+
+
+def row_sort_key(fields: Sequence[str], descending: Sequence[bool]) -> Callable[[Row], Tuple[Any, ...]]:
+    """
+    Return a key function ordering dict rows by fields (missing fields
+    being None) like ResultSet.sort, each field in its own direction.
+    """
+    pairs = list(zip(fields, descending))
+
+    def key(row: Row) -> Tuple[Any, ...]:
+        return tuple(
+            Descending(sort_key(row.get(field))) if reverse else sort_key(row.get(field))
+            for field, reverse in pairs
+        )
+    return key
+
+
+class Run:
+    """
+    A sorted run of rows spilled to a temporary file.
+
+    Args:
+        rows (Iterable[Row]): The rows, already sorted.
+        directory (Optional[str]): Where to create the file, default the system temporary directory.
+    """
+    def __init__(self, rows: Iterable[Row], directory: Optional[str] = None) -> None:
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.length = 0
+        for row in rows:
+            pickle.dump(row, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+            self.length += 1
+
+    def read(self) -> Iterator[Row]:
+        self.file.seek(0)
+        for _ in range(self.length):
+            yield pickle.load(self.file)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def _chunk(rows: Iterator[Any], memory_limit: int, exhausted: List[bool]) -> Iterator[Any]:
+    """
+    Yield rows until their estimated size exceeds memory_limit, setting
+    exhausted[0] if rows ran out first.
+    """
+    size = 0
+    for row in rows:
+        yield row
+        size += estimate_size(row) if isinstance(row, dict) else 0
+        if size > memory_limit:
+            return
+    exhausted[0] = True
+
+
+def _merge(runs: List[Run], key: Callable[[Row], Tuple[Any, ...]]) -> Iterator[Row]:
+    try:
+        # merge() prefers earlier runs on ties, which keeps the sort stable
+        yield from heapq.merge(*(run.read() for run in runs), key=key)
+    finally:
+        for run in runs:
+            run.close()
+
+
+def external_sort(
+    rows: Iterable[Row],
+    fields: Sequence[str],
+    descending: Sequence[bool],
+    memory_limit: Optional[int] = None,
+) -> Union[ResultSet, Iterator[Row]]:
+    """
+    Sort dict rows by fields, stably, without holding more than about
+    memory_limit bytes of them in memory.
+
+    Rows are read into a ResultSet until their estimated size reaches
+    memory_limit. If that is all of them they are sorted in memory and
+    the sorted ResultSet is returned. Otherwise every chunk is sorted
+    and spilled as a run to a temporary file in
+    settings.DELVE_SORT_SPILL_DIRECTORY, and the runs are merged lazily.
+
+    Args:
+        rows (Iterable[Row]): The rows to sort.
+        fields (Sequence[str]): The fields to sort by.
+        descending (Sequence[bool]): Whether to sort each field in descending order.
+        memory_limit (Optional[int]): The estimated size in bytes of the rows
+            sorted in memory, default settings.DELVE_SORT_MEMORY_LIMIT MiB.
+
+    Returns:
+        Union[ResultSet, Iterator[Row]]: The sorted rows.
+    """
+    if memory_limit is None:
+        memory_limit = settings.DELVE_SORT_MEMORY_LIMIT * 1024 * 1024
+    directory = settings.DELVE_SORT_SPILL_DIRECTORY or None
+    rows = iter(rows)
+    runs: List[Run] = []
+    try:
+        while True:
+            exhausted = [False]
+            chunk = ResultSet.from_rows(_chunk(rows, memory_limit, exhausted)).sort(fields, descending)
+            if exhausted[0] and not runs:
+                return chunk
+            if chunk:
+                runs.append(Run(chunk, directory))
+            if exhausted[0]:
+                break
+    except BaseException:
+        for run in runs:
+            run.close()
+        raise
+    log.debug(f"Spilled {sum(run.length for run in runs)} rows to {len(runs)} sorted runs, merging")
+    return _merge(runs, row_sort_key(fields, descending))
+
+
+def top_k(rows: Iterable[Row], fields: Sequence[str], descending: Sequence[bool], limit: int) -> List[Row]:
+    """
+    Return the first limit rows of rows sorted by fields, keeping only
+    limit rows in memory (in a heap) instead of sorting all of them.
+    """
+    return heapq.nsmallest(limit, rows, key=row_sort_key(fields, descending))
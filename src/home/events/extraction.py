@@ -0,0 +1,237 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+"""
+Extraction of named groups with regular expressions, as done by the rex
+search command.
+
+This module only depends on the standard library so that worker
+processes (which are spawned, not forked from the threads of the web
+server) can import it without setting up Django.
+"""
+import re
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Pattern, Sequence, Tuple
+
+ANCHORS = ("^", r"\A")
+NAMED_GROUP = re.compile(r"(?<!\\)\(\?P<(\w+)>")
+BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=|\(\?\(")
+# Searching an anchored expression which does not match is cheap, so a
+# combined alternation (whose groups are then picked out in Python) only
+# beats trying the expressions one by one from about this many of them
+COMBINE_MIN_EXPRESSIONS = 8
+
+
+def to_text(value: Any) -> Optional[str]:
+    """
+    Return value as a string to match against: None stays None (which
+    never matches), bytes are decoded as UTF-8 with invalid bytes
+    replaced and other values are converted with str().
+    """
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).decode("utf-8", errors="replace")
+    return str(value)
+
+
+def has_top_level_alternation(pattern: str) -> bool:
+    """
+    Return whether pattern has a | outside of any group or character
+    class, in which case an anchor at its start only anchors the first
+    alternative.
+    """
+    depth = 0
+    index = 0
+    length = len(pattern)
+    while index < length:
+        character = pattern[index]
+        if character == "\\":
+            index += 1
+        elif character == "[":
+            index += 1
+            if index < length and pattern[index] == "^":
+                index += 1
+            if index < length and pattern[index] == "]":
+                index += 1
+            while index < length and pattern[index] != "]":
+                if pattern[index] == "\\":
+                    index += 1
+                index += 1
+        elif character == "(":
+            depth += 1
+        elif character == ")":
+            depth -= 1
+        elif character == "|" and depth == 0:
+            return True
+        index += 1
+    return False
+
+
+def anchored_body(pattern: str, compiled: Pattern) -> Optional[str]:
+    """
+    Return pattern without its leading anchor if it can only match at the
+    start of the string and can be renamed into an alternation (it has no
+    backreferences, which would be renumbered), otherwise None.
+    """
+    anchor = next((anchor for anchor in ANCHORS if pattern.startswith(anchor)), None)
+    if anchor is None or compiled.flags & re.MULTILINE and anchor == "^":
+        return None
+    if BACKREFERENCE.search(pattern) or has_top_level_alternation(pattern):
+        return None
+    return pattern[len(anchor):]
+
+
+class Extractor:
+    """
+    Extracts the named groups of one or more regular expressions from
+    strings.
+
+    By default every expression is searched and the named groups of each
+    one which matches are merged in order, so later expressions overwrite
+    the groups of earlier ones. With first, only the groups of the first
+    expression which matches are returned. When, in addition, there are
+    many expressions and every one is anchored at the start of the string,
+    they are combined into a single alternation which is tried once
+    instead of once per expression, the alternatives being tried in order.
+
+    Args:
+        expressions (Sequence[str]): The regular expressions.
+        first (bool): Whether the first expression which matches wins.
+
+    Raises:
+        re.error: If an expression is invalid.
+    """
+    def __init__(self, expressions: Sequence[str], first: bool = False) -> None:
+        self.expressions = tuple(expressions)
+        self.first = first
+        self.patterns = [re.compile(expression) for expression in self.expressions]
+        self.combined: Optional[Pattern] = None
+        # The named groups of each alternative of combined, by the index of
+        # the group wrapping the alternative: [(index, name)]
+        self.alternatives: Dict[int, List[Tuple[int, str]]] = {}
+        if first and len(self.patterns) >= COMBINE_MIN_EXPRESSIONS:
+            self._combine()
+
+    def _combine(self) -> None:
+        branches = []
+        alternatives = []
+        for number, (expression, pattern) in enumerate(zip(self.expressions, self.patterns)):
+            body = anchored_body(expression, pattern)
+            if body is None:
+                return
+            prefix = f"_{number}_"
+            body, renamed = NAMED_GROUP.subn(lambda match: f"(?P<{prefix}{match[1]}>", body)
+            if renamed != len(pattern.groupindex):
+                # A (?P< inside a character class
+                return
+            group = f"_{number}"
+            branches.append(f"(?P<{group}>{body})")
+            alternatives.append((group, [(prefix + name, name) for name in pattern.groupindex]))
+        try:
+            combined = re.compile("(?:" + "|".join(branches) + ")")
+        except re.error:
+            return
+        expected = {group for group, _ in alternatives}
+        expected.update(renamed for _, names in alternatives for renamed, _ in names)
+        if set(combined.groupindex) != expected:
+            return
+        index = combined.groupindex
+        self.combined = combined
+        self.alternatives = {
+            index[group]: [(index[renamed], name) for renamed, name in names]
+            for group, names in alternatives
+        }
+
+    def extract(self, value: Any) -> Optional[Dict[str, Any]]:
+        """
+        Return the named groups extracted from value (see to_text), or
+        None if no expression matches.
+        """
+        text = to_text(value)
+        if text is None:
+            return None
+        if self.combined is not None:
+            match = self.combined.match(text)
+            if match is None:
+                return None
+            # The group wrapping an alternative closes after the groups in
+            # it, so the last group matched is the matching alternative's
+            group = match.group
+            return {name: group(index) for index, name in self.alternatives[match.lastindex]}
+        ret = None
+        for pattern in self.patterns:
+            match = pattern.search(text)
+            if match is None:
+                continue
+            if self.first:
+                return match.groupdict()
+            if ret is None:
+                ret = {}
+            ret.update(match.groupdict())
+        return ret
+
+
+@lru_cache(maxsize=256)
+def compile_extractor(expressions: Tuple[str, ...], first: bool = False) -> Extractor:
+    """
+    Return the Extractor of expressions, compiled once per process.
+    """
+    return Extractor(expressions, first)
+
+
+def extract_chunk(expressions: Tuple[str, ...], first: bool, values: List[Any]) -> List[Optional[Dict[str, Any]]]:
+    """
+    Extract the named groups of every value, run in a worker process.
+    """
+    extract = compile_extractor(expressions, first).extract
+    return [extract(value) for value in values]
+
+
+def extract_events(
+    events: Iterable[Dict[str, Any]],
+    field: str,
+    expressions: Tuple[str, ...],
+    first: bool = False,
+    processes: int = 0,
+    chunk_size: int = 10000,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Update each event with the named groups extracted from its field,
+    yielding the events in order.
+
+    With processes, inputs of more than chunk_size events are split into
+    chunks whose values of field are sent to a pool of that many worker
+    processes. No more than two chunks per process are in flight at a
+    time, so memory use stays bounded however many events there are.
+    """
+    extract = compile_extractor(expressions, first).extract
+    events = iter(events)
+    chunk = list(itertools.islice(events, chunk_size))
+    if processes < 1 or len(chunk) < chunk_size:
+        for event in itertools.chain(chunk, events):
+            groups = extract(event.get(field))
+            if groups:
+                event.update(groups)
+            yield event
+        return
+    pending: Deque[Tuple[List[Dict[str, Any]], Any]] = deque()
+    executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        while chunk or pending:
+            while chunk and len(pending) < 2 * processes:
+                values = [event.get(field) for event in chunk]
+                pending.append((chunk, executor.submit(extract_chunk, expressions, first, values)))
+                chunk = list(itertools.islice(events, chunk_size))
+            chunk_events, future = pending.popleft()
+            for event, groups in zip(chunk_events, future.result()):
+                if groups:
+                    event.update(groups)
+                yield event
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,391 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+"""
+Incremental parsers for the formats of uploaded files, as read by the
+read_file search command.
+
+Every parser reads its file CHUNK_SIZE bytes (or characters) at a time
+and yields one record as soon as it is complete, so the memory used
+depends on the size of the largest record rather than of the file.
+Files compressed with gzip or Zstandard are decompressed on the fly.
+
+Uncompressed CSV and JSON Lines files can also be split on line
+boundaries and parsed by a pool of worker processes, see read_parallel.
+
+This module only depends on the standard library (and, for Zstandard,
+on the zstandard package when such a file is read) so that worker
+processes can import it without setting up Django.
+"""
+import io
+import os
+import re
+import csv
+import gzip
+import json
+import mmap
+import itertools
+import multiprocessing
+import xml.etree.ElementTree as ElementTree
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, BinaryIO, Deque, Dict, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+CHUNK_SIZE = 1 << 16
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+WHITESPACE = " \t\n\r"
+SEPARATOR = re.compile(r"[ \t\n\r]*,[ \t\n\r]*")
+
+
+def decompressed(stream: BinaryIO) -> BinaryIO:
+    """
+    Return a binary stream of the contents of stream, decompressing it
+    if it starts like a gzip or Zstandard file.
+    """
+    stream = stream if hasattr(stream, "peek") else io.BufferedReader(stream, CHUNK_SIZE)
+    head = stream.peek(len(ZSTD_MAGIC))[:len(ZSTD_MAGIC)]
+    if head.startswith(GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=stream, mode="rb")
+    if head == ZSTD_MAGIC:
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("Reading Zstandard compressed files requires the zstandard package")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(stream), CHUNK_SIZE)
+    return stream
+
+
+def text(stream: BinaryIO) -> TextIO:
+    """Return stream decoded as UTF-8, with newlines left as they are."""
+    return io.TextIOWrapper(stream, encoding="utf-8", errors="replace", newline="")
+
+
+def iter_csv(stream: BinaryIO) -> Iterator[Dict[str, Any]]:
+    """Yield the rows of a CSV file with a header as dicts."""
+    yield from csv.DictReader(text(stream))
+
+
+def iter_lines(stream: BinaryIO) -> Iterator[bytes]:
+    """Yield the lines of a file as bytes, with their line endings."""
+    yield from stream
+
+
+class JSONItems:
+    """
+    The items of a JSON document which is an array, read one at a time,
+    or the whole document if it is anything else (see array).
+
+    Items are decoded with json.JSONDecoder.raw_decode from a buffer
+    holding the rest of the current item, so an array of any length is
+    read with the memory of its largest item.
+
+    Args:
+        stream (BinaryIO): The document, encoded as UTF-8.
+    """
+    def __init__(self, stream: BinaryIO) -> None:
+        self._decoder = json.JSONDecoder()
+        self._reader = text(stream)
+        self._buffer = ""
+        self._position = 0
+        self._eof = False
+        self._skip()
+        self.array = self._peek() == "["
+
+    def _fill(self) -> None:
+        # Drop what was decoded, and read at least as much as is left so
+        # that retrying the decode of a large item stays linear
+        self._buffer = self._buffer[self._position:]
+        self._position = 0
+        chunk = self._reader.read(max(CHUNK_SIZE, len(self._buffer)))
+        if chunk:
+            self._buffer += chunk
+        else:
+            self._eof = True
+
+    def _skip(self) -> None:
+        while True:
+            while self._position < len(self._buffer) and self._buffer[self._position] in WHITESPACE:
+                self._position += 1
+            if self._position < len(self._buffer) or self._eof:
+                return
+            self._fill()
+
+    def _peek(self) -> Optional[str]:
+        if self._position < len(self._buffer):
+            return self._buffer[self._position]
+        return None
+
+    def _decode(self) -> Any:
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            else:
+                # A number (or literal) ending the buffer may go on in the
+                # next chunk, anything else ends with a delimiter
+                if end < len(self._buffer) or self._eof:
+                    self._position = end
+                    return value
+            self._fill()
+
+    def __iter__(self) -> Iterator[Any]:
+        if not self.array:
+            yield self._decode()
+            return
+        self._position += 1
+        self._skip()
+        if self._peek() == "]":
+            return
+        while True:
+            yield self._decode()
+            # Most items are followed by a comma and the next item
+            match = SEPARATOR.match(self._buffer, self._position)
+            if match is not None and match.end() < len(self._buffer):
+                self._position = match.end()
+                continue
+            self._skip()
+            character = self._peek()
+            if character == "]":
+                return
+            if character is None:
+                raise ValueError("Unterminated JSON array")
+            if character != ",":
+                raise ValueError(f"Expected ',' or ']' in JSON array, found {character!r}")
+            self._position += 1
+            self._skip()
+
+
+def _name(tag: str, prefixes: Dict[str, str]) -> str:
+    # ElementTree expands namespace prefixes, put them back like xmltodict
+    if tag.startswith("{"):
+        uri, _, local = tag[1:].partition("}")
+        prefix = prefixes.get(uri)
+        if prefix:
+            return f"{prefix}:{local}"
+        if prefix is not None:
+            return local
+    return tag
+
+
+def _value(element: ElementTree.Element, prefixes: Dict[str, str], declarations: Dict[ElementTree.Element, List[Tuple[str, str]]]) -> Any:
+    """
+    Convert element to the value xmltodict.parse(process_namespaces=False)
+    gives it: None when empty, its text when it only has text, otherwise
+    a dict of its "@attributes", children (a list for repeated ones) and
+    "#text".
+    """
+    ret: Dict[str, Any] = {}
+    for prefix, uri in declarations.pop(element, ()):
+        ret[f"@xmlns:{prefix}" if prefix else "@xmlns"] = uri
+    for key, value in element.attrib.items():
+        ret[f"@{_name(key, prefixes)}"] = value
+    parts = [element.text or ""]
+    for child in element:
+        name = _name(child.tag, prefixes)
+        value = _value(child, prefixes, declarations)
+        if name in ret:
+            if not isinstance(ret[name], list):
+                ret[name] = [ret[name]]
+            ret[name].append(value)
+        else:
+            ret[name] = value
+        parts.append(child.tail or "")
+    content = "".join(parts).strip() or None
+    if not ret:
+        return content
+    if content is not None:
+        ret["#text"] = content
+    return ret
+
+
+def iter_xml(stream: BinaryIO, record_path: Optional[str] = None) -> Iterator[Any]:
+    """
+    Yield the elements of an XML document found at record_path, a "/"
+    separated path of tags from the root element (ie. "catalog/book"),
+    converted like xmltodict would, or the whole document as
+    {root: value} if record_path is None.
+
+    Each record, and every element outside of records, is dropped from
+    the tree once it ends, so only the current record is kept in memory.
+    """
+    path = record_path.strip("/").split("/") if record_path else None
+    prefixes: Dict[str, str] = {}
+    declarations: Dict[ElementTree.Element, List[Tuple[str, str]]] = {}
+    pending: List[Tuple[str, str]] = []
+    stack: List[ElementTree.Element] = []
+    names: List[str] = []
+    for event, item in ElementTree.iterparse(stream, events=("start-ns", "start", "end")):
+        if event == "start-ns":
+            prefix, uri = item
+            prefixes[uri] = prefix
+            pending.append(item)
+        elif event == "start":
+            if pending:
+                declarations[item] = pending
+                pending = []
+            stack.append(item)
+            names.append(_name(item.tag, prefixes))
+        else:
+            depth = len(stack)
+            if path is None:
+                if depth == 1:
+                    yield {names[0]: _value(item, prefixes, declarations)}
+            elif names == path:
+                yield _value(item, prefixes, declarations)
+            stack.pop()
+            names.pop()
+            if path is not None and depth <= len(path):
+                declarations.pop(item, None)
+                if stack:
+                    stack[-1].remove(item)
+                item.clear()
+
+
+def jsonl_content(line: bytes, allow_escape: bool = False) -> Any:
+    """
+    Decode a line of a JSON Lines file, with backslashes escaped if it is
+    invalid and allow_escape, or return [line] if it is still invalid.
+    """
+    try:
+        return json.loads(line)
+    except ValueError:
+        if allow_escape:
+            try:
+                return json.loads(line.replace(b"\\", b"\\\\"))
+            except ValueError:
+                pass
+    return [line.decode(errors="replace")]
+
+
+def is_compressed(path: str) -> bool:
+    with open(path, "rb") as stream:
+        head = stream.read(len(ZSTD_MAGIC))
+    return head.startswith(GZIP_MAGIC) or head == ZSTD_MAGIC
+
+
+def split_offsets(path: str, split_size: int, quoted: bool = False) -> List[int]:
+    """
+    Return the offsets splitting the file at path into parts of about
+    split_size bytes, each starting at the beginning of a line, from 0 to
+    the size of the file.
+
+    If quoted, lines only end at newlines preceded by an even number of
+    double quotes, so that CSV fields holding newlines (whose quotes are
+    escaped by doubling them) are never split.
+    """
+    with open(path, "rb") as stream:
+        size = os.fstat(stream.fileno()).st_size
+        if size == 0:
+            return [0, 0]
+        with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            offsets = [0]
+            quotes = 0
+            while True:
+                target = offsets[-1] + split_size
+                if target >= size:
+                    break
+                newline = data.find(b"\n", target)
+                if quoted and newline != -1:
+                    # mmap has no count(), each slice is at most one part
+                    quotes += data[offsets[-1]:newline].count(b'"')
+                    while newline != -1 and quotes % 2:
+                        following = data.find(b"\n", newline + 1)
+                        if following != -1:
+                            quotes += data[newline:following].count(b'"')
+                        newline = following
+                if newline == -1 or newline + 1 >= size:
+                    break
+                offsets.append(newline + 1)
+    offsets.append(size)
+    return offsets
+
+
+def csv_header(path: str) -> Tuple[List[str], int]:
+    """
+    Return the field names of the CSV file at path and the offset of its
+    first row.
+    """
+    offsets = split_offsets(path, 1, quoted=True)
+    end = offsets[1]
+    with open(path, "rb") as stream:
+        line = stream.read(end).decode("utf-8", errors="replace")
+    return next(csv.reader(io.StringIO(line, newline="")), []), end
+
+
+def parse_split(path: str, _format: str, start: int, end: int, allow_escape: bool = False) -> Tuple[Optional[List[str]], List[Any]]:
+    """
+    Parse the lines of the file at path from offset start to end, run in
+    a worker process: the rows of a CSV file as lists of values (empty
+    rows are skipped, like csv.DictReader does) or the decoded lines of a
+    JSON Lines file (see jsonl_content).
+
+    Unpickling a list of strings per row costs the parent process about
+    as much as parsing them, so when every row has as many values, and
+    no value holds a NUL, CSV rows are returned as one string per column
+    joined with NUL instead, which the parent splits (see split_rows).
+    """
+    with open(path, "rb") as stream:
+        stream.seek(start)
+        data = stream.read(end - start)
+    if _format == "csv":
+        text = data.decode("utf-8", errors="replace")
+        rows = [row for row in csv.reader(io.StringIO(text, newline="")) if row]
+        if rows and "\x00" not in text:
+            width = len(rows[0])
+            if all(len(row) == width for row in rows):
+                return ["\x00".join(column) for column in zip(*rows)], []
+        return None, rows
+    lines = data.split(b"\n")
+    last = lines.pop()
+    ret = [jsonl_content(line + b"\n", allow_escape) for line in lines]
+    if last:
+        ret.append(jsonl_content(last, allow_escape))
+    return None, ret
+
+
+def split_rows(columns: Optional[List[str]], records: List[Any]) -> List[Any]:
+    """Return the records of a part returned by parse_split."""
+    if columns is None:
+        return records
+    return list(zip(*(column.split("\x00") for column in columns)))
+
+
+def read_parallel(
+    path: str,
+    _format: str,
+    processes: int,
+    offsets: Sequence[int],
+    ordered: bool = True,
+    allow_escape: bool = False,
+) -> Iterator[List[Any]]:
+    """
+    Parse the parts of the file at path between consecutive offsets in a
+    pool of worker processes and yield the batch of records of each part
+    (CSV rows as sequences of values, or decoded JSON Lines, see
+    parse_split), in order, or as soon as they are parsed if not ordered.
+
+    No more than two parts per process are in flight at a time, so the
+    memory used depends on the size of the parts rather than of the file.
+    """
+    parts = iter(zip(offsets, offsets[1:]))
+    pending: Deque[Future] = deque()
+    executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        while True:
+            for start, end in itertools.islice(parts, 2 * processes - len(pending)):
+                pending.append(executor.submit(parse_split, path, _format, start, end, allow_escape))
+            if not pending:
+                return
+            if ordered:
+                yield split_rows(*pending.popleft().result())
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    yield split_rows(*future.result())
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -51,6 +51,10 @@ class QueryForm(forms.ModelForm):
     _save = forms.BooleanField(
         required=False,
     )
+    profile = forms.BooleanField(
+        required=False,
+        help_text="Profile each stage of the query",
+    )
 
     class Meta:
         model = Query
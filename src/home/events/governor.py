@@ -0,0 +1,198 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+import time
+import logging
+import tracemalloc
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+import psutil
+
+from django.conf import settings
+from django.db.models.query import QuerySet
+
+from .planner import StageHook
+from .profiling import start_tracing, stop_tracing
+from .util import EventStream, ResultSet
+
+log = logging.getLogger(__name__)
+
+# The governor of the query being resolved in the current thread (or task).
+current_governor: ContextVar[Optional["QueryGovernor"]] = ContextVar("current_governor", default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    Raised when a query exceeds one of its budgets.
+
+    Attributes:
+        budget (str): Which budget was exceeded, "seconds", "rows" or "memory".
+        limit (int): The configured limit.
+        value (float): The value which exceeded the limit.
+        stage (str): The text of the search command which was running.
+    """
+    def __init__(self, budget: str, limit: int, value: float, stage: str) -> None:
+        self.budget = budget
+        self.limit = limit
+        self.value = value
+        self.stage = stage
+        super().__init__(
+            f"Query exceeded its {budget} budget ({value:g} > {limit}) in stage: {stage}"
+        )
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "budget": self.budget,
+            "limit": self.limit,
+            "value": self.value,
+            "stage": self.stage,
+        }
+
+
+def get_budget(user: Any) -> Dict[str, int]:
+    """
+    Return the budget of user. Limits set on the user's profile take
+    precedence over the global DELVE_QUERY_MAX_* settings, 0 means unlimited.
+    """
+    budget = {
+        "seconds": settings.DELVE_QUERY_MAX_SECONDS,
+        "rows": settings.DELVE_QUERY_MAX_ROWS,
+        "memory": settings.DELVE_QUERY_MAX_MEMORY * 1024 * 1024,
+    }
+    profile = getattr(user, "profile", None)
+    if profile is not None:
+        for name in ("seconds", "rows"):
+            value = getattr(profile, f"query_max_{name}", None)
+            if value is not None:
+                budget[name] = value
+        memory = getattr(profile, "query_max_memory", None)
+        if memory is not None:
+            budget["memory"] = memory * 1024 * 1024
+    return budget
+
+
+class QueryGovernor(StageHook):
+    """
+    Enforces a wall time, row and memory budget on a query.
+
+    Budgets are checked cooperatively: before and after every stage, and
+    every settings.DELVE_STREAMING_BATCH_SIZE rows while lazy output (and
+    QuerySets being materialized by events.util.resolve) is consumed.
+    A stage cannot be interrupted between checks.
+
+    Memory is measured as the growth of the process' RSS (or of the memory
+    traced by tracemalloc if DELVE_QUERY_MEMORY_METHOD is "tracemalloc",
+    in a session shared with the other queries, see
+    events.profiling.start_tracing) since the query started, so
+    allocations by other threads count too.
+
+    Args:
+        seconds (int): The maximum wall time, 0 for unlimited.
+        rows (int): The maximum number of rows output by any stage, 0 for unlimited.
+        memory (int): The maximum memory growth in bytes, 0 for unlimited.
+    """
+    def __init__(self, seconds: int = 0, rows: int = 0, memory: int = 0) -> None:
+        self.seconds = seconds
+        self.rows = rows
+        self.memory = memory
+        self.stage = ""
+        self.started: Optional[float] = None
+        self.memory_baseline = 0
+        self._tracing = False
+        self._token = None
+
+    @classmethod
+    def for_user(cls, user: Any) -> Optional["QueryGovernor"]:
+        """
+        Return a governor enforcing user's budget, or None if it is unlimited.
+        """
+        budget = get_budget(user)
+        if not any(budget.values()):
+            return None
+        return cls(**budget)
+
+    def current_memory(self) -> int:
+        if settings.DELVE_QUERY_MEMORY_METHOD == "tracemalloc":
+            return tracemalloc.get_traced_memory()[0]
+        return psutil.Process().memory_info().rss
+
+    def start(self, events: Any) -> None:
+        if self.memory and settings.DELVE_QUERY_MEMORY_METHOD == "tracemalloc" and not self._tracing:
+            start_tracing()
+            self._tracing = True
+        self.memory_baseline = self.current_memory() if self.memory else 0
+        self.started = time.perf_counter()
+        self._token = current_governor.set(self)
+
+    def stop(self) -> None:
+        if self._token is not None:
+            current_governor.reset(self._token)
+            self._token = None
+        if self._tracing:
+            stop_tracing()
+            self._tracing = False
+
+    def check(self, rows: Optional[int] = None, stage: Optional[str] = None) -> None:
+        """
+        Raise QueryBudgetExceeded if any budget has been exceeded.
+
+        Args:
+            rows (Optional[int]): The number of rows output so far by stage.
+            stage (Optional[str]): The stage being checked, default the current stage.
+        """
+        stage = self.stage if stage is None else stage
+        if self.rows and rows is not None and rows > self.rows:
+            raise QueryBudgetExceeded("rows", self.rows, rows, stage)
+        if self.seconds and self.started is not None:
+            elapsed = time.perf_counter() - self.started
+            if elapsed > self.seconds:
+                raise QueryBudgetExceeded("seconds", self.seconds, round(elapsed, 3), stage)
+        if self.memory:
+            growth = self.current_memory() - self.memory_baseline
+            if growth > self.memory:
+                raise QueryBudgetExceeded("memory", self.memory, growth, stage)
+
+    def govern(self, iterable: Iterable[Any], stage: str) -> Iterator[Any]:
+        """
+        Yield from iterable, checking the budgets every batch.
+        """
+        batch_size = settings.DELVE_STREAMING_BATCH_SIZE
+        rows = 0
+        for item in iterable:
+            rows += 1
+            if not rows % batch_size:
+                self.check(rows, stage)
+            yield item
+        self.check(rows, stage)
+
+    def run_stage(self, text: str, function: Callable[[], Any]) -> Any:
+        self.stage = text.strip()
+        self.check()
+        events = function()
+        if isinstance(events, (list, tuple, ResultSet)):
+            self.check(len(events))
+        elif isinstance(events, EventStream):
+            events = EventStream(self.govern(events, self.stage))
+        elif hasattr(events, "__next__"):
+            events = self.govern(events, self.stage)
+        else:
+            # QuerySets are governed when they are materialized
+            self.check()
+        return events
+
+
+def governed(iterable: Iterable[Any]) -> Iterable[Any]:
+    """
+    Return iterable governed by the governor of the current query, or
+    unchanged if there is none.
+    """
+    governor = current_governor.get()
+    if governor is None:
+        return iterable
+    if isinstance(iterable, QuerySet) and iterable._result_cache is None:
+        # Iterating a QuerySet directly fetches every row before the first
+        # one is returned, iterator() fetches them one batch at a time.
+        iterable = iterable.iterator(chunk_size=settings.DELVE_STREAMING_BATCH_SIZE)
+    return governor.govern(iterable, governor.stage)
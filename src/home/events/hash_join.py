@@ -0,0 +1,255 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+import sys
+import heapq
+import pickle
+import logging
+import tempfile
+from operator import itemgetter
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+from .util import field_value, freeze
+
+log = logging.getLogger(__name__)
+
+JOIN_TYPES = ("left", "right", "inner", "full")
+
+Row = Dict[str, Any]
+Key = Optional[Tuple[Hashable, ...]]
+
+
+def row_key(row: Row, fields: Sequence[str]) -> Key:
+    """
+    Return the join key of row, or None if any of fields is missing
+    from it. Rows without a key never match.
+    """
+    try:
+        return tuple(freeze(field_value(row, field)) for field in fields)
+    except KeyError:
+        return None
+
+
+def estimate_size(row: Row) -> int:
+    """
+    Return a rough estimate of the memory used by row, in bytes.
+    """
+    return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row.values())
+
+
+class Partitions:
+    """
+    Rows (along with their keys and positions) spilled to temporary files,
+    partitioned by the hash of their key so that matching rows of both
+    sides of a join end up in the same partition.
+
+    Args:
+        count (int): The number of partitions.
+        directory (Optional[str]): Where to create the files, default the system temporary directory.
+    """
+    def __init__(self, count: int, directory: Optional[str] = None) -> None:
+        self.count = count
+        self.files = [tempfile.TemporaryFile(dir=directory) for _ in range(count)]
+
+    def add(self, key: Key, position: int, row: Row) -> None:
+        self.write(hash(key) % self.count, (key, position, row))
+
+    def write(self, partition: int, record: Any) -> None:
+        pickle.dump(record, self.files[partition], protocol=pickle.HIGHEST_PROTOCOL)
+
+    def read(self, partition: int) -> Iterator[Any]:
+        file = self.files[partition]
+        file.seek(0)
+        while True:
+            try:
+                yield pickle.load(file)
+            except EOFError:
+                return
+
+    def close(self) -> None:
+        for file in self.files:
+            file.close()
+
+
+class HashTable:
+    """
+    The build side of a hash join: rows by key, in their original
+    order, along with their positions and whether each row has been matched.
+    """
+    def __init__(self) -> None:
+        self.rows: List[Row] = []
+        self.positions: List[int] = []
+        self.keys: List[Key] = []
+        self.buckets: Dict[Key, List[int]] = {}
+        self.matched = bytearray()
+        self.size = 0
+
+    def add(self, key: Key, row: Row, position: int) -> None:
+        # Rows without a key are kept (to be returned unmatched) but never match
+        if key is not None:
+            self.buckets.setdefault(key, []).append(len(self.rows))
+        self.rows.append(row)
+        self.positions.append(position)
+        self.keys.append(key)
+        self.matched.append(0)
+        self.size += estimate_size(row)
+
+    def unmatched(self) -> Iterator[Tuple[int, Row]]:
+        for index, row in enumerate(self.rows):
+            if not self.matched[index]:
+                yield self.positions[index], row
+
+
+def hash_join(
+    left: Iterable[Row],
+    right: Iterable[Row],
+    left_fields: Sequence[str],
+    right_fields: Sequence[str],
+    how: str = "left",
+    build: str = "right",
+    memory_limit: Optional[int] = None,
+    partitions: Optional[int] = None,
+) -> Iterator[Row]:
+    """
+    Join two iterables of dicts on equal values of left_fields and right_fields.
+
+    One side (build) is read into a hash table and the other side is
+    streamed through it, so the cost is linear in the size of both sides
+    instead of their product. Pick the smaller side as build.
+
+    Joined rows are a copy of the left row updated with the fields of the
+    right row (except right_fields), or for right joins a copy of the
+    right row updated with the fields of the left row (except left_fields).
+    Unmatched rows kept by the join type are returned as-is.
+
+    Whichever side is built, rows are returned like a nested loop over
+    the left side (the right side for right joins): in the order of its
+    rows, each followed by its matches in the order of the other side,
+    then for full joins the unmatched rows of the right side. This is
+    free when the other side is built and fits in memory. Otherwise the
+    output is held in memory and put back in order at the end, or if the
+    build side grows beyond memory_limit both sides are partitioned to
+    temporary files, joined one partition at a time and the sorted
+    output of every partition is merged.
+
+    Args:
+        left (Iterable[Row]): The left side.
+        right (Iterable[Row]): The right side.
+        left_fields (Sequence[str]): The fields of the left side to join on.
+        right_fields (Sequence[str]): The fields of the right side to join on.
+        how (str): One of "left", "right", "inner" or "full".
+        build (str): Which side to build the hash table from, "left" or "right".
+        memory_limit (Optional[int]): The estimated size in bytes of the build
+            side above which it is spilled to disk, default settings.DELVE_JOIN_MEMORY_LIMIT MiB.
+        partitions (Optional[int]): The number of partitions to spill to,
+            default settings.DELVE_JOIN_SPILL_PARTITIONS.
+
+    Returns:
+        Iterator[Row]: The joined rows.
+    """
+    if how not in JOIN_TYPES:
+        raise ValueError(f"Unsupported join type {how}, choose one of {JOIN_TYPES}")
+    if len(left_fields) != len(right_fields):
+        raise ValueError("The same number of fields must be joined on from each side")
+    if memory_limit is None:
+        memory_limit = settings.DELVE_JOIN_MEMORY_LIMIT * 1024 * 1024
+    if partitions is None:
+        partitions = settings.DELVE_JOIN_SPILL_PARTITIONS
+
+    left_fields = list(left_fields)
+    right_fields = list(right_fields)
+    keep_left = how in ("left", "full")
+    keep_right = how in ("right", "full")
+    if build == "right":
+        build_rows, build_fields, keep_build = right, right_fields, keep_right
+        probe_rows, probe_fields, keep_probe = left, left_fields, keep_left
+    else:
+        build_rows, build_fields, keep_build = left, left_fields, keep_left
+        probe_rows, probe_fields, keep_probe = right, right_fields, keep_right
+    # The side whose order the output follows
+    probe_leads = build != ("right" if how == "right" else "left")
+
+    def merge(build_row: Row, probe_row: Row) -> Row:
+        left_row, right_row = (probe_row, build_row) if build == "right" else (build_row, probe_row)
+        if how == "right":
+            ret = right_row.copy()
+            ret.update({k: v for k, v in left_row.items() if k not in left_fields})
+        else:
+            ret = left_row.copy()
+            ret.update({k: v for k, v in right_row.items() if k not in right_fields})
+        return ret
+
+    def probe(table: HashTable, rows: Iterable[Tuple[Key, int, Row]]) -> Iterator[Tuple[Tuple[int, int], Row]]:
+        """
+        Yield the joined rows along with their place in the output: the
+        position of the leading row they come from, rows of the other
+        side which are kept unmatched after every leading row.
+        """
+        lead, other = (0, 1) if probe_leads else (1, 0)
+        for key, position, probe_row in rows:
+            indices = table.buckets.get(key) if key is not None else None
+            if not indices:
+                if keep_probe:
+                    yield (lead, position), probe_row
+                continue
+            for index in indices:
+                table.matched[index] = 1
+                order = (0, position) if probe_leads else (0, table.positions[index])
+                yield order, merge(table.rows[index], probe_row)
+        if keep_build:
+            for position, row in table.unmatched():
+                yield (other, position), row
+
+    def keyed(rows: Iterable[Tuple[int, Row]], fields: Sequence[str], keep: bool) -> Iterator[Tuple[Key, int, Row]]:
+        for position, row in rows:
+            key = row_key(row, fields)
+            if key is not None or keep:
+                yield key, position, row
+
+    table = HashTable()
+    build_iterator = keyed(enumerate(build_rows), build_fields, keep_build)
+    for key, position, row in build_iterator:
+        table.add(key, row, position)
+        if memory_limit and table.size > memory_limit:
+            break
+    else:
+        log.debug(f"Built hash table of {len(table.rows)} rows ({table.size} bytes)")
+        joined = probe(table, keyed(enumerate(probe_rows), probe_fields, keep_probe))
+        if not probe_leads:
+            # Matches come in the order of the probe side, put them back
+            # in the order of the build side (sorted is stable)
+            joined = sorted(joined, key=itemgetter(0))
+        for _, row in joined:
+            yield row
+        return
+
+    log.info(f"Hash join build side exceeds {memory_limit} bytes, spilling to {partitions} partitions")
+    directory = settings.DELVE_JOIN_SPILL_DIRECTORY or None
+    build_partitions = Partitions(partitions, directory)
+    probe_partitions = Partitions(partitions, directory)
+    output = Partitions(partitions, directory)
+    try:
+        for key, position, row in zip(table.keys, table.positions, table.rows):
+            build_partitions.add(key, position, row)
+        del table
+        for key, position, row in build_iterator:
+            build_partitions.add(key, position, row)
+        for key, position, row in keyed(enumerate(probe_rows), probe_fields, keep_probe):
+            probe_partitions.add(key, position, row)
+        for partition in range(partitions):
+            table = HashTable()
+            for key, position, row in build_partitions.read(partition):
+                table.add(key, row, position)
+            for record in sorted(probe(table, probe_partitions.read(partition)), key=itemgetter(0)):
+                output.write(partition, record)
+            del table
+        # Every leading row and its matches are in a single partition
+        for _, row in heapq.merge(*(output.read(partition) for partition in range(partitions)), key=itemgetter(0)):
+            yield row
+    finally:
+        build_partitions.close()
+        probe_partitions.close()
+        output.close()
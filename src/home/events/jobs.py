@@ -0,0 +1,249 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+import json
+import zlib
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.db.models.query import QuerySet
+from django.http import HttpRequest
+from django.utils import timezone
+
+from django_q.tasks import async_task
+
+from .models import (
+    Query,
+    QueryJob,
+    QueryJobPage,
+)
+from .planner import StageHook, compile_query
+from .profiling import count_rows, materialize
+from .util import resolve, ResultSet
+from . import table_store
+
+log = logging.getLogger(__name__)
+
+
+class QueryCancelled(Exception):
+    """
+    Raised between stages when the QueryJob being run was cancelled.
+    """
+
+
+class JobJSONEncoder(DjangoJSONEncoder):
+    """
+    Encodes what DjangoJSONEncoder can (datetimes, UUIDs, Decimals, etc.)
+    and falls back to str() for everything else.
+    """
+    def default(self, o):
+        try:
+            return super().default(o)
+        except TypeError:
+            return str(o)
+
+
+def encode_page(rows: List[Any]) -> bytes:
+    return zlib.compress(
+        json.dumps(rows, cls=JobJSONEncoder, separators=(",", ":")).encode("utf-8")
+    )
+
+
+def decode_page(data: bytes) -> List[Any]:
+    return json.loads(zlib.decompress(bytes(data)).decode("utf-8"))
+
+
+def as_rows(results: Any) -> List[Any]:
+    """
+    Return the (resolved) results of a query as a list of rows.
+    """
+    if isinstance(results, list):
+        return results
+    if results is None:
+        return []
+    return [results]
+
+
+def preview(events: Any, size: int) -> List[Any]:
+    """
+    Return the first size rows of the output of a stage, JSON encoded.
+    """
+    if isinstance(events, QuerySet):
+        rows = as_rows(resolve(events[:size] if not events.query.is_sliced else list(events)[:size]))
+    elif isinstance(events, (list, tuple, ResultSet)):
+        rows = as_rows(resolve(list(events[:size])))
+    else:
+        rows = as_rows(resolve(events))
+    return json.loads(json.dumps(rows[:size], cls=JobJSONEncoder))
+
+
+class JobTracker(StageHook):
+    """
+    Reports the progress of a running QueryJob after every stage (stages
+    done, rows output by the latest stage and a preview of those rows) and
+    stops the query between stages once the job has been cancelled.
+    """
+    def __init__(self, job: QueryJob) -> None:
+        self.job = job
+        self.error: Optional[str] = None
+
+    def run_stage(self, text: str, function: Callable[[], Any]) -> Any:
+        jobs = QueryJob.objects.filter(pk=self.job.pk, status=QueryJob.RUNNING)
+        if not jobs.update(current_stage=text.strip()):
+            self.error = "Cancelled"
+            raise QueryCancelled(f"Query job {self.job.pk} was cancelled.")
+        try:
+            events = materialize(function())
+        except (Exception, SystemExit) as exception:
+            self.error = str(exception)
+            raise
+        jobs.update(
+            stages_done=F("stages_done") + 1,
+            rows=count_rows(events),
+            partial_results=preview(events, settings.DELVE_QUERY_JOB_PREVIEW_SIZE),
+        )
+        return events
+
+    def fail(self, exception: BaseException) -> None:
+        # ie. the governor, which runs outside of this hook, aborted the query
+        if self.error is None:
+            self.error = str(exception)
+
+
+def submit(request: HttpRequest, query: Query, context: Optional[Dict[str, Any]] = None) -> QueryJob:
+    """
+    Create a QueryJob for query and enqueue it on the Q cluster.
+
+    Args:
+        request (HttpRequest): The request submitting the query.
+        query (Query): The query to resolve.
+        context (Optional[Dict[str, Any]]): The local context.
+
+    Returns:
+        QueryJob: The queued job.
+
+    Raises:
+        ValueError: If the query contains an unrecognized search command.
+    """
+    stages = compile_query(query.text)
+    job = QueryJob.objects.create(
+        name=query.name,
+        text=query.text,
+        context=context or {},
+        stages_total=sum(not stage.synthetic for stage in stages),
+        page_size=settings.DELVE_QUERY_JOB_PAGE_SIZE,
+        user=request.user,
+    )
+    log.debug(f"Enqueuing query job {job.pk}")
+    async_task(
+        "events.jobs.run",
+        str(job.pk),
+        task_name=f"query-job-{job.pk}",
+        hook="events.jobs.task_finished",
+    )
+    return job
+
+
+def run(job_id: str) -> None:
+    """
+    Resolve the query of a QueryJob and store its results in pages.
+    This is the task executed by the Q cluster.
+    """
+    started = QueryJob.objects.filter(pk=job_id, status=QueryJob.QUEUED).update(
+        status=QueryJob.RUNNING,
+        started=timezone.now(),
+    )
+    if not started:
+        log.info(f"Query job {job_id} is no longer queued, skipping")
+        return
+    job = QueryJob.objects.select_related("user").get(pk=job_id)
+    request = HttpRequest()
+    request.user = job.user
+    query = Query(name=job.name, text=job.text, user=job.user)
+    tracker = JobTracker(job)
+    try:
+        # The results are read from the database by the web server, which
+        # cannot read the rows of tables kept server-side by this process
+        with table_store.disabled():
+            results = query.resolve(request, context=job.context, hooks=[tracker])
+    except Exception as exception:
+        log.exception(f"Query job {job_id} failed")
+        tracker.error = str(exception)
+    running = QueryJob.objects.filter(pk=job_id, status=QueryJob.RUNNING)
+    if tracker.error is not None:
+        running.update(
+            status=QueryJob.FAILED,
+            error=tracker.error,
+            finished=timezone.now(),
+        )
+        return
+    rows = as_rows(results)
+    QueryJobPage.objects.bulk_create(
+        QueryJobPage(
+            job=job,
+            number=number,
+            data=encode_page(rows[offset:offset + job.page_size]),
+        )
+        for number, offset in enumerate(range(0, len(rows), job.page_size), start=1)
+    )
+    finished = running.update(
+        status=QueryJob.FINISHED,
+        result_count=len(rows),
+        current_stage="",
+        finished=timezone.now(),
+    )
+    if not finished:
+        # Cancelled after the last stage, the results are not wanted
+        QueryJobPage.objects.filter(job_id=job_id).delete()
+
+
+def task_finished(task) -> None:
+    """
+    Called by the Q cluster after run, marks jobs whose task failed
+    (ie. timed out or crashed the worker) as failed.
+    """
+    if task.success or not task.args:
+        return
+    QueryJob.objects.filter(
+        pk=task.args[0],
+        status__in=(QueryJob.QUEUED, QueryJob.RUNNING),
+    ).update(
+        status=QueryJob.FAILED,
+        error=str(task.result),
+        finished=timezone.now(),
+    )
+
+
+def cancel(job: QueryJob) -> bool:
+    """
+    Cancel a job which has not finished. A running job stops before its
+    next stage.
+
+    Returns:
+        bool: False if the job had already finished.
+    """
+    return bool(
+        QueryJob.objects.filter(
+            pk=job.pk,
+            status__in=(QueryJob.QUEUED, QueryJob.RUNNING),
+        ).update(
+            status=QueryJob.CANCELLED,
+            finished=timezone.now(),
+        )
+    )
+
+
+def get_page(job: QueryJob, number: int) -> Optional[List[Any]]:
+    """
+    Return page number (starting from 1) of the results of a finished job,
+    or None if there is no such page.
+    """
+    try:
+        page = job.result_pages.get(number=number)
+    except QueryJobPage.DoesNotExist:
+        return None
+    return decode_page(page.data)
@@ -0,0 +1,100 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.http import HttpRequest
+
+from events.models import Query
+
+DEFAULT_QUERY_TEXT = 'search index=default | head -n 100'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the throughput of Query.resolve when queries run concurrently in threads'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--text',
+            default=DEFAULT_QUERY_TEXT,
+            help='The query text to benchmark',
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=200,
+            help='The number of queries to resolve per measurement',
+        )
+        parser.add_argument(
+            '--threads',
+            default='1,2,4,8',
+            help='Comma-separated numbers of threads to measure',
+        )
+        parser.add_argument(
+            '--username',
+            default=None,
+            help='The user to run the queries as, default the first superuser',
+        )
+
+    def handle(self, *args, **options):
+        user_model = get_user_model()
+        if options['username']:
+            user = user_model.objects.filter(username=options['username']).first()
+        else:
+            user = user_model.objects.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError('No user to run the queries as, pass --username')
+        self.request = HttpRequest()
+        self.request.user = user
+        self.text = options['text']
+        queries = options['queries']
+
+        self.stdout.write('Starting concurrent query benchmark...\n')
+        results = {}
+        for threads in (int(threads) for threads in options['threads'].split(',')):
+            results[threads] = self._measure(threads, queries)
+        self._print_results(results, queries)
+
+    def _resolve(self, number):
+        """
+        Resolve the query under test, and every other time a failing query
+        whose captured stderr must only contain its own error message.
+
+        Returns:
+            bool: Whether the captured output belonged to this query.
+        """
+        try:
+            if number % 2:
+                Query(name='benchmark', text=self.text, user=self.request.user).resolve(self.request)
+                return True
+            results = Query(
+                name='benchmark',
+                text=f'{self.text} | head -n invalid-{number}',
+                user=self.request.user,
+            ).resolve(self.request)
+            stderr = results[0]['stderr']
+            return f"'invalid-{number}'" in stderr and stderr.count('invalid-') == 1
+        finally:
+            connections.close_all()
+
+    def _measure(self, threads, queries):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            isolated = list(executor.map(self._resolve, range(queries)))
+        return time.perf_counter() - start, isolated.count(False)
+
+    def _print_results(self, results, queries):
+        self.stdout.write('\n=== BENCHMARK RESULTS ===\n')
+        baseline = None
+        for threads, (total, clobbered) in results.items():
+            baseline = baseline or total
+            self.stdout.write(
+                f'{threads} thread(s): {total:.4f} seconds for {queries} queries '
+                f'({queries / total:.1f} queries/second, {baseline / total:.2f}x, '
+                f'{clobbered} clobbered captures)'
+            )
@@ -0,0 +1,105 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+import time
+import shlex
+import statistics
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+from django.conf import settings
+
+from jinja2 import Environment
+
+from events.planner import (
+    compile_query,
+    render_stage,
+    split_search_commands,
+)
+
+DEFAULT_QUERY_TEXT = (
+    'search index={{ index }} --last-day '
+    '| explode extracted_fields '
+    '| filter status=500 '
+    '| rex -f text "(?P<method>GET||POST)" '
+    '| sort -d created '
+    '| head -n 100'
+)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the per-query overhead of Query.resolve'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--text',
+            default=DEFAULT_QUERY_TEXT,
+            help='The query text to benchmark',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=1000,
+            help='The number of times to prepare the query per measurement',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='The number of measurements to take',
+        )
+
+    def handle(self, *args, **options):
+        text = options['text']
+        iterations = options['iterations']
+        repeat = options['repeat']
+        context = {'index': 'default'}
+
+        self.stdout.write('Starting query planning benchmark...\n')
+        results = {
+            'uncached': self._measure(self._prepare_uncached, text, context, iterations, repeat),
+            'cached': self._measure(self._prepare_cached, text, context, iterations, repeat),
+        }
+        self._print_results(results, iterations)
+
+    def _measure(self, prepare, text, context, iterations, repeat):
+        timings = []
+        for _ in range(repeat):
+            compile_query.cache_clear()
+            start = time.perf_counter()
+            for _ in range(iterations):
+                prepare(text, context)
+            timings.append(time.perf_counter() - start)
+        return statistics.mean(timings)
+
+    def _prepare_uncached(self, text, context):
+        """Prepare every stage the way Query.resolve did before plans were cached."""
+        environment = Environment()
+        environment.trim_blocks = True
+        environment.lstrip_blocks = True
+        ret = []
+        for search_command in split_search_commands(text):
+            funcname = shlex.split(search_command, comments=True)[0]
+            operation = import_string(settings.DELVE_SEARCH_COMMANDS[funcname])
+            rendered = environment.from_string(search_command).render(context)
+            ret.append((operation, shlex.split(rendered, comments=True)))
+        return ret
+
+    def _prepare_cached(self, text, context):
+        return [
+            (stage.operation, render_stage(stage, context))
+            for stage in compile_query(text)
+            if not stage.synthetic
+        ]
+
+    def _print_results(self, results, iterations):
+        self.stdout.write('\n=== BENCHMARK RESULTS ===\n')
+        for name, total in results.items():
+            self.stdout.write(
+                f'{name}: {total:.4f} seconds for {iterations} queries '
+                f'({total / iterations * 1000000:.1f} microseconds/query)'
+            )
+        self.stdout.write(
+            f'\nSpeedup: {results["uncached"] / results["cached"]:.1f}x'
+        )
@@ -0,0 +1,92 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+import time
+import random
+
+from django.core.management.base import BaseCommand
+
+from events.search_commands.stats import stats
+
+# Pairs of equivalent invocations of stats, sort and groupby first
+COMPARISONS = {
+    'avg by group': (
+        'stats avg value --by group',
+        'stats aggregate avg=avg(value) --by group',
+    ),
+    'count by group': (
+        'stats count --by group',
+        'stats aggregate count --by group',
+    ),
+    'avg by group (reduce)': (
+        'stats avg value --by group',
+        'stats aggregate avg(value) --by group --reduce',
+    ),
+    'count, avg, max and p95 by group (reduce)': (
+        'stats avg value --by group',
+        'stats aggregate count avg(value) max(value) p95(value) --by group --reduce',
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the one pass hash aggregation of stats aggregate against sorting and grouping'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=1000000,
+            help='The number of rows to aggregate',
+        )
+        parser.add_argument(
+            '--groups',
+            type=int,
+            default=100,
+            help='The number of distinct values of the field grouped by',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=3,
+            help='The number of times to run each invocation, the fastest run is reported',
+        )
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        groups = options['groups']
+        iterations = options['iterations']
+        generator = random.Random(0)
+        self.stdout.write(f'Generating {rows} rows in {groups} groups...\n')
+        events = [
+            {'id': number, 'group': f'group{generator.randrange(groups)}', 'value': generator.random() * 1000}
+            for number in range(rows)
+        ]
+
+        self.stdout.write('Starting stats benchmark...\n')
+        results = {}
+        for name, (baseline, candidate) in COMPARISONS.items():
+            results[name] = (
+                self._measure(events, baseline, iterations),
+                self._measure(events, candidate, iterations),
+            )
+        self._print_results(results, rows)
+
+    def _measure(self, events, text, iterations):
+        argv = text.split()
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            stats(None, events, list(argv), {})
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    def _print_results(self, results, rows):
+        self.stdout.write('\n=== BENCHMARK RESULTS ===\n')
+        for name, (baseline, candidate) in results.items():
+            baseline_text, candidate_text = COMPARISONS[name]
+            self.stdout.write(f'{name} ({rows} rows):')
+            self.stdout.write(f'  {baseline_text}: {baseline:.4f} seconds')
+            self.stdout.write(f'  {candidate_text}: {candidate:.4f} seconds')
+            self.stdout.write(f'  Speedup: {baseline / candidate:.2f}x\n')
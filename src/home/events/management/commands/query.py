@@ -68,6 +68,11 @@ class Command(BaseCommand):
             default="table",
             help="The output format (default pprint)",
         )
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            help="Profile each stage of the query and print the profile after the results",
+        )
 
     def handle(self, *args, **options):
         log = logging.getLogger(__name__)
@@ -113,11 +118,16 @@ class Command(BaseCommand):
             data={
                 "text": text,
                 "name": name,
+                "profile": options["profile"],
             }
         )
         log.info(f"Received response: {response}")
         response_json = response.json()
         log.info(f"Found response json: {response_json}")
+        profile = None
+        if options["profile"] and isinstance(response_json, dict) and "profile" in response_json:
+            profile = response_json["profile"]
+            response_json = response_json["results"]
         if format == "table":
             column_names = set()
             if isinstance(response_json, list):
@@ -143,4 +153,38 @@ class Command(BaseCommand):
             console.print(table)
             # print(json.dumps(response_json, indent=4))
         elif format == "json":
+            if profile is not None:
+                response_json = {
+                    "results": response_json,
+                    "profile": profile,
+                }
             print(json.dumps(response_json, indent=4))
+        if profile is not None and format == "table":
+            self.print_profile(profile)
+
+    def print_profile(self, profile):
+        from rich.table import Table
+        from rich.console import Console
+        table = Table(
+            "stage",
+            "wall (ms)",
+            "cpu (ms)",
+            "rows in",
+            "rows out",
+            "sql queries",
+            "sql (ms)",
+            "peak memory (KiB)",
+            title=f"Profile (total {profile['total_time'] * 1000:.1f} ms)",
+        )
+        for stage in profile["stages"]:
+            table.add_row(
+                stage["stage"] if stage["error"] is None else f"{stage['stage']} ({stage['error']})",
+                f"{stage['wall_time'] * 1000:.1f}",
+                f"{stage['cpu_time'] * 1000:.1f}",
+                str(stage["rows_in"]),
+                str(stage["rows_out"]),
+                str(stage["sql_queries"]),
+                f"{stage['sql_time'] * 1000:.1f}",
+                f"{stage['peak_memory'] / 1024:.1f}",
+            )
+        Console().print(table)
@@ -0,0 +1,56 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+# Generated by Django 5.2.18 on 2026-10-18 03:36
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0005_event_index_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('started', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('name', models.CharField(blank=True, max_length=1024, null=True)),
+                ('text', models.TextField()),
+                ('context', models.JSONField(blank=True, default=dict, null=True)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('finished', 'Finished'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], db_index=True, default='queued', max_length=16)),
+                ('stages_total', models.PositiveIntegerField(default=0)),
+                ('stages_done', models.PositiveIntegerField(default=0)),
+                ('current_stage', models.TextField(blank=True, default='')),
+                ('rows', models.PositiveIntegerField(blank=True, null=True)),
+                ('partial_results', models.JSONField(blank=True, default=list)),
+                ('result_count', models.PositiveIntegerField(blank=True, null=True)),
+                ('page_size', models.PositiveIntegerField(default=1000)),
+                ('error', models.TextField(blank=True, default='')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='query_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QueryJobPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='result_pages', to='events.queryjob')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('job', 'number'), name='events_queryjobpage_job_number')],
+            },
+        ),
+    ]
@@ -2,13 +2,10 @@
 # This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
 # See the LICENSE file in the root of this repository for details.
 
-import re
-import sys
-import shlex
 import logging
+from functools import partial
 from uuid import uuid4
 from uuid import UUID as UUID
-from io import StringIO
 
 from django.db import models
 from django.conf import settings
@@ -18,11 +15,14 @@ from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.utils.module_loading import import_string
 
-from jinja2 import Environment
 from uuid_utils import uuid7
 
 from .validators import JsonObjectValidator
-from events.util import resolve
+from .planner import compile_query, render_stage, apply_stage
+from . import result_cache
+from .governor import QueryGovernor, QueryBudgetExceeded, current_governor
+from .capture import capture
+from events.util import resolve, ResultSet
 
 
 class FileUpload(models.Model):
@@ -151,39 +151,49 @@ class Query(models.Model):
     def get_search_commands(self):
         log = logging.getLogger(__name__)
         log.debug(f"Found self.text: {self.text}")
-        search_commands = re.split(r'(?<!\|)\|(?!\|)', self.text)
-        search_commands = [search_command.replace('||', '|') for search_command in search_commands]
-        log.debug(f"Found search_commands: {search_commands}")
-        ret = []
-        for search_command in search_commands:
-            log.debug(f"Found search_command: {search_command}")
-            argv = shlex.split(search_command, comments=True)
-            log.debug(f"Found argv: {argv}")
-            funcname = argv[0]
-            log.debug(f"Found funcname: {funcname}")
-            if funcname not in settings.DELVE_SEARCH_COMMANDS:
-                raise ValueError(f"{funcname} is not a recognized search command.")
-            funcpath = settings.DELVE_SEARCH_COMMANDS[funcname]
-            log.debug(f"Found funcpath: {funcpath}")
-            func = import_string(funcpath)
-            log.debug(f"Found func: {func}")
-            ret.append((search_command, func))
+        ret = [(stage.text, stage.operation) for stage in compile_query(self.text) if not stage.synthetic]
+        log.debug(f"Found search_commands: {ret}")
         return ret
     
-    def resolve(self, request, context=None, events=None):
+    def resolve(self, request, context=None, events=None, streaming=None, profile=None, hooks=None):
+        """
+        Execute the query and return the resulting events.
+
+        If streaming is True (default settings.DELVE_STREAMING_PIPELINES),
+        search commands which declare themselves as streaming receive a
+        lazy EventStream instead of a materialized result set, so only
+        blocking search commands (sort, stats, transpose, etc.) hold the
+        full result set in memory.
+
+        While the result set is still a QuerySet, search commands which
+        support it (filter, sort, head) are pushed down into the QuerySet
+        so the database does the work (see events.planner.push_down).
+
+        If profile is an events.profiling.QueryProfile, the wall time, CPU
+        time, row counts, SQL queries and peak memory of each stage are
+        recorded on it. More generally, every events.planner.StageHook in
+        hooks (profile is simply appended to them) wraps the execution of
+        each stage, the first hook being the outermost.
+
+        Unless it is nested in another query, the query is governed by the
+        budget of request.user (see events.governor) and aborted with an
+        error describing the exceeded budget and the offending stage.
+
+        If settings.DELVE_RESULT_CACHE is enabled, the results of queries
+        which only use cacheable search commands are shared between
+        processes through the cache (see events.result_cache).
+        """
         log = logging.getLogger(__name__)
+        if streaming is None:
+            streaming = settings.DELVE_STREAMING_PIPELINES
         # I need this so the import for events.models.Event happens after initialization
-        search_commands = self.get_search_commands()
-        log.debug(f"Found search_commands: {search_commands}")
+        stages = compile_query(self.text)
+        log.debug(f"Found stages: {stages}")
         if events is not None:
             matching_events = events
         else:
             matching_events = []
         log.debug(f"Provisioning jinja2 context")
-        environment = Environment()
-        environment.trim_blocks = True
-        environment.lstrip_blocks = True
-        environment.strip_trailing_newlines = True
         try:
             environment_globals = request.user.global_context.context
         except AttributeError:
@@ -202,56 +212,225 @@ class Query(models.Model):
         else:
             raise ValueError(f"Unsupported type for context")
 
-        # We have to patch sys.stdout and sys.stderr, to 
-        # catch any output from exceptions
-        for search_command, operation in search_commands:
-            log.debug(f"Found search_command: {search_command}")
-            search_command = environment.from_string(search_command, globals=environment_globals).render(context)
-            log.debug(f"Rendered search_command: {search_command}")
-            argv = shlex.split(search_command, comments=True)
-            log.debug("swapping stdout and stderr")
-            orig_stderr = sys.stderr
-            orig_stdout = sys.stdout
-            sys.stderr = StringIO()
-            sys.stdout = StringIO()
+        hooks = list(hooks or [])
+        if profile is not None:
+            hooks.append(profile)
+
+        # Only complete, unobserved executions are served from the cache
+        cache_plan = None
+        if events is None and not hooks:
+            cache_plan = result_cache.plan(stages, request, context, environment_globals)
+            if cache_plan is not None:
+                cached = result_cache.lookup(cache_plan)
+                if cached is not None:
+                    return cached
+
+        # Nested queries (ie. run_query) share the budget of the outer query
+        if current_governor.get() is None:
+            governor = QueryGovernor.for_user(getattr(request, "user", None))
+            if governor is not None:
+                hooks.insert(0, governor)
+
+        for hook in hooks:
+            hook.start(matching_events)
+
+        # We have to capture stdout and stderr, to catch any output
+        # from exceptions. The capture only sees this thread's output,
+        # so queries can be resolved concurrently.
+        synthetic = []
+        for stage in stages:
+            if stage.synthetic:
+                # Applied to the input of the next stage, as part of it
+                synthetic.append(stage)
+                continue
+            operation = stage.operation
+            log.debug(f"Found search_command: {stage.text}")
+            argv = render_stage(stage, context, environment_globals)
+            log.debug(f"Rendered argv: {argv}")
             log.debug(f"Checking for search_command validators")
             if settings.DELVE_STRICT_VALIDATION:
                 if operation.input_validators is not None:
                     log.debug(f"Found Input validators: {operation.input_validators}")
                     for validator in operation.input_validators:
                         log.debug(f"Verifying validator {validator} against events.")
-                        validator(events=matching_events)
+                        validator(events=resolve(matching_events) if isinstance(matching_events, ResultSet) else matching_events)
                         log.debug(f"Successfully validated against: {validator}")
                     log.debug(f"Successfully tested all validators for {operation}")
-            try:
-                log.debug(f"Attempting to apply operation: {operation}")
-                matching_events = operation(request, matching_events, argv, context)
-                log.debug(f"Successfully called operation: {operation}")
-            except (Exception, SystemExit) as exception:
-                logging.exception("An unhandled exception occurred.")
+            with capture() as captured:
                 try:
-                    sys.stderr.seek(0)
-                    sys.stdout.seek(0)
-                except:
-                    log.exception("An Unhandled exception occurred.")
-                return [
-                    {
-                        "stdout": sys.stdout.read(),
-                        "stderr": sys.stderr.read(),
-                        "exception": str(exception),
-                        "matching_events": events,
-                    },
-                ]
-            finally:
-                log.debug("replacing original stdout and stderr")
-                sys.stderr = orig_stderr
-                sys.stdout = orig_stdout
+                    function = partial(apply_stage, request, operation, matching_events, argv, context, streaming, stage.fields, tuple(synthetic))
+                    synthetic = []
+                    for hook in reversed(hooks):
+                        function = partial(hook.run_stage, stage.text, function)
+                    matching_events = function()
+                except (Exception, SystemExit) as exception:
+                    logging.exception("An unhandled exception occurred.")
+                    for hook in hooks:
+                        hook.fail(exception)
+                    for hook in hooks:
+                        hook.stop()
+                    return self._error_results(
+                        exception,
+                        events,
+                        captured.stdout.getvalue(),
+                        captured.stderr.getvalue(),
+                    )
         # Resolve any QuerySets, generators, etc.
         log.debug(f"Attempting to resolve QuerySets, generators, etc.")
-        matching_events = resolve(matching_events)
+        try:
+            matching_events = resolve(matching_events)
+        except QueryBudgetExceeded as exception:
+            log.warning(f"Aborted query: {exception}")
+            for hook in hooks:
+                hook.fail(exception)
+            return self._error_results(exception, events)
+        finally:
+            for hook in hooks:
+                hook.stop()
         log.debug(f"Finished resolution")
+        if cache_plan is not None and matching_events is not None:
+            result_cache.store(cache_plan, matching_events)
         return matching_events
 
+    @staticmethod
+    def _error_results(exception, events, stdout="", stderr=""):
+        """
+        Build the results returned in place of events when a stage fails.
+        Queries aborted by their governor also describe the exceeded budget.
+        """
+        ret = {
+            "stdout": stdout,
+            "stderr": stderr,
+            "exception": str(exception),
+            "matching_events": events,
+        }
+        if isinstance(exception, QueryBudgetExceeded):
+            ret["budget"] = exception.as_dict()
+        return [ret]
+
+
+class QueryJob(models.Model):
+    """
+    A Query submitted to be resolved asynchronously by the Q cluster.
+
+    See events.jobs for how jobs are submitted, run and cancelled.
+    """
+    QUEUED = "queued"
+    RUNNING = "running"
+    FINISHED = "finished"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    STATUS_CHOICES = (
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (FINISHED, "Finished"),
+        (FAILED, "Failed"),
+        (CANCELLED, "Cancelled"),
+    )
+
+    id = models.UUIDField(
+        default=uuid4,
+        primary_key=True,
+        editable=False,
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+    )
+    modified = models.DateTimeField(
+        auto_now=True,
+    )
+    started = models.DateTimeField(
+        blank=True,
+        null=True,
+    )
+    finished = models.DateTimeField(
+        blank=True,
+        null=True,
+    )
+
+    name = models.CharField(
+        max_length=1024,
+        blank=True,
+        null=True,
+    )
+    text = models.TextField()
+    context = models.JSONField(
+        default=dict,
+        blank=True,
+        null=True,
+    )
+    status = models.CharField(
+        max_length=16,
+        choices=STATUS_CHOICES,
+        default=QUEUED,
+        db_index=True,
+    )
+    stages_total = models.PositiveIntegerField(
+        default=0,
+    )
+    stages_done = models.PositiveIntegerField(
+        default=0,
+    )
+    current_stage = models.TextField(
+        blank=True,
+        default="",
+    )
+    rows = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+    )
+    partial_results = models.JSONField(
+        default=list,
+        blank=True,
+    )
+    result_count = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+    )
+    page_size = models.PositiveIntegerField(
+        default=1000,
+    )
+    error = models.TextField(
+        blank=True,
+        default="",
+    )
+
+    user = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.CASCADE,
+        related_name="query_jobs",
+    )
+
+    @property
+    def pages(self):
+        if not self.result_count:
+            return 0
+        return -(-self.result_count // self.page_size)
+
+    @property
+    def done(self):
+        return self.status in (self.FINISHED, self.FAILED, self.CANCELLED)
+
+
+class QueryJobPage(models.Model):
+    """
+    One page of the results of a finished QueryJob, stored as
+    zlib compressed JSON.
+    """
+    job = models.ForeignKey(
+        QueryJob,
+        on_delete=models.CASCADE,
+        related_name="result_pages",
+    )
+    number = models.PositiveIntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["job", "number"], name="events_queryjobpage_job_number"),
+        ]
+
+
 def generate_uuid7():
     """Generate a UUID v7 that's compatible with Django's UUIDField"""
     return UUID(str(uuid7()))
@@ -365,3 +544,10 @@ class Event(BaseEvent):
         on_delete=models.CASCADE,
         related_name="events",
     )
+
+    class Meta:
+        indexes = [
+            # Lets the query result cache find the newest event in an
+            # index (its high water mark) without scanning the index.
+            models.Index(fields=["index", "id"], name="events_event_index_id"),
+        ]
@@ -0,0 +1,609 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+import re
+import json
+import shlex
+import logging
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.db import NotSupportedError, connections
+from django.db.models import CharField, F, Field, Func, JSONField
+from django.db.models.fields.json import KeyTransform, compile_json_path
+from django.db.models.query import ModelIterable, QuerySet
+from django.utils.module_loading import import_string
+
+from jinja2 import Environment, Template
+
+from events.util import stream
+from events.capture import capture
+
+# A single, shared jinja2 environment. Templates compiled from it are
+# immutable and safe to render concurrently from multiple threads.
+environment = Environment()
+environment.trim_blocks = True
+environment.lstrip_blocks = True
+
+TEMPLATE_MARKERS = (
+    environment.block_start_string,
+    environment.variable_start_string,
+    environment.comment_start_string,
+)
+
+
+class Stage(NamedTuple):
+    """
+    One compiled stage of a query pipeline.
+
+    Attributes:
+        text (str): The text of the search command as written in the query.
+        operation (Callable): The resolved search command function.
+        template (Optional[Template]): The compiled jinja2 template, or None
+            if the text contains no template syntax.
+        argv (Optional[Tuple[str, ...]]): The pre-split arguments for stages
+            without template syntax, None for templated stages.
+        fields (Optional[FrozenSet[str]]): The fields which this stage and the
+            stages after it read from the input of this stage, None if they
+            may read any field (see plan_projections).
+        synthetic (bool): Whether the planner added this stage, which is not
+            written in the query (see propagate_limits). Synthetic stages run
+            as part of the stage after them, so they are left out of
+            profiles, job progress and the search commands of a query.
+    """
+    text: str
+    operation: Callable
+    template: Optional[Template]
+    argv: Optional[Tuple[str, ...]]
+    fields: Optional[FrozenSet[str]] = None
+    synthetic: bool = False
+
+
+class FieldUsage(NamedTuple):
+    """
+    The fields a search command reads from the events it receives, as
+    returned by the fields function passed to the search_command decorator.
+
+    Attributes:
+        fields (Iterable[str]): The fields read, paths into nested fields
+            written as ie. extracted_fields__status.
+        projects (bool): Whether the events returned only depend on these
+            fields (ie. select or stats aggregate --reduce) rather than
+            being the events received, with some fields changed.
+    """
+    fields: Iterable[str]
+    projects: bool = False
+
+
+def split_search_commands(text: str) -> List[str]:
+    """
+    Split the text of a query into the text of its search commands.
+
+    A single pipe separates search commands while a double pipe is
+    an escaped, literal pipe.
+
+    Args:
+        text (str): The text of the query.
+
+    Returns:
+        List[str]: The text of each search command.
+    """
+    search_commands = re.split(r'(?<!\|)\|(?!\|)', text)
+    return [search_command.replace('||', '|') for search_command in search_commands]
+
+
+def has_template_syntax(text: str) -> bool:
+    """
+    Return True if text contains any jinja2 block, variable or comment markers.
+    """
+    return any(marker in text for marker in TEMPLATE_MARKERS)
+
+
+@lru_cache(maxsize=settings.DELVE_QUERY_PLAN_CACHE_SIZE)
+def compile_query(text: str) -> Tuple[Stage, ...]:
+    """
+    Compile the text of a query into a tuple of Stages.
+
+    Results are kept in a process-wide, bounded LRU cache keyed on the
+    text of the query so repeated executions of the same query skip
+    parsing, importing of search commands and template compilation.
+
+    Args:
+        text (str): The text of the query.
+
+    Returns:
+        Tuple[Stage, ...]: The compiled stages, in order.
+
+    Raises:
+        ValueError: If a search command is not recognized.
+    """
+    log = logging.getLogger(__name__)
+    log.debug(f"Compiling query text: {text}")
+    ret = []
+    for search_command in split_search_commands(text):
+        log.debug(f"Found search_command: {search_command}")
+        argv = shlex.split(search_command, comments=True)
+        log.debug(f"Found argv: {argv}")
+        funcname = argv[0]
+        if funcname not in settings.DELVE_SEARCH_COMMANDS:
+            raise ValueError(f"{funcname} is not a recognized search command.")
+        funcpath = settings.DELVE_SEARCH_COMMANDS[funcname]
+        log.debug(f"Found funcpath: {funcpath}")
+        operation = import_string(funcpath)
+        if has_template_syntax(search_command):
+            log.debug(f"Compiling template for: {search_command}")
+            ret.append(
+                Stage(search_command, operation, environment.from_string(search_command), None)
+            )
+        else:
+            ret.append(
+                Stage(search_command, operation, None, tuple(argv))
+            )
+    return tuple(plan_projections(fold_limits(propagate_limits(ret))))
+
+
+def _parse_literal(stage: Stage) -> Optional[Any]:
+    """
+    Parse the arguments of a stage without template syntax, or return
+    None if it has some or they are invalid (the error is reported when
+    the stage runs).
+    """
+    if stage.argv is None:
+        return None
+    with capture():
+        try:
+            return stage.operation.parser.parse_args(list(stage.argv[1:]))
+        except SystemExit:
+            return None
+
+
+def propagate_limits(stages: List[Stage]) -> List[Stage]:
+    """
+    Copy each literal head in front of the stages before it which return
+    one event per event, in order (see the one_to_one argument of the
+    search_command decorator), so that ie. in search | rex ... | head the
+    limit reaches search (and is pushed down into its QuerySet) and rex
+    only runs on the events which are returned. head still runs where
+    it was written, the copies are marked as synthetic.
+    """
+    ret = list(stages)
+    index = len(ret) - 1
+    while index > 0:
+        stage = ret[index]
+        start = index
+        while start > 0 and getattr(ret[start - 1].operation, "one_to_one", False):
+            start -= 1
+        if (
+            start == index
+            or start == 0
+            or stage.argv is None
+            or stage.argv[0] != "head"
+            or ret[start - 1].argv is not None and ret[start - 1].argv[0] == "head"
+        ):
+            index -= 1
+            continue
+        args = _parse_literal(stage)
+        if args is not None and args.number >= 0:
+            ret.insert(start, stage._replace(synthetic=True))
+        index = start - 1
+    return ret
+
+
+def fold_limits(stages: List[Stage]) -> List[Stage]:
+    """
+    Fold head into the stage before it, if that search command accepts a
+    limit (see the limit argument of the search_command decorator), so
+    that ie. sort followed by head only selects the first events with a
+    heap instead of sorting all of them. head still runs afterwards.
+
+    Only stages without template syntax are folded.
+    """
+    ret = list(stages)
+    for index in range(len(ret) - 1):
+        stage, following = ret[index], ret[index + 1]
+        dest = getattr(stage.operation, "limit", None)
+        if dest is None or following.argv is None or following.argv[0] != "head":
+            continue
+        args = _parse_literal(stage)
+        head_args = _parse_literal(following)
+        if args is None or head_args is None or head_args.number < 0:
+            continue
+        limit = head_args.number
+        if getattr(args, dest) is not None:
+            limit = min(limit, getattr(args, dest))
+        ret[index] = stage._replace(argv=(*stage.argv, f"--{dest}", str(limit)))
+    return ret
+
+
+def _field_usage(stage: Stage) -> Optional[FieldUsage]:
+    """
+    Return the fields a stage without template syntax reads, or None if
+    it has some, does not declare them or its arguments are invalid.
+    """
+    fields = getattr(stage.operation, "fields", None)
+    if fields is None:
+        return None
+    args = _parse_literal(stage)
+    if args is None:
+        return None
+    try:
+        return fields(args)
+    except (Exception, SystemExit):
+        return None
+
+
+def plan_projections(stages: List[Stage]) -> List[Stage]:
+    """
+    Record on each stage the fields which it and the stages after it read
+    from its input (see the fields argument of the search_command
+    decorator), so that ie. in search | eval ... | stats aggregate ...
+    --reduce only the columns eval and stats read are loaded from the
+    database, see project.
+
+    Walking back from the last stage (whose events are returned with every
+    field), a stage which projects its events replaces the fields read
+    after it with its own, any other stage adds its own, and a stage which
+    does not declare the fields it reads reads every field.
+    """
+    ret = list(stages)
+    fields: Optional[FrozenSet[str]] = None
+    for index in range(len(ret) - 1, -1, -1):
+        usage = _field_usage(ret[index])
+        if usage is None:
+            fields = None
+        elif usage.projects:
+            fields = frozenset(usage.fields)
+        elif fields is not None:
+            fields = fields.union(usage.fields)
+        ret[index] = ret[index]._replace(fields=fields)
+    return ret
+
+
+def render_stage(stage: Stage, context: Dict[str, Any], environment_globals: Optional[Dict[str, Any]] = None) -> List[str]:
+    """
+    Produce the argv for one execution of a Stage.
+
+    Stages without template syntax skip rendering entirely. A fresh list
+    is always returned because search commands are allowed to mutate argv.
+
+    Args:
+        stage (Stage): The compiled stage.
+        context (Dict[str, Any]): The local context used for rendering.
+        environment_globals (Optional[Dict[str, Any]]): The user's global context.
+            Values in context take precedence.
+
+    Returns:
+        List[str]: The arguments for the search command.
+    """
+    if stage.template is None:
+        return list(stage.argv)
+    rendered = stage.template.render({**(environment_globals or {}), **context})
+    return shlex.split(rendered, comments=True)
+
+
+PUSHABLE_TYPES = {
+    "CharField": (str,),
+    "TextField": (str,),
+    "SlugField": (str,),
+    "EmailField": (str,),
+    "URLField": (str,),
+    "IntegerField": (int, float),
+    "BigIntegerField": (int, float),
+    "SmallIntegerField": (int, float),
+    "PositiveIntegerField": (int, float),
+    "PositiveBigIntegerField": (int, float),
+    "PositiveSmallIntegerField": (int, float),
+    "FloatField": (int, float),
+    "BooleanField": (bool,),
+    "DateTimeField": (datetime,),
+}
+
+# JSON types as named by SQLite's JSON_TYPE and PostgreSQL's jsonb_typeof
+JSON_NUMBER_TYPES = ("integer", "real", "number")
+JSON_STRING_TYPES = ("text", "string")
+JSON_BOOLEAN_TYPES = ("true", "false", "boolean")
+JSON_CONTAINER_TYPES = ("object", "array")
+
+
+class JSONType(Func):
+    """
+    The JSON type of the value at a key path inside a JSONField, or NULL
+    if the key is missing. Only SQLite and PostgreSQL are supported.
+    """
+    output_field = CharField()
+
+    def __init__(self, column: str, keys: List[str]) -> None:
+        self.keys = list(keys)
+        super().__init__(F(column))
+
+    def as_sql(self, compiler, connection, **extra_context):
+        raise NotSupportedError(f"JSONType is not supported on {connection.vendor}")
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        lhs, params = compiler.compile(self.source_expressions[0])
+        return f"JSON_TYPE({lhs}, %s)", (*params, compile_json_path(self.keys))
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        lhs, params = compiler.compile(self.source_expressions[0])
+        return f"JSONB_TYPEOF({lhs} #> %s)", (*params, self.keys)
+
+
+def model_columns(queryset: QuerySet) -> Dict[str, Field]:
+    """
+    Return the concrete fields of the QuerySet's model keyed by the name
+    they have in the dicts produced by QuerySet.values().
+    """
+    return {field.attname: field for field in queryset.model._meta.concrete_fields}
+
+
+def stable_order(queryset: QuerySet) -> QuerySet:
+    """
+    Return queryset ordered by primary key if it has no ordering.
+
+    Without an ORDER BY the database may return rows in any order, ie.
+    that of an index covering the columns it reads, so limiting the
+    QuerySet or narrowing it with .values() could change which events
+    are returned, or their order, compared to reading all of it.
+    """
+    return queryset if queryset.ordered else queryset.order_by("pk")
+
+
+def is_pushable_value(field: Field, value: Any) -> bool:
+    """
+    Return True if comparing value to field in the database gives the same
+    answer as comparing it to the field's value in Python.
+
+    Values of a different type than the column (e.g. the int 2024 against a
+    CharField) never compare equal in Python, but the database would coerce
+    them, so they are not pushable. Naive datetimes are not pushable either
+    because Python refuses to compare them to the aware datetimes Django returns.
+    """
+    types = PUSHABLE_TYPES.get(field.get_internal_type())
+    if types is None:
+        return False
+    if isinstance(value, bool) and bool not in types:
+        return False
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return False
+    return isinstance(value, types)
+
+
+def push_down(operation: Callable, events: Any, argv: List[str]) -> Optional[Any]:
+    """
+    Attempt to fold a search command into the QuerySet produced by the
+    previous stage, so the database does the work instead of Python.
+
+    Search commands opt in by passing a pushdown function to the
+    search_command decorator. The pushdown function receives the QuerySet
+    and a copy of argv and returns a new QuerySet, or None if it cannot
+    guarantee the same results as running the command on the rows.
+    Commands whose output is small (ie. aggregations) may instead return
+    their already evaluated results.
+
+    Args:
+        operation (Callable): The search command about to be applied.
+        events (Any): The output of the previous stage.
+        argv (List[str]): The rendered arguments for the search command.
+
+    Returns:
+        Optional[Any]: The rewritten QuerySet (or evaluated results), or
+            None if the search command must be applied as usual.
+    """
+    log = logging.getLogger(__name__)
+    pushdown = getattr(operation, "pushdown", None)
+    if pushdown is None or not settings.DELVE_QUERY_PUSHDOWN:
+        return None
+    if not isinstance(events, QuerySet) or events._iterable_class is not ModelIterable:
+        return None
+    try:
+        ret = pushdown(events, list(argv))
+    except (Exception, SystemExit):
+        log.debug(f"Unable to push {argv} down into the QuerySet", exc_info=True)
+        return None
+    if ret is not None:
+        log.debug(f"Pushed {argv} down into the QuerySet")
+    return ret
+
+
+# The value of the keys of a JSONField which are missing from a row read by project
+MISSING = object()
+
+
+class ProjectedKeyField(JSONField):
+    """
+    The output field of ProjectedKey, which decodes a key of a JSONField
+    exactly like the JSONField decodes the whole value.
+    """
+    def from_db_value(self, value: Any, expression: Any, connection: Any) -> Any:
+        if value is None:
+            return MISSING
+        if isinstance(value, str):
+            return json.loads(value, cls=self.decoder)
+        return value
+
+
+class ProjectedKey(KeyTransform):
+    """
+    The value of one key of a JSONField, or MISSING if the key (rather
+    than its value) is null.
+
+    Unlike KeyTransform, which on SQLite extracts ie. the string "123" as
+    the number 123, the key is read as JSON on every database.
+    """
+    def __init__(self, key_name: str, column: str, decoder: Any = None) -> None:
+        super().__init__(key_name, column, output_field=ProjectedKeyField(decoder=decoder))
+
+    def as_sqlite(self, compiler: Any, connection: Any) -> Tuple[str, Tuple[Any, ...]]:
+        lhs, params, key_transforms = self.preprocess_lhs(compiler, connection)
+        return f"({lhs} -> %s)", (*params, compile_json_path(key_transforms))
+
+
+def supports_key_projection(connection: Any) -> bool:
+    """
+    Return True if keys of JSONFields can be read as JSON with ProjectedKey
+    (SQLite only has the -> operator from 3.38).
+    """
+    if connection.vendor == "sqlite":
+        return connection.Database.sqlite_version_info >= (3, 38)
+    return connection.vendor in ("postgresql", "mysql")
+
+
+def _nest_keys(rows: Iterable[Dict[str, Any]], keys: List[Tuple[str, str, str]]) -> Iterator[Dict[str, Any]]:
+    """
+    Move the keys of JSONFields read by project back into a dict under
+    the name of their column, like QuerySet.values() returns them.
+    """
+    for row in rows:
+        for alias, column, key in keys:
+            value = row.pop(alias)
+            nested = row.get(column)
+            if nested is None:
+                nested = row[column] = {}
+            if value is not MISSING:
+                nested[key] = value
+        yield row
+
+
+def project(events: Any, fields: FrozenSet[str]) -> Any:
+    """
+    Read only the columns of the QuerySet produced by the previous stage
+    which are needed to get fields, so the database does not read (and
+    Python does not decode) the rest, ie. the text of events. Unordered
+    QuerySets are ordered by primary key (see stable_order).
+
+    A field which is a path into a JSONField only reads the key of the
+    JSONField it starts with (unless the whole JSONField is read for another
+    field), and the row gets a dict of the keys read, which are missing
+    from it if they are missing from the JSONField. Fields which are not
+    columns of the model are not read from the database.
+
+    Args:
+        events (Any): The output of the previous stage.
+        fields (FrozenSet[str]): The fields the next stages read, see plan_projections.
+
+    Returns:
+        Any: A QuerySet of dicts or, if keys of JSONFields are read, an
+            iterator of dicts, or events unchanged if they are not a
+            QuerySet of model instances.
+    """
+    from events.governor import governed
+    log = logging.getLogger(__name__)
+    if not settings.DELVE_QUERY_PROJECTION:
+        return events
+    if not isinstance(events, QuerySet) or events._iterable_class is not ModelIterable:
+        return events
+    # Reading fewer columns must not change the order of the events
+    events = stable_order(events)
+    columns = model_columns(events)
+    key_projection = supports_key_projection(connections[events.db])
+    whole = set()
+    keys: Dict[str, Dict[str, None]] = {}
+    for field in fields:
+        name, _, path = field.partition("__")
+        column = columns.get(name)
+        if column is None:
+            continue
+        key = path.split("__")[0]
+        if key and not key.isdigit() and key_projection and isinstance(column, JSONField):
+            keys.setdefault(name, {})[key] = None
+        else:
+            whole.add(name)
+    names = [name for name in columns if name in whole]
+    keys = {name: nested for name, nested in keys.items() if name not in whole}
+    if not keys:
+        log.debug(f"Reading only {names} from the QuerySet")
+        # A row must still be read for each event
+        return events.values(*(names or [events.model._meta.pk.attname]))
+    aliases = []
+    annotations = {}
+    for name, nested in keys.items():
+        for key in nested:
+            alias = f"_projected_{len(aliases)}"
+            aliases.append((alias, name, key))
+            annotations[alias] = ProjectedKey(key, name, columns[name].decoder)
+    log.debug(f"Reading only {names} and {aliases} from the QuerySet")
+    rows = events.values(*names, **annotations).iterator(chunk_size=settings.DELVE_STREAMING_BATCH_SIZE)
+    return _nest_keys(governed(rows), aliases)
+
+
+class StageHook:
+    """
+    Base class for objects which observe or control the execution of
+    a query, one stage at a time (see the hooks argument of Query.resolve).
+    """
+    def start(self, events: Any) -> None:
+        """
+        Called once before the first stage with the events passed to Query.resolve.
+        """
+
+    def run_stage(self, text: str, function: Callable[[], Any]) -> Any:
+        """
+        Called for each stage. Must call function, which applies the
+        stage, and return its result (or raise).
+
+        Args:
+            text (str): The text of the search command.
+            function (Callable[[], Any]): Applies the stage and returns its output.
+
+        Returns:
+            Any: The output of the stage.
+        """
+        return function()
+
+    def fail(self, exception: BaseException) -> None:
+        """
+        Called before stop when the query fails, with the exception which
+        made it fail, whichever hook or stage raised it.
+        """
+
+    def stop(self) -> None:
+        """
+        Called once after the last stage, or after a stage fails.
+        """
+
+
+def apply_stage(request: Any, operation: Callable, events: Any, argv: List[str], context: Dict[str, Any], streaming: bool, fields: Optional[FrozenSet[str]] = None, synthetic: Tuple[Stage, ...] = ()) -> Any:
+    """
+    Apply one search command to the output of the previous stage, after
+    the synthetic stages the planner placed in front of it (see
+    Stage.synthetic).
+
+    The search command is pushed down into the QuerySet when possible,
+    otherwise it is called with the events (only with the columns needed
+    for fields if they are a QuerySet, see project), which are streamed
+    into it if both streaming and the search command allow it.
+
+    Args:
+        request (Any): The request which is resolving the query.
+        operation (Callable): The search command.
+        events (Any): The output of the previous stage.
+        argv (List[str]): The rendered arguments for the search command.
+        context (Dict[str, Any]): The local context.
+        streaming (bool): Whether streaming pipelines are enabled.
+        fields (Optional[FrozenSet[str]]): The fields read from the events by
+            this stage and the following ones, None for every field.
+        synthetic (Tuple[Stage, ...]): The synthetic stages in front of
+            this stage, in order.
+
+    Returns:
+        Any: The output of the search command.
+    """
+    log = logging.getLogger(__name__)
+    for stage in synthetic:
+        events = apply_stage(request, stage.operation, events, render_stage(stage, context), context, streaming, stage.fields)
+    pushed_down = push_down(operation, events, argv)
+    if pushed_down is not None:
+        log.debug(f"Pushed operation {operation} down into the QuerySet")
+        return pushed_down
+    if fields is not None:
+        events = project(events, fields)
+    if streaming and getattr(operation, "streaming", False):
+        log.debug(f"Streaming events into: {operation}")
+        events = stream(events)
+    log.debug(f"Attempting to apply operation: {operation}")
+    ret = operation(request, events, argv, context)
+    log.debug(f"Successfully called operation: {operation}")
+    return ret
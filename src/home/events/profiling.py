@@ -0,0 +1,245 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+import time
+import shlex
+import logging
+import threading
+import tracemalloc
+from contextlib import ExitStack
+from typing import Any, Callable, Dict, List, Optional
+
+from django.db import connections
+from django.db.models import Model
+from django.db.models.query import QuerySet
+
+from .planner import StageHook
+
+log = logging.getLogger(__name__)
+
+# tracemalloc is global to the process, so the queries traced at the same
+# time (profiled, or governed with DELVE_QUERY_MEMORY_METHOD=tracemalloc)
+# share one tracing session, started by the first and stopped by the last.
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_started = False
+# The number of stages measuring the peak of traced memory, only the
+# first of overlapping stages may reset the peak.
+_peak_users = 0
+_peak_resets = 0
+
+
+def start_tracing() -> None:
+    """
+    Join the tracemalloc session, starting it if nothing is tracing yet.
+    Every call must be followed by a call to stop_tracing().
+    """
+    global _tracing_users, _tracing_started
+    with _tracing_lock:
+        if not _tracing_users and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_started = True
+        _tracing_users += 1
+
+
+def stop_tracing() -> None:
+    """
+    Leave the tracemalloc session, stopping it if it was started by
+    start_tracing() and this was its last user.
+    """
+    global _tracing_users, _tracing_started
+    with _tracing_lock:
+        _tracing_users -= 1
+        if not _tracing_users and _tracing_started:
+            tracemalloc.stop()
+            _tracing_started = False
+
+
+def start_peak() -> Optional[int]:
+    """
+    Start measuring the peak of traced memory, resetting it unless another
+    measurement is in progress. Every call must be followed by a call to
+    stop_peak() with the value returned.
+    """
+    global _peak_users, _peak_resets
+    with _tracing_lock:
+        _peak_users += 1
+        if _peak_users > 1:
+            return None
+        tracemalloc.reset_peak()
+        _peak_resets += 1
+        return _peak_resets
+
+
+def stop_peak(token: Optional[int]) -> Optional[int]:
+    """
+    Return the peak of traced memory since start_peak() returned token,
+    or None if it was not reset for this measurement (or has been since).
+    """
+    global _peak_users
+    with _tracing_lock:
+        _peak_users -= 1
+        if token is None or token != _peak_resets:
+            return None
+        return tracemalloc.get_traced_memory()[1]
+
+
+class SQLRecorder:
+    """
+    A database execute wrapper which counts the SQL queries executed
+    and the time spent executing them.
+
+    See https://docs.djangoproject.com/en/5.2/topics/db/instrumentation/
+    """
+    def __init__(self) -> None:
+        self.count = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.time += time.perf_counter() - start
+
+
+def count_rows(events: Any) -> int:
+    """
+    Return the number of rows in a result set. QuerySets which have not
+    been evaluated are counted with an additional COUNT query.
+    """
+    if events is None:
+        return 0
+    if isinstance(events, (dict, Model, str, bytes)):
+        return 1
+    if isinstance(events, QuerySet) and events._result_cache is None:
+        return events.count()
+    try:
+        return len(events)
+    except TypeError:
+        return 1
+
+
+def materialize(events: Any) -> Any:
+    """
+    Force the evaluation of lazy output so the work is attributed to the
+    stage which produced it rather than to the stage which consumes it.
+
+    Iterators (generators, EventStreams) are converted to lists. QuerySets
+    are left alone, so later stages can still be pushed down into them and
+    their SQL is attributed to the stage which executes it.
+    """
+    if isinstance(events, QuerySet):
+        return events
+    if isinstance(events, (dict, list, tuple, str, bytes, Model)) or events is None:
+        return events
+    if hasattr(events, "__next__"):
+        return list(events)
+    return events
+
+
+class QueryProfile(StageHook):
+    """
+    Collects per-stage measurements while a Query is resolved.
+
+    Pass an instance to Query.resolve as profile and read the results
+    with as_dict() afterwards. While profiling, the output of each stage
+    is materialized (see materialize), which means streaming pipelines
+    hold each intermediate result in memory.
+
+    Memory is measured with tracemalloc, which traces allocations made
+    by every thread in the process, so peak_memory counts allocations of
+    other queries running at the same time. When stages of several
+    profiled queries overlap, only the first can measure its peak and the
+    others record the growth of traced memory instead, which is lower.
+    """
+    def __init__(self) -> None:
+        self.stages: List[Dict[str, Any]] = []
+        self.rows_in: Optional[int] = 0
+        self.started: Optional[float] = None
+        self.total_time = 0.0
+        self._tracing = False
+
+    def start(self, events: Any = None) -> None:
+        """
+        Start the clock and join the tracemalloc session (see start_tracing).
+        """
+        self.rows_in = None if hasattr(events, "__next__") else count_rows(events)
+        if not self._tracing:
+            start_tracing()
+            self._tracing = True
+        self.started = time.perf_counter()
+
+    def stop(self) -> None:
+        """
+        Stop the clock and leave the tracemalloc session.
+        """
+        if self.started is not None:
+            self.total_time = time.perf_counter() - self.started
+        if self._tracing:
+            stop_tracing()
+            self._tracing = False
+
+    def run_stage(self, text: str, function: Callable[[], Any]) -> Any:
+        """
+        Call function, which applies one stage of the query, and record
+        its measurements under text.
+
+        If function raises, the stage is recorded along with the
+        exception and the exception is re-raised.
+
+        Args:
+            text (str): The text of the search command.
+            function (Callable[[], Any]): Applies the stage and returns its output.
+
+        Returns:
+            Any: The (materialized) output of the stage.
+        """
+        if self.started is None:
+            self.start()
+        record = {
+            "stage": text.strip(),
+            "command": (shlex.split(text, comments=True) or [""])[0],
+            "start": time.perf_counter() - self.started,
+            "rows_in": self.rows_in,
+            "rows_out": None,
+            "error": None,
+        }
+        recorder = SQLRecorder()
+        peak_token = start_peak()
+        memory_before, _ = tracemalloc.get_traced_memory()
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                events = materialize(function())
+        except (Exception, SystemExit) as exception:
+            record["error"] = str(exception)
+            raise
+        finally:
+            record["wall_time"] = time.perf_counter() - wall_start
+            record["cpu_time"] = time.thread_time() - cpu_start
+            record["sql_queries"] = recorder.count
+            record["sql_time"] = recorder.time
+            memory_after, _ = tracemalloc.get_traced_memory()
+            peak = stop_peak(peak_token)
+            record["peak_memory"] = max((memory_after if peak is None else peak) - memory_before, 0)
+            self.stages.append(record)
+        # Counting happens outside of the measurements above, because
+        # counting a QuerySet costs an extra query.
+        record["rows_out"] = self.rows_in = count_rows(events)
+        log.debug(f"Profiled stage: {record}")
+        return events
+
+    def as_dict(self) -> Dict[str, Any]:
+        """
+        Return the profile in a JSON serializable form.
+        """
+        return {
+            "total_time": self.total_time,
+            "stages": self.stages,
+        }
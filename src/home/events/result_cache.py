@@ -0,0 +1,217 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+import json
+import hashlib
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .planner import Stage, render_stage
+from . import table_store
+
+log = logging.getLogger(__name__)
+
+CACHE_ALIAS = "query_results"
+KEY_PREFIX = "delve:results"
+STATS = ("hits", "misses", "invalidations")
+
+
+class Scope(NamedTuple):
+    """
+    The rows of one model (in one database) a search stage reads from.
+
+    Attributes:
+        model (str): The dotted path of the model.
+        using (str): The database alias.
+        indexes (Optional[Tuple[Any, ...]]): The values of the positive
+            index= terms of the search, None if the search is not limited
+            to particular indexes (or the model has no index field).
+    """
+    model: str
+    using: str
+    indexes: Optional[Tuple[Any, ...]]
+
+
+class CachePlan(NamedTuple):
+    """
+    Everything needed to look up and store the results of one execution
+    of a query.
+
+    Attributes:
+        key (str): The cache key.
+        high_water_marks (Dict[str, Optional[str]]): The newest primary key
+            of each Scope at the time the plan was made.
+    """
+    key: str
+    high_water_marks: Dict[str, Optional[str]]
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def search_scope(argv: List[str]) -> Scope:
+    """
+    Return the Scope read by a search stage, given its rendered argv.
+    """
+    from .search_commands import search
+    from .search_commands.util import cast
+    args = search.parser.parse_args(argv[1:])
+    model = import_string(args.model)
+    indexes = []
+    for kv_pair in args.terms or []:
+        key, value = kv_pair.split("=", 1)
+        if key == "index":
+            indexes.append(cast(value))
+    has_index = any(field.name == "index" for field in model._meta.concrete_fields)
+    return Scope(
+        args.model,
+        args.using or "default",
+        tuple(indexes) if indexes and has_index else None,
+    )
+
+
+def high_water_mark(scope: Scope) -> Optional[str]:
+    """
+    Return the newest primary key in the Scope. Event ids are uuid7, which
+    sort by creation time, so a new Event in any of the indexes read
+    by the search raises the high water mark.
+    """
+    model = import_string(scope.model)
+    queryset = model._default_manager.using(scope.using)
+    if scope.indexes is not None:
+        # Multiple index= terms are ANDed by search, the high water
+        # mark needs the union of the indexes.
+        condition = Q()
+        for index in scope.indexes:
+            condition |= Q(index=index)
+        queryset = queryset.filter(condition)
+    newest = queryset.order_by("-pk").values_list("pk", flat=True).first()
+    return None if newest is None else str(newest)
+
+
+def plan(stages: Sequence[Stage], request: Any, context: Dict[str, Any], environment_globals: Dict[str, Any]) -> Optional[CachePlan]:
+    """
+    Decide whether the results of a query can be cached and, if so,
+    compute its cache key and the current high water marks of the
+    data it reads.
+
+    A query is cacheable when every one of its search commands is listed
+    in settings.DELVE_RESULT_CACHE_COMMANDS and is deterministic given its
+    arguments (see the deterministic argument of search_command). The key is derived from the
+    rendered arguments of every stage (which normalizes whitespace and
+    quoting and includes the rendered context), the context itself,
+    the user and the models read by each search stage.
+
+    Returns:
+        Optional[CachePlan]: The plan, or None if the query is not cacheable.
+    """
+    if not settings.DELVE_RESULT_CACHE:
+        return None
+    try:
+        rendered = [render_stage(stage, context, environment_globals) for stage in stages]
+        if any(not argv or argv[0] not in settings.DELVE_RESULT_CACHE_COMMANDS for argv in rendered):
+            return None
+        for stage, argv in zip(stages, rendered):
+            deterministic = getattr(stage.operation, "deterministic", None)
+            if deterministic is not None and not deterministic(stage.operation.parser.parse_args(argv[1:])):
+                return None
+        scopes = [search_scope(argv) for argv in rendered if argv[0] == "search"]
+        high_water_marks = {
+            json.dumps(scope, default=str): high_water_mark(scope)
+            for scope in scopes
+        }
+        fingerprint = json.dumps(
+            {
+                "argv": rendered,
+                "context": context,
+                "globals": environment_globals,
+                "user": getattr(getattr(request, "user", None), "pk", None),
+                "scopes": scopes,
+            },
+            sort_keys=True,
+            default=str,
+        )
+    except (Exception, SystemExit):
+        log.debug("Unable to plan result caching, skipping the cache", exc_info=True)
+        return None
+    key = f"{KEY_PREFIX}:{hashlib.sha256(fingerprint.encode()).hexdigest()}"
+    return CachePlan(key, high_water_marks)
+
+
+def _increment(stat: str) -> None:
+    cache = get_cache()
+    key = f"{KEY_PREFIX}:stats:{stat}"
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add and incr
+        cache.set(key, 1, timeout=None)
+
+
+def lookup(cache_plan: CachePlan) -> Optional[Any]:
+    """
+    Return the cached results for cache_plan, or None on a miss.
+
+    Entries stored while any of the high water marks were different are
+    invalidated (deleted) and count as a miss.
+    """
+    cache = get_cache()
+    entry = cache.get(cache_plan.key)
+    if entry is None:
+        log.debug(f"Result cache miss for {cache_plan.key}")
+        _increment("misses")
+        return None
+    if entry["high_water_marks"] != cache_plan.high_water_marks:
+        log.debug(f"Result cache entry {cache_plan.key} invalidated by new events")
+        cache.delete(cache_plan.key)
+        _increment("invalidations")
+        _increment("misses")
+        return None
+    log.debug(f"Result cache hit for {cache_plan.key}")
+    _increment("hits")
+    return entry["results"]
+
+
+def store(cache_plan: CachePlan, results: Any) -> None:
+    """
+    Store results for cache_plan for settings.DELVE_RESULT_CACHE_TIMEOUT seconds.
+    Results which cannot be pickled are not cached, nor server-side tables
+    whose rows are only kept by this process.
+    """
+    if table_store.is_server_side(results):
+        return
+    try:
+        get_cache().set(
+            cache_plan.key,
+            {
+                "high_water_marks": cache_plan.high_water_marks,
+                "results": results,
+            },
+            timeout=settings.DELVE_RESULT_CACHE_TIMEOUT,
+        )
+    except Exception:
+        log.exception(f"Unable to store results for {cache_plan.key}")
+
+
+def stats() -> Dict[str, Any]:
+    """
+    Return the hit, miss and invalidation counts shared by every process
+    using the cache, along with the hit ratio.
+    """
+    cache = get_cache()
+    ret = {stat: cache.get(f"{KEY_PREFIX}:stats:{stat}", 0) for stat in STATS}
+    lookups = ret["hits"] + ret["misses"]
+    ret["hit_ratio"] = ret["hits"] / lookups if lookups else None
+    return ret
+
+
+def reset_stats() -> None:
+    get_cache().delete_many([f"{KEY_PREFIX}:stats:{stat}" for stat in STATS])
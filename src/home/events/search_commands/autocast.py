@@ -29,6 +29,8 @@ parser.add_argument(
     input_validators=[
         QuerySetOrListOfDicts,
     ],
+    streaming=True,
+    one_to_one=True,
 )
 def autocast(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], argv: List[str], environment: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
@@ -45,7 +47,7 @@ def autocast(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]]
     """
     log = logging.getLogger(__name__)
     log.info("In search_command autocast")
-    events = resolve(events)
+    events = resolve(events, lazy=True)
     log.debug(f"Received argv: {argv}")
     if "autocast" in argv:
         argv.pop(argv.index("autocast"))
@@ -57,6 +59,6 @@ def autocast(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]]
         for field in args.fields:
             # lhs = left-hand side, rhs right-hand side
             log.debug(f"Found field: {type(field)}({field})")
-            event[field] = cast(event[field])
+            event[field] = cast(event.get(field))
             log.debug(f"New type of field: {type(field)}({field})")
         yield event
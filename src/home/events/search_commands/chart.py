@@ -4,16 +4,33 @@
 
 import logging
 import argparse
+from datetime import date, datetime, time, timedelta
 from itertools import groupby
-from typing import Any, Dict, List, Union
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Tuple, Union
 
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast, NullIf, Trunc
 from django.db.models.query import QuerySet
 from django.http import HttpRequest
+from django.utils import timezone
 
 from events.validators import ListOfDicts
-from events.util import resolve
+from events.util import field_value, resolve, sort_key, ResultSet
+from events.planner import FieldUsage, model_columns, JSONType, JSON_NUMBER_TYPES, PUSHABLE_TYPES
+from events.downsampling import DOWNSAMPLERS
+from events.search_commands.filter import lookup_map
+from events.search_commands.qs._util import AGGREGATION_FUNCTIONS
+from .stats.engine import HashAggregation, parse_aggregate
+from .stats.pushdown import NUMERIC_COLUMNS, ORDERED_COLUMNS, SQL_AGGREGATES
 from .decorators import search_command
 
+# Series of a chart: the x and y values of its points, by label
+Series = Dict[Any, Tuple[List[Any], List[Any]]]
+
 parser = argparse.ArgumentParser(
     prog="chart",
     description="Return the JSON data to configure a Chart.js chart.",
@@ -45,15 +62,379 @@ parser.add_argument(
     choices=("minute", "hour", "day", "week", "month", "quarter", "year"),
     help="If specified, the data of the x axis will be treated as time"
 )
+parser.add_argument(
+    "-a",
+    "--aggregate",
+    choices=("count", "sum", "avg", "min", "max"),
+    help="With --time-x, plot the aggregate of the y field (or, for count "
+         "without a y field, the number of events) over each --time-x unit "
+         "instead of one point per event",
+)
+parser.add_argument(
+    "--max-points",
+    type=int,
+    help="The maximum number of points of each series, longer series are "
+         "downsampled (by default DELVE_CHART_MAX_POINTS, 0 for no maximum). "
+         "Without --aggregate, series are only downsampled with --max-points "
+         "or --downsample, and only if their x values are numbers, dates or "
+         "times and their y values numbers",
+)
+parser.add_argument(
+    "--downsample",
+    choices=tuple(DOWNSAMPLERS),
+    help="How series are downsampled: lttb (the default) keeps the overall "
+         "shape, minmax keeps the lowest and highest point of every interval",
+)
+
+def truncate(value: Any, unit: str) -> Optional[datetime]:
+    """
+    Return the start of the unit of time (ie. the day) value falls in, in
+    the current time zone like the database's Trunc, or None if value is
+    not a datetime, date or ISO 8601 string.
+    """
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if isinstance(value, datetime):
+        if settings.USE_TZ and timezone.is_aware(value):
+            value = timezone.localtime(value)
+    elif isinstance(value, date):
+        value = datetime.combine(value, time())
+    else:
+        return None
+    value = value.replace(second=0, microsecond=0)
+    if unit == "minute":
+        return value
+    value = value.replace(minute=0)
+    if unit == "hour":
+        return value
+    value = value.replace(hour=0)
+    if unit == "day":
+        return value
+    if unit == "week":
+        return value - timedelta(days=value.weekday())
+    value = value.replace(day=1)
+    if unit == "month":
+        return value
+    if unit == "quarter":
+        return value.replace(month=(value.month - 1) // 3 * 3 + 1)
+    return value.replace(month=1)
+
+def _position(value: Any) -> Optional[float]:
+    # The x value as a number, for downsampling
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, date):
+        return value.toordinal() * 86400
+    return None
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    return None
+
+def _values(events: ResultSet, field: Optional[str]) -> List[Any]:
+    """
+    Return the values of field, which may be a path into a column of dicts
+    (ie. extracted_fields__status), None for every row if field is None.
+    """
+    if field is None:
+        return [None] * len(events)
+    if field in events.columns or "__" not in field:
+        return events.column(field)
+    root = field.split("__")[0]
+    ret = []
+    for value in events.column(root):
+        try:
+            ret.append(field_value({root: value}, field))
+        except KeyError:
+            ret.append(None)
+    return ret
+
+def _aggregate_name(args: argparse.Namespace) -> str:
+    return args.aggregate if args.y_field is None else f"{args.aggregate}({args.y_field})"
+
+def _bucket(events: ResultSet, args: argparse.Namespace) -> Series:
+    """
+    Return the series of the aggregate of each --time-x bucket, one pass
+    over the events keeping one accumulator per bucket and series.
+    """
+    aggregation = HashAggregation([parse_aggregate(_aggregate_name(args))])
+    labels = _values(events, args.by_field)
+    for x, y, label in zip(_values(events, args.x_field), _values(events, args.y_field), labels):
+        bucket = truncate(x, args.time_x)
+        if bucket is not None:
+            aggregation.add((label, bucket), [y])
+    series: Series = {}
+    for (label, bucket), result in zip(aggregation.group_values, aggregation.results()):
+        xs, ys = series.setdefault(label, ([], []))
+        xs.append(bucket)
+        ys.append(result[aggregation.aggregates[0].name])
+    return series
+
+def _downsampled_rows(events: ResultSet, args: argparse.Namespace, max_points: int) -> Optional[List[int]]:
+    """
+    Return the indices, in order, of the events kept when each series of
+    more than max_points points is downsampled, or None to keep every
+    event: when no series is that long, or when an x value is not a
+    number, date or time or a y value is not a number, as there is no
+    shape to keep then. Events with the same x value are separate points.
+    """
+    downsample = DOWNSAMPLERS[args.downsample or "lttb"]
+    series: Dict[Any, List[Tuple[float, float, int]]] = {}
+    rows = zip(_values(events, args.x_field), _values(events, args.y_field), _values(events, args.by_field))
+    for index, (x, y, label) in enumerate(rows):
+        position = _position(x)
+        if position is None or isinstance(y, bool) or not isinstance(y, (int, float)):
+            return None
+        series.setdefault(label, []).append((position, y, index))
+    if all(len(points) <= max_points for points in series.values()):
+        return None
+    kept = []
+    for points in series.values():
+        points.sort(key=itemgetter(0))
+        selected = downsample([point[0] for point in points], [point[1] for point in points], max_points)
+        kept.extend(points[index][2] for index in selected)
+    return sorted(kept)
+
+def _series_data(series: Series, args: argparse.Namespace, max_points: int) -> Dict[str, Any]:
+    """
+    Return the chart data of the --aggregate series as columns: the
+    buckets of every series as the labels and, for each series, its
+    aggregate at each bucket (null where it has none), downsampled to
+    max_points buckets per series. Each series has one point per bucket.
+    """
+    downsample = DOWNSAMPLERS[args.downsample or "lttb"]
+    points = {}
+    for label in sorted(series, key=sort_key):
+        xs, ys = series[label]
+        pairs = sorted(
+            ((x, y) for x, y in zip(xs, map(_number, ys)) if y is not None and x is not None),
+            key=lambda pair: sort_key(pair[0]),
+        )
+        if max_points and len(pairs) > max_points:
+            positions = [_position(x) for x, _ in pairs]
+            if any(position is None for position in positions):
+                positions = list(range(len(pairs)))
+            pairs = [pairs[index] for index in downsample(positions, [y for _, y in pairs], max_points)]
+        points[label] = pairs
+    labels = sorted({x for pairs in points.values() for x, _ in pairs}, key=sort_key)
+    positions = {x: position for position, x in enumerate(labels)}
+    datasets = []
+    for label, pairs in points.items():
+        data = [None] * len(labels)
+        for x, y in pairs:
+            data[positions[x]] = y
+        datasets.append(
+            {
+                "label": label if args.by_field is not None else (_aggregate_name(args) if args.aggregate else args.y_field),
+                "data": data,
+                "spanGaps": True,
+            }
+        )
+    return {"labels": labels, "datasets": datasets}
+
+def chart_pushdown(queryset: QuerySet, argv: List[str]) -> Optional[Dict[str, Any]]:
+    """
+    Compute chart --aggregate in the database, grouping on Trunc() of the
+    x field, so only one row per bucket and series is read.
+
+    The x field must be a DateTimeField and the by field a model column.
+    The y field may be a model column or a key inside a JSONField, whose
+    values must all be numbers for the database to agree with Python.
+
+    Returns:
+        Optional[Dict[str, Any]]: The chart, or None if it must be computed in Python.
+    """
+    args = parser.parse_args(argv[1:])
+    if args.aggregate is None or args.time_x is None or queryset.query.is_sliced:
+        return None
+    columns = model_columns(queryset)
+    x_column = columns.get(args.x_field)
+    if x_column is None or x_column.get_internal_type() != "DateTimeField":
+        return None
+    annotations = {"chart_x": Trunc(x_column.attname, args.time_x)}
+    group_by = ["chart_x"]
+    if args.by_field is not None:
+        by_column = columns.get(args.by_field)
+        if by_column is None or by_column.get_internal_type() not in PUSHABLE_TYPES:
+            return None
+        annotations["chart_by"] = F(by_column.attname)
+        group_by.append("chart_by")
+    function = AGGREGATION_FUNCTIONS[SQL_AGGREGATES[args.aggregate]]
+    aggregates = {}
+    if args.y_field is None:
+        if args.aggregate != "count":
+            return None
+        aggregates["chart_y"] = function("*")
+    else:
+        path = args.y_field.split("__")
+        y_column = columns.get(path[0])
+        if y_column is None:
+            return None
+        if len(path) == 1:
+            internal_type = y_column.get_internal_type()
+            if args.aggregate in ("sum", "avg") and internal_type not in NUMERIC_COLUMNS:
+                return None
+            if args.aggregate in ("min", "max") and internal_type not in ORDERED_COLUMNS:
+                return None
+            if internal_type not in PUSHABLE_TYPES:
+                return None
+            aggregates["chart_y"] = function(F(y_column.attname))
+        elif y_column.get_internal_type() == "JSONField" and all(
+            segment and segment not in lookup_map and not segment.isdigit() for segment in path[1:]
+        ):
+            annotations["chart_type"] = NullIf(JSONType(y_column.attname, path[1:]), Value("null"))
+            if args.aggregate == "count":
+                aggregates["chart_y"] = function("chart_type")
+            else:
+                value = KT(args.y_field)
+                options = {}
+                if connections[queryset.db].vendor != "sqlite":
+                    # KT() returns numbers as text on PostgreSQL
+                    value = Cast(value, FloatField())
+                    options["output_field"] = FloatField()
+                aggregates["chart_y"] = function(value, filter=Q(chart_type__in=JSON_NUMBER_TYPES), **options)
+                # Anything but numbers would be compared or added differently
+                aggregates["chart_other"] = AGGREGATION_FUNCTIONS["Count"](
+                    "pk",
+                    filter=Q(chart_type__isnull=False) & ~Q(chart_type__in=JSON_NUMBER_TYPES),
+                )
+        else:
+            return None
+    rows = queryset.order_by().annotate(**annotations).values(*group_by).annotate(**aggregates).order_by(*group_by)
+    series: Series = {}
+    for row in rows:
+        if row.get("chart_other"):
+            return None
+        if row["chart_x"] is None:
+            continue
+        xs, ys = series.setdefault(row.get("chart_by"), ([], []))
+        xs.append(row["chart_x"])
+        y = row["chart_y"]
+        if y is None and args.aggregate == "sum":
+            y = 0
+        ys.append(y)
+    return _configuration(args, _series_data(series, args, _max_points(args)), columnar=True)
+
+def _columnar_data(events: ResultSet, args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Build the chart data from a ResultSet, reading only the columns
+    which are plotted.
+    """
+    x_values = events.column(args.x_field)
+    if args.by_field is None:
+        return {
+            "labels": x_values,
+            "datasets": [
+                {
+                    "label": args.y_field,
+                    "data": events.to_dicts(),
+                }
+            ]
+        }
+    y_values = events.column(args.y_field)
+    labels = events.column(args.by_field)
+    datasets = []
+    for label, indices in groupby(sorted(range(len(events)), key=labels.__getitem__), key=labels.__getitem__):
+        datasets.append(
+            {
+                "label": label,
+                "data": [
+                    {
+                        args.x_field: x_values[index],
+                        args.y_field: y_values[index],
+                    } for index in indices
+                ],
+            }
+        )
+    return {"datasets": datasets}
+
+def chart_fields(args: argparse.Namespace) -> Optional[FieldUsage]:
+    # Without --by-field or --aggregate, the events are the data of the chart
+    if args.by_field is None and args.aggregate is None:
+        return None
+    fields = (args.x_field, args.y_field, args.by_field)
+    return FieldUsage([field for field in fields if field is not None], projects=True)
+
+def _max_points(args: argparse.Namespace) -> int:
+    return settings.DELVE_CHART_MAX_POINTS if args.max_points is None else args.max_points
+
+def _configuration(args: argparse.Namespace, data: Dict[str, Any], columnar: bool = False) -> Dict[str, Any]:
+    """
+    Return the Chart.js configuration of data. Columnar data (see
+    _series_data) is made of labels and arrays of y values, which Chart.js
+    reads without parsing keys.
+    """
+    ret = {
+        "visualization": "chartjs",
+        "type": args.type,
+        "data": data,
+        "options": {
+            "plugins": {
+                # "colors": {
+                #     "forceOverride": True
+                # }
+           },
+        },
+    }
+    if not columnar:
+        ret["options"]["parsing"] = {
+            "xAxisKey": args.x_field,
+            "yAxisKey": args.y_field,
+        }
+    if args.time_x:
+        ret["options"]["scales"] = {
+            "x": {
+                "type": "time",
+                "time": {
+                    "unit": args.time_x,
+                    "displayFormats": {
+                        "minute": "MM-DD HH:mm:SS",
+                        "hour":  "MM-DD HH",
+                        "day": "YY-MM-DD",
+                        "week": "YY-MM-DD",
+                        "month": "YY-MM",
+                        "quarter": "YY-MM",
+                        "year": "yyyy",
+                    },
+                },
+                "ticks": {
+                    "source": "data"
+                },
+            },
+        }
+    return ret
 
 @search_command(
     parser,
     input_validators=[ListOfDicts],
+    pushdown=chart_pushdown,
+    fields=chart_fields,
 )
 def chart(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], argv: List[str], environment: Dict[str, Any]) -> Dict[str, Any]:
     """
     Return the JSON data to configure a Chart.js chart.
 
+    With --aggregate, the events are bucketed by --time-x unit and each
+    series has one point per bucket (computed by the database when possible,
+    see chart_pushdown). Series with more than --max-points points are
+    downsampled. Both return the data as columns (see _series_data).
+
     Args:
         request (HttpRequest): The HTTP request object.
         events (Union[QuerySet, List[Dict[str, Any]]]): The result set to operate on.
@@ -66,9 +447,29 @@ def chart(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], a
     log = logging.getLogger(__name__)
     log.info("In search_command chart")
     args = chart.parser.parse_args(argv[1:])
-    events = resolve(events)
+    if args.aggregate is not None:
+        if args.time_x is None:
+            raise ValueError("chart --aggregate requires --time-x")
+        if args.y_field is None and args.aggregate != "count":
+            raise ValueError(f"chart --aggregate {args.aggregate} requires --y-field")
+    max_points = _max_points(args)
+    events = resolve(events, columnar=True)
 
-    if args.by_field is not None:
+    if args.aggregate is not None:
+        log.debug(f"Bucketing events by {args.time_x}")
+        if not isinstance(events, ResultSet):
+            events = ResultSet.from_rows(events)
+        return _configuration(args, _series_data(_bucket(events, args), args, max_points), columnar=True)
+    downsample = args.max_points is not None or args.downsample is not None
+    if downsample and isinstance(events, ResultSet) and max_points and len(events) > max_points:
+        kept = _downsampled_rows(events, args, max_points)
+        if kept is not None:
+            log.debug(f"Downsampled series to {max_points} points")
+            events = events.take(kept)
+
+    if isinstance(events, ResultSet):
+        data = _columnar_data(events, args)
+    elif args.by_field is not None:
         log.debug(f"Found by_field: {args.by_field}")
         datasets = []
         log.debug(f"sorting events by by_field")
@@ -101,42 +502,4 @@ def chart(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], a
             ]
         }
     log.debug(f"Building response")
-    ret = {
-        "visualization": "chartjs",
-        "type": args.type,
-        "data": data,
-        "options": {
-            "plugins": {
-                # "colors": {
-                #     "forceOverride": True
-                # }
-           },
-            "parsing": {
-                "xAxisKey": args.x_field,
-                "yAxisKey": args.y_field,
-            },
-        },
-    }
-    if args.time_x:
-        log.debug(f"Found time_x: {args.time_x}")
-        ret["options"]["scales"] = {
-            "x": {
-                "type": "time",
-                "time": {
-                    "unit": args.time_x,
-                    "displayFormats": {
-                        "minute": "MM-DD HH:mm:SS",
-                        "hour":  "MM-DD HH",
-                        "day": "YY-MM-DD",
-                        "week": "YY-MM-DD",
-                        "month": "YY-MM",
-                        "quarter": "YY-MM",
-                        "year": "yyyy",
-                    },
-                },
-                "ticks": {
-                    "source": "data"
-                },
-            },
-        }
-    return ret
+    return _configuration(args, data)
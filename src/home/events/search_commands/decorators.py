@@ -9,7 +9,7 @@ from typing import Optional, List, Callable, Any
 
 import pydantic
 
-def search_command(parser: argparse.ArgumentParser, input_validators: Optional[List[pydantic.BaseModel]] = None) -> Callable:
+def search_command(parser: argparse.ArgumentParser, input_validators: Optional[List[pydantic.BaseModel]] = None, streaming: bool = False, pushdown: Optional[Callable] = None, limit: Optional[str] = None, one_to_one: bool = False, fields: Optional[Callable] = None, deterministic: Optional[Callable] = None) -> Callable:
     """
     Decorator to register a search command.
 
@@ -19,6 +19,28 @@ def search_command(parser: argparse.ArgumentParser, input_validators: Optional[L
     Args:
         parser (argparse.ArgumentParser): The argument parser for the command.
         input_validators (Optional[List[pydantic.BaseModel]]): List of input validators.
+        streaming (bool): If True, the command processes events one at a time and,
+            when streaming pipelines are enabled, receives a lazy EventStream
+            instead of a materialized list.
+        pushdown (Optional[Callable]): A function accepting a QuerySet and argv which
+            returns an equivalent QuerySet with the command folded into it (or the
+            results computed by the database), or None if that is not possible.
+            See events.planner.push_down.
+        limit (Optional[str]): The dest of an integer --DEST option through which the
+            command returns at most that many events (ie. "limit" for sort --limit).
+            A literal head directly following the command is folded into it,
+            see events.planner.fold_limits.
+        one_to_one (bool): If True, the command returns exactly one event for each
+            event it receives, in the same order, so a head after it may run before it
+            instead, see events.planner.propagate_limits.
+        fields (Optional[Callable]): A function accepting the parsed arguments of the
+            command which returns the fields it reads as an events.planner.FieldUsage,
+            so that only those are read from the database. Commands without it may
+            read any field, see events.planner.plan_projections.
+        deterministic (Optional[Callable]): A function accepting the parsed arguments of
+            the command which returns False if its results depend on more than its input
+            and arguments (ie. the current time), so that they are not cached even though
+            the command is in DELVE_RESULT_CACHE_COMMANDS, see events.result_cache.plan.
 
     Returns:
         Callable: The decorated function.
@@ -32,6 +54,12 @@ def search_command(parser: argparse.ArgumentParser, input_validators: Optional[L
             return result
         inner.parser = parser
         inner.input_validators = input_validators
+        inner.streaming = streaming
+        inner.pushdown = pushdown
+        inner.limit = limit
+        inner.one_to_one = one_to_one
+        inner.fields = fields
+        inner.deterministic = deterministic
         return inner
     return _decorator
 
@@ -4,17 +4,49 @@
 
 import argparse
 import logging
-from typing import Any, Dict, List, Union
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
 
+from django.conf import settings
 from django.db.models.query import QuerySet
 from django.http import HttpRequest
 
-from events.util import resolve
+from events.util import freeze, resolve, stream, ResultSet
+from events.bloom import BloomFilter, digest
+from events.planner import FieldUsage
 from events.search_commands.decorators import search_command
 
 parser = argparse.ArgumentParser(
     prog="dedup",
-    description="Deduplicate the result set based on the optional fields. First matching item is kept. (events should be sorted prior to calling this)",
+    description="Deduplicate the result set based on the optional fields. First matching item is kept. "
+                "By default only consecutive duplicates are removed (events should be sorted prior to "
+                "calling this), with --global every duplicate is removed in a single pass.",
+)
+parser.add_argument(
+    "-g", "--global",
+    action="store_true",
+    dest="all",
+    help="If specified, remove every duplicate instead of only consecutive ones, "
+         "remembering the values of the fields (or a digest of the whole event "
+         "if no fields are given) of every distinct event",
+)
+parser.add_argument(
+    "--bloom",
+    action="store_true",
+    help="Implies --global, but remembers distinct events in a Bloom filter of "
+         "fixed size instead, which may also remove a small fraction (see --error) "
+         "of events which are not duplicates",
+)
+parser.add_argument(
+    "--capacity",
+    type=int,
+    help="The number of distinct events the Bloom filter is sized for, "
+         "default settings.DELVE_DEDUP_BLOOM_CAPACITY",
+)
+parser.add_argument(
+    "--error",
+    type=float,
+    help="The rate of unique events the Bloom filter wrongly removes once it "
+         "holds --capacity events, default settings.DELVE_DEDUP_BLOOM_ERROR",
 )
 parser.add_argument(
     nargs="*",
@@ -22,11 +54,58 @@ parser.add_argument(
     help="The fields to use for deduplication",
 )
 
-@search_command(parser)
-def dedup(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], argv: List[str], environment: Dict[str, Any]) -> List[Dict[str, Any]]:
+def _seen(args: argparse.Namespace) -> Callable[[Any], bool]:
+    """
+    Return a function which records a key and returns whether it had
+    already been recorded, in a set or (with --bloom) a Bloom filter.
+    """
+    if args.bloom:
+        bloom = BloomFilter(
+            settings.DELVE_DEDUP_BLOOM_CAPACITY if args.capacity is None else args.capacity,
+            settings.DELVE_DEDUP_BLOOM_ERROR if args.error is None else args.error,
+        )
+        return lambda key: bloom.add(digest(key))
+    keys = set()
+
+    def seen(key: Any) -> bool:
+        try:
+            if key in keys:
+                return True
+            keys.add(key)
+        except TypeError:
+            # ie. dicts or lists extracted from JSON
+            key = tuple(freeze(value) for value in key)
+            if key in keys:
+                return True
+            keys.add(key)
+        return False
+    return seen
+
+def _global_dedup(events: Iterable[Dict[str, Any]], fields: List[str], seen: Callable[[Any], bool]) -> Iterator[Dict[str, Any]]:
+    if fields:
+        for event in events:
+            if not seen(tuple(event.get(field) for field in fields)):
+                yield event
+        return
+    for event in events:
+        # Whole events are remembered by digest rather than kept alive
+        if not seen(digest(event)):
+            yield event
+
+def dedup_fields(args: argparse.Namespace) -> Optional[FieldUsage]:
+    # Without fields, whole events are compared
+    if not args.fields:
+        return None
+    return FieldUsage(args.fields)
+
+@search_command(parser, fields=dedup_fields)
+def dedup(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], argv: List[str], environment: Dict[str, Any]) -> Union[ResultSet, List[Dict[str, Any]], Iterator[Dict[str, Any]]]:
     """
     Deduplicate the result set based on the optional fields. First matching item is kept.
 
+    With --global (or --bloom) events which are not already in memory
+    are streamed, and only the keys of distinct events are kept.
+
     Args:
         request (HttpRequest): The HTTP request object.
         events (Union[QuerySet, List[Dict[str, Any]]]): The result set to operate on.
@@ -34,14 +113,35 @@ def dedup(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], a
         environment (Dict[str, Any]): Dictionary used as a jinja2 environment (context) for rendering the arguments of a command.
 
     Returns:
-        List[Dict[str, Any]]: A list of dictionaries with duplicate records removed.
+        Union[ResultSet, List[Dict[str, Any]], Iterator[Dict[str, Any]]]: The result set with duplicate records removed.
     """
     log = logging.getLogger(__name__)
     log.debug(f"Found events: {events}")
     args = dedup.parser.parse_args(argv[1:])
     log.debug(f"Found args: {args}")
+    if args.bloom:
+        args.all = True
+
+    if args.all:
+        seen = _seen(args)
+        if isinstance(events, ResultSet):
+            keys = events.tuples(args.fields or events.fields)
+            return events.take([index for index, key in enumerate(keys) if not seen(key)])
+        log.debug(f"Deduplicating globally by fields: {args.fields}")
+        return _global_dedup(resolve(stream(events), lazy=True), args.fields, seen)
+
+    events = resolve(events=events, columnar=True)
 
-    events = resolve(events=events)
+    if isinstance(events, ResultSet):
+        # Compare the values of consecutive rows column-wise, without building dicts
+        keys = events.tuples(args.fields or events.fields)
+        keep = []
+        last_key = object()
+        for index, key in enumerate(keys):
+            if key != last_key:
+                keep.append(index)
+                last_key = key
+        return events.take(keep)
 
     if not args.fields:
         log.info("No fields specified, using default comparison")
@@ -11,6 +11,7 @@ from django.db.models.query import QuerySet
 from django.http import HttpRequest
 
 from events.util import resolve
+from events.planner import FieldUsage
 
 from .decorators import search_command
 
@@ -24,7 +25,10 @@ parser.add_argument(
     help="The fields to use for distinct records",
 )
 
-@search_command(parser)
+def distinct_fields(args: argparse.Namespace) -> FieldUsage:
+    return FieldUsage(args.fields, projects=True)
+
+@search_command(parser, fields=distinct_fields)
 def distinct(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], argv: List[str], environment: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
     Return one event with fields containing the unique values of the specified fields.
@@ -11,6 +11,7 @@ from django.http import HttpRequest
 
 from .decorators import search_command
 from events.util import resolve
+from events.planner import FieldUsage
 from events.models import (
     BaseEvent,
 )
@@ -28,11 +29,17 @@ parser.add_argument(
     help="Field to drop if present from all events."
 )
 
+def drop_fields_fields(args: argparse.Namespace) -> FieldUsage:
+    return FieldUsage(())
+
 @search_command(
     parser,
     input_validators=[
         QuerySetOrListOfDictsOrEvents,
-    ]
+    ],
+    streaming=True,
+    one_to_one=True,
+    fields=drop_fields_fields,
 )
 def drop_fields(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], argv: List[str], environment: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
@@ -51,7 +58,7 @@ def drop_fields(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any
     log = logging.getLogger(__name__)
     fields = args.fields
     log.debug(f"Found fields: {fields}")
-    events = resolve(events)
+    events = resolve(events, lazy=True)
 
     for event in events:
         for field in fields:
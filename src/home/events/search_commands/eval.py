@@ -2,60 +2,241 @@
 # This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
 # See the LICENSE file in the root of this repository for details.
 
+import ast
 import logging
 import argparse
-from typing import Any, Dict, List, Union
+import re
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple, Union
 
 from django.db.models.query import QuerySet
 from django.http import HttpRequest
 
-from events.util import resolve
+from events.expressions import BOOLEAN, DATETIME, FUNCTIONS, NUMBER, STRING, compile_expression, substitute_fields
+from events.util import resolve, ResultSet
+from events.planner import FieldUsage
 
 from .util import cast
 from .decorators import search_command
 
 parser = argparse.ArgumentParser(
     prog="eval",
-    description="Set the value of a field on each event."
+    description="Set the value of a field on each event, ie. eval kb='round($bytes / 1024, 1)'. "
+                "A value which references a field ($name) or calls a function of the expression "
+                "language is an expression, anything else is taken literally.",
 )
 parser.add_argument(
     "expressions",
     nargs="+",
-    help="Provide one or more expressions to evaluate",
+    help="Provide one or more FIELD=VALUE assignments to evaluate, in order",
 )
 
-@search_command(parser)
-def eval(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], argv: List[str], environment: Dict[str, Any]) -> List[Dict[str, Any]]:
+FIELD_REFERENCE = re.compile(r"^\$(\w+)$")
+IMMUTABLE_TYPES = {BOOLEAN, DATETIME, NUMBER, STRING}
+
+class Assignment(NamedTuple):
+    """
+    A FIELD=VALUE argument of eval, as parsed by parse_assignment. Either
+    source (a field copied as is, but cast, or literal if an event does not
+    have it), expression or literal alone is set.
+    """
+    field: str
+    source: Optional[str] = None
+    expression: Any = None
+    literal: Any = None
+
+def parse_assignment(text: str) -> Assignment:
+    """
+    Parse FIELD=VALUE. VALUE is either $name, which copies the field name
+    (cast, see cast), an expression (see events.expressions) if it
+    references a field or calls a function, or otherwise a literal which
+    is cast once. A VALUE which is not valid expression syntax or names
+    something other than fields and functions (ie. `Costs $USD` or `f(x)`)
+    is taken as before expressions: a copy of the field after a leading $,
+    or a literal.
+
+    Raises:
+        ValueError: If text is not an assignment or VALUE is an invalid expression.
+    """
+    if "=" not in text:
+        raise ValueError(f"Invalid expression {text!r}, expected FIELD=VALUE")
+    lhs, rhs = text.split("=", 1)
+    reference = FIELD_REFERENCE.match(rhs)
+    if reference is not None:
+        return Assignment(lhs, source=reference[1], literal=cast(rhs))
+    if _is_expression(rhs):
+        return Assignment(lhs, expression=compile_expression(rhs))
+    if rhs.startswith("$"):
+        return Assignment(lhs, source=rhs.replace("$", ""), literal=cast(rhs))
+    return Assignment(lhs, literal=cast(rhs))
+
+def _is_expression(text: str) -> bool:
+    """
+    Return whether text parses as an expression which references a field
+    or calls a function, and only names fields and known functions.
+    """
+    try:
+        source, fields = substitute_fields(text)
+        tree = ast.parse(source.strip(), mode="eval")
+    except (ValueError, SyntaxError):
+        return False
+    nodes = list(ast.walk(tree))
+    if not fields and not any(isinstance(node, ast.Call) for node in nodes):
+        return False
+    return all(
+        re.fullmatch(r"_\d+", node.id) or node.id in FUNCTIONS
+        for node in nodes if isinstance(node, ast.Name)
+    )
+
+def _literal(value: Any) -> Callable[[Any], Any]:
+    """
+    Return a function of an event returning value, copied if it may be modified.
+    """
+    if isinstance(value, (list, dict, set)):
+        return lambda event: _copy_value(value)
+    return lambda event: value
+
+def _copy_value(value: Any) -> Any:
+    """
+    Copy the lists, dicts and sets of a literal (faster than copy.deepcopy).
+    """
+    if isinstance(value, list):
+        return [_copy_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _copy_value(item) for key, item in value.items()}
+    if isinstance(value, set):
+        return set(value)
+    return value
+
+def _copy(source: str, default: Any, seen: Set[str]) -> Callable[[Dict[str, Any]], Any]:
+    """
+    Return a function of an event returning its field source, cast, or if
+    the event does not have it None if source is in seen (the fields other
+    events have) and default otherwise.
+    """
+    def function(event: Dict[str, Any]) -> Any:
+        if source in event:
+            return cast(event[source])
+        return None if source in seen else default
+    return function
+
+def eval_fields(args: argparse.Namespace) -> FieldUsage:
+    fields = []
+    for assignment in map(parse_assignment, args.expressions):
+        if assignment.expression is not None:
+            fields.extend(assignment.expression.fields)
+        elif assignment.source is not None:
+            fields.append(assignment.source)
+    return FieldUsage(fields)
+
+def eval_deterministic(args: argparse.Namespace) -> bool:
+    return all(
+        assignment.expression is None or assignment.expression.deterministic
+        for assignment in map(parse_assignment, args.expressions)
+    )
+
+@search_command(parser, streaming=True, one_to_one=True, fields=eval_fields, deterministic=eval_deterministic)
+def eval(request: HttpRequest, events: Union[QuerySet, ResultSet, List[Dict[str, Any]]], argv: List[str], environment: Dict[str, Any]) -> Union[ResultSet, Iterator[Dict[str, Any]]]:
     """
     Set the value of a field on each event.
 
     Args:
         request (HttpRequest): The HTTP request object.
-        events (Union[QuerySet, List[Dict[str, Any]]]): The result set to operate on.
+        events (Union[QuerySet, ResultSet, List[Dict[str, Any]]]): The result set to operate on.
         argv (List[str]): List of command-line arguments.
         environment (Dict[str, Any]): Dictionary used as a jinja2 environment (context) for rendering the arguments of a command.
 
     Returns:
-        List[Dict[str, Any]]: A list of dictionaries with the evaluated expressions set as fields.
+        Union[ResultSet, Iterator[Dict[str, Any]]]: The events with the evaluated expressions set as fields,
+            as a ResultSet if events is one and as a generator otherwise.
     """
     log = logging.getLogger(__name__)
-    events = resolve(events)
     log.info(f"Received argv: {argv}")
     args = eval.parser.parse_args(argv[1:])
     log.debug(f"Found args: {args}")
-    ret = []
-    for event in events:
-        log.debug(f"Found event: {event}")
-        for expression in args.expressions:
-            log.info(f"Found expression: {expression}")
-            lhs, rhs = expression.split("=", 1)
-            log.info(f"Found lhs, rhs: {lhs}, {rhs}")
-            if rhs.startswith("$"):
-                rhs_symbol = rhs.replace("$", "")
-                if rhs_symbol in event:
-                    event[lhs] = cast(event[rhs_symbol])
-                else:
-                    event[lhs] = cast(rhs)    
+    # Every expression is parsed and compiled once, before any event is read
+    assignments = [parse_assignment(expression) for expression in args.expressions]
+    log.debug(f"Found assignments: {assignments}")
+    if isinstance(events, ResultSet):
+        return _eval_result_set(events, assignments)
+    return _eval_events(events, assignments)
+
+def _eval_events(events: Any, assignments: List[Assignment]) -> Iterator[Dict[str, Any]]:
+    """
+    Set the fields of each event, one at a time.
+    """
+    # $name copies a field missing from an event as None if any other event
+    # has it (as every event has the fields of the others once resolved),
+    # and as the literal otherwise. An event missing a copied field is held
+    # back, along with the events after it, until another event has the
+    # field or there are no more events, so events are streamed unless a
+    # copied field is missing from all of them.
+    seen: Set[str] = set()
+    sources = set()
+    steps = []
+    for index, assignment in enumerate(assignments):
+        if assignment.expression is not None:
+            function = assignment.expression.bind()[0]
+        elif assignment.source is not None:
+            function = _copy(assignment.source, assignment.literal, seen)
+            if all(earlier.field != assignment.source for earlier in assignments[:index]):
+                sources.add(assignment.source)
+        else:
+            function = _literal(assignment.literal)
+        steps.append((assignment.field, function))
+    pending: Deque[Dict[str, Any]] = deque()
+    for event in resolve(events, lazy=True):
+        seen.update(source for source in sources if source in event)
+        pending.append(event)
+        if len(seen) == len(sources):
+            while pending:
+                yield _assign(pending.popleft(), steps)
+    while pending:
+        yield _assign(pending.popleft(), steps)
+
+def _assign(event: Dict[str, Any], steps: List[Tuple[str, Callable[[Dict[str, Any]], Any]]]) -> Dict[str, Any]:
+    for field, function in steps:
+        event[field] = function(event)
+    return event
+
+def _eval_result_set(events: ResultSet, assignments: List[Assignment]) -> ResultSet:
+    """
+    Set the fields of a ResultSet one column at a time, mapping each
+    expression over the columns of the fields it references.
+    """
+    for assignment in assignments:
+        length = len(events)
+        if assignment.expression is not None:
+            function = assignment.expression.bind()[1]
+            fields = assignment.expression.fields
+            column = events.columns.get(fields[0]) if len(fields) == 1 else None
+            if column is not None and column.kind == "str" and assignment.expression.type in IMMUTABLE_TYPES:
+                # Dictionary encoded columns are mapped once per distinct value,
+                # so results are shared between rows and must not be mutable
+                values = column.map(function)
+            elif fields:
+                values = list(map(function, *(_column(events, field) for field in fields)))
             else:
-                event[lhs] = cast(rhs)
-        yield event
+                values = [function() for _ in range(length)]
+        elif assignment.source is not None:
+            if assignment.source in events.columns:
+                values = [cast(value) for value in events.column(assignment.source)]
+            else:
+                values = [assignment.literal] * length
+        else:
+            literal = _literal(assignment.literal)
+            values = [literal(None) for _ in range(length)]
+        events = events.with_column(assignment.field, values)
+    return events
+
+def _column(events: ResultSet, field: str) -> List[Any]:
+    """
+    Return the values of field, which may be a path into nested dicts.
+    """
+    if field in events.columns or "__" not in field:
+        return events.column(field)
+    root, *path = field.split("__")
+    values = events.column(root)
+    for segment in path:
+        values = [value.get(segment) if isinstance(value, dict) else None for value in values]
+    return values
@@ -10,6 +10,7 @@ from django.db.models.query import QuerySet
 from django.http import HttpRequest
 
 from events.util import resolve
+from events.planner import FieldUsage
 
 from .decorators import search_command
 
@@ -31,7 +32,10 @@ parser.add_argument(
     "Events without the specified fields will be omitted from the results"
 )
 
-@search_command(parser)
+def explode_fields(args: argparse.Namespace) -> FieldUsage:
+    return FieldUsage((args.field,))
+
+@search_command(parser, streaming=True, one_to_one=True, fields=explode_fields)
 def explode(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], argv: List[str], environment: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
     Extract the nested JSON fields from an object and add them to the event. Also removes the original field.
@@ -48,7 +52,7 @@ def explode(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]],
     args = explode.parser.parse_args(argv[1:])
     log = logging.getLogger(__name__)
     field = args.field
-    events = resolve(events)
+    events = resolve(events, lazy=True)
     for event in events:
         log.debug(f"Found event: {event}")
         
@@ -28,7 +28,7 @@ parser.add_argument(
     help="A field with a timestamp as the value. All available fields from the timestamp (year, month, day, hour, etc) will be added to the event",
 )
 
-@search_command(parser)
+@search_command(parser, one_to_one=True)
 def explode_timestamp(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], argv: List[str], environment: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
     Extract the available fields in a timestamp field and add them as fields to the event with the optional prefix.
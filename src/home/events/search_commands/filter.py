@@ -5,12 +5,28 @@
 import logging
 import argparse
 import re
-from typing import Any, Dict, List, Union
+from datetime import datetime
+from functools import lru_cache, reduce
+from itertools import compress
+from operator import and_, or_
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
 
+from django.db import connections
+from django.db.models import Field, Q
+from django.db.models.lookups import In
 from django.db.models.query import QuerySet
 from django.http import HttpRequest
 
-from events.util import resolve
+from events.util import resolve, ResultSet
+from events.planner import (
+    model_columns,
+    is_pushable_value,
+    FieldUsage,
+    JSONType,
+    JSON_BOOLEAN_TYPES,
+    JSON_NUMBER_TYPES,
+    JSON_STRING_TYPES,
+)
 from .util import cast
 from .decorators import search_command
 
@@ -29,29 +45,275 @@ lookup_map = {
     "startswith": lambda lhs, rhs: lhs.startswith(rhs),
     "istartswith": lambda lhs, rhs: lhs.lower().startswith(rhs.lower()),
     "endswith": lambda lhs, rhs: lhs.endswith(rhs),
-    "iendswith": lambda lhs, rhs: lhs.lower().endswith(rhs.lower),
+    "iendswith": lambda lhs, rhs: lhs.lower().endswith(rhs.lower()),
     "isnull": lambda lhs, rhs: lhs is None if rhs is True else lhs is not None,
     "regex": lambda lhs, rhs: re.search(rhs, lhs),
     "iregex": lambda lhs, rhs: re.search(rhs, lhs, re.I),
 }
 
-def resolve_field_lookup(expression: str, item: Dict[str, Any]) -> Any:
-    log = logging.getLogger(__name__)
-    if "__" not in expression or not expression.endswith(tuple([i for i in lookup_map.keys()])):
-        log.debug(f"Found expression: {expression}, appending lookup.")
-        expression = f"{expression}__exact"
-        log.debug(f"Expression modified to: {expression}")
-    ret = item
-    log.debug(f"Found ret: {ret}")
-    for subexpr in expression.split("__")[:-1]:
-        log.debug(f"ret: {ret}, subexpr: {subexpr}")
+# Lookups which the database evaluates exactly like lookup_map when pushed
+# down onto a model column, and onto a key inside a JSONField.
+COLUMN_LOOKUPS = {
+    "exact", "iexact", "contains", "icontains", "in", "gt", "gte", "lt", "lte",
+    "startswith", "istartswith", "endswith", "iendswith", "isnull", "regex", "iregex",
+}
+JSON_KEY_LOOKUPS = {"exact", "in", "gt", "gte", "lt", "lte"}
+# The databases whose JSON types terms on keys inside a JSONField are checked against
+JSON_TYPE_VENDORS = ("sqlite", "postgresql")
+# SQLite implements these with LIKE, which ignores case.
+CASE_SENSITIVE_LIKE_LOOKUPS = {"contains", "startswith", "endswith"}
+# The databases which compare strings in columns by code point, as long
+# as they are only ordered on SQLite (MySQL's default collations also
+# ignore case and accents when comparing strings for equality)
+STRING_COLUMN_VENDORS = ("sqlite", "postgresql")
+STRING_RANGE_LOOKUPS = {"gt", "gte", "lt", "lte"}
+# The databases only fold the case of ASCII letters like Python does
+CASE_INSENSITIVE_LOOKUPS = {"iexact", "icontains", "istartswith", "iendswith", "iregex"}
+# Only SQLite evaluates regular expressions with Python's re module
+REGEX_LOOKUPS = {"regex", "iregex"}
+
+def split_field_lookup(expression: str) -> Tuple[List[str], str]:
+    """
+    Split a filter expression into the path to the field and the lookup,
+    defaulting to an exact lookup.
+
+    Args:
+        expression (str): The left-hand side of a filter term, e.g. extracted_fields__foo__gte
+
+    Returns:
+        Tuple[List[str], str]: The path segments and the name of the lookup.
+    """
+    segments = expression.split("__")
+    if len(segments) > 1 and segments[-1] in lookup_map:
+        return segments[:-1], segments[-1]
+    return segments, "exact"
+
+class Term(NamedTuple):
+    """
+    One KEY=VALUE term of a filter expression, with KEY split into the
+    path to the field and the lookup and VALUE cast once.
+    """
+    path: Tuple[str, ...]
+    lookup: str
+    rhs: Any
+    negate: bool
+
+class Not(NamedTuple):
+    operand: Any
+
+class And(NamedTuple):
+    operands: Tuple[Any, ...]
+
+class Or(NamedTuple):
+    operands: Tuple[Any, ...]
+
+Node = Union[Term, Not, And, Or]
+
+def parse_term(term: str, no_cast: bool) -> Term:
+    """
+    Parse a single KEY=VALUE term, KEY optionally prefixed with ! to negate it.
+
+    Raises:
+        ValueError: If term is not KEY=VALUE or the lookup is not supported.
+    """
+    expression, separator, rhs = term.partition("=")
+    if not separator or not expression.lstrip("!"):
+        raise ValueError(f"Invalid filter term {term!r}, expected KEY=VALUE")
+    negate = expression.startswith("!")
+    expression = expression.lstrip("!")
+    path, lookup = split_field_lookup(expression)
+    if not no_cast:
+        rhs = cast(rhs)
+    return Term(tuple(path), lookup, rhs, negate)
+
+def parse_expression(tokens: Sequence[str], no_cast: bool = False) -> Optional[Node]:
+    """
+    Parse the terms of a filter into a tree of Term, Not, And and Or.
+
+    Terms are combined with AND, OR and NOT (in any case) and grouped
+    with ( and ), each of which must be a separate argument. Adjacent
+    terms are ANDed, NOT binds tighter than AND, which binds tighter
+    than OR.
+
+    Returns:
+        Optional[Node]: The expression, or None if there are no terms.
+
+    Raises:
+        ValueError: If the expression is malformed.
+    """
+    tokens = list(tokens)
+    position = 0
+
+    def peek() -> Optional[str]:
+        return tokens[position] if position < len(tokens) else None
+
+    def keyword(token: Optional[str]) -> Optional[str]:
+        if token is not None and token.lower() in ("and", "or", "not"):
+            return token.lower()
+        return token if token in ("(", ")") else None
+
+    def parse_or() -> Node:
+        nonlocal position
+        operands = [parse_and()]
+        while keyword(peek()) == "or":
+            position += 1
+            operands.append(parse_and())
+        return operands[0] if len(operands) == 1 else Or(tuple(operands))
+
+    def parse_and() -> Node:
+        nonlocal position
+        operands = [parse_not()]
+        while peek() is not None and keyword(peek()) not in ("or", ")"):
+            if keyword(peek()) == "and":
+                position += 1
+            operands.append(parse_not())
+        return operands[0] if len(operands) == 1 else And(tuple(operands))
+
+    def parse_not() -> Node:
+        nonlocal position
+        token = peek()
+        if token is None:
+            raise ValueError("Invalid filter, expected a term at the end of the expression")
+        position += 1
+        if keyword(token) == "not":
+            return Not(parse_not())
+        if keyword(token) == "(":
+            node = parse_or()
+            if peek() != ")":
+                raise ValueError("Invalid filter, missing a closing )")
+            position += 1
+            return node
+        if keyword(token) is not None:
+            raise ValueError(f"Invalid filter, unexpected {token!r}")
+        return parse_term(token, no_cast)
+
+    if not tokens:
+        return None
+    node = parse_or()
+    if position < len(tokens):
+        raise ValueError(f"Invalid filter, unexpected {tokens[position]!r}")
+    return node
+
+def compile_getter(path: Sequence[str]) -> Callable[[Dict[str, Any]], Any]:
+    """
+    Return a function returning the value at path in a dict row, None if
+    any segment is missing.
+    """
+    if len(path) == 1:
+        field = path[0]
+        return lambda row: row.get(field)
+
+    def get(row: Dict[str, Any]) -> Any:
+        value = row
+        for segment in path:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(segment)
+        return value
+    return get
+
+def compile_test(lookup: str, rhs: Any) -> Callable[[Any], Any]:
+    """
+    Return lookup_map[lookup] as a function of the value alone, with rhs
+    lowercased, regular expressions compiled and lists of values turned
+    into sets ahead of time where possible.
+    """
+    if lookup in ("exact", "eq"):
+        return lambda lhs: lhs == rhs
+    if lookup == "ne":
+        return lambda lhs: lhs != rhs
+    if lookup == "gt":
+        return lambda lhs: lhs > rhs
+    if lookup == "gte":
+        return lambda lhs: lhs >= rhs
+    if lookup == "lt":
+        return lambda lhs: lhs < rhs
+    if lookup == "lte":
+        return lambda lhs: lhs <= rhs
+    if lookup in ("regex", "iregex") and isinstance(rhs, str):
+        return re.compile(rhs, re.I if lookup == "iregex" else 0).search
+    if lookup in ("iexact", "icontains", "istartswith", "iendswith") and isinstance(rhs, str):
+        lowered = rhs.lower()
+        return {
+            "iexact": lambda lhs: lhs.lower() == lowered,
+            "icontains": lambda lhs: lowered in lhs.lower(),
+            "istartswith": lambda lhs: lhs.lower().startswith(lowered),
+            "iendswith": lambda lhs: lhs.lower().endswith(lowered),
+        }[lookup]
+    if lookup == "in" and isinstance(rhs, (list, tuple, set)):
         try:
-            ret = ret[subexpr]
-        except KeyError:
-            ret = None
-            continue
-        log.debug(f"Built ret: {ret}")
-    return expression.split("__")[-1], ret
+            members = frozenset(rhs)
+        except TypeError:
+            members = None
+        if members is not None:
+            def test(lhs: Any) -> bool:
+                try:
+                    return lhs in members
+                except TypeError:
+                    # Unhashable values, ie. dicts, are compared one by one
+                    return lhs in rhs
+            return test
+    predicate = lookup_map[lookup]
+    return lambda lhs: predicate(lhs, rhs)
+
+def compile_predicate(node: Optional[Node]) -> Callable[[Dict[str, Any]], bool]:
+    """
+    Compile an expression into a single function of a dict row.
+    """
+    if node is None:
+        return lambda row: True
+    if isinstance(node, Term):
+        get = compile_getter(node.path)
+        test = compile_test(node.lookup, node.rhs)
+        if node.negate:
+            return lambda row: not test(get(row))
+        return lambda row: bool(test(get(row)))
+    if isinstance(node, Not):
+        operand = compile_predicate(node.operand)
+        return lambda row: not operand(row)
+    operands = [compile_predicate(operand) for operand in node.operands]
+    if isinstance(node, And):
+        return lambda row: all(operand(row) for operand in operands)
+    return lambda row: any(operand(row) for operand in operands)
+
+class CompiledFilter(NamedTuple):
+    expression: Optional[Node]
+    predicate: Callable[[Dict[str, Any]], bool]
+
+def compile_filter(terms: Tuple[str, ...], no_cast: bool) -> CompiledFilter:
+    """
+    Parse and compile the terms of a filter, keeping recently used
+    filters so repeated queries do not parse or cast anything.
+
+    Values cast to datetimes are not kept: the parts of a date or time
+    missing from them (ie. created__gte=10:00) are filled in with the
+    current date, so they are cast again every time.
+    """
+    compiled = _compile_cached_filter(terms, no_cast)
+    if compiled is None:
+        expression = parse_expression(terms, no_cast)
+        compiled = CompiledFilter(expression, compile_predicate(expression))
+    return compiled
+
+@lru_cache(maxsize=256)
+def _compile_cached_filter(terms: Tuple[str, ...], no_cast: bool) -> Optional[CompiledFilter]:
+    """
+    Return the compiled filter, or None if it must not be kept.
+    """
+    expression = parse_expression(terms, no_cast)
+    if _has_datetimes(expression):
+        return None
+    return CompiledFilter(expression, compile_predicate(expression))
+
+def _has_datetimes(node: Optional[Node]) -> bool:
+    if isinstance(node, Term):
+        values = node.rhs if isinstance(node.rhs, (list, tuple, set)) else [node.rhs]
+        return any(isinstance(value, datetime) for value in values)
+    if isinstance(node, Not):
+        return _has_datetimes(node.operand)
+    if node is not None:
+        return any(_has_datetimes(operand) for operand in node.operands)
+    return False
 
 parser = argparse.ArgumentParser(
     prog="filter",
@@ -60,7 +322,9 @@ parser = argparse.ArgumentParser(
 parser.add_argument(
     "terms",
     nargs="*",
-    help="Provide one or more search terms, must be in the form KEY=VALUE where key is a reference to a field and VALUE is the value. For KEY, django field lookups are (kind of) supported.",
+    help="Provide one or more search terms, must be in the form KEY=VALUE where key is a reference to a field and VALUE is the value. For KEY, django field lookups are (kind of) supported. "
+         "Terms are ANDed together unless combined with OR, and can be negated with NOT (or by prefixing KEY with !) and grouped with ( and ), "
+         "each as a separate argument, ie. ( status=500 OR status=503 ) NOT host=localhost",
 )
 parser.add_argument(
     "--no-cast",
@@ -68,61 +332,230 @@ parser.add_argument(
     help="If specified, the value will not be cast to a type before completing the test",
 )
 
-@search_command(parser)
-def filter(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], argv: List[str], environment: Dict[str, Any]) -> List[Dict[str, Any]]:
+def term_to_q(term: Term, columns: Dict[str, Field], vendor: str, negate: bool = False) -> Optional[Q]:
+    """
+    Translate one filter term (negated if negate is True) into a Q object,
+    or return None if the database would not give exactly the same
+    answer as lookup_map.
+    """
+    path, lookup, rhs = list(term.path), term.lookup, term.rhs
+    negate = term.negate != negate
+    if lookup not in lookup_map or path[0] not in columns:
+        return None
+    field = columns[path[0]]
+    if lookup == "eq":
+        lookup = "exact"
+    elif lookup == "ne":
+        lookup = "exact"
+        negate = not negate
+    values = rhs if lookup == "in" and isinstance(rhs, (list, tuple)) else [rhs]
+
+    if len(path) == 1:
+        if lookup not in COLUMN_LOOKUPS or (negate and field.null):
+            return None
+        if vendor == "sqlite" and lookup in CASE_SENSITIVE_LIKE_LOOKUPS:
+            return None
+        if lookup == "isnull":
+            if not isinstance(rhs, bool):
+                return None
+        elif lookup == "exact" and rhs is None:
+            pass
+        elif lookup == "in" and not isinstance(rhs, (list, tuple)):
+            return None
+        elif not all(is_pushable_value(field, value) for value in values):
+            return None
+        strings = [value for value in values if isinstance(value, str)]
+        if strings and (
+            vendor not in STRING_COLUMN_VENDORS
+            or lookup in STRING_RANGE_LOOKUPS and vendor != "sqlite"
+            or lookup in CASE_INSENSITIVE_LOOKUPS and not all(value.isascii() for value in strings)
+        ):
+            return None
+        if lookup in REGEX_LOOKUPS and vendor != "sqlite":
+            return None
+    else:
+        # Missing keys and JSON nulls behave differently in SQL than in
+        # Python, so only non-null scalars and non-negated terms are pushed.
+        if field.get_internal_type() != "JSONField" or negate:
+            return None
+        if lookup not in JSON_KEY_LOOKUPS:
+            return None
+        if lookup == "in" and not isinstance(rhs, (list, tuple)):
+            return None
+        if any(not segment or segment in lookup_map for segment in path[1:]):
+            return None
+        return json_key_q(path, lookup, values, vendor)
+    condition = Q(**{"__".join(path + [lookup]): rhs})
+    return ~condition if negate else condition
+
+def json_key_q(path: Sequence[str], lookup: str, values: Sequence[Any], vendor: str) -> Optional[Q]:
+    """
+    Translate a comparison of the key at path inside a JSONField to values
+    (a single value unless lookup is in) into a Q object, or return None
+    if the database would not give exactly the same answer as lookup_map.
+
+    The database compares values of different JSON types by its own
+    rules (ie. PostgreSQL orders every string before every number), so
+    each value is only compared to keys holding a value of the same type,
+    plus booleans, which Python compares to numbers as 0 and 1.
+    """
+    if vendor not in JSON_TYPE_VENDORS:
+        return None
+    for value in values:
+        if value is None or isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            return None
+    strings = [value for value in values if isinstance(value, str)]
+    numbers = [value for value in values if not isinstance(value, str)]
+    # PostgreSQL orders strings with the database's collation
+    if strings and lookup not in ("exact", "in") and vendor != "sqlite":
+        return None
+    key = "__".join(path)
+    json_type = JSONType(path[0], list(path[1:]))
+    conditions = []
+    for types, group in ((JSON_STRING_TYPES, strings), (JSON_NUMBER_TYPES, numbers)):
+        if group:
+            condition = Q(**{f"{key}__{lookup}": group}) if lookup == "in" else Q(**{f"{key}__{lookup}": group[0]})
+            conditions.append(Q(In(json_type, types)) & condition)
+    test = compile_test(lookup, values if lookup == "in" else values[0])
+    for boolean in (True, False):
+        try:
+            matches = test(boolean)
+        except TypeError:
+            matches = False
+        if matches:
+            conditions.append(Q(In(json_type, JSON_BOOLEAN_TYPES)) & Q(**{f"{key}__exact": boolean}))
+    if not conditions:
+        # Nothing can match, ie. in an empty list
+        return Q(pk__in=[])
+    return reduce(or_, conditions)
+
+def expression_to_q(node: Node, columns: Dict[str, Field], vendor: str, negate: bool = False) -> Optional[Q]:
+    """
+    Translate an expression into a Q object, or return None if any of its
+    terms cannot be pushed down (see term_to_q). NOT is pushed down to the
+    terms (by De Morgan's laws) so every negated term is checked on its own.
+    """
+    if isinstance(node, Term):
+        return term_to_q(node, columns, vendor, negate)
+    if isinstance(node, Not):
+        return expression_to_q(node.operand, columns, vendor, not negate)
+    conditions = [expression_to_q(operand, columns, vendor, negate) for operand in node.operands]
+    if any(condition is None for condition in conditions):
+        return None
+    return reduce(or_ if isinstance(node, And) == negate else and_, conditions)
+
+def filter_pushdown(queryset: QuerySet, argv: List[str]) -> Optional[QuerySet]:
+    """
+    Fold the filter expression into the QuerySet as a .filter() call.
+
+    Only terms on model columns and on keys inside JSONFields (e.g.
+    extracted_fields__status=500) are pushed and only when every term
+    can be pushed, otherwise None is returned and the expression is
+    evaluated in Python.
+    """
+    if queryset.query.is_sliced:
+        return None
+    if "filter" in argv:
+        argv.pop(argv.index("filter"))
+    args = parser.parse_args(argv)
+    expression = compile_filter(tuple(args.terms), args.no_cast).expression
+    if expression is None:
+        return queryset
+    condition = expression_to_q(expression, model_columns(queryset), connections[queryset.db].vendor)
+    if condition is None:
+        return None
+    return queryset.filter(condition)
+
+def _select(events: ResultSet, node: Node, alive: List[int]) -> List[int]:
+    """
+    Return the indices in alive (in order) of the rows of events which
+    match node. Terms are evaluated column-wise, once per distinct value
+    of dictionary encoded columns, and only for the rows which can still
+    change the result: AND narrows alive term by term and OR only tests
+    the rows which no previous operand matched.
+    """
+    if not alive:
+        return alive
+    if isinstance(node, Term):
+        rest = node.path[1:]
+        test = compile_test(node.lookup, node.rhs)
+        negate = node.negate
+
+        def matches(value: Any) -> bool:
+            for segment in rest:
+                value = value.get(segment) if isinstance(value, dict) else None
+            return not test(value) if negate else bool(test(value))
+        return list(compress(alive, events.get_column(node.path[0]).map(matches, alive)))
+    if isinstance(node, Not):
+        matched = set(_select(events, node.operand, alive))
+        return [index for index in alive if index not in matched]
+    if isinstance(node, And):
+        for operand in node.operands:
+            alive = _select(events, operand, alive)
+        return alive
+    matched = set()
+    remaining = alive
+    for operand in node.operands:
+        selected = set(_select(events, operand, remaining))
+        matched |= selected
+        remaining = [index for index in remaining if index not in selected]
+    return [index for index in alive if index in matched]
+
+def filter_result_set(events: ResultSet, terms: List[str], no_cast: bool) -> ResultSet:
+    """
+    Filter a ResultSet column-wise, see _select.
+    """
+    expression = compile_filter(tuple(terms), no_cast).expression
+    if expression is None:
+        return events
+    return events.take(_select(events, expression, list(range(len(events)))))
+
+def _term_fields(node: Optional[Node]) -> Iterator[str]:
+    if isinstance(node, Term):
+        yield "__".join(node.path)
+    elif isinstance(node, Not):
+        yield from _term_fields(node.operand)
+    elif node is not None:
+        for operand in node.operands:
+            yield from _term_fields(operand)
+
+def filter_fields(args: argparse.Namespace) -> FieldUsage:
+    return FieldUsage(_term_fields(compile_filter(tuple(args.terms), args.no_cast).expression))
+
+@search_command(parser, streaming=True, pushdown=filter_pushdown, fields=filter_fields)
+def filter(request: HttpRequest, events: Union[QuerySet, ResultSet, List[Dict[str, Any]]], argv: List[str], environment: Dict[str, Any]) -> Union[ResultSet, Iterator[Dict[str, Any]]]:
     """
     Reduce the result set by removing events that don't meet the specified criteria.
 
     Args:
         request (HttpRequest): The HTTP request object.
-        events (Union[QuerySet, List[Dict[str, Any]]]): The result set to operate on.
+        events (Union[QuerySet, ResultSet, List[Dict[str, Any]]]): The result set to operate on.
         argv (List[str]): List of command-line arguments.
         environment (Dict[str, Any]): Dictionary used as a jinja2 environment (context) for rendering the arguments of a command.
 
     Returns:
-        List[Dict[str, Any]]: A list of dictionaries with events that meet the specified criteria.
+        Union[ResultSet, Iterator[Dict[str, Any]]]: The events that meet the specified criteria,
+            as a ResultSet if events is one and as a generator otherwise.
     """
     log = logging.getLogger(__name__)
-    log.debug(f"Received {events} events")
-    events = resolve(events)
-    log.debug(f"Resolved events: {events}")
-    log.debug(f"Received argv: {argv}")
     if "filter" in argv:
         argv.pop(argv.index("filter"))
     args = filter.parser.parse_args(argv)
     log.debug(f"Found args: {args}")
+    if isinstance(events, ResultSet):
+        return filter_result_set(events, args.terms, args.no_cast)
+    # The expression is compiled once, before any event is read
+    predicate = compile_filter(tuple(args.terms), args.no_cast).predicate
+    return _filter_events(events, predicate)
 
+def _filter_events(events: Any, predicate: Callable[[Dict[str, Any]], bool]) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the events which meet the criteria, one at a time.
+    """
+    log = logging.getLogger(__name__)
+    log.debug(f"Received {events} events")
+    events = resolve(events, lazy=True)
+    log.debug(f"Resolved events: {events}")
     for event in events:
-        log.debug(f"Found event: {event}")
-        allowed = True
-        for term in args.terms:
-            log.debug(f"Found term: {term}")
-            expression, rhs = term.split("=")
-            if expression.startswith("!"):
-                negate = True
-                expression = expression.lstrip("!")
-            else:
-                negate = False
-            log.debug(f"Found expression: {expression}, rhs: {rhs}")
-            predicate, lhs = resolve_field_lookup(expression=expression, item=event)
-            log.debug(f"Found predicate: {predicate}, lhs: {lhs}")
-            if predicate not in lookup_map:
-                raise ValueError(f"Sorry, {predicate} is not a valid lookup, please choose one of {lookup_map.keys()}")
-            predicate = lookup_map[predicate]
-            log.debug(f"predicate resolved: {predicate}")
-
-            if not args.no_cast:
-                rhs = cast(rhs)
-                log.debug(f"Cast rhs: {rhs} to {type(rhs)}")
-            if negate:
-                if predicate(lhs, rhs):
-                    log.debug(f"negated {predicate}({lhs}, {rhs}) returned: {predicate(lhs, rhs)}")
-                    allowed = False
-                    break
-            else:
-                if not predicate(lhs, rhs):
-                    log.debug(f"{predicate}({lhs}, {rhs}) returned: {predicate(lhs, rhs)}")
-                    allowed = False
-                    break
-        if allowed:
+        if predicate(event):
             yield event
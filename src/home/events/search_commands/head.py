@@ -4,12 +4,14 @@
 
 import logging
 import argparse
-from typing import Any, Dict, List, Union
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Union
 
 from django.db.models.query import QuerySet
 from django.http import HttpRequest
 
-from events.util import resolve
+from events.util import resolve, stream, ResultSet
+from events.planner import FieldUsage, stable_order
 from .decorators import search_command
 
 parser = argparse.ArgumentParser(
@@ -23,27 +25,61 @@ parser.add_argument(
     help="Provide the number of events to return.",
 )
 
-@search_command(parser)
-def head(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], argv: List[str], environment: Dict[str, Any]) -> List[Dict[str, Any]]:
+def head_pushdown(queryset: QuerySet, argv: List[str]) -> Optional[QuerySet]:
+    """
+    Fold head into the QuerySet as a LIMIT, of the QuerySet ordered by
+    primary key unless it is ordered already (see stable_order).
+    """
+    if "head" in argv:
+        argv.pop(argv.index("head"))
+    args = parser.parse_args(argv)
+    if args.number < 0:
+        return None
+    return stable_order(queryset)[:args.number]
+
+def head_fields(args: argparse.Namespace) -> FieldUsage:
+    return FieldUsage(())
+
+@search_command(parser, streaming=True, pushdown=head_pushdown, fields=head_fields)
+def head(request: HttpRequest, events: Union[QuerySet, ResultSet, List[Dict[str, Any]]], argv: List[str], environment: Dict[str, Any]) -> Union[ResultSet, Iterator[Dict[str, Any]], List[Dict[str, Any]]]:
     """
     Return the first n records of the result set.
 
+    Events are pulled from the previous stage one at a time and, once n
+    events have been returned, the previous stage is closed so that no
+    more events are read or processed.
+
     Args:
         request (HttpRequest): The HTTP request object.
-        events (Union[QuerySet, List[Dict[str, Any]]]): The result set to operate on.
+        events (Union[QuerySet, ResultSet, List[Dict[str, Any]]]): The result set to operate on.
         argv (List[str]): List of command-line arguments.
         environment (Dict[str, Any]): Dictionary used as a jinja2 environment (context) for rendering the arguments of a command.
 
     Returns:
-        List[Dict[str, Any]]: A list of dictionaries with the first n records of the result set.
+        Union[ResultSet, Iterator[Dict[str, Any]], List[Dict[str, Any]]]: The first n records of the result set,
+            as a ResultSet if events is one.
     """
     log = logging.getLogger(__name__)
-    events = resolve(events)
-    log.debug(f"Received {len(events)} events")
     log.debug(f"Received argv: {argv}")
     if "head" in argv:
         argv.pop(argv.index("head"))
     args = head.parser.parse_args(argv)
+    if isinstance(events, ResultSet):
+        return events[:args.number]
+    if args.number < 0:
+        # All but the last events, which requires reading all of them
+        return resolve(events)[:args.number]
+    if isinstance(events, QuerySet):
+        return resolve(stable_order(events)[:args.number])
+    return _take(stream(events), args.number)
 
-    for item in events[:args.number]:
-        yield item
+def _take(events: Any, number: int) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the first number events, then close events.
+    """
+    try:
+        yield from islice(events, number)
+    finally:
+        close = getattr(events, "close", None)
+        if close is not None:
+            close()
@@ -5,8 +5,10 @@
 import argparse
 from datetime import timedelta
 import logging
-from typing import Any, Dict, List, Union
+from itertools import chain, islice
+from typing import Any, Dict, List, Optional, Sequence, Set, Union
 
+from django.db import connections
 from django.db.models import Q
 from django.db.models.query import QuerySet
 from django.http import HttpRequest
@@ -14,7 +16,12 @@ from django.utils import timezone
 from django.utils.module_loading import import_string
 from django.contrib.auth.models import Permission
 
-from events.util import resolve
+from django.conf import settings
+
+from events.util import resolve, stream
+from events.hash_join import hash_join, row_key, Key
+from events.planner import model_columns, is_pushable_value
+from .filter import lookup_map, json_key_q, JSON_TYPE_VENDORS
 from .decorators import search_command
 from .util import (
     cast,
@@ -67,8 +74,11 @@ parser.add_argument(
 )
 parser.add_argument(
     "-f", "--fields",
+    action="append",
     help="Specify the fields to join on. "
-         "Specify in the format of LEFT_FIELD,RIGHT_FIELD",
+         "Specify in the format of LEFT_FIELD,RIGHT_FIELD "
+         "(or FIELD if it has the same name on both sides). "
+         "Can be specified multiple times to join on multiple fields.",
 )
 parser.add_argument(
     "--model",
@@ -84,11 +94,83 @@ parser.add_argument(
          "For KEY, django field lookups are supported.",
 )
 
+def _is_pushable_json_value(value: Any) -> bool:
+    # See filter.json_key_q, only non-null scalars compare the same way
+    # inside a JSONField in the database as they do in Python.
+    return not isinstance(value, bool) and isinstance(value, (str, int, float))
+
+def key_conditions(queryset: QuerySet, right_fields: Sequence[str], keys: Set[Key], batch_size: int) -> Optional[List[Q]]:
+    """
+    Translate the distinct join keys of the left side into batches of
+    field__in conditions selecting the rows of queryset which can match.
+
+    Right fields may be model columns or keys inside a JSONField (ie.
+    extracted_fields__status). Batches are split on the values of the
+    first field, so no row is selected by more than one batch. Multi-key
+    batches select a superset of the matching rows, the join itself only
+    keeps exact matches.
+
+    Returns:
+        Optional[List[Q]]: One condition per batch, or None if any field
+            or key value cannot be compared by the database exactly like
+            Python would.
+    """
+    columns = model_columns(queryset)
+    vendor = connections[queryset.db].vendor
+    checks = []
+    for field in right_fields:
+        path = field.split("__")
+        column = columns.get(path[0])
+        if column is None:
+            return None
+        if len(path) == 1:
+            checks.append(lambda value, column=column: is_pushable_value(column, value))
+        elif (
+            column.get_internal_type() == "JSONField"
+            and vendor in JSON_TYPE_VENDORS
+            and all(segment and segment not in lookup_map for segment in path[1:])
+        ):
+            checks.append(_is_pushable_json_value)
+        else:
+            return None
+    for key in keys:
+        if not all(check(value) for check, value in zip(checks, key)):
+            return None
+
+    by_first_value: Dict[Any, List[Key]] = {}
+    for key in keys:
+        by_first_value.setdefault(key[0], []).append(key)
+    conditions = []
+    batch: List[Key] = []
+    for group in by_first_value.values():
+        batch.extend(group)
+        if len(batch) >= batch_size:
+            conditions.append(_batch_condition(right_fields, batch, vendor))
+            batch = []
+    if batch:
+        conditions.append(_batch_condition(right_fields, batch, vendor))
+    return conditions
+
+def _batch_condition(right_fields: Sequence[str], batch: List[Key], vendor: str) -> Q:
+    condition = Q()
+    for position, field in enumerate(right_fields):
+        values = list({key[position] for key in batch})
+        if "__" in field:
+            # Keys inside a JSONField are compared by JSON type, like 1 and true in Python
+            condition &= json_key_q(field.split("__"), "in", values, vendor)
+        else:
+            condition &= Q(**{f"{field}__in": values})
+    return condition
+
 @search_command(parser)
 def join(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], argv: List[str], environment: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
     Join the current result set to the results of this command.
 
+    The join is a hash join (see events.hash_join), so each side is
+    only read once. Rows are returned in the order of the left side
+    (the right side for right joins).
+
     Args:
         request (HttpRequest): The HTTP request object.
         events (Union[QuerySet, List[Dict[str, Any]]]): The result set to operate on.
@@ -159,36 +241,47 @@ def join(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], ar
         log.critical(f"FOUND ORDER_BY: {order_by}")
         ret = ret.order_by(*order_by)
 
-    left = events
-    right = list(ret.values())
-    left_field, right_field = args.fields.split(",")
-    if args.type == "left":
-        for left_row in left:
-            match = False
-            for right_row in right:
-                if left_row.get(left_field, False) == right_row.get(right_field, "False"):
-                    new_row = left_row.copy()
-                    new_row.update(
-                        {k: v for k, v in right_row.items() if k != right_field}
-                    )
-                    yield new_row
-                    match = True
-            if not match:
-                yield left_row
-    elif args.type == "right":
-        for right_row in right:
-            match = False
-            for left_row in left:
-                if right_row.get(right_field, False) == left_row.get(left_field, "False"):
-                    new_row = right_row.copy()
-                    new_row.update(
-                        {k: v for k, v in left_row.items() if k != left_field}
-                    )
-                    yield new_row
-                    match = True
-            if not match:
-                yield right_row
-    elif args.type == "full":
-        raise NotImplementedError(f"Sorry {args.type} currently not supported")
-    elif args.type == "inner":
-        raise NotImplementedError(f"Sorry {args.type} currently not supported")
+    if not args.fields:
+        raise ValueError("Please specify the fields to join on with --fields.")
+    left_fields, right_fields = [], []
+    for pair in args.fields:
+        left_field, _, right_field = pair.partition(",")
+        left_fields.append(left_field.strip())
+        right_fields.append((right_field or left_field).strip())
+
+    ret = ret.all()
+    right_count = ret.count()
+    right = stream(ret)
+    if args.type in ("left", "inner"):
+        # Rows of the right side which match no left row are not needed,
+        # so only fetch the ones whose keys appear on the left side.
+        keys = {row_key(event, left_fields) for event in events} - {None}
+        batch_size = settings.DELVE_JOIN_KEY_BATCH_SIZE
+        conditions = None
+        if len(keys) < right_count:
+            conditions = key_conditions(ret, right_fields, keys, batch_size)
+        if conditions is None:
+            log.debug(f"Unable to push down the join keys, reading every right side row")
+        elif len(conditions) > settings.DELVE_JOIN_MAX_KEY_BATCHES:
+            log.debug(f"Found {len(keys)} join keys, too many to push down, reading every right side row")
+        else:
+            log.debug(f"Pushing {len(keys)} join keys down in {len(conditions)} batches")
+            right = chain.from_iterable(stream(ret.filter(condition)) for condition in conditions)
+
+    # Build the hash table from the smaller side and stream the other one.
+    # The right side is only counted once it has the rows which can match,
+    # by reading up to one more row than the left side has.
+    head = list(islice(right, len(events) + 1))
+    if len(head) <= len(events):
+        build, right = "right", head
+    else:
+        build, right = "left", chain(head, right)
+    log.debug(f"Joining {len(events)} events to {'more than ' if build == 'left' else ''}{len(head)} rows, building from the {build} side")
+    yield from hash_join(
+        events,
+        right,
+        left_fields,
+        right_fields,
+        how=args.type,
+        build=build,
+    )
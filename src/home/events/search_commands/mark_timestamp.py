@@ -24,7 +24,7 @@ parser.add_argument(
     help="Provide the fields you would like to parse as datetime",
 )
 
-@search_command(parser)
+@search_command(parser, one_to_one=True)
 def mark_timestamp(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], argv: List[str], environment: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
     Parse the given fields from strings to datetime objects. Useful for use with filter search_command.
@@ -4,11 +4,26 @@
 
 import argparse
 
+from django.conf import settings
+
+from events.file_formats import (
+    JSONItems,
+    csv_header,
+    decompressed,
+    is_compressed,
+    iter_csv,
+    iter_lines,
+    iter_xml,
+    jsonl_content,
+    read_parallel,
+    split_offsets,
+)
 from events.models import (
     FileUpload,
 )
 
 from .decorators import search_command
+from .util import worker_processes
 
 parser = argparse.ArgumentParser(
     prog="read_file",
@@ -29,12 +44,85 @@ parser.add_argument(
         "csv",
         "json",
         "jsonl",
+        "lines",
         "xml",
     ),
     help="If specified, must be a supported option. File contents "
-         "will be parsed according to the format specified.",
+         "will be parsed according to the format specified. Files "
+         "compressed with gzip or zstd are decompressed first.",
+)
+parser.add_argument(
+    "--record-path",
+    help="With --parse xml, the '/' separated path of tags from the root "
+         "element (ie. catalog/book) of the elements to read in as events, "
+         "one at a time. By default the whole document is one event.",
+)
+parser.add_argument(
+    "-p", "--processes",
+    type=int,
+    default=None,
+    help="With --parse csv or jsonl, parse the file in this many worker processes "
+         "when it is larger than DELVE_READ_FILE_SPLIT_SIZE MiB, default "
+         "DELVE_READ_FILE_PROCESSES (0 parses in the query's process), at most DELVE_MAX_PROCESSES",
+)
+parser.add_argument(
+    "--unordered",
+    action="store_true",
+    help="With --processes, return the events of each part of the file as soon as "
+         "it is parsed rather than in the order of the file",
 )
 
+def _csv_event(title, url, fieldnames, row):
+    # The same dict csv.DictReader makes of a row
+    ret = {
+        "title": title,
+        "url": url,
+    }
+    ret.update(zip(fieldnames, row))
+    if len(row) > len(fieldnames):
+        ret[None] = list(row[len(fieldnames):])
+    else:
+        for key in fieldnames[len(row):]:
+            ret[key] = None
+    return ret
+
+def _jsonl_events(title, url, content):
+    if isinstance(content, (str, int, dict)):
+        yield {
+            "title": title,
+            "url": url,
+            "content": content,
+        }
+    else:
+        for item in content:
+            yield {
+                "title": title,
+                "url": url,
+                'content': item,
+            }
+
+def _parallel_parts(file_object, _format, split_size):
+    """
+    Return the path of the uploaded file, its field names if it is a CSV
+    file and the offsets of the parts it is split into, or None if it is
+    read in this process: when it is not on the local file system, is
+    compressed or is not larger than one part.
+    """
+    try:
+        path = file_object.content.path
+    except NotImplementedError:
+        return None
+    if is_compressed(path):
+        return None
+    fieldnames = None
+    offsets = split_offsets(path, split_size, quoted=_format == "csv")
+    if _format == "csv":
+        fieldnames, start = csv_header(path)
+        offsets = [start] + [offset for offset in offsets if offset > start]
+    if len(offsets) <= 2:
+        return None
+    return path, fieldnames, offsets
+
 @search_command(parser)
 def read_file(request, events, argv, environment):
     # import magic
@@ -46,72 +134,91 @@ def read_file(request, events, argv, environment):
         user=request.user,
         title=filename,
     )
+    title = file_object.title
+    url = file_object.content.url
+    processes = worker_processes(settings.DELVE_READ_FILE_PROCESSES if args.processes is None else args.processes)
+    if processes > 0 and args.parse in ("csv", "jsonl"):
+        parts = _parallel_parts(file_object, args.parse, int(settings.DELVE_READ_FILE_SPLIT_SIZE * 1024 * 1024))
+        if parts is not None:
+            path, fieldnames, offsets = parts
+            batches = read_parallel(
+                path,
+                args.parse,
+                processes,
+                offsets,
+                ordered=not args.unordered,
+                allow_escape=args.allow_escape,
+            )
+            for batch in batches:
+                if args.parse == "csv":
+                    for row in batch:
+                        yield _csv_event(title, url, fieldnames, row)
+                else:
+                    for content in batch:
+                        yield from _jsonl_events(title, url, content)
+            return
     # file_type = magic.from_buffer(file_object.open("rb").read(2048))
-    if args.parse:
+    # Every format is read a chunk at a time, so only the current record
+    # is kept in memory however large the file
+    with file_object.content.open("rb") as stream:
+        stream = decompressed(stream)
         _format = args.parse
         if _format == "csv":
-            import csv
-            reader = csv.DictReader(file_object.content.open("r"))
-            for row in reader:
+            for row in iter_csv(stream):
                 yield {
-                    "title": file_object.title,
-                    "url": file_object.content.url,
+                    "title": title,
+                    "url": url,
                     **row
                 }
         elif _format == "json":
-            import json
-            content = json.load(file_object.content)
-            if isinstance(content, (str, int, dict)):
-                yield {
-                    "title": file_object.title,
-                    "url": file_object.content.url,
-                    "content": content,
-                }
-            else:
+            content = JSONItems(stream)
+            if content.array:
                 for item in content:
                     yield {
-                        "title": file_object.title,
-                        "url": file_object.content.url,
+                        "title": title,
+                        "url": url,
                         **item
                     }
+            else:
+                for item in content:
+                    yield {
+                        "title": title,
+                        "url": url,
+                        "content": item,
+                    }
         elif _format == "jsonl":
-            import json
-            for line in file_object.content:
-                try:
-                    content = json.loads(line)
-                except:
-                    if args.allow_escape:
-                        try:
-                            content = json.loads(line.replace("\\", "\\\\"))
-                        except:
-                            content = [line.decode()]
-                    else:
-                        content = [line.decode()]
-                if isinstance(content, (str, int, dict)):
+            for line in iter_lines(stream):
+                yield from _jsonl_events(title, url, jsonl_content(line, args.allow_escape))
+        elif _format == "lines":
+            for line in iter_lines(stream):
+                yield {
+                    "title": title,
+                    "url": url,
+                    "content": line.decode(errors="replace").rstrip("\r\n"),
+                }
+        elif _format == "xml":
+            for record in iter_xml(stream, args.record_path):
+                if args.record_path is None:
+                    yield record
+                elif isinstance(record, dict):
                     yield {
-                        "title": file_object.title,
-                        "url": file_object.content.url,
-                        "content": content,
+                        "title": title,
+                        "url": url,
+                        **record
                     }
                 else:
-                    for item in content:
-                        yield {
-                            "title": file_object.title,
-                            "url": file_object.content.url,
-                            'content': item,
-                        }
-        elif _format == "xml":
-            # from xml.etree.ElementTree import ElementTree as etree
-            # tree = etree.parse
-            import xmltodict
-            import json
-            dict_repr = xmltodict.parse(file_object.content, process_namespaces=False)
-            yield json.loads(json.dumps(dict_repr))
+                    yield {
+                        "title": title,
+                        "url": url,
+                        "content": record,
+                    }
+        elif _format is None:
+            # The lines of the file make up a single event, so this is the
+            # one mode which reads the whole file, see --parse lines
+            yield {
+                "title": title,
+                "url": url,
+                "content": list(iter_lines(stream)),
+            }
         else:
             raise ValueError(f"Format {_format} is unsupported.")
-    else:
-        yield {
-            "title": file_object.title,
-            "url": file_object.content.url,
-            "content": list(file_object.content),
-        }
@@ -9,6 +9,7 @@ from django.db.models.query import QuerySet
 from django.http import HttpRequest
 
 from events.util import resolve
+from events.planner import FieldUsage
 from .decorators import search_command
 
 parser = argparse.ArgumentParser(
@@ -26,7 +27,10 @@ parser.add_argument(
     help="The field to rename to",
 )
 
-@search_command(parser)
+def rename_fields(args: argparse.Namespace) -> FieldUsage:
+    return FieldUsage((args.from_field,))
+
+@search_command(parser, streaming=True, one_to_one=True, fields=rename_fields)
 def rename(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], argv: List[str], environment: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
     Rename a field.
@@ -40,8 +44,8 @@ def rename(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]],
     Returns:
         List[Dict[str, Any]]: A list of dictionaries with the specified field renamed.
     """
-    events = resolve(events)
+    events = resolve(events, lazy=True)
     args = rename.parser.parse_args(argv[1:])
     for event in events:
-        event[args.to_field] = event.pop(args.from_field)
+        event[args.to_field] = event.pop(args.from_field, None)
         yield event
@@ -31,7 +31,7 @@ parser.add_argument(
     help="The string to replace the matched text with",
 )
 
-@search_command(parser)
+@search_command(parser, streaming=True, one_to_one=True)
 def replace(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], argv: List[str], environment: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
     Replace text matching a regular expression with a provided string.
@@ -45,11 +45,11 @@ def replace(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]],
     Returns:
         List[Dict[str, Any]]: A list of dictionaries with the specified text replaced.
     """
-    events = resolve(events)
+    events = resolve(events, lazy=True)
     args = replace.parser.parse_args(argv[1:])
     field = args.field
     expression = re.compile(args.expression)
     replacement = args.replacement
     for event in events:
-        event[field] = expression.sub(replacement, event[field])
+        event[field] = expression.sub(replacement, event.get(field))
         yield event
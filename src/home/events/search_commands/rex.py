@@ -2,17 +2,20 @@
 # This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
 # See the LICENSE file in the root of this repository for details.
 
-import re
 import argparse
 import logging
 from typing import Any, Dict, List, Union
 
+from django.conf import settings
 from django.db.models.query import QuerySet
 from django.http import HttpRequest
 
+from events.extraction import compile_extractor, extract_events
 from events.util import resolve
+from events.planner import FieldUsage
 
 from .decorators import search_command
+from .util import worker_processes
 
 parser = argparse.ArgumentParser(
     prog="rex",
@@ -23,13 +26,30 @@ parser.add_argument(
     default="text",
     help="The field to run the regular expression against"
 )
+parser.add_argument(
+    "--first",
+    action="store_true",
+    help="Only extract the named groups of the first regular expression which matches, "
+         "by default later regular expressions overwrite the groups of earlier ones",
+)
+parser.add_argument(
+    "-p", "--processes",
+    type=int,
+    default=None,
+    help="Extract in this many worker processes when there are more than "
+         "DELVE_REX_CHUNK_SIZE events, default DELVE_REX_PROCESSES (0 extracts in the query's process), "
+         "at most DELVE_MAX_PROCESSES",
+)
 parser.add_argument(
     nargs="+",
     dest="expressions",
     help="The regular expressions to use for extraction",
 )
 
-@search_command(parser)
+def rex_fields(args: argparse.Namespace) -> FieldUsage:
+    return FieldUsage((args.field,))
+
+@search_command(parser, streaming=True, one_to_one=True, fields=rex_fields)
 def rex(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], argv: List[str], environment: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
     Use regular expressions to extract values from a field and store in extracted_fields.
@@ -45,19 +65,18 @@ def rex(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], arg
     """
     log = logging.getLogger(__name__)
     log.info("In search_command rex")
-    events = resolve(events)
+    events = resolve(events, lazy=True)
     args = rex.parser.parse_args(argv[1:])
     log.debug(f"Found args: {args}")
-    expressions = [re.compile(expression) for expression in args.expressions]
-    log.debug(f"Found expressions: {expressions}")
-    for event in events:
-        log.debug(f"Found event: {event}")
-        for expression in expressions:
-            try:
-                results = expression.search(event[args.field])
-            except:
-                results = expression.search(event[args.field].decode())
-            log.debug(f"Found results: {results}")
-            if results:
-                event.update(results.groupdict())
-        yield event
+    expressions = tuple(args.expressions)
+    # Compile once per process (and validate before any event is read)
+    compile_extractor(expressions, args.first)
+    processes = worker_processes(settings.DELVE_REX_PROCESSES if args.processes is None else args.processes)
+    yield from extract_events(
+        events,
+        args.field,
+        expressions,
+        first=args.first,
+        processes=processes,
+        chunk_size=settings.DELVE_REX_CHUNK_SIZE,
+    )
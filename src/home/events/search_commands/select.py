@@ -11,6 +11,7 @@ from typing import Any, Dict, List, Union
 from django.db.models.query import QuerySet
 from django.http import HttpRequest
 
+from events.planner import FieldUsage
 from .decorators import search_command
 
 parser = argparse.ArgumentParser(
@@ -23,7 +24,10 @@ parser.add_argument(
     help="The fields to select from the result set",
 )
 
-@search_command(parser)
+def select_fields(args: argparse.Namespace) -> FieldUsage:
+    return FieldUsage(args.fields, projects=True)
+
+@search_command(parser, fields=select_fields)
 def select(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], argv: List[str], environment: Dict[str, Any]) -> Union[QuerySet, List[Dict[str, Any]]]:
     """
     Remove all but the specified fields from all events.
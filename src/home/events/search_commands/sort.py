@@ -4,35 +4,124 @@
 
 import argparse
 import logging
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from django.db.models.functions import Collate
 from django.db.models.query import QuerySet
 from django.http import HttpRequest
-from operator import itemgetter
 
-from events.util import resolve
+from events.util import resolve, stream, ResultSet
+from events.external_sort import external_sort, top_k
+from events.governor import governed
+from events.planner import model_columns, stable_order, FieldUsage, PUSHABLE_TYPES
 from .decorators import search_command
 
 parser = argparse.ArgumentParser(
     prog="sort",
-    description="Sort the result set by the given fields",
+    description="Sort the result set by the given fields. Nulls and missing "
+                "values sort first, followed by numbers, strings and any other "
+                "values, so fields of mixed types can be sorted.",
 )
 parser.add_argument(
     "-d", "--descending",
     action="store_true",
     help="If specified, sorting will be done in descending order",
 )
+parser.add_argument(
+    "-l", "--limit",
+    type=int,
+    help="If specified, only the first LIMIT sorted events are returned, "
+         "which only keeps LIMIT events in memory. sort followed by head "
+         "uses this automatically.",
+)
 parser.add_argument(
     nargs="*",
     dest="fields",
-    help="The fields to sort by",
+    help="The fields to sort by, suffix a field with :asc or :desc to "
+         "sort it in that direction regardless of --descending (ie. host created:desc)",
 )
 
-@search_command(parser)
-def sort(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], argv: List[str], environment: Dict[str, Any]) -> Union[QuerySet, List[Dict[str, Any]]]:
+# Collations ordering strings by code point like Python does, by database vendor
+BINARY_COLLATIONS = {
+    "sqlite": "BINARY",
+    "postgresql": "C",
+}
+
+def parse_fields(args: argparse.Namespace) -> Tuple[List[str], List[bool]]:
+    """
+    Return the fields to sort by and whether each one is sorted in
+    descending order.
+    """
+    fields = []
+    descending = []
+    for field in args.fields:
+        name, _, direction = field.rpartition(":")
+        if name and direction in ("asc", "desc"):
+            fields.append(name)
+            descending.append(direction == "desc")
+        else:
+            fields.append(field)
+            descending.append(args.descending)
+    return fields, descending
+
+def sort_pushdown(queryset: QuerySet, argv: List[str]) -> Optional[QuerySet]:
+    """
+    Fold the sort into the QuerySet as .order_by() if every field is a model column.
+
+    Nulls are ordered explicitly like they are in Python (first when
+    ascending, last when descending), and strings with a binary collation.
+    Python's sort is stable, so any existing ordering (or else the primary
+    key, see stable_order) is kept as a tie-breaker.
+    """
+    args = parser.parse_args(argv[1:])
+    if not args.fields or queryset.query.is_sliced:
+        return None
+    fields, descending = parse_fields(args)
+    columns = model_columns(queryset)
+    collation = BINARY_COLLATIONS.get(connections[queryset.db].vendor)
+    expressions = []
+    for field in fields:
+        if field not in columns or columns[field].get_internal_type() == "JSONField":
+            return None
+        if PUSHABLE_TYPES.get(columns[field].get_internal_type()) == (str,):
+            # Python orders strings by code point, whatever the collation of the column
+            if collation is None:
+                return None
+            expressions.append(Collate(F(field), collation))
+        else:
+            expressions.append(F(field))
+    if args.limit is not None and args.limit < 0:
+        return None
+    existing_ordering = stable_order(queryset).query.order_by
+    if not existing_ordering and queryset.query.default_ordering:
+        existing_ordering = queryset.model._meta.ordering
+    queryset = queryset.order_by(
+        *[
+            expression.desc(nulls_last=True) if reverse else expression.asc(nulls_first=True)
+            for expression, reverse in zip(expressions, descending)
+        ],
+        *existing_ordering,
+    )
+    if args.limit is not None:
+        queryset = queryset[:args.limit]
+    return queryset
+
+def sort_fields(args: argparse.Namespace) -> FieldUsage:
+    return FieldUsage(parse_fields(args)[0])
+
+@search_command(parser, pushdown=sort_pushdown, limit="limit", fields=sort_fields)
+def sort(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], argv: List[str], environment: Dict[str, Any]) -> Union[QuerySet, ResultSet, List[Dict[str, Any]]]:
     """
     Sort the result set by the specified fields.
 
+    Result sets which are not already in memory are sorted with an external
+    merge sort (see events.external_sort), which spills sorted runs to
+    disk beyond settings.DELVE_SORT_MEMORY_LIMIT, or with a heap if only
+    the first --limit events are needed.
+
     Args:
         request (HttpRequest): The HTTP request object.
         events (Union[QuerySet, List[Dict[str, Any]]]): The result set to operate on.
@@ -40,26 +129,29 @@ def sort(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], ar
         environment (Dict[str, Any]): Dictionary used as a jinja2 environment (context) for rendering the arguments of a command.
 
     Returns:
-        Union[QuerySet, List[Dict[str, Any]]]: A sorted QuerySet or list of events.
+        Union[QuerySet, ResultSet, List[Dict[str, Any]]]: A sorted QuerySet, ResultSet or list of events.
     """
     log = logging.getLogger(__name__)
     log.debug(f"Found events: {events}")
     args = sort.parser.parse_args(argv[1:])
     log.debug(f"Found args: {args}")
-
-    events = resolve(events)
+    if args.limit is not None and args.limit < 0:
+        raise ValueError(f"Invalid limit {args.limit}, must not be negative")
 
     if not args.fields:
         log.info("No fields specified, using default sort")
         return sorted(
-            events,
-            reverse=args.descending,
-        )
-    else:
-        log.debug(f"Sorting by fields: {args.fields}")
-        events.sort(
+            resolve(events),
             reverse=args.descending,
-            key=itemgetter(*args.fields),
-        )
+        )[:args.limit]
 
-    return events
+    fields, descending = parse_fields(args)
+    if isinstance(events, ResultSet):
+        log.debug(f"Sorting ResultSet by fields: {fields}")
+        return events.sort(fields, reverse=descending, limit=args.limit)
+    rows = governed(stream(events))
+    if args.limit is not None:
+        log.debug(f"Selecting the first {args.limit} events by fields: {fields}")
+        return resolve(top_k(rows, fields, descending, args.limit), columnar=True)
+    log.debug(f"Sorting by fields: {fields}")
+    return external_sort(rows, fields, descending)
@@ -0,0 +1,94 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+from itertools import repeat
+
+from events.util import resolve, stream, Column, ResultSet
+from .engine import HashAggregation, parse_aggregate
+
+def add_aggregate_parser_arguments(aggregate_parser):
+    aggregate_parser.add_argument(
+        "aggregates",
+        nargs="+",
+        help="The aggregates to compute, any of count, count(FIELD), dc(FIELD), "
+             "sum(FIELD), avg(FIELD), min(FIELD), max(FIELD), stddev(FIELD), "
+             "median(FIELD) and pNN(FIELD) (ie. p95(latency)), or the approximate "
+             "estdc(FIELD[,ERROR]), estmedian(FIELD[,COMPRESSION]), "
+             "estpNN(FIELD[,COMPRESSION]) and top(FIELD[,COUNT]). Prefix an "
+             "aggregate with NAME= to store it as NAME instead of ie. avg(FIELD)",
+    )
+    aggregate_parser.add_argument(
+        "--by",
+        nargs="+",
+        default=[],
+        help="If specified, the aggregates are computed per distinct value of the specified fields",
+    )
+    aggregate_parser.add_argument(
+        "--reduce",
+        action="store_true",
+        help="If specified, return one row per group with the by fields and the "
+             "aggregates, instead of adding the aggregates to each event",
+    )
+
+def aggregate(events, args, environment):
+    aggregates = [parse_aggregate(text) for text in args.aggregates]
+    aggregation = HashAggregation(aggregates, args.by)
+    if args.reduce:
+        if isinstance(events, ResultSet):
+            _add_columns(aggregation, events)
+        else:
+            # Only the accumulators of each group are kept, so events
+            # (including QuerySets) are aggregated as they are read
+            for _ in aggregation.add_rows(resolve(stream(events), lazy=True)):
+                pass
+        return aggregation.rows()
+
+    events = resolve(events, columnar=True)
+    if not isinstance(events, ResultSet):
+        if events:
+            raise ValueError("stats aggregate can only add aggregates to events which are dicts, use --reduce")
+        return events
+    groups = _add_columns(aggregation, events)
+    results = aggregation.results()
+    for name in (item.name for item in aggregates):
+        # Build each column once per group and expand it to one value per row
+        column = Column()
+        for result in results:
+            column.append(result[name])
+        events = events.with_column(name, column.finish().take(groups))
+    return events
+
+def _column(events, field):
+    """
+    Return the values of field in the ResultSet events, following paths
+    into nested dicts (ie. extracted_fields__status) like get_value.
+    """
+    if field in events.columns or "__" not in field:
+        return events.column(field)
+    segments = field.split("__")
+    ret = []
+    for value in events.column(segments[0]):
+        for segment in segments[1:]:
+            value = value.get(segment) if isinstance(value, dict) else None
+        ret.append(value)
+    return ret
+
+def _add_columns(aggregation, events):
+    """
+    Add the rows of the ResultSet events to aggregation, returning the
+    index of the group of each row.
+    """
+    if aggregation.by:
+        by_values = zip(*(_column(events, field) for field in aggregation.by))
+    else:
+        by_values = repeat((), len(events))
+    values = [
+        repeat(None) if field is None else _column(events, field)
+        for field in aggregation.fields
+    ]
+    add = aggregation.add
+    return [
+        add(row_by_values, row_values)
+        for row_by_values, row_values in zip(by_values, zip(*values))
+    ]
@@ -6,7 +6,7 @@ from itertools import groupby
 from operator import itemgetter
 from statistics import mean
 
-from events.util import resolve
+from events.util import resolve, ResultSet
 from events.search_commands.util import cast
 
 def add_avg_parser_arguments(avg_parser):
@@ -25,8 +25,27 @@ def add_avg_parser_arguments(avg_parser):
         help="The field to average",
     )
 
+def _columnar_avg(events, args):
+    if not args.by:
+        average = mean(events.column(args.field))
+        averages = [average] * len(events)
+    else:
+        events = events.sort(args.by)
+        values = events.column(args.field)
+        averages = []
+        for key, indices in groupby(range(len(events)), key=list(events.tuples(args.by)).__getitem__):
+            indices = list(indices)
+            average = mean(values[index] for index in indices)
+            averages.extend([average] * len(indices))
+    if args.as_field in events.columns:
+        # Like {args.as_field: average, **event}, existing values win
+        return events
+    return events.with_column(args.as_field, averages, first=True)
+
 def avg(events, args, environment):
-    events = resolve(events)
+    events = resolve(events, columnar=True)
+    if isinstance(events, ResultSet):
+        return _columnar_avg(events, args)
     if args.by:
         ret = []
         events.sort(key=itemgetter(*args.by))
@@ -13,7 +13,18 @@ from io import StringIO
 
 from django.db.models.query import QuerySet
 
-from events.util import resolve
+from events.util import freeze, resolve, ResultSet
+from .engine import get_value
+
+def _distinct_count(events, field):
+    """
+    Count the distinct non-null values of field in events, or the distinct
+    events if no field is given.
+    """
+    if field is None:
+        return len(set(str(e) for e in events))
+    values = (get_value(event, field) for event in events)
+    return len({freeze(value) for value in values if value is not None})
 
 def add_count_parser_arguments(count_parser):
     count_parser.add_argument(
@@ -82,9 +93,35 @@ def add_count_parser_arguments(count_parser):
 #     return events
 
 
+def _columnar_count(events, args):
+    field_name = args.field_name if args.field_name else "count"
+    events = events.sort(args.by)
+    keys = events.column(args.by[0]) if len(args.by) == 1 else list(events.tuples(args.by))
+    counts = []
+    for key, indices in groupby(range(len(events)), key=keys.__getitem__):
+        indices = list(indices)
+        if args.distinct:
+            count = _distinct_count((events.row(index) for index in indices), args.field)
+        else:
+            count = len(indices)
+        counts.extend([count] * len(indices))
+    # Like {"key": key, field_name: count, **event}, existing values win
+    if field_name not in events.columns:
+        events = events.with_column(field_name, counts, first=True)
+    if "key" not in events.columns:
+        events = events.with_column("key", keys, first=True)
+    return events
+
 def count(events, args, environment):
     log = logging.getLogger(__name__)
-    events = resolve(events)
+    events = resolve(events, columnar=True)
+
+    if isinstance(events, ResultSet):
+        if args.by:
+            return _columnar_count(events, args)
+        if args.distinct:
+            return _distinct_count(events, args.field)
+        return len(events)
 
     if args.by:
         ret = []
@@ -92,7 +129,7 @@ def count(events, args, environment):
         for key, event_group in groupby(events, key=itemgetter(*args.by)):
             event_group = list(event_group)
             if args.distinct:
-                count = len(set(str(i) for i in event_group))
+                count = _distinct_count(event_group, args.field)
                 for event in event_group:
                     field_name = args.field_name if args.field_name else "count"
                     ret.append(
@@ -116,6 +153,6 @@ def count(events, args, environment):
         return ret
     else:
         if args.distinct:
-            return len(set(str(e) for e in events))
+            return _distinct_count(events, args.field)
         else:
             return len(events)
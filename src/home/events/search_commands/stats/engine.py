@@ -0,0 +1,417 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+import re
+import math
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+from events.util import field_value, freeze
+from .sketches import CountMinSketch, HyperLogLog, TDigest
+
+Key = Tuple[Hashable, ...]
+
+
+def get_value(row: Dict[str, Any], field: str) -> Any:
+    """
+    Return the value of field in row, which may be a path into nested
+    dicts (ie. extracted_fields__status), or None if it is missing.
+    """
+    try:
+        return field_value(row, field)
+    except KeyError:
+        return None
+
+
+class CountRows:
+    """The number of rows, whatever their values."""
+    __slots__ = ("count",)
+
+    def __init__(self) -> None:
+        self.count = 0
+
+    def add(self, value: Any) -> None:
+        self.count += 1
+
+    def merge(self, other: "CountRows") -> None:
+        self.count += other.count
+
+    def result(self) -> int:
+        return self.count
+
+
+class Count:
+    """The number of values which are not None."""
+    __slots__ = ("count",)
+
+    def __init__(self) -> None:
+        self.count = 0
+
+    def add(self, value: Any) -> None:
+        if value is not None:
+            self.count += 1
+
+    def merge(self, other: "Count") -> None:
+        self.count += other.count
+
+    def result(self) -> int:
+        return self.count
+
+
+class DistinctCount:
+    """The number of distinct values which are not None."""
+    __slots__ = ("values",)
+
+    def __init__(self) -> None:
+        self.values = set()
+
+    def add(self, value: Any) -> None:
+        if value is not None:
+            self.values.add(freeze(value))
+
+    def merge(self, other: "DistinctCount") -> None:
+        self.values |= other.values
+
+    def result(self) -> int:
+        return len(self.values)
+
+
+class Sum:
+    """The sum of the values which are not None."""
+    __slots__ = ("total",)
+
+    def __init__(self) -> None:
+        self.total = 0
+
+    def add(self, value: Any) -> None:
+        if value is not None:
+            self.total += value
+
+    def merge(self, other: "Sum") -> None:
+        self.total += other.total
+
+    def result(self) -> Any:
+        return self.total
+
+
+class Avg:
+    """The arithmetic mean of the values which are not None."""
+    __slots__ = ("count", "total")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0
+
+    def add(self, value: Any) -> None:
+        if value is not None:
+            self.count += 1
+            self.total += value
+
+    def merge(self, other: "Avg") -> None:
+        self.count += other.count
+        self.total += other.total
+
+    def result(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+
+class Min:
+    """The smallest value which is not None."""
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = None
+
+    def add(self, value: Any) -> None:
+        if value is not None and (self.value is None or value < self.value):
+            self.value = value
+
+    def merge(self, other: Any) -> None:
+        self.add(other.value)
+
+    def result(self) -> Any:
+        return self.value
+
+
+class Max:
+    """The largest value which is not None."""
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = None
+
+    def add(self, value: Any) -> None:
+        if value is not None and (self.value is None or value > self.value):
+            self.value = value
+
+    def merge(self, other: Any) -> None:
+        self.add(other.value)
+
+    def result(self) -> Any:
+        return self.value
+
+
+class StdDev:
+    """
+    The sample standard deviation of the values which are not None,
+    computed in one pass with Welford's algorithm.
+    """
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value: Any) -> None:
+        if value is not None:
+            self.count += 1
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (value - self.mean)
+
+    def merge(self, other: "StdDev") -> None:
+        # See Chan et al., updating formulae for the sample variance
+        count = self.count + other.count
+        if not other.count:
+            return
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+
+    def result(self) -> Optional[float]:
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else None
+
+
+class Percentile:
+    """
+    The exact percentile of the values which are not None, interpolated
+    linearly between the closest ranks. Unlike the other aggregates the
+    values of each group are kept in memory until the result is taken.
+    """
+    __slots__ = ("percent", "values")
+
+    def __init__(self, percent: float) -> None:
+        self.percent = percent
+        self.values = []
+
+    def add(self, value: Any) -> None:
+        if value is not None:
+            self.values.append(value)
+
+    def merge(self, other: "Percentile") -> None:
+        self.values.extend(other.values)
+
+    def result(self) -> Optional[float]:
+        if not self.values:
+            return None
+        self.values.sort()
+        position = (len(self.values) - 1) * self.percent / 100
+        lower = math.floor(position)
+        upper = math.ceil(position)
+        if lower == upper:
+            return self.values[lower]
+        return self.values[lower] + (self.values[upper] - self.values[lower]) * (position - lower)
+
+
+AGGREGATES: Dict[str, Callable[[], Any]] = {
+    "count": Count,
+    "dc": DistinctCount,
+    "distinct_count": DistinctCount,
+    "sum": Sum,
+    "avg": Avg,
+    "mean": Avg,
+    "min": Min,
+    "max": Max,
+    "stddev": StdDev,
+    "stdev": StdDev,
+    "median": lambda: Percentile(50),
+}
+
+# Approximate aggregates with bounded memory (see .sketches), by function,
+# given the optional parameter after the field, ie. estdc(client_ip,0.005)
+SKETCHES: Dict[str, Callable[[Optional[str]], Any]] = {
+    "estdc": lambda parameter: HyperLogLog(
+        float(parameter) if parameter else settings.DELVE_STATS_ESTDC_ERROR,
+    ),
+    "estmedian": lambda parameter: TDigest(
+        50,
+        int(parameter) if parameter else settings.DELVE_STATS_TDIGEST_COMPRESSION,
+    ),
+    "top": lambda parameter: CountMinSketch(
+        int(parameter) if parameter else settings.DELVE_STATS_TOP_COUNT,
+        settings.DELVE_STATS_TOP_ERROR,
+        settings.DELVE_STATS_TOP_CONFIDENCE,
+    ),
+}
+
+AGGREGATE_PATTERN = re.compile(
+    r"^(?:(?P<name>[^=()]+)=)?(?P<function>(?:est)?p\d+(?:\.\d+)?|[a-z_]+)(?:\((?P<arguments>[^()]*)\))?$"
+)
+PERCENTILE_PATTERN = re.compile(r"^(?P<estimate>est)?p(?P<percent>\d+(?:\.\d+)?)$")
+
+
+class Aggregate(NamedTuple):
+    """
+    An aggregate to compute, as parsed from NAME=FUNCTION(FIELD).
+    field is None for count without a field, which counts rows.
+    """
+    name: str
+    function: str
+    field: Optional[str]
+    factory: Callable[[], Any]
+
+
+def parse_aggregate(text: str) -> Aggregate:
+    """
+    Parse an aggregate such as count, avg(bytes), p95(latency),
+    slowest=max(latency) or (for approximate aggregates which take an
+    optional parameter) estp99(latency,200).
+
+    Raises:
+        ValueError: If text is not a supported aggregate.
+    """
+    match = AGGREGATE_PATTERN.match(text.strip())
+    if match is None:
+        raise ValueError(f"Invalid aggregate {text!r}, expected FUNCTION(FIELD) or NAME=FUNCTION(FIELD)")
+    function = match["function"]
+    field, _, parameter = (match["arguments"] or "").partition(",")
+    field = field.strip() or None
+    parameter = parameter.strip() or None
+    percentile = PERCENTILE_PATTERN.match(function)
+    if parameter is not None and function not in SKETCHES and not (percentile and percentile["estimate"]):
+        raise ValueError(f"Aggregate {text!r} does not take a parameter")
+    if percentile is not None:
+        percent = float(percentile["percent"])
+        if not 0 <= percent <= 100:
+            raise ValueError(f"Invalid percentile {text!r}, must be between p0 and p100")
+        if percentile["estimate"]:
+            compression = int(parameter) if parameter else settings.DELVE_STATS_TDIGEST_COMPRESSION
+            TDigest(percent, compression)
+            factory = lambda: TDigest(percent, compression)
+        else:
+            factory = lambda: Percentile(percent)
+    elif function in AGGREGATES:
+        factory = AGGREGATES[function]
+    elif function in SKETCHES:
+        # Build one sketch to validate the parameter before any row is read
+        SKETCHES[function](parameter)
+        factory = lambda: SKETCHES[function](parameter)
+    else:
+        raise ValueError(
+            f"Unsupported aggregate function {function!r}, choose one of "
+            f"{', '.join(sorted([*AGGREGATES, *SKETCHES]))}, pNN or estpNN"
+        )
+    if field is None:
+        if function != "count":
+            raise ValueError(f"Aggregate {text!r} requires a field, ie. {function}(FIELD)")
+        factory = CountRows
+    if match["name"]:
+        name = match["name"].strip()
+    else:
+        name = f"{function}({match['arguments'].strip()})" if field else function
+    return Aggregate(name, function, field, factory)
+
+
+class HashAggregation:
+    """
+    Single pass hash aggregation: rows are added one at a time and
+    folded into the accumulators of their group, so only one set of
+    accumulators per distinct group is kept in memory.
+
+    Args:
+        aggregates (Sequence[Aggregate]): The aggregates to compute for each group.
+        by (Sequence[str]): The fields to group by, no fields is a single group.
+    """
+    def __init__(self, aggregates: Sequence[Aggregate], by: Sequence[str] = ()) -> None:
+        self.aggregates = list(aggregates)
+        self.by = list(by)
+        self.fields = [aggregate.field for aggregate in self.aggregates]
+        self.groups: Dict[Key, int] = {}
+        self.group_values: List[Tuple[Any, ...]] = []
+        self.accumulators: List[List[Any]] = []
+
+    def add(self, by_values: Tuple[Any, ...], values: Iterable[Any]) -> int:
+        """
+        Add a row, given the values of its by fields and of the field of
+        each aggregate (None for a count of rows).
+
+        Returns:
+            int: The index of the row's group.
+        """
+        key = by_values
+        try:
+            group = self.groups.get(key)
+        except TypeError:
+            key = tuple(freeze(value) for value in by_values)
+            group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = len(self.accumulators)
+            self.group_values.append(by_values)
+            self.accumulators.append([aggregate.factory() for aggregate in self.aggregates])
+        for accumulator, value in zip(self.accumulators[group], values):
+            accumulator.add(value)
+        return group
+
+    def add_rows(self, rows: Iterable[Dict[str, Any]]) -> Iterator[int]:
+        """
+        Add dict rows, missing fields being None, yielding the index of
+        the group of each row.
+        """
+        by = self.by
+        fields = self.fields
+        add = self.add
+        if any("__" in field for field in by + fields if field):
+            for row in rows:
+                yield add(
+                    tuple(get_value(row, field) for field in by),
+                    [get_value(row, field) if field else None for field in fields],
+                )
+            return
+        for row in rows:
+            get = row.get
+            yield add(tuple(map(get, by)), map(get, fields))
+
+    def merge(self, other: "HashAggregation") -> None:
+        """
+        Fold the groups of other, an aggregation of the same aggregates
+        over different rows (ie. another partition), into this one.
+        """
+        for key, other_group in other.groups.items():
+            group = self.groups.get(key)
+            if group is None:
+                self.groups[key] = len(self.accumulators)
+                self.group_values.append(other.group_values[other_group])
+                self.accumulators.append(other.accumulators[other_group])
+                continue
+            for accumulator, other_accumulator in zip(self.accumulators[group], other.accumulators[other_group]):
+                accumulator.merge(other_accumulator)
+
+    def results(self) -> List[Dict[str, Any]]:
+        """
+        Return the aggregates of each group, by group index.
+        """
+        names = [aggregate.name for aggregate in self.aggregates]
+        return [
+            dict(zip(names, (accumulator.result() for accumulator in accumulators)))
+            for accumulators in self.accumulators
+        ]
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """
+        Return one row per group, in the order in which groups were first
+        seen, with the values of the by fields followed by the aggregates.
+        Without by fields there is a single row, even if no rows were added.
+        """
+        if not self.by and not self.accumulators:
+            # Without groups there is always one row, even without input
+            return [{aggregate.name: aggregate.factory().result() for aggregate in self.aggregates}]
+        ret = []
+        for values, aggregates in zip(self.group_values, self.results()):
+            row = dict(zip(self.by, values))
+            row.update(aggregates)
+            ret.append(row)
+        return ret
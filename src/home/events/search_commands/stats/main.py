@@ -12,7 +12,14 @@ from .count import (
     count,
     add_count_parser_arguments
 )
+from .aggregate import (
+    aggregate,
+    add_aggregate_parser_arguments,
+)
+from .engine import parse_aggregate
+from .pushdown import aggregate_pushdown
 
+from events.planner import FieldUsage
 from events.search_commands.decorators import search_command
 
 parser = argparse.ArgumentParser(
@@ -35,7 +42,36 @@ count_parser = subcommands.add_parser(
 )
 add_count_parser_arguments(count_parser)
 
-@search_command(parser)
+aggregate_parser = subcommands.add_parser(
+    "aggregate",
+    description="Compute any number of aggregates (count, distinct count, sum, "
+                "avg, min, max, stddev, median, percentiles and their approximate "
+                "counterparts) in a single pass, "
+                "either stored as additional fields on each event or, with "
+                "--reduce, as one row per group.",
+)
+add_aggregate_parser_arguments(aggregate_parser)
+
+def stats_pushdown(queryset, argv):
+    if "stats" in argv:
+        argv.pop(argv.index("stats"))
+    args = parser.parse_args(argv)
+    if args.subparser_name == "aggregate":
+        return aggregate_pushdown(queryset, args)
+    return None
+
+def stats_fields(args):
+    match args.subparser_name:
+        case "avg" | "count":
+            fields = [args.field, *(args.by or [])]
+            return FieldUsage([field for field in fields if field is not None])
+        case "aggregate":
+            aggregates = [parse_aggregate(text) for text in args.aggregates]
+            fields = [item.field for item in aggregates if item.field is not None]
+            return FieldUsage(fields + args.by, projects=args.reduce)
+    return None
+
+@search_command(parser, pushdown=stats_pushdown, fields=stats_fields)
 def stats(request, events, argv, environment):
 
     if "stats" in argv:
@@ -46,4 +82,6 @@ def stats(request, events, argv, environment):
             return avg(events, args, environment)
         case "count":
             return count(events, args, environment)
+        case "aggregate":
+            return aggregate(events, args, environment)
     
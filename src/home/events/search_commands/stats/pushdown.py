@@ -0,0 +1,323 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+import json
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from django.db import connections
+from django.db.models import BigIntegerField, Case, F, FloatField, Q, Value, When
+from django.db.models.expressions import OrderBy
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast, NullIf
+from django.db.models.query import QuerySet
+
+from events.util import freeze
+from events.planner import (
+    model_columns,
+    JSONType,
+    JSON_CONTAINER_TYPES,
+    JSON_NUMBER_TYPES,
+    PUSHABLE_TYPES,
+)
+from events.search_commands.filter import lookup_map, STRING_COLUMN_VENDORS
+from events.search_commands.qs._util import AGGREGATION_FUNCTIONS
+from .engine import parse_aggregate
+
+# The stats aggregate functions which the database computes the same way
+# as the engine, by the name of their aggregate in qs._util.AGGREGATION_FUNCTIONS
+SQL_AGGREGATES = {
+    "count": "Count",
+    "dc": "Count",
+    "distinct_count": "Count",
+    # An exact distinct count is within any error bound
+    "estdc": "Count",
+    "sum": "Sum",
+    "avg": "Avg",
+    "mean": "Avg",
+    "min": "Min",
+    "max": "Max",
+    "stddev": "StdDev",
+    "stdev": "StdDev",
+}
+DISTINCT_FUNCTIONS = ("dc", "distinct_count", "estdc")
+NUMERIC_FUNCTIONS = ("sum", "avg", "mean", "stddev", "stdev")
+ORDERED_FUNCTIONS = ("min", "max")
+NUMERIC_COLUMNS = (
+    "IntegerField",
+    "BigIntegerField",
+    "SmallIntegerField",
+    "PositiveIntegerField",
+    "PositiveBigIntegerField",
+    "PositiveSmallIntegerField",
+    "FloatField",
+)
+# Strings are compared using the database's collation, so only numbers
+# and datetimes are ordered the same way as in Python.
+ORDERED_COLUMNS = NUMERIC_COLUMNS + ("DateTimeField",)
+# The aggregates which give an integer for integers in Python
+EXACT_FUNCTIONS = ("sum", "min", "max")
+# The databases supported by JSONType
+JSON_TYPE_VENDORS = ("sqlite", "postgresql")
+# A JSON number which Python decodes as a float, and one too long for a
+# BIGINT (PostgreSQL's jsonb_typeof does not tell integers from reals)
+JSON_REAL = r"[.eE]"
+JSON_LONG_INTEGER = r"[0-9]{19}"
+
+
+def _pk_descending(queryset: QuerySet) -> Optional[bool]:
+    """
+    Return whether the events of queryset are read in descending order of
+    their primary key, or None if they are ordered by anything else.
+    Unordered QuerySets are assumed to be read in ascending order.
+    """
+    names = ("pk", queryset.model._meta.pk.attname)
+    ordering = (*queryset.query.order_by, *queryset.query.extra_order_by)
+    if not ordering:
+        return False
+    # The primary key is unique, so it decides the order on its own
+    first = ordering[0]
+    if isinstance(first, str):
+        return first.startswith("-") if first.lstrip("-") in names else None
+    if isinstance(first, OrderBy) and isinstance(first.expression, F) and first.expression.name in names:
+        return first.descending
+    return None
+
+
+class SQLField(NamedTuple):
+    """
+    A field of the stats command as seen by the database: either a model
+    column, or a key path inside a JSONField along with the aliases of its
+    (null when missing or JSON null) type and value annotations.
+    """
+    column: Any
+    type_alias: Optional[str] = None
+    value_alias: Optional[str] = None
+
+
+def _decode(value: Any, json_type: Optional[str]) -> Tuple[bool, Any]:
+    """
+    Convert a KT() value back to the Python value of the JSON key, given
+    its JSON type.
+
+    Returns:
+        Tuple[bool, Any]: Whether the value could be decoded, and the value.
+    """
+    if json_type is None:
+        return True, None
+    if json_type in JSON_NUMBER_TYPES:
+        return True, json.loads(value) if isinstance(value, str) else value
+    if json_type in ("text", "string"):
+        return True, value
+    if json_type in ("true", "false", "boolean"):
+        return True, value in ("true", 1, True)
+    return False, None
+
+
+def aggregate_pushdown(queryset: QuerySet, args: Any) -> Optional[List[Dict[str, Any]]]:
+    """
+    Compute stats aggregate --reduce in the database, as a GROUP BY built
+    with values(...).annotate(...), so only one row per group is read.
+
+    The by and aggregated fields may be model columns or keys inside a
+    JSONField (ie. extracted_fields__status, read with KT()). Keys are
+    grouped on their value and their JSON type, so that ie. the number 200
+    and the string "200" are different groups like they are in Python.
+
+    Returns:
+        Optional[List[Dict[str, Any]]]: The evaluated rows, ordered by the
+            by fields, or None if the database would not give the same
+            answer as the engine (unsupported aggregates such as
+            percentiles, strings compared by a collation, JSON values of
+            mixed or container types, etc.).
+    """
+    log = logging.getLogger(__name__)
+    if not args.reduce or queryset.query.is_sliced:
+        return None
+    aggregates = [parse_aggregate(text) for text in args.aggregates]
+    if any(aggregate.function not in SQL_AGGREGATES for aggregate in aggregates):
+        return None
+    vendor = connections[queryset.db].vendor
+    sqlite = vendor == "sqlite"
+    if sqlite and any(SQL_AGGREGATES[aggregate.function] == "StdDev" for aggregate in aggregates):
+        # Django's STDDEV_SAMP for SQLite fails on groups of less than two
+        # values instead of returning NULL
+        return None
+    columns = model_columns(queryset)
+    annotations = {}
+    fields: Dict[str, SQLField] = {}
+
+    def sql_field(field: str) -> Optional[SQLField]:
+        if field in fields:
+            return fields[field]
+        path = field.split("__")
+        column = columns.get(path[0])
+        if column is None:
+            return None
+        if len(path) == 1:
+            if column.get_internal_type() not in PUSHABLE_TYPES:
+                return None
+            if PUSHABLE_TYPES[column.get_internal_type()] == (str,) and vendor not in STRING_COLUMN_VENDORS:
+                # ie. MySQL's default collations group "web" with "WEB"
+                return None
+            fields[field] = SQLField(column)
+        elif vendor in JSON_TYPE_VENDORS and column.get_internal_type() == "JSONField" and all(
+            segment and segment not in lookup_map and not segment.isdigit() for segment in path[1:]
+        ):
+            type_alias = f"stats_type_{len(fields)}"
+            value_alias = f"stats_value_{len(fields)}"
+            annotations[type_alias] = NullIf(JSONType(column.attname, path[1:]), Value("null"))
+            annotations[value_alias] = Case(
+                When(**{f"{type_alias}__isnull": True}, then=Value(None)),
+                default=KT(field),
+            )
+            fields[field] = SQLField(column, type_alias, value_alias)
+        else:
+            return None
+        return fields[field]
+
+    # The aliases of the value and (for JSON keys) type of each by field
+    by_aliases = []
+    for number, field in enumerate(args.by):
+        by_field = sql_field(field)
+        if by_field is None:
+            return None
+        if by_field.type_alias is None:
+            alias = f"stats_by_{number}"
+            annotations[alias] = F(by_field.column.attname)
+            by_aliases.append((alias, None))
+        else:
+            by_aliases.append((by_field.value_alias, by_field.type_alias))
+    group_by = [alias for aliases in by_aliases for alias in aliases if alias]
+
+    # Aggregates by alias, and guards (alias, expression, limit) which
+    # no group may exceed for the database to agree with Python
+    sql_aggregates = {}
+    guards = []
+    # The aliases of the aggregates over integers, and of the number of
+    # reals, of the aggregates which are exact for groups of integers
+    exact = {}
+    for number, aggregate in enumerate(aggregates):
+        alias = f"stats_aggregate_{number}"
+        function = AGGREGATION_FUNCTIONS[SQL_AGGREGATES[aggregate.function]]
+        if aggregate.field is None:
+            sql_aggregates[alias] = function("*")
+            continue
+        field = sql_field(aggregate.field)
+        if field is None:
+            return None
+        if field.type_alias is None:
+            internal_type = field.column.get_internal_type()
+            if aggregate.function in NUMERIC_FUNCTIONS and internal_type not in NUMERIC_COLUMNS:
+                return None
+            if aggregate.function in ORDERED_FUNCTIONS and internal_type not in ORDERED_COLUMNS:
+                return None
+            options = {}
+            if aggregate.function in DISTINCT_FUNCTIONS:
+                options["distinct"] = True
+            if SQL_AGGREGATES[aggregate.function] == "StdDev":
+                options["sample"] = True
+            sql_aggregates[alias] = function(F(field.column.attname), **options)
+            continue
+        type_alias, value_alias = field.type_alias, field.value_alias
+        if aggregate.function == "count":
+            sql_aggregates[alias] = function(type_alias)
+        elif aggregate.function in DISTINCT_FUNCTIONS:
+            sql_aggregates[alias] = function(value_alias, distinct=True)
+            # Values of a single scalar type compare the same way as in Python
+            guards.append((f"{alias}_types", AGGREGATION_FUNCTIONS["Count"](type_alias, distinct=True), 1))
+            guards.append((
+                f"{alias}_containers",
+                AGGREGATION_FUNCTIONS["Count"]("pk", filter=Q(**{f"{type_alias}__in": JSON_CONTAINER_TYPES})),
+                0,
+            ))
+        else:
+            options = {"sample": True} if SQL_AGGREGATES[aggregate.function] == "StdDev" else {}
+            if sqlite:
+                # KT() returns numbers as integers or reals, which SQLite
+                # adds and compares like Python does
+                value = KT(aggregate.field)
+            else:
+                value = Cast(KT(aggregate.field), FloatField())
+                options["output_field"] = FloatField()
+                if aggregate.function in EXACT_FUNCTIONS:
+                    # Groups of integers are aggregated as integers instead,
+                    # as long as they fit a BIGINT
+                    numbers = Q(**{f"{type_alias}__in": JSON_NUMBER_TYPES})
+                    reals = Q(**{f"{value_alias}__regex": JSON_REAL})
+                    long = Q(**{f"{value_alias}__regex": JSON_LONG_INTEGER}) & ~reals
+                    sql_aggregates[f"{alias}_integers"] = function(
+                        Cast(KT(aggregate.field), BigIntegerField()),
+                        filter=numbers & ~reals & ~long,
+                    )
+                    sql_aggregates[f"{alias}_reals"] = AGGREGATION_FUNCTIONS["Count"]("pk", filter=numbers & reals)
+                    exact[number] = (f"{alias}_integers", f"{alias}_reals")
+                    guards.append((f"{alias}_long", AGGREGATION_FUNCTIONS["Count"]("pk", filter=numbers & long), 0))
+            sql_aggregates[alias] = function(
+                value,
+                filter=Q(**{f"{type_alias}__in": JSON_NUMBER_TYPES}),
+                **options,
+            )
+            # Anything but numbers would be compared or added differently
+            guards.append((
+                f"{alias}_other",
+                AGGREGATION_FUNCTIONS["Count"](
+                    "pk",
+                    filter=Q(**{f"{type_alias}__isnull": False}) & ~Q(**{f"{type_alias}__in": JSON_NUMBER_TYPES}),
+                ),
+                0,
+            ))
+    sql_aggregates.update((alias, expression) for alias, expression, _ in guards)
+
+    if group_by:
+        # The engine returns groups in the order their first event is
+        # read, which is the order of the primary key unless the events
+        # are ordered by something else
+        descending = _pk_descending(queryset)
+        if descending is None:
+            log.debug(f"Unable to push stats down, the events are ordered by {queryset.query.order_by}")
+            return None
+        sql_aggregates["stats_first"] = AGGREGATION_FUNCTIONS["Max" if descending else "Min"]("pk")
+
+    queryset = queryset.order_by().annotate(**annotations)
+    if group_by:
+        rows = queryset.values(*group_by).annotate(**sql_aggregates).order_by("-stats_first" if descending else "stats_first")
+    else:
+        rows = [queryset.aggregate(**sql_aggregates)]
+
+    ret = []
+    seen = set()
+    for row in rows:
+        if any(row[alias] > limit for alias, _, limit in guards):
+            log.debug(f"Unable to push stats down, {row} fails a guard")
+            return None
+        values = []
+        for value_alias, type_alias in by_aliases:
+            if type_alias is None:
+                values.append(row[value_alias])
+                continue
+            decoded, value = _decode(row[value_alias], row[type_alias])
+            if not decoded:
+                return None
+            values.append(value)
+        key = tuple(freeze(value) for value in values)
+        if key in seen:
+            # ie. 1 and 1.0, which Python considers the same group
+            return None
+        seen.add(key)
+        result = dict(zip(args.by, values))
+        for number, aggregate in enumerate(aggregates):
+            value = row[f"stats_aggregate_{number}"]
+            if number in exact:
+                integers, reals = row[exact[number][0]], row[exact[number][1]]
+                if reals and integers is not None:
+                    log.debug(f"Unable to push stats down, {aggregate.name} mixes integers and reals")
+                    return None
+                if not reals:
+                    value = None if integers is None else int(integers)
+            if value is None and aggregate.function == "sum":
+                value = 0
+            result[aggregate.name] = value
+        ret.append(result)
+    return ret
@@ -0,0 +1,306 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+"""
+Approximate aggregates with bounded memory, usable as accumulators of
+events.search_commands.stats.engine.HashAggregation.
+
+Values are hashed with blake2b rather than hash(), which is salted per
+process for strings, so sketches built by different processes can be merged.
+"""
+import math
+import hashlib
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+from events.util import canonical, freeze
+
+
+def hash64(value: Any) -> int:
+    """
+    Return a 64 bit hash of value which is the same in every process.
+    Values which are equal in Python (ie. 1, 1.0 and True) hash the same,
+    see events.util.canonical.
+    """
+    return int.from_bytes(hashlib.blake2b(canonical(value), digest_size=8).digest(), "little")
+
+
+class HyperLogLog:
+    """
+    Approximate count of the distinct values which are not None.
+
+    Uses 2 ** precision one byte registers, where precision is chosen so
+    that the relative standard error (1.04 / sqrt(registers)) is at most
+    error. Small counts are estimated with linear counting.
+
+    Until more than one in SPARSE_FRACTION registers is set, only the set
+    registers are kept (in a dict), so the many groups with few distinct
+    values use far less memory than the full array of registers.
+
+    Args:
+        error (float): The relative standard error, between MIN_ERROR and 1.
+    """
+    __slots__ = ("precision", "registers", "sparse")
+
+    MAX_PRECISION = 18
+    MIN_ERROR = 1.04 / math.sqrt(1 << MAX_PRECISION)
+    # Each entry of the dict takes about as much memory as a hundred registers
+    SPARSE_FRACTION = 128
+
+    def __init__(self, error: float = 0.01) -> None:
+        if not self.MIN_ERROR <= error < 1:
+            raise ValueError(f"Invalid error {error}, must be at least {self.MIN_ERROR:.5f} and below 1")
+        self.precision = max(4, math.ceil(math.log2((1.04 / error) ** 2)))
+        self.registers: Optional[bytearray] = None
+        self.sparse: Optional[Dict[int, int]] = {}
+        if self._sparse_limit() == 0:
+            self._densify()
+
+    def _sparse_limit(self) -> int:
+        return (1 << self.precision) // self.SPARSE_FRACTION
+
+    def _densify(self) -> None:
+        self.registers = bytearray(1 << self.precision)
+        for index, rank in self.sparse.items():
+            self.registers[index] = rank
+        self.sparse = None
+
+    def _update(self, index: int, rank: int) -> None:
+        if self.sparse is None:
+            if rank > self.registers[index]:
+                self.registers[index] = rank
+        elif rank > self.sparse.get(index, 0):
+            self.sparse[index] = rank
+            if len(self.sparse) > self._sparse_limit():
+                self._densify()
+
+    def add(self, value: Any) -> None:
+        if value is None:
+            return
+        hashed = hash64(value)
+        bits = 64 - self.precision
+        self._update(hashed >> bits, bits - (hashed & ((1 << bits) - 1)).bit_length() + 1)
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.precision != self.precision:
+            raise ValueError("Only HyperLogLogs of the same precision can be merged")
+        if other.sparse is not None:
+            for index, rank in other.sparse.items():
+                self._update(index, rank)
+            return
+        if self.sparse is not None:
+            self._densify()
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def result(self) -> int:
+        count = 1 << self.precision
+        if self.sparse is None:
+            zeros = self.registers.count(0)
+            total = math.fsum(2.0 ** -register for register in self.registers)
+        else:
+            zeros = count - len(self.sparse)
+            total = zeros + math.fsum(2.0 ** -register for register in self.sparse.values())
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(count, 0.7213 / (1 + 1.079 / count))
+        estimate = alpha * count * count / total
+        if estimate <= 2.5 * count and zeros:
+            estimate = count * math.log(count / zeros)
+        return round(estimate)
+
+
+class TDigest:
+    """
+    Approximate percentiles of the values which are not None.
+
+    Values are buffered and periodically merged into at most about
+    compression centroids, which are smaller (so more precise) towards
+    both tails of the distribution. Higher compression means more
+    precise percentiles and more memory.
+
+    Args:
+        percent (float): The percentile to return from result.
+        compression (int): The compression of the digest, ie. 100.
+    """
+    __slots__ = ("percent", "compression", "centroids", "buffer", "count", "min", "max")
+
+    def __init__(self, percent: float = 50, compression: int = 100) -> None:
+        if compression < 10:
+            raise ValueError(f"Invalid compression {compression}, must be at least 10")
+        self.percent = percent
+        self.compression = compression
+        self.centroids: List[Tuple[float, float]] = []
+        self.buffer: List[Tuple[float, float]] = []
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: Any, weight: float = 1) -> None:
+        if value is None:
+            return
+        self.buffer.append((value, weight))
+        self.count += weight
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if len(self.buffer) >= 5 * self.compression:
+            self._compress()
+
+    def merge(self, other: "TDigest") -> None:
+        for mean, weight in other.centroids + other.buffer:
+            self.add(mean, weight)
+        # Centroid means are within the range of their values
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def _scale(self, quantile: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(2 * min(1.0, quantile) - 1)
+
+    def _compress(self) -> None:
+        if not self.buffer:
+            return
+        items = sorted(self.centroids + self.buffer)
+        self.buffer = []
+        total = self.count
+        centroids = []
+        mean, weight = items[0]
+        before = 0
+        lower = self._scale(0)
+        for item_mean, item_weight in items[1:]:
+            if self._scale((before + weight + item_weight) / total) - lower <= 1:
+                weight += item_weight
+                mean += (item_mean - mean) * item_weight / weight
+            else:
+                centroids.append((mean, weight))
+                before += weight
+                lower = self._scale(before / total)
+                mean, weight = item_mean, item_weight
+        centroids.append((mean, weight))
+        self.centroids = centroids
+
+    def quantile(self, quantile: float) -> Optional[float]:
+        """
+        Return the estimated value at quantile (between 0 and 1), which is
+        exact while every centroid holds a single value.
+        """
+        self._compress()
+        if not self.centroids:
+            return None
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+        # Like Percentile, the rank of the value is interpolated between
+        # the centers of the centroids on either side of it.
+        target = quantile * (self.count - 1) + 0.5
+        centers = []
+        cumulative = 0
+        for mean, weight in self.centroids:
+            centers.append(cumulative + weight / 2)
+            cumulative += weight
+        if target <= centers[0]:
+            first_mean, first_weight = self.centroids[0]
+            if first_weight == 1 or centers[0] <= 0.5:
+                return first_mean
+            return self.min + (first_mean - self.min) * (target - 0.5) / (centers[0] - 0.5)
+        if target >= centers[-1]:
+            last_mean, last_weight = self.centroids[-1]
+            if last_weight == 1 or self.count - 0.5 <= centers[-1]:
+                return last_mean
+            return last_mean + (self.max - last_mean) * (target - centers[-1]) / (self.count - 0.5 - centers[-1])
+        for index in range(1, len(centers)):
+            if target < centers[index]:
+                left_mean = self.centroids[index - 1][0]
+                right_mean = self.centroids[index][0]
+                position = (target - centers[index - 1]) / (centers[index] - centers[index - 1])
+                return left_mean + (right_mean - left_mean) * position
+        return self.centroids[-1][0]
+
+    def result(self) -> Optional[float]:
+        return self.quantile(self.percent / 100)
+
+
+class CountMinSketch:
+    """
+    Approximate most frequent values (heavy hitters) which are not None.
+
+    Counts are kept in a Count-Min sketch of depth rows of width counters,
+    so estimates never undercount and overcount by at most error times
+    the number of values with probability confidence. The top values seen
+    so far are tracked alongside the sketch.
+
+    Args:
+        top (int): The number of most frequent values to return.
+        error (float): The overcount as a fraction of the number of values.
+        confidence (float): The probability that estimates are within error.
+    """
+    __slots__ = ("top", "width", "depth", "counters", "count", "candidates", "smallest")
+
+    def __init__(self, top: int = 10, error: float = 0.001, confidence: float = 0.99) -> None:
+        if top < 1:
+            raise ValueError(f"Invalid top {top}, must be at least 1")
+        if not 0 < error < 1 or not 0 < confidence < 1:
+            raise ValueError("The error and confidence of a Count-Min sketch must be between 0 and 1")
+        self.top = top
+        self.width = math.ceil(math.e / error)
+        self.depth = math.ceil(math.log(1 / (1 - confidence)))
+        self.counters = [array("q", bytes(8 * self.width)) for _ in range(self.depth)]
+        self.count = 0
+        # The top values by their frozen value: [estimate, value]
+        self.candidates: Dict[Any, List[Any]] = {}
+        self.smallest = 0
+
+    def _indices(self, value: Any) -> List[int]:
+        # Double hashing, see Kirsch and Mitzenmacher
+        hashed = hash64(value)
+        first, second = hashed & 0xFFFFFFFF, hashed >> 32
+        return [(first + row * second) % self.width for row in range(self.depth)]
+
+    def estimate(self, value: Any) -> int:
+        return min(counters[index] for counters, index in zip(self.counters, self._indices(value)))
+
+    def add(self, value: Any, count: int = 1) -> None:
+        if value is None:
+            return
+        self.count += count
+        estimate = None
+        for counters, index in zip(self.counters, self._indices(value)):
+            counters[index] += count
+            if estimate is None or counters[index] < estimate:
+                estimate = counters[index]
+        self._offer(value, estimate)
+
+    def _offer(self, value: Any, estimate: int) -> None:
+        key = freeze(value)
+        candidate = self.candidates.get(key)
+        if candidate is not None:
+            candidate[0] = estimate
+            return
+        if len(self.candidates) < self.top:
+            self.candidates[key] = [estimate, value]
+            return
+        # Estimates only grow, so smallest is a lower bound of the
+        # smallest estimate among the candidates
+        if estimate <= self.smallest:
+            return
+        smallest_key = min(self.candidates, key=lambda key: self.candidates[key][0])
+        self.smallest = self.candidates[smallest_key][0]
+        if estimate > self.smallest:
+            del self.candidates[smallest_key]
+            self.candidates[key] = [estimate, value]
+
+    def merge(self, other: "CountMinSketch") -> None:
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Only Count-Min sketches of the same dimensions can be merged")
+        for counters, other_counters in zip(self.counters, other.counters):
+            for index, count in enumerate(other_counters):
+                if count:
+                    counters[index] += count
+        self.count += other.count
+        candidates = {**self.candidates, **other.candidates}
+        self.candidates = {}
+        self.smallest = 0
+        for key, (_, value) in candidates.items():
+            self._offer(value, self.estimate(value))
+
+    def result(self) -> List[Dict[str, Any]]:
+        ranked = sorted(self.candidates.values(), key=lambda candidate: candidate[0], reverse=True)
+        return [{"value": value, "count": estimate} for estimate, value in ranked]
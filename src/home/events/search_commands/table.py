@@ -6,12 +6,16 @@ import argparse
 import logging
 import json
 import html
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, Iterable, List, Optional, Union
 
+from django.conf import settings
 from django.db.models.query import QuerySet
 from django.http import HttpRequest
+from django.urls import reverse
 
-from events.util import resolve, cast
+from events.util import resolve, cast, ResultSet
+from events.planner import FieldUsage
+from events import table_store
 
 from .decorators import search_command
 
@@ -44,12 +48,29 @@ parser.add_argument(
     nargs="*",
     help="The fields to include in the table",
 )
+parser.add_argument(
+    "--server-side",
+    action=argparse.BooleanOptionalAction,
+    default=None,
+    help="Keep the rows on the server, which sends the browser one page at a time "
+         "(by default, tables of more than DELVE_TABLE_SERVER_SIDE_ROWS rows are server-side)",
+)
+
+def table_fields(args: argparse.Namespace) -> Optional[FieldUsage]:
+    # Without --fields, the columns are those of the events
+    if args.fields is None:
+        return None
+    return FieldUsage(args.fields, projects=True)
 
-@search_command(parser)
+@search_command(parser, fields=table_fields)
 def table(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], argv: List[str], environment: Dict[str, Any]) -> Dict[str, Any]:
     """
     Return the JSON configuration to make a table using datatables.
 
+    Server-side tables (see events.table_store) are kept in memory instead
+    of being included in the configuration, which tells datatables to
+    request their rows a page at a time.
+
     Args:
         request (HttpRequest): The HTTP request object.
         events (Union[QuerySet, List[Dict[str, Any]]]): The result set to operate on.
@@ -62,24 +83,54 @@ def table(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], a
     log = logging.getLogger(__name__)
     args = table.parser.parse_args(argv[1:])
     fields = args.fields
-    events = resolve(events)
+    events = resolve(events, columnar=True)
 
-    if fields is not None:
+    if isinstance(events, ResultSet):
+        columns = fields if fields is not None else events.fields
+        server_side = args.server_side
+        if server_side is None:
+            threshold = settings.DELVE_TABLE_SERVER_SIDE_ROWS
+            server_side = 0 < threshold < len(events)
+        if server_side and table_store.enabled():
+            owner = getattr(getattr(request, "user", None), "pk", None)
+            # Only the columns shown are kept, sharing them with events
+            rows = ResultSet({column: events.get_column(column) for column in columns}, len(events))
+            token = table_store.tables.put(rows, columns, owner)
+            log.debug(f"Keeping {events} server-side as table {token}")
+            return _configuration(
+                columns,
+                serverSide=True,
+                processing=True,
+                searchDelay=400,
+                ajax=reverse("api_table_page", args=[token]),
+            )
+        # Encoding column-wise encodes each distinct string only once
         events = [
-            _pull_fields(event, fields) for event in events
-        ]
-        columns = fields
+            list(row) for row in zip(*(events.get_column(column).map(encode) for column in columns))
+        ] if columns else [[] for _ in range(len(events))]
     else:
-        # resolve, up above, ensures that the keys are the same for all events
-        columns = events[0].keys()
-    events = [
-        [encode(event.get(column, None)) for column in columns] for event in events
-    ]
-    columns = [{"title": column} for column in columns]
+        if fields is not None:
+            events = [
+                _pull_fields(event, fields) for event in events
+            ]
+            columns = fields
+        else:
+            # resolve, up above, ensures that the keys are the same for all events
+            columns = events[0].keys()
+        events = [
+            [encode(event.get(column, None)) for column in columns] for event in events
+        ]
+    return _configuration(columns, data=events)
+
+def _configuration(columns: Iterable[str], **options: Any) -> Dict[str, Any]:
+    """
+    Return the DataTables configuration of a table of columns, with
+    either its data or the options making it server-side.
+    """
     return {
         "visualization": "table",
-        "columns": columns,
-        "data": events,
+        "columns": [{"title": column} for column in columns],
+        **options,
         "autowidth": True,
         "colReorder": True,
         "order": [],
@@ -113,4 +164,3 @@ def table(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], a
             "bottomEnd": None,
         }
     }
-
@@ -6,12 +6,15 @@
 located at events.search_commands.chart.
 """
 import json
+from datetime import datetime, timedelta
 from unittest.mock import MagicMock
 from typing import Any
 
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.test import TestCase, override_settings
+from django.utils import timezone
 
 from rest_framework import status
 from rest_framework.authtoken.models import Token
@@ -25,6 +28,8 @@ from events.models import (
     Event,
     Query,
 )
+from events.downsampling import lttb, min_max
+from events.search_commands.chart import truncate
 
 TEST_USER = "testuser"
 TEST_USER_PASS = "testuser"
@@ -87,3 +92,148 @@ class ChartTests(APITestCase):
         self.assertIn('datasets', results['data'])
         self.assertEqual(len(results['data']['labels']), 10)
         self.assertEqual(len(results['data']['datasets'][0]['data']), 10)
+
+
+class ChartBucketTests(TestCase):
+    def setUp(self, *args: Any, **kwargs: Any) -> None:
+        """For preparation, we are going to setup a user and add a hundred
+        Events, seven minutes apart, on two hosts.
+        """
+        self.user = get_user_model().objects.create_user(
+            username='testuser',
+            email='testuser@test.com',
+            password='testuser',
+        )
+        start = timezone.now().replace(minute=0, second=0, microsecond=0)
+        for i in range(100):
+            event = Event.objects.create(
+                index="test",
+                host=f"host{i % 2}",
+                user=self.user,
+                text=f"event {i}",
+                extracted_fields={"value": i, "mixed": "x" if i == 5 else i},
+            )
+            Event.objects.filter(pk=event.pk).update(created=start - timedelta(minutes=i * 7))
+        super().setUp(*args, **kwargs)
+
+    def resolve(self, text: str) -> Any:
+        query = Query(name="test", text=text, user=self.user)
+        return query.resolve(request=MagicMock(user=self.user))
+
+    def test_buckets_match_python(self) -> None:
+        """Buckets computed in the database are the same as those computed
+        in Python, with one label per bucket and one value per label in
+        each dataset.
+        """
+        for text in (
+            "search index=test | chart -x created -y extracted_fields__value --time-x hour -a sum -b host",
+            "search index=test | chart -x created --time-x day -a count",
+            "search index=test | chart -x created -y extracted_fields__mixed --time-x hour -a count",
+            "search index=test | chart -x created -y extracted_fields__value --time-x hour -a avg --max-points 4 --downsample minmax",
+        ):
+            with self.subTest(text=text):
+                with override_settings(DELVE_QUERY_PUSHDOWN=False):
+                    expected = self.resolve(text)
+                results = self.resolve(text)
+                self.assertEqual(results, expected)
+                labels = results["data"]["labels"]
+                self.assertEqual(labels, sorted(labels))
+                for dataset in results["data"]["datasets"]:
+                    self.assertEqual(len(dataset["data"]), len(labels))
+        results = self.resolve("search index=test | chart -x created -y extracted_fields__value --time-x hour -a sum -b host")
+        self.assertEqual([dataset["label"] for dataset in results["data"]["datasets"]], ["host0", "host1"])
+        self.assertEqual(
+            sum(value or 0 for dataset in results["data"]["datasets"] for value in dataset["data"]),
+            sum(range(100)),
+        )
+        results = self.resolve("search index=test | chart -x created --time-x day -a count")
+        self.assertEqual(sum(results["data"]["datasets"][0]["data"]), 100)
+
+    def test_long_series_are_downsampled(self) -> None:
+        """With --max-points or --downsample, series of more points are
+        downsampled, keeping their first and last points and the shape of
+        the chart data.
+        """
+        for method in ("lttb", "minmax"):
+            with self.subTest(method=method):
+                results = self.resolve(
+                    "search index=test | sort created | select created extracted_fields__value "
+                    f"| chart -x created -y extracted_fields__value --max-points 10 --downsample {method}"
+                )
+                data = results["data"]["datasets"][0]["data"]
+                self.assertLessEqual(len(data), 10)
+                self.assertEqual(len(results["data"]["labels"]), len(data))
+                self.assertEqual((data[0]["extracted_fields__value"], data[-1]["extracted_fields__value"]), (99, 0))
+        # Only when asked for
+        with override_settings(DELVE_CHART_MAX_POINTS=10):
+            results = self.resolve(
+                "search index=test | select created extracted_fields__value | chart -x created -y extracted_fields__value"
+            )
+        self.assertEqual(len(results["data"]["datasets"][0]["data"]), 100)
+
+    def test_categories_are_never_downsampled(self) -> None:
+        """Points sharing an x value, and x values which are not numbers
+        or times, are all kept, in the order of the events.
+        """
+        Event.objects.filter(index="test").delete()
+        for i in range(60):
+            Event.objects.create(
+                index="test",
+                user=self.user,
+                text=f"event {i}",
+                extracted_fields={"x": f"c{i % 5}", "n": i % 5, "y": i},
+            )
+        for x in ("x", "n"):
+            with self.subTest(x=x):
+                results = self.resolve(
+                    f"search index=test | select extracted_fields__{x} extracted_fields__y "
+                    f"| chart -t bar -x extracted_fields__{x} -y extracted_fields__y --max-points 10"
+                )
+                data = results["data"]["datasets"][0]["data"]
+                if x == "x":
+                    self.assertEqual([row["extracted_fields__y"] for row in data], list(range(60)))
+                else:
+                    # Repeated numbers are separate points, never merged
+                    self.assertLessEqual(len(data), 10)
+                    self.assertEqual(len(results["data"]["labels"]), len(data))
+
+    def test_invalid_aggregates(self) -> None:
+        """--aggregate needs --time-x, and a y field unless it counts."""
+        for text in (
+            "search index=test | chart -x created -y extracted_fields__value -a sum",
+            "search index=test | chart -x created --time-x hour -a sum",
+        ):
+            with self.subTest(text=text):
+                results = self.resolve(text)
+                self.assertIn("requires", results[0]["exception"])
+
+    def test_truncate(self) -> None:
+        """Weeks start on Monday and quarters in January, April, July and
+        October, and values which are not dates are not bucketed.
+        """
+        value = datetime(2024, 8, 15, 13, 45, 12)
+        self.assertEqual(truncate(value, "hour"), datetime(2024, 8, 15, 13))
+        self.assertEqual(truncate(value, "week"), datetime(2024, 8, 12))
+        self.assertEqual(truncate(value, "quarter"), datetime(2024, 7, 1))
+        self.assertEqual(truncate("2024-08-15T13:45:12", "year"), datetime(2024, 1, 1))
+        self.assertIsNone(truncate("yesterday", "day"))
+        self.assertIsNone(truncate(12, "day"))
+
+    def test_downsamplers(self) -> None:
+        """Both downsamplers keep the ends of a series and its extremes,
+        and keep short series whole.
+        """
+        xs = list(range(1000))
+        ys = [0.0] * 1000
+        ys[500] = 100.0
+        ys[700] = -100.0
+        for function in (lttb, min_max):
+            with self.subTest(function=function.__name__):
+                indices = function(xs, ys, 20)
+                self.assertLessEqual(len(indices), 20)
+                self.assertEqual(indices, sorted(set(indices)))
+                self.assertIn(500, indices)
+                self.assertIn(700, indices)
+                self.assertEqual(function(xs[:10], ys[:10], 20), list(range(10)))
+        indices = lttb(xs, ys, 20)
+        self.assertEqual((indices[0], indices[-1]), (0, 999))
@@ -6,11 +6,13 @@
 command, located at events.search_commands.dedup.
 """
 import json
+import datetime
 from unittest.mock import MagicMock
 
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.test import SimpleTestCase
 
 from rest_framework import status
 from rest_framework.authtoken.models import Token
@@ -21,10 +23,13 @@ from rest_framework.test import (
     force_authenticate,
 )
 
+from events.bloom import BloomFilter, digest
 from events.models import (
     Event,
     Query,
 )
+from events.search_commands.dedup import dedup
+from events.util import ResultSet
 
 
 # from apps.core import models, admin
@@ -103,3 +108,67 @@ class DedupTests(APITestCase):
         # that was kept
         self.assertEqual(results[0]["extracted_fields"]["foo"], 0)
 
+    def test_dedup_global_streams_events(self):
+        """Events with the same values are removed wherever they are,
+        without sorting first.
+        """
+        for text in ("dedup --global host", "dedup --bloom host"):
+            with self.subTest(text=text):
+                query = Query(
+                    name="test",
+                    text=f"search index=test | explode extracted_fields | eval foo=1 | {text} foo",
+                    user=self.user,
+                )
+                results = query.resolve(request=MagicMock(user=self.user))
+                self.assertEqual(len(results), 1)
+
+ROWS = [
+    {"host": "a", "port": 80},
+    {"host": "b", "port": 80},
+    {"host": "a", "port": 80},
+    {"host": "a", "port": 443},
+    {"host": "b", "port": 80, "tags": ["x"]},
+    {"host": "a", "port": 80},
+]
+
+def run_dedup(text, rows):
+    return list(dedup(None, rows, text.split(), {}))
+
+class GlobalDedupTests(SimpleTestCase):
+    def test_global_keeps_first_of_each_key(self):
+        """Every duplicate is removed, not only consecutive ones, for dicts and ResultSets."""
+        for rows in (ROWS, ResultSet.from_rows(ROWS)):
+            with self.subTest(rows=type(rows)):
+                self.assertEqual(
+                    [(row["host"], row["port"]) for row in run_dedup("dedup --global host port", rows)],
+                    [("a", 80), ("b", 80), ("a", 443)],
+                )
+                self.assertEqual(len(run_dedup("dedup -g tags", rows)), 2)
+                self.assertEqual(len(run_dedup("dedup --bloom host", rows)), 2)
+        # Without fields, whole events are compared
+        self.assertEqual(run_dedup("dedup --global", ROWS), ROWS[:2] + ROWS[3:5])
+        self.assertEqual(run_dedup("dedup --bloom", ROWS), ROWS[:2] + ROWS[3:5])
+        # Consecutive duplicates only, as before
+        self.assertEqual(len(run_dedup("dedup host", ROWS)), 5)
+
+    def test_modes_agree_on_equal_values(self):
+        """Fields and whole events are compared like Python compares them,
+        whether they are kept in a set or a Bloom filter.
+        """
+        moment = datetime.datetime(2025, 1, 2, 3, 4, 5)
+        values = [1, 1.0, True, "1", moment, str(moment), {"a": 1, "b": [0]}, {"b": [False], "a": 1.0}, None]
+        rows = [{"value": value} for value in values]
+        expected = [1, "1", moment, str(moment), {"a": 1, "b": [0]}, None]
+        for text in ("dedup --global value", "dedup --bloom value", "dedup --global", "dedup --bloom"):
+            with self.subTest(text=text):
+                self.assertEqual([row["value"] for row in run_dedup(text, rows)], expected)
+
+    def test_bloom_filter_error_rate(self):
+        """A Bloom filter never forgets a digest and stays close to its false positive rate."""
+        bloom = BloomFilter(10000, 0.01)
+        self.assertLess(sum(bloom.add(digest(number)) for number in range(10000)), 0.01 * 10000)
+        self.assertTrue(all(bloom.add(digest(number)) for number in range(10000)))
+        false_positives = sum(digest(number) in bloom for number in range(10000, 30000))
+        self.assertLess(false_positives, 2 * 0.01 * 20000)
+        with self.assertRaises(ValueError):
+            BloomFilter(10, 0)
@@ -6,7 +6,8 @@
 command, located at events.search_commands.eval.
 """
 import json
-from unittest.mock import MagicMock
+import importlib
+from unittest.mock import MagicMock, patch
 from typing import Any
 
 from django.urls import reverse
@@ -25,8 +26,12 @@ from events.models import (
     Event,
     Query,
 )
+from events.search_commands.eval import parse_assignment
 
 
+# events.search_commands.eval is also the name of the command it defines
+eval_module = importlib.import_module("events.search_commands.eval")
+
 TEST_USER = "testuser"
 TEST_USER_PASS = "testuser"
 TEST_ADMIN = "testadmin"
@@ -103,3 +108,59 @@ class EvalTests(APITestCase):
         )
         self.assertEqual(len(results), 10)
         self.assertEqual(results[0]["test_field"], "json")
+
+    def test_eval_expressions(self) -> None:
+        """Values referencing fields or calling functions are expressions,
+        evaluated in order, the same on dicts and on a ResultSet.
+        """
+        expressions = (
+            "eval 'double=$foo * 2' 'label=case($double > 10, \"big\", \"small\")' "
+            "'host=upper($host)' 'first=substr($host, 0, 3)' literal=1+2"
+        )
+        streamed = Query(
+            name="test",
+            text=f"search index=test | explode extracted_fields | {expressions}",
+            user=self.user,
+        ).resolve(request=MagicMock(user=self.user))
+        # sort returns a ResultSet, which eval computes one column at a time
+        with patch.object(eval_module, "_eval_result_set", wraps=eval_module._eval_result_set) as columns:
+            columnar = Query(
+                name="test",
+                text=f"search index=test | explode extracted_fields | sort created | {expressions}",
+                user=self.user,
+            ).resolve(request=MagicMock(user=self.user))
+        self.assertTrue(columns.called)
+        self.assertEqual(len(streamed), 10)
+        by_foo = {row["foo"]: row for row in streamed}
+        self.assertEqual(by_foo[3]["double"], 6)
+        self.assertEqual(by_foo[3]["label"], "small")
+        self.assertEqual(by_foo[6]["label"], "big")
+        self.assertEqual(by_foo[6]["host"], "127.0.0.1")
+        self.assertEqual(by_foo[6]["first"], "127")
+        # Without a field or a function, the value is taken literally as before
+        self.assertEqual(by_foo[6]["literal"], "1+2")
+        self.assertEqual(sorted(streamed, key=lambda row: row["foo"]), sorted(columnar, key=lambda row: row["foo"]))
+
+    def test_eval_parse_assignment(self) -> None:
+        """Invalid assignments and expressions fail before any event is read."""
+        self.assertEqual(parse_assignment("a=$b").source, "b")
+        self.assertEqual(parse_assignment("a=[1, 2]").literal, [1, 2])
+        self.assertEqual(parse_assignment("a=b==c").literal, "b==c")
+        self.assertEqual(parse_assignment("a=$b==1").expression.fields, ["b"])
+        for text in ("no_equals", "a=lower($b, 1)", "a=upper($b) - 1"):
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    parse_assignment(text)
+
+    def test_eval_takes_other_values_literally(self) -> None:
+        """Values which are not expressions of fields and functions are set as before."""
+        results = Query(
+            name="test",
+            text="search index=test | eval 'note=Costs $USD' 'tag=f(x)' 'copy=$sourcetype and more' 'other=unknown($host)'",
+            user=self.user,
+        ).resolve(request=MagicMock(user=self.user))
+        self.assertEqual(len(results), 10)
+        self.assertEqual(results[0]["note"], "Costs $USD")
+        self.assertEqual(results[0]["tag"], "f(x)")
+        self.assertEqual(results[0]["copy"], "$sourcetype and more")
+        self.assertEqual(results[0]["other"], "unknown($host)")
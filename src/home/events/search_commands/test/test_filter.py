@@ -6,12 +6,16 @@
 command, located at events.search_commands.filter.
 """
 import json
-from unittest.mock import MagicMock
+from datetime import datetime
+from unittest.mock import MagicMock, patch
 from typing import Any
 
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
 from rest_framework import status
 from rest_framework.authtoken.models import Token
@@ -25,6 +29,18 @@ from events.models import (
     Event,
     Query,
 )
+from events.search_commands.filter import (
+    And,
+    Not,
+    Or,
+    Term,
+    compile_filter,
+    filter_result_set,
+    parse_expression,
+    term_to_q,
+)
+from events.planner import model_columns
+from events.util import ResultSet
 
 TEST_USER = "testuser"
 TEST_USER_PASS = "testuser"
@@ -88,3 +104,178 @@ class FilterTests(APITestCase):
             request=MagicMock(user=self.user),
         )
         self.assertEqual(len(results), 5)
+
+    def _resolve_both_ways(self, text: str) -> Any:
+        """Resolve text with and without pushdown, returning both results
+        along with the SQL executed while pushdown was enabled.
+        """
+        query = Query(name="test", text=text, user=self.user)
+        with CaptureQueriesContext(connection) as context:
+            pushed = query.resolve(request=MagicMock(user=self.user))
+        with override_settings(DELVE_QUERY_PUSHDOWN=False):
+            unpushed = query.resolve(request=MagicMock(user=self.user))
+        return pushed, unpushed, [q["sql"] for q in context.captured_queries]
+
+    def test_filter_pushdown_matches_python(self) -> None:
+        """Filtering on a JSON key is pushed into the WHERE clause and
+        gives the same results as filtering in Python.
+        """
+        pushed, unpushed, queries = self._resolve_both_ways(
+            "search index=test | filter extracted_fields__foo__gte=5 host=127.0.0.1",
+        )
+        self.assertEqual(len(pushed), 5)
+        self.assertEqual(
+            sorted(event["id"] for event in pushed),
+            sorted(event["id"] for event in unpushed),
+        )
+        self.assertTrue(any('"host" = ' in sql for sql in queries))
+
+    def test_filter_pushdown_declines_type_mismatches(self) -> None:
+        """Comparing a column to a value of a different type never matches
+        in Python, so it must not be pushed down.
+        """
+        pushed, unpushed, queries = self._resolve_both_ways(
+            "search index=test | filter sourcetype=1",
+        )
+        self.assertEqual(pushed, unpushed)
+        self.assertEqual(len(pushed), 0)
+        self.assertFalse(any('"sourcetype" = ' in sql for sql in queries))
+
+    def test_filter_boolean_expression_pushdown_matches_python(self) -> None:
+        """OR, NOT and parentheses are pushed into the WHERE clause and
+        give the same results as filtering in Python.
+        """
+        pushed, unpushed, queries = self._resolve_both_ways(
+            "search index=test | filter ( extracted_fields__foo__lt=2 OR extracted_fields__foo__gte=8 ) "
+            "NOT ( host=localhost OR sourcetype=csv )",
+        )
+        self.assertEqual(len(pushed), 4)
+        self.assertEqual(
+            sorted(event["id"] for event in pushed),
+            sorted(event["id"] for event in unpushed),
+        )
+        self.assertTrue(any(" OR " in sql and '"host" = ' in sql for sql in queries))
+
+    def test_filter_pushdown_compares_json_types_like_python(self) -> None:
+        """Terms on a JSON key holding values of several types (where the
+        database and Python compare differently, ie. true and 1) give the
+        same results pushed down as in Python.
+        """
+        values = [1, True, 1.0, "1", 2, False, 0, None, {"a": 1}, [1], "b", "a"]
+        for value in values:
+            Event.objects.create(
+                index="mixed",
+                host="127.0.0.1",
+                source="test",
+                sourcetype="json",
+                user=self.user,
+                text=json.dumps({"v": value}),
+            )
+        for terms in (
+            "extracted_fields__v=1",
+            "extracted_fields__v=0",
+            "extracted_fields__v=1.0",
+            """'extracted_fields__v="1"'""",
+            """'extracted_fields__v="[1]"'""",
+            """'extracted_fields__v__in=[1, "a"]'""",
+        ):
+            with self.subTest(terms=terms):
+                pushed, unpushed, queries = self._resolve_both_ways(f"search index=mixed | filter {terms}")
+                self.assertEqual(
+                    sorted(event["id"] for event in pushed),
+                    sorted(event["id"] for event in unpushed),
+                )
+                self.assertTrue(any("JSON_TYPE" in sql for sql in queries))
+        # Ranges only compare values of the same type in Python
+        Event.objects.filter(index="mixed", extracted_fields__v__in=["1", "a", "b"]).update(index="strings")
+        Event.objects.filter(index="mixed").exclude(extracted_fields__v__in=[1, 2, 0]).delete()
+        for index, terms in (
+            ("mixed", "extracted_fields__v__gt=0"),
+            ("mixed", "extracted_fields__v__lte=0.5"),
+            ("mixed", "extracted_fields__v__gte=1"),
+            ("strings", "extracted_fields__v__gt=a"),
+        ):
+            with self.subTest(terms=terms):
+                pushed, unpushed, queries = self._resolve_both_ways(f"search index={index} | filter {terms}")
+                self.assertEqual(
+                    sorted(event["id"] for event in pushed),
+                    sorted(event["id"] for event in unpushed),
+                )
+                self.assertTrue(pushed)
+                self.assertTrue(any("JSON_TYPE" in sql for sql in queries))
+
+    def test_filter_pushdown_declines_string_comparisons_unlike_python(self) -> None:
+        """Case is only folded for ASCII letters, and strings are only
+        compared to columns on databases which compare them by code point.
+        """
+        for host in ("éclair", "Éclair", "eclair", "ECLAIR"):
+            Event.objects.create(index="strings", host=host, user=self.user, text="")
+        for terms in ("host__icontains=É", "host__iexact=éclair", "host__icontains=e", "host__gte=e"):
+            with self.subTest(terms=terms):
+                pushed, unpushed, queries = self._resolve_both_ways(f"search index=strings | filter {terms}")
+                self.assertEqual([event["id"] for event in pushed], [event["id"] for event in unpushed])
+        columns = model_columns(Event.objects.all())
+        for vendor, term in (
+            ("mysql", Term(("host",), "exact", "web", False)),
+            ("mysql", Term(("host",), "in", ["web"], False)),
+            ("postgresql", Term(("host",), "gt", "web", False)),
+            ("postgresql", Term(("host",), "regex", "^web", False)),
+            ("postgresql", Term(("host",), "icontains", "É", False)),
+        ):
+            with self.subTest(vendor=vendor, term=term):
+                self.assertIsNone(term_to_q(term, columns, vendor))
+        self.assertIsNotNone(term_to_q(Term(("host",), "icontains", "web", False), columns, "postgresql"))
+        self.assertIsNotNone(term_to_q(Term(("host",), "exact", "web", False), columns, "postgresql"))
+
+ROWS = [
+    {"host": "web1", "status": 200, "bytes": 10, "meta": {"region": "eu"}},
+    {"host": "web2", "status": 500, "bytes": 20, "meta": {"region": "us"}},
+    {"host": "db1", "status": 404, "bytes": None, "meta": None},
+    {"host": "WEB3", "status": 503, "bytes": 40},
+]
+
+class FilterExpressionTests(SimpleTestCase):
+    def select(self, text, rows=ROWS):
+        """Filter rows both as dicts and as a ResultSet, which must agree."""
+        compiled = compile_filter(tuple(text.split()), False)
+        expected = [row["host"] for row in rows if compiled.predicate(row)]
+        columnar = filter_result_set(ResultSet.from_rows(rows), text.split(), False)
+        self.assertEqual([row["host"] for row in columnar], expected)
+        return expected
+
+    def test_parse_precedence(self) -> None:
+        """NOT binds tighter than AND, which binds tighter than OR."""
+        a, b, c = (Term((field,), "exact", 1, False) for field in "abc")
+        self.assertEqual(parse_expression("a=1 b=1 OR c=1".split()), Or((And((a, b)), c)))
+        self.assertEqual(parse_expression("a=1 and ( b=1 or NOT c=1 )".split()), And((a, Or((b, Not(c))))))
+        self.assertIsNone(parse_expression([]))
+        for text in ("a=1 OR", "( a=1", "a=1 )", "OR a=1", "a", "NOT"):
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    parse_expression(text.split())
+
+    def test_constants_are_prepared_once(self) -> None:
+        """Values are cast, lowered and compiled when the filter is compiled."""
+        self.assertIs(compile_filter(("status__in=[500,503]",), False), compile_filter(("status__in=[500,503]",), False))
+        self.assertEqual(self.select("status__in=[500,503]"), ["web2", "WEB3"])
+        self.assertEqual(self.select("host__iregex=^web[13]$"), ["web1", "WEB3"])
+        self.assertEqual(self.select("host__iendswith=B3"), ["WEB3"])
+        self.assertEqual(self.select("meta__region=eu"), ["web1"])
+        self.assertEqual(self.select("meta__region__isnull=True"), ["db1", "WEB3"])
+
+    def test_datetimes_are_cast_every_time(self) -> None:
+        """Times are filled in with the current date, so they are not cached."""
+        first, second = datetime(2025, 1, 1, 10), datetime(2025, 1, 2, 10)
+        with patch("dateutil.parser.parse") as parse:
+            parse.return_value = first
+            self.assertEqual(compile_filter(("created__gte=10:00",), False).expression.rhs, first)
+            parse.return_value = second
+            self.assertEqual(compile_filter(("created__gte=10:00",), False).expression.rhs, second)
+
+    def test_boolean_expressions(self) -> None:
+        """Expressions agree between dict rows and ResultSets."""
+        self.assertEqual(self.select("status=200 OR status__gte=500"), ["web1", "web2", "WEB3"])
+        self.assertEqual(self.select("NOT ( status=200 OR status__gte=500 )"), ["db1"])
+        self.assertEqual(self.select("!status=200 host__startswith=web"), ["web2"])
+        self.assertEqual(self.select("( bytes__isnull=True OR bytes__gt=30 ) AND NOT host=db1"), ["WEB3"])
+        self.assertEqual(self.select(""), [row["host"] for row in ROWS])
@@ -12,6 +12,8 @@ from typing import Any
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from rest_framework import status
 from rest_framework.authtoken.models import Token
@@ -25,6 +27,7 @@ from events.models import (
     Event,
     Query,
 )
+from events.search_commands import head
 
 TEST_USER = "testuser"
 TEST_USER_PASS = "testuser"
@@ -89,3 +92,69 @@ class HeadTests(APITestCase):
             request=MagicMock(user=self.user),
         )
         self.assertEqual(len(results), 5)
+
+    def test_head_pushdown_limits_query(self) -> None:
+        """When head directly follows search, the limit is applied in SQL."""
+        query = Query(
+            name="test",
+            text="search index=test --order-by extracted_fields__foo | head -n 3",
+            user=self.user,
+        )
+        with CaptureQueriesContext(connection) as context:
+            results = query.resolve(request=MagicMock(user=self.user))
+        self.assertEqual(
+            [event["extracted_fields"]["foo"] for event in results],
+            [0, 1, 2],
+        )
+        self.assertTrue(any("LIMIT 3" in q["sql"] for q in context.captured_queries))
+
+    def test_head_stops_reading_upstream(self) -> None:
+        """head pulls only the events it returns, then closes the previous stage."""
+        pulled = []
+
+        def upstream():
+            for number in range(1000):
+                pulled.append(number)
+                yield {"number": number}
+
+        events = upstream()
+        results = list(head(MagicMock(user=self.user), events, ["head", "-n", "3"], {}))
+        self.assertEqual(results, [{"number": 0}, {"number": 1}, {"number": 2}])
+        self.assertEqual(pulled, [0, 1, 2])
+        self.assertIsNone(events.gi_frame)
+
+    def test_head_limit_reaches_search(self) -> None:
+        """The limit of head is pushed down into search through stages
+        which return one event per event, so they only process those events.
+        """
+        query = Query(
+            name="test",
+            text=(
+                "search index=test --order-by extracted_fields__foo | explode extracted_fields "
+                "| rex -f foo '(?P<digit>\\d)' | head -n 3"
+            ),
+            user=self.user,
+        )
+        with CaptureQueriesContext(connection) as context:
+            results = query.resolve(request=MagicMock(user=self.user))
+        self.assertEqual([event["digit"] for event in results], ["0", "1", "2"])
+        self.assertTrue(any("LIMIT 3" in q["sql"] for q in context.captured_queries))
+
+    def test_head_pushdown_keeps_the_order_of_events(self) -> None:
+        """Without an ordering, a limit pushed down into the database still
+        returns the first events, even when later stages read only columns
+        which are indexed.
+        """
+        for host in ["db", "web1", "db", "web1", "web10", "", "", "", "", ""]:
+            Event.objects.create(index="hosts", host=host, user=self.user, text="")
+        events = list(Event.objects.order_by("pk"))
+        by_source = sorted(events, key=lambda event: event.source)
+        for text, expected in (
+            ("head -n 5 | select host", events),
+            ("head -n 5 | eval x=1 | select host", events),
+            ("sort source | head -n 5 | select host", by_source),
+        ):
+            with self.subTest(text=text):
+                query = Query(name="test", text=f"search | {text}", user=self.user)
+                results = query.resolve(request=MagicMock(user=self.user))
+                self.assertEqual([event["host"] for event in results], [event.host for event in expected[:5]])
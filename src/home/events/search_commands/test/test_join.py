@@ -12,6 +12,9 @@ from typing import Any
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 
 from rest_framework import status
 from rest_framework.authtoken.models import Token
@@ -92,3 +95,92 @@ class JoinTests(APITestCase):
         # single value, the result effectively squares the
         # number of events
         self.assertEqual(len(results), 100)
+
+    def test_join_types(self) -> None:
+        """Test inner and full joins and joining on multiple fields."""
+        # 5 events on the left, all sharing index and host with the 10 events on the right
+        query = Query(
+            name="test",
+            text="search index=test | explode extracted_fields | filter foo__lt=5 | join --type inner --fields index --fields host,host index=test",
+            user=self.user,
+        )
+        results = query.resolve(request=MagicMock(user=self.user))
+        self.assertEqual(len(results), 50)
+
+        # Nothing matches, so every row of both sides is kept
+        query = Query(
+            name="test",
+            text="search index=test | explode extracted_fields | filter foo__lt=5 | join --type full --fields foo,index index=test",
+            user=self.user,
+        )
+        results = query.resolve(request=MagicMock(user=self.user))
+        self.assertEqual(len(results), 15)
+
+        query = Query(
+            name="test",
+            text="search index=test | explode extracted_fields | filter foo__lt=5 | join --type inner --fields foo,index index=test",
+            user=self.user,
+        )
+        results = query.resolve(request=MagicMock(user=self.user))
+        self.assertEqual(results, [])
+
+    def test_join_keeps_left_order(self) -> None:
+        """Rows come in the order of the left side, even when it is the
+        smaller side and the hash table is built from it.
+        """
+        query = Query(
+            name="test",
+            text="search index=test --order-by=-extracted_fields__foo | explode extracted_fields | filter foo__lt=3 | join --fields index index=test --order-by id",
+            user=self.user,
+        )
+        results = query.resolve(request=MagicMock(user=self.user))
+        self.assertEqual([row["foo"] for row in results], [2] * 10 + [1] * 10 + [0] * 10)
+        self.assertEqual([row["id"] for row in results], [event.id for event in self.events] * 3)
+
+    def _join_on_json_key(self):
+        query = Query(
+            name="test",
+            text="search index=test | explode extracted_fields | filter foo__lt=5 | join --type inner --fields foo,extracted_fields__foo index=test",
+            user=self.user,
+        )
+        with CaptureQueriesContext(connection) as context:
+            results = query.resolve(request=MagicMock(user=self.user))
+        in_queries = [q["sql"] for q in context.captured_queries if " IN (" in q["sql"] and "events_event" in q["sql"]]
+        return sorted(results, key=lambda row: row["foo"]), in_queries
+
+    def test_join_pushes_keys_down(self) -> None:
+        """Only the right side rows whose keys appear on the left side are read."""
+        results, in_queries = self._join_on_json_key()
+        self.assertEqual([row["foo"] for row in results], [0, 1, 2, 3, 4])
+        self.assertEqual([row["extracted_fields"]["foo"] for row in results], [0, 1, 2, 3, 4])
+        self.assertEqual(len(in_queries), 1)
+
+        with override_settings(DELVE_JOIN_KEY_BATCH_SIZE=2):
+            batched, in_queries = self._join_on_json_key()
+        self.assertEqual(batched, results)
+        self.assertEqual(len(in_queries), 3)
+
+    def test_join_falls_back_to_full_scan(self) -> None:
+        """Too many batches of keys read the whole right side instead."""
+        results, _ = self._join_on_json_key()
+        with override_settings(DELVE_JOIN_KEY_BATCH_SIZE=1, DELVE_JOIN_MAX_KEY_BATCHES=4):
+            scanned, in_queries = self._join_on_json_key()
+        self.assertEqual(scanned, results)
+        self.assertEqual(in_queries, [])
+
+    def test_join_pushdown_matches_booleans_like_python(self) -> None:
+        """A key of 1 matches true on the right side, pushed down or not."""
+        Event.objects.create(
+            index="test",
+            host="127.0.0.1",
+            source="test",
+            sourcetype="json",
+            user=self.user,
+            text=json.dumps({"foo": True}),
+        )
+        results, in_queries = self._join_on_json_key()
+        with override_settings(DELVE_JOIN_MAX_KEY_BATCHES=0):
+            scanned, _ = self._join_on_json_key()
+        self.assertEqual(len(in_queries), 1)
+        self.assertEqual(results, scanned)
+        self.assertEqual([row["foo"] for row in results], [0, 1, 1, True, True, 2, 3, 4])
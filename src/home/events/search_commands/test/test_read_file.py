@@ -0,0 +1,177 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+"""This test module is meant to test the read_file command,
+located at events.search_commands.read_file, and the incremental
+and parallel parsers of events.file_formats.
+"""
+import io
+import os
+import csv
+import gzip
+import json
+import tempfile
+from unittest.mock import MagicMock, patch
+from typing import Any
+
+import xmltodict
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+
+from events import file_formats
+from events.models import (
+    FileUpload,
+    Query,
+)
+
+XML = (
+    '<?xml version="1.0"?>\n'
+    '<catalog xmlns:x="urn:x">\n'
+    '  <book id="1" x:lang="en"><title>A</title><title>B</title>text<x:note/></book>\n'
+    '  <book id="2"><title>C</title></book>\n'
+    '  <book>plain</book>\n'
+    '</catalog>\n'
+)
+
+class ReadFileTests(TestCase):
+    def setUp(self, *args: Any, **kwargs: Any) -> None:
+        """For preparation, we are going to setup a user and keep the files
+        it uploads in a temporary directory.
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = get_user_model().objects.create_user(
+            username='testuser',
+            email='testuser@test.com',
+            password='testuser',
+        )
+        super().setUp(*args, **kwargs)
+
+    def upload(self, title: str, content: bytes) -> None:
+        FileUpload.objects.create(
+            title=title,
+            user=self.user,
+            content=ContentFile(content, name=title),
+        )
+
+    def resolve(self, text: str) -> Any:
+        query = Query(name="test", text=text, user=self.user)
+        return query.resolve(request=MagicMock(user=self.user))
+
+    def test_formats(self) -> None:
+        """Each format gives the same events as parsing the whole file."""
+        self.upload("test.csv", b"a,b\r\n1,2\r\n3,\"x,y\"\r\n")
+        results = self.resolve("read_file test.csv --parse csv")
+        self.assertEqual([{"a": row["a"], "b": row["b"]} for row in results], [{"a": "1", "b": "2"}, {"a": "3", "b": "x,y"}])
+        self.assertEqual(results[0]["title"], "test.csv")
+        items = [{"n": i, "s": "é" * i, "nested": [i, {"x": None}]} for i in range(50)]
+        self.upload("array.json", json.dumps(items, indent=2).encode())
+        results = self.resolve("read_file array.json --parse json")
+        self.assertEqual([{key: row[key] for key in ("n", "s", "nested")} for row in results], items)
+        self.upload("object.json", b' {"a": [1, 2]} ')
+        self.assertEqual(self.resolve("read_file object.json --parse json")[0]["content"], {"a": [1, 2]})
+        self.upload("test.jsonl", b'{"a": 1}\n[2, 3]\nnot json\n')
+        results = self.resolve("read_file test.jsonl --parse jsonl")
+        self.assertEqual([row["content"] for row in results], [{"a": 1}, 2, 3, "not json\n"])
+        self.upload("test.log", b"one\r\ntwo\nthree")
+        results = self.resolve("read_file test.log --parse lines")
+        self.assertEqual([row["content"] for row in results], ["one", "two", "three"])
+        results = self.resolve("read_file test.log")
+        self.assertEqual(results[0]["content"], [b"one\r\n", b"two\n", b"three"])
+
+    def test_xml(self) -> None:
+        """XML documents are converted like xmltodict, as a whole or one
+        record at a time.
+        """
+        self.upload("test.xml", XML.encode())
+        expected = json.loads(json.dumps(xmltodict.parse(XML, process_namespaces=False)))
+        self.assertEqual(self.resolve("read_file test.xml --parse xml"), [expected])
+        results = self.resolve("read_file test.xml --parse xml --record-path catalog/book")
+        self.assertEqual(len(results), 3)
+        for row, book in zip(results, expected["catalog"]["book"]):
+            if isinstance(book, dict):
+                # The title of each book takes the place of the file's, and
+                # the rows share the columns of the others (None if missing)
+                self.assertEqual({key: row[key] for key in book}, book)
+            else:
+                self.assertEqual(row["content"], book)
+        self.assertEqual(results[0]["@x:lang"], "en")
+        self.assertIsNone(results[0]["x:note"])
+
+    def test_compressed(self) -> None:
+        """gzip files are decompressed whatever their name."""
+        self.upload("test.csv.gz", gzip.compress(b"a,b\n1,2\n"))
+        results = self.resolve("read_file test.csv.gz --parse csv")
+        self.assertEqual((results[0]["a"], results[0]["b"]), ("1", "2"))
+        self.upload("compressed", gzip.compress(b'[{"a": 1}, {"a": 2}]'))
+        self.assertEqual([row["a"] for row in self.resolve("read_file compressed --parse json")], [1, 2])
+
+    def test_json_items_across_chunks(self) -> None:
+        """Items and numbers split across chunks are decoded whole, and
+        malformed arrays are rejected.
+        """
+        items = [12345, -1.5e10, "a\"b\\", [1, [2]], {"k": True}, None, ""]
+        with patch.object(file_formats, "CHUNK_SIZE", 2):
+            for text in (json.dumps(items), json.dumps(items, indent=3)):
+                with self.subTest(text=text):
+                    content = file_formats.JSONItems(io.BytesIO(text.encode()))
+                    self.assertTrue(content.array)
+                    self.assertEqual(list(content), items)
+            self.assertEqual(list(file_formats.JSONItems(io.BytesIO(b"[ ]"))), [])
+            self.assertEqual(list(file_formats.JSONItems(io.BytesIO(b"12345"))), [12345])
+            for text in (b"[1, 2", b"[1 2]", b"[1,]"):
+                with self.subTest(text=text):
+                    with self.assertRaises(ValueError):
+                        list(file_formats.JSONItems(io.BytesIO(text)))
+
+    def test_split_offsets(self) -> None:
+        """Files are split after newlines, but not inside quoted CSV fields."""
+        with tempfile.NamedTemporaryFile(delete=False) as stream:
+            self.addCleanup(os.unlink, stream.name)
+            stream.write(b'a,b\n1,"x\ny\nz"\n2,""""\n3,\n')
+        self.assertEqual(file_formats.split_offsets(stream.name, 1), [0, 4, 9, 11, 14, 21, 24])
+        self.assertEqual(file_formats.split_offsets(stream.name, 1, quoted=True), [0, 4, 14, 21, 24])
+        self.assertEqual(file_formats.split_offsets(stream.name, 100), [0, 24])
+        self.assertEqual(file_formats.csv_header(stream.name), (["a", "b"], 4))
+
+    def test_processes(self) -> None:
+        """Parsing in worker processes gives the same events, in order
+        unless --unordered.
+        """
+        rows = [["id", "text"]] + [[str(index), f"line\n{index}" if index % 7 == 0 else "plain"] for index in range(300)]
+        content = io.StringIO(newline="")
+        csv.writer(content).writerows(rows)
+        self.upload("test.csv", content.getvalue().encode() + b"\n1,2,3\n4\n")
+        lines = [json.dumps({"id": index}) for index in range(300)] + ["not json", "[1, 2]"]
+        self.upload("test.jsonl", "\n".join(lines).encode())
+        with override_settings(DELVE_READ_FILE_SPLIT_SIZE=0.001):
+            for text in (
+                "read_file test.csv --parse csv",
+                "read_file test.jsonl --parse jsonl",
+            ):
+                with self.subTest(text=text):
+                    expected = self.resolve(text)
+                    self.assertEqual(self.resolve(f"{text} --processes 2"), expected)
+                    results = self.resolve(f"{text} --processes 2 --unordered")
+                    self.assertEqual(sorted(results, key=repr), sorted(expected, key=repr))
+        self.assertEqual(len(expected), 303)
+
+    def test_processes_are_limited(self) -> None:
+        """--processes may not be negative, and is clamped to
+        DELVE_MAX_PROCESSES.
+        """
+        self.upload("test.jsonl", "\n".join(json.dumps({"id": index}) for index in range(300)).encode())
+        with override_settings(DELVE_READ_FILE_SPLIT_SIZE=0.001, DELVE_MAX_PROCESSES=1), \
+                patch("events.search_commands.read_file.read_parallel", return_value=iter(())) as read:
+            self.resolve("read_file test.jsonl --parse jsonl --processes 64")
+            self.assertEqual(read.call_args.args[2], 1)
+            read.reset_mock()
+            results = self.resolve("read_file test.jsonl --parse jsonl --processes -1")
+            read.assert_not_called()
+        self.assertIn("must not be negative", str(results[0]["exception"]))
@@ -6,12 +6,13 @@
 command, located at events.search_commands.rex.
 """
 import json
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 from typing import Any
 
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.test import SimpleTestCase, override_settings
 
 from rest_framework import status
 from rest_framework.authtoken.models import Token
@@ -21,6 +22,7 @@ from rest_framework.test import (
     APIClient,
 )
 
+from events.extraction import Extractor, compile_extractor, extract_events
 from events.models import (
     Event,
     Query,
@@ -80,3 +82,93 @@ class RexTests(APITestCase):
         self.assertTrue(all('bar' in result for result in results))
         self.assertEqual(results[0]['bar'], '0')
         self.assertEqual(results[1]['bar'], '1')
+
+    def test_rex_first(self) -> None:
+        """With --first only the groups of the first expression which
+        matches are extracted, otherwise later expressions overwrite
+        earlier ones.
+        """
+        for flags, expected in (("", "last"), ("--first ", "first")):
+            with self.subTest(flags=flags):
+                query = Query(
+                    name="test",
+                    text=(
+                        "search index=test | explode extracted_fields | "
+                        rf"rex -f foo {flags}'foo_(?P<bar>\d+)(?P<which>)' 'foo_(?P<which>\d)'"
+                    ),
+                    user=self.user,
+                )
+                results = query.resolve(
+                    request=MagicMock(user=self.user),
+                )
+                self.assertEqual(len(results), 10)
+                self.assertEqual(results[3]['bar'], '3')
+                self.assertEqual(results[3]['which'], '' if expected == "first" else '3')
+
+    def test_rex_processes_are_limited(self) -> None:
+        """--processes may not be negative, and is clamped to
+        DELVE_MAX_PROCESSES.
+        """
+        text = r"search index=test | explode extracted_fields | rex -f foo 'foo_(?P<bar>\d+)' --processes {}"
+        with override_settings(DELVE_MAX_PROCESSES=2), \
+                patch("events.search_commands.rex.extract_events", return_value=iter(())) as extract:
+            for requested, expected in (("0", 0), ("1", 1), ("64", 2)):
+                with self.subTest(requested=requested):
+                    Query(name="test", text=text.format(requested), user=self.user).resolve(
+                        request=MagicMock(user=self.user),
+                    )
+                    self.assertEqual(extract.call_args.kwargs["processes"], expected)
+            extract.reset_mock()
+            results = Query(name="test", text=text.format("-1"), user=self.user).resolve(
+                request=MagicMock(user=self.user),
+            )
+            extract.assert_not_called()
+        self.assertIn("must not be negative", str(results[0]["exception"]))
+
+class ExtractorTests(SimpleTestCase):
+    def test_values(self) -> None:
+        """Missing values never match, bytes are decoded and other values converted."""
+        extract = Extractor([r"(?P<number>\d+)"]).extract
+        self.assertIsNone(extract(None))
+        self.assertIsNone(extract("none"))
+        self.assertEqual(extract(b"id 42 \xff"), {"number": "42"})
+        self.assertEqual(extract(1234), {"number": "1234"})
+
+    def test_combined_alternation(self) -> None:
+        """Combining anchored expressions into an alternation extracts the
+        same groups as trying them one at a time.
+        """
+        expressions = [rf"^f{number}: (?P<word>\w+) (?P<n{number}>\d+)?" for number in range(10)]
+        expressions[3] = r"^f3: (?P<word>[a-z]+)(?:[0-9]|x)\b"
+        combined = Extractor(expressions, first=True)
+        self.assertIsNotNone(combined.combined)
+        sequential = Extractor(expressions, first=True)
+        sequential.combined = None
+        for line in ["f1: word 1", "f3: word1", "f3: wordx", "f9: other ", "f10: word 1", "x f1: word 1", ""]:
+            with self.subTest(line=line):
+                self.assertEqual(combined.extract(line), sequential.extract(line))
+        self.assertEqual(combined.extract("f9: word 9"), {"word": "word", "n9": "9"})
+
+    def test_not_combined(self) -> None:
+        """Expressions which are not all anchored (or anchor only one
+        alternative, or use backreferences) are tried one at a time.
+        """
+        anchored = [rf"^f{number}: (?P<word>\w+)" for number in range(9)]
+        for expression in (r"f9: (?P<word>\w+)", r"^f9|(?P<word>\w+)", r"^(?P<word>\w)(?P=word)", r"(?m)^f9"):
+            with self.subTest(expression=expression):
+                self.assertIsNone(Extractor(anchored + [expression], first=True).combined)
+        self.assertIsNotNone(Extractor(anchored + [r"\Af9: (?P<word>\w+)"], first=True).combined)
+        self.assertIs(compile_extractor(tuple(anchored), True), compile_extractor(tuple(anchored), True))
+
+    def test_processes(self) -> None:
+        """Extracting in worker processes keeps the events and their order."""
+        events = [{"text": f"id={index}", "index": index} for index in range(95)]
+        events[10]["text"] = None
+        del events[20]["text"]
+        results = list(extract_events(
+            [dict(event) for event in events], "text", (r"id=(?P<id>\d+)",), processes=2, chunk_size=10,
+        ))
+        self.assertEqual([event["index"] for event in results], list(range(95)))
+        self.assertEqual([event.get("id") for event in results], [
+            None if index in (10, 20) else str(index) for index in range(95)
+        ])
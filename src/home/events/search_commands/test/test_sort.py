@@ -12,6 +12,9 @@ from typing import Any
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 
 from rest_framework import status
 from rest_framework.authtoken.models import Token
@@ -78,3 +81,91 @@ class SortTests(APITestCase):
         )
         self.assertEqual(len(results), 10)
         self.assertEqual([result['foo'] for result in results], list(range(10)))
+
+    def test_sort_pushdown_matches_python(self) -> None:
+        """Sorting on model columns is pushed into the ORDER BY clause
+        and gives the same results as sorting in Python.
+        """
+        query = Query(
+            name="test",
+            text="search index=test | sort -d created",
+            user=self.user,
+        )
+        with CaptureQueriesContext(connection) as context:
+            pushed = query.resolve(request=MagicMock(user=self.user))
+        with override_settings(DELVE_QUERY_PUSHDOWN=False):
+            unpushed = query.resolve(request=MagicMock(user=self.user))
+        self.assertEqual(
+            [event["id"] for event in pushed],
+            [event["id"] for event in unpushed],
+        )
+        self.assertTrue(
+            any('ORDER BY "events_event"."created" DESC' in q["sql"] for q in context.captured_queries)
+        )
+
+    def test_sort_pushdown_orders_strings_like_python(self) -> None:
+        """Strings are ordered by code point when pushed down, whatever
+        the collation of the column.
+        """
+        for host in ("b", "B", "a", "é", "A", "z"):
+            Event.objects.create(index="hosts", host=host, source="test", sourcetype="json", user=self.user, text="{}")
+        query = Query(name="test", text="search index=hosts | sort host", user=self.user)
+        with CaptureQueriesContext(connection) as context:
+            pushed = query.resolve(request=MagicMock(user=self.user))
+        with override_settings(DELVE_QUERY_PUSHDOWN=False):
+            unpushed = query.resolve(request=MagicMock(user=self.user))
+        self.assertEqual([event["host"] for event in pushed], ["A", "B", "a", "b", "z", "é"])
+        self.assertEqual([event["id"] for event in pushed], [event["id"] for event in unpushed])
+        self.assertTrue(any("COLLATE" in q["sql"] for q in context.captured_queries))
+
+    def test_sort_mixed_types_and_directions(self) -> None:
+        """Missing and mixed type values sort without raising, each field in its own direction."""
+        for fields in ({"foo": "x"}, {"bar": 1}):
+            event = Event.objects.create(
+                index="test",
+                host="127.0.0.2",
+                source="test",
+                sourcetype="json",
+                user=self.user,
+                text=json.dumps(fields),
+            )
+            event.extract_fields()
+            event.process()
+            event.save()
+        query = Query(
+            name="test",
+            text="search index=test | explode extracted_fields | sort foo:desc",
+            user=self.user,
+        )
+        results = query.resolve(request=MagicMock(user=self.user))
+        self.assertEqual([result.get("foo") for result in results], ["x", *range(9, -1, -1), None])
+        query = Query(
+            name="test",
+            text="search index=test | explode extracted_fields | sort -d host foo:asc",
+            user=self.user,
+        )
+        results = query.resolve(request=MagicMock(user=self.user))
+        self.assertEqual([result.get("foo") for result in results], [None, "x", *range(10)])
+
+    def test_sort_head_selects_top_k(self) -> None:
+        """sort followed by head returns the same events as sorting everything."""
+        for text in ("sort -d foo | head -n 3", "sort foo:desc | head -n 3"):
+            with self.subTest(text=text):
+                query = Query(
+                    name="test",
+                    text=f"search index=test | explode extracted_fields | {text}",
+                    user=self.user,
+                )
+                results = query.resolve(request=MagicMock(user=self.user))
+                self.assertEqual([result["foo"] for result in results], [9, 8, 7])
+
+    @override_settings(DELVE_SORT_MEMORY_LIMIT=0)
+    def test_sort_spills_to_disk(self) -> None:
+        """Beyond DELVE_SORT_MEMORY_LIMIT the sort is merged from sorted runs."""
+        query = Query(
+            name="test",
+            text="search index=test | explode extracted_fields | sort -d foo",
+            user=self.user,
+        )
+        results = query.resolve(request=MagicMock(user=self.user))
+        self.assertEqual([result["foo"] for result in results], list(range(9, -1, -1)))
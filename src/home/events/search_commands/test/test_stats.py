@@ -0,0 +1,344 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+"""This test module is meant to test the stats search
+command, located at events.search_commands.stats.
+"""
+import json
+import random
+import statistics
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from events.models import (
+    Event,
+    Query,
+)
+from events.search_commands.stats import stats, pushdown
+from events.search_commands.stats.engine import HashAggregation, parse_aggregate
+from events.search_commands.stats.sketches import CountMinSketch, HyperLogLog, TDigest
+
+ROWS = [
+    {"host": "a", "status": 200, "latency": 10},
+    {"host": "b", "status": 500, "latency": 40},
+    {"host": "a", "status": 200, "latency": 30},
+    {"host": "a", "status": 404, "latency": None},
+    {"host": "b", "status": 200, "latency": 20},
+    {"host": "a", "status": 500, "latency": 20},
+]
+
+def run_stats(text, rows=ROWS):
+    return stats(None, [dict(row) for row in rows], text.split(), {})
+
+class StatsAggregateTests(SimpleTestCase):
+    def test_reduce_matches_statistics(self) -> None:
+        """Every aggregate is computed in one pass, one row per group."""
+        results = run_stats(
+            "stats aggregate count count(latency) dc(status) sum(latency) avg(latency) "
+            "min(latency) max(latency) stddev(latency) median(latency) p75(latency) --by host --reduce"
+        )
+        self.assertEqual([row["host"] for row in results], ["a", "b"])
+        latencies = [10, 30, 20]
+        self.assertEqual(
+            results[0],
+            {
+                "host": "a",
+                "count": 4,
+                "count(latency)": 3,
+                "dc(status)": 3,
+                "sum(latency)": 60,
+                "avg(latency)": statistics.mean(latencies),
+                "min(latency)": 10,
+                "max(latency)": 30,
+                "stddev(latency)": statistics.stdev(latencies),
+                "median(latency)": statistics.median(latencies),
+                "p75(latency)": statistics.quantiles(latencies, n=4, method="inclusive")[-1],
+            },
+        )
+        self.assertEqual(results[1]["stddev(latency)"], statistics.stdev([40, 20]))
+
+    def test_reduce_without_groups(self) -> None:
+        """Without --by there is a single row, even without events."""
+        self.assertEqual(run_stats("stats aggregate total=count slowest=max(latency) --reduce"), [{"total": 6, "slowest": 40}])
+        self.assertEqual(run_stats("stats aggregate count avg(latency) --reduce", []), [{"count": 0, "avg(latency)": None}])
+
+    def test_aggregates_are_added_to_events(self) -> None:
+        """Without --reduce every event gets the aggregates of its group, in the original order."""
+        results = list(run_stats("stats aggregate count avg(latency) --by host status"))
+        self.assertEqual(len(results), len(ROWS))
+        self.assertEqual([row["latency"] for row in results], [row["latency"] for row in ROWS])
+        self.assertEqual([row["count"] for row in results], [2, 1, 2, 1, 1, 1])
+        self.assertEqual(results[0]["avg(latency)"], 20)
+        self.assertIsNone(results[3]["avg(latency)"])
+
+    def test_invalid_aggregates(self) -> None:
+        """Unknown functions and missing fields are rejected."""
+        for text in ("bogus(latency)", "avg", "p101(latency)", "avg(latency"):
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    parse_aggregate(text)
+        self.assertEqual(parse_aggregate("p99.9(latency)").name, "p99.9(latency)")
+
+    def test_count_distinct_field(self) -> None:
+        """stats count FIELD --distinct counts the distinct values of FIELD."""
+        self.assertEqual(run_stats("stats count status --distinct"), 3)
+        self.assertEqual(run_stats("stats count latency --distinct"), 4)
+        counts = {row["host"]: row["count"] for row in run_stats("stats count status --distinct --by host")}
+        self.assertEqual(counts, {"a": 3, "b": 2})
+
+class StatsSketchTests(SimpleTestCase):
+    def test_hyperloglog_error(self) -> None:
+        """Distinct counts are within a few standard errors, small counts almost exact."""
+        sketch = HyperLogLog(0.01)
+        for value in range(100000):
+            sketch.add(f"10.0.{value}")
+        self.assertLess(abs(sketch.result() - 100000), 3 * 0.01 * 100000)
+        small = HyperLogLog(0.01)
+        for value in [1, 1.0, "1", None, 2, 3] * 10:
+            small.add(value)
+        self.assertEqual(small.result(), 4)
+
+    def test_hyperloglog_sparse(self) -> None:
+        """Only the registers which are set are kept until the sketch
+        fills up, without changing its estimates, and error bounds below
+        what the largest sketch can meet are rejected.
+        """
+        sparse, dense = HyperLogLog(0.01), HyperLogLog(0.01)
+        dense._densify()
+        for value in range(100):
+            sparse.add(value)
+            dense.add(value)
+        self.assertIsNone(sparse.registers)
+        self.assertEqual(sparse.result(), dense.result())
+        merged = HyperLogLog(0.01)
+        merged.merge(sparse)
+        self.assertIsNotNone(merged.sparse)
+        for value in range(100, 5000):
+            sparse.add(value)
+        self.assertIsNone(sparse.sparse)
+        merged.merge(sparse)
+        self.assertEqual(merged.result(), sparse.result())
+        with self.assertRaises(ValueError):
+            HyperLogLog(0.002)
+        self.assertEqual(HyperLogLog(HyperLogLog.MIN_ERROR).precision, HyperLogLog.MAX_PRECISION)
+
+    def test_tdigest_percentiles(self) -> None:
+        """Percentiles are exact for few values and close to exact for many."""
+        digest = TDigest(75)
+        for value in [10, 30, 20]:
+            digest.add(value)
+        self.assertEqual(digest.result(), statistics.quantiles([10, 30, 20], n=4, method="inclusive")[-1])
+        values = [random.Random(seed).expovariate(1) for seed in range(50000)]
+        digest = TDigest(99, 100)
+        for value in values:
+            digest.add(value)
+        exact = statistics.quantiles(values, n=100, method="inclusive")
+        self.assertAlmostEqual(digest.quantile(0.99), exact[98], delta=0.02 * exact[98])
+        self.assertAlmostEqual(digest.quantile(0.5), exact[49], delta=0.02 * exact[49])
+        self.assertLess(len(digest.centroids), 200)
+
+    def test_count_min_heavy_hitters(self) -> None:
+        """The most frequent values are found and never undercounted."""
+        sketch = CountMinSketch(3, 0.001)
+        rows = ["a"] * 5000 + ["b"] * 3000 + ["c"] * 2000 + [str(value) for value in range(20000)]
+        random.Random(0).shuffle(rows)
+        for value in rows:
+            sketch.add(value)
+        result = sketch.result()
+        self.assertEqual([row["value"] for row in result], ["a", "b", "c"])
+        for row, count in zip(result, (5000, 3000, 2000)):
+            self.assertGreaterEqual(row["count"], count)
+            self.assertLessEqual(row["count"], count + 0.001 * len(rows))
+
+    def test_merge_partitions(self) -> None:
+        """Aggregating partitions separately and merging them gives the same results."""
+        rows = [{"host": f"h{value % 3}", "value": value % 1000} for value in range(9000)]
+        aggregates = [
+            parse_aggregate(text)
+            for text in ("count", "sum(value)", "stddev(value)", "dc(value)", "estdc(value)", "estmedian(value)", "top(value,2)")
+        ]
+        whole = HashAggregation(aggregates, ["host"])
+        list(whole.add_rows(rows))
+        merged = HashAggregation(aggregates, ["host"])
+        for start in range(0, len(rows), 2000):
+            partition = HashAggregation(aggregates, ["host"])
+            list(partition.add_rows(rows[start:start + 2000]))
+            merged.merge(partition)
+        for expected, actual in zip(whole.rows(), merged.rows()):
+            self.assertEqual(expected["host"], actual["host"])
+            for name in ("count", "sum(value)", "dc(value)", "estdc(value)"):
+                self.assertEqual(expected[name], actual[name])
+            self.assertAlmostEqual(expected["stddev(value)"], actual["stddev(value)"])
+            self.assertAlmostEqual(expected["estmedian(value)"], actual["estmedian(value)"], delta=10)
+            self.assertEqual(len(actual["top(value,2)"]), 2)
+
+    def test_parse_sketches(self) -> None:
+        """Approximate aggregates take an optional parameter, others do not."""
+        self.assertEqual(parse_aggregate("estdc(ip,0.005)").factory().precision, 16)
+        self.assertEqual(parse_aggregate("estp99(latency,200)").factory().compression, 200)
+        self.assertEqual(parse_aggregate("top(ip,5)").factory().top, 5)
+        self.assertEqual(parse_aggregate("top(ip, 5)").name, "top(ip, 5)")
+        for text in ("avg(latency,5)", "estdc(ip,2)", "estdc(ip,0.001)", "top(ip,zero)", "estp99(latency,5)", "estdc"):
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    parse_aggregate(text)
+
+    def test_reduce_with_sketches(self) -> None:
+        """Sketches are aggregates like any other."""
+        results = run_stats("stats aggregate estdc(status) estmedian(latency) estp75(latency) top(status,1) --by host --reduce")
+        self.assertEqual(results[0]["estdc(status)"], 3)
+        self.assertEqual(results[0]["estmedian(latency)"], 20)
+        self.assertEqual(results[0]["estp75(latency)"], 25)
+        self.assertEqual(results[0]["top(status,1)"], [{"value": 200, "count": 2}])
+
+class StatsPipelineTests(TestCase):
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            username='testuser',
+            email='testuser@test.com',
+            password='testuser',
+        )
+        for i in range(10):
+            Event.objects.create(
+                index="test",
+                host=f"host{i % 3}",
+                source="test",
+                sourcetype="json",
+                user=self.user,
+                text=json.dumps({"foo": i}),
+            )
+
+    def resolve(self, text):
+        query = Query(name="test", text=text, user=self.user)
+        return query.resolve(request=MagicMock(user=self.user))
+
+    def test_stats_aggregate_reduce(self) -> None:
+        """Events read from the database are aggregated per group."""
+        results = self.resolve("search index=test | stats aggregate count dc(source) --by host --reduce")
+        self.assertEqual(
+            sorted(results, key=lambda row: row["host"]),
+            [
+                {"host": "host0", "count": 4, "dc(source)": 1},
+                {"host": "host1", "count": 3, "dc(source)": 1},
+                {"host": "host2", "count": 3, "dc(source)": 1},
+            ],
+        )
+
+    def test_stats_aggregate_matches_stats_count(self) -> None:
+        """Adding a count to each event agrees with stats count."""
+        aggregated = self.resolve("search index=test | stats aggregate count --by host")
+        counted = self.resolve("search index=test | stats count --by host")
+        self.assertEqual(
+            sorted((row["id"], row["count"]) for row in aggregated),
+            sorted((row["id"], row["count"]) for row in counted),
+        )
+
+class StatsPushdownTests(TestCase):
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            username='testuser',
+            email='testuser@test.com',
+            password='testuser',
+        )
+        statuses = [200, 500, "200", None, 200, 1.5, 404, 500]
+        for i, status in enumerate(statuses):
+            fields = {"bytes": i * 10, "status": status}
+            if i == 7:
+                # Missing keys group with null values, like in Python
+                del fields["status"]
+            Event.objects.create(
+                index="test",
+                host=f"host{i % 2}",
+                source="test",
+                sourcetype="json",
+                user=self.user,
+                text=json.dumps(fields),
+            )
+
+    def resolve(self, text):
+        query = Query(name="test", text=text, user=self.user)
+        return query.resolve(request=MagicMock(user=self.user))
+
+    def assertPushedDown(self, text, pushed_down=True) -> None:
+        with CaptureQueriesContext(connection) as queries:
+            results = self.resolve(f"search index=test | {text}")
+        # Unless it was pushed down, stats reads every event last
+        last_query = queries.captured_queries[-1]["sql"]
+        self.assertEqual("GROUP BY" in last_query or "COUNT(" in last_query, pushed_down)
+        with override_settings(DELVE_QUERY_PUSHDOWN=False):
+            expected = self.resolve(f"search index=test | {text}")
+        # Groups are returned in the order they are first seen, like in Python
+        canonical = lambda rows: [json.dumps(row, sort_keys=True, default=str) for row in rows]
+        self.assertEqual(canonical(results), canonical(expected))
+
+    def test_group_by_json_keys(self) -> None:
+        """Grouping on JSON keys keeps numbers and strings apart and matches Python."""
+        text = (
+            "stats aggregate count count(extracted_fields__status) dc(extracted_fields__bytes) "
+            "sum(extracted_fields__bytes) avg(extracted_fields__bytes) min(extracted_fields__bytes) "
+            "max(extracted_fields__bytes) --by extracted_fields__status --reduce"
+        )
+        self.assertPushedDown(text)
+        results = self.resolve(f"search index=test | {text}")
+        statuses = [row["extracted_fields__status"] for row in results]
+        self.assertEqual(sorted(statuses, key=repr), sorted([200, 500, "200", None, 1.5, 404], key=repr))
+
+    def test_group_by_columns(self) -> None:
+        """Model columns are grouped on directly."""
+        self.assertPushedDown("stats aggregate total=count dc(source) min(created) sum(extracted_fields__bytes) --by host --reduce")
+        self.assertPushedDown("stats aggregate count avg(extracted_fields__bytes) --reduce")
+        self.assertPushedDown("stats aggregate estdc(extracted_fields__bytes) --by host --reduce")
+
+    def test_groups_follow_the_order_of_events(self) -> None:
+        """Groups are returned in the order of their first event, also
+        when the events are ordered by descending primary key, and events
+        ordered by other fields are grouped in Python.
+        """
+        self.assertPushedDown("stats aggregate count --by extracted_fields__bytes --reduce")
+        self.assertPushedDown("sort -d id | stats aggregate count --by host --reduce")
+        self.assertPushedDown("sort created | stats aggregate count --by host --reduce", pushed_down=False)
+
+    def test_falls_back_to_python(self) -> None:
+        """Percentiles, strings compared by collation and mixed JSON types run in Python."""
+        self.assertPushedDown("stats aggregate p95(extracted_fields__bytes) --by host --reduce", pushed_down=False)
+        self.assertPushedDown("stats aggregate max(host) --reduce", pushed_down=False)
+        self.assertPushedDown("stats aggregate dc(extracted_fields__status) --by host --reduce", pushed_down=False)
+
+    def test_other_databases(self) -> None:
+        """Without SQLite's integer and real JSON types, sums, minimums and
+        maximums of integers stay integers, and string columns are only
+        grouped by databases which compare them like Python.
+        """
+        for i, (big, small) in enumerate([(2 ** 53 + 1, 2 ** 53 + 1), (2, 0.5), (10 ** 19, 2 ** 53 + 1), (3, 0.25)]):
+            Event.objects.create(
+                index="big",
+                host=f"host{i % 2}",
+                source="test",
+                sourcetype="json",
+                user=self.user,
+                text=json.dumps({"big": big, "small": small}),
+            )
+        with patch.object(pushdown, "connections", {"default": MagicMock(vendor="postgresql")}):
+            self.assertPushedDown("stats aggregate sum(extracted_fields__bytes) min(extracted_fields__bytes) max(extracted_fields__bytes) --by host --reduce")
+            with CaptureQueriesContext(connection) as queries:
+                results = self.resolve("search index=big | stats aggregate sum(extracted_fields__small) max(extracted_fields__small) --by host --reduce")
+            self.assertIn("GROUP BY", queries.captured_queries[-1]["sql"])
+            self.assertEqual(results, [
+                {"host": "host0", "sum(extracted_fields__small)": 2 ** 54 + 2, "max(extracted_fields__small)": 2 ** 53 + 1},
+                {"host": "host1", "sum(extracted_fields__small)": 0.75, "max(extracted_fields__small)": 0.5},
+            ])
+            # Mixed integers and reals, and integers too long for a BIGINT, are aggregated in Python
+            for text in ("sum(extracted_fields__small)", "max(extracted_fields__big) --by host"):
+                with self.subTest(text=text):
+                    with CaptureQueriesContext(connection) as queries:
+                        results = self.resolve(f"search index=big | stats aggregate {text} --reduce")
+                    self.assertNotIn("COUNT(", queries.captured_queries[-1]["sql"])
+            self.assertEqual(results[0]["max(extracted_fields__big)"], 10 ** 19)
+        with patch.object(pushdown, "connections", {"default": MagicMock(vendor="mysql")}):
+            self.assertPushedDown("stats aggregate count --by host --reduce", pushed_down=False)
+            self.assertPushedDown("stats aggregate count --by extracted_fields__bytes --reduce", pushed_down=False)
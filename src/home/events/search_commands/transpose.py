@@ -3,18 +3,18 @@
 # See the LICENSE file in the root of this repository for details.
 
 import argparse
-import sys
 import logging
 import inspect
 from itertools import chain
 from types import GeneratorType
-from io import StringIO
 from typing import Any, Dict, List, Union
 
 from django.db.models.manager import Manager
 from django.db.models.query import QuerySet
 from django.http import HttpRequest
 
+from events.capture import capture
+
 from .util import cast
 from .decorators import search_command
 
@@ -49,20 +49,12 @@ def transpose(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]
         events = list(events.values())
     elif isinstance(events, GeneratorType) or inspect.isgeneratorfunction(events):
         log.debug(f"Casting matching events, detected {type(events)}({events})")
-        log.debug("swapping stdout and stderr")
-        orig_stderr = sys.stderr
-        orig_stdout = sys.stdout
-        sys.stderr = StringIO()
-        sys.stdout = StringIO()
-        try:
-            events = list(events)
-        except Exception as exception:
-            log.critical(f"Unhandled exception occurred, {exception}")
-            raise
-        finally:
-            log.debug("replacing original stdout and stderr")
-            sys.stderr = orig_stderr
-            sys.stdout = orig_stdout
+        with capture():
+            try:
+                events = list(events)
+            except Exception as exception:
+                log.critical(f"Unhandled exception occurred, {exception}")
+                raise
     if not isinstance(events[0], dict):
         raise ValueError("Transpose only works for QuerySets and Lists of Dicts.")
 
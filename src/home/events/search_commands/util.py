@@ -10,6 +10,7 @@ from types import GeneratorType
 from django.db.models.query import QuerySet
 from django.contrib.auth.models import Permission
 from django.db import models
+from django.conf import settings
 from django.http import HttpRequest, HttpResponse
 
 from events.util import cast
@@ -32,6 +33,19 @@ def has_permission_for_model(permission_string: str, model: models.Model, reques
     return True
 
 
+def worker_processes(processes: int) -> int:
+    """
+    Return the number of worker processes to start for --processes,
+    at most settings.DELVE_MAX_PROCESSES.
+
+    Raises:
+        ValueError: If processes is negative.
+    """
+    if processes < 0:
+        raise ValueError(f"Invalid number of processes {processes}, must not be negative")
+    return min(processes, settings.DELVE_MAX_PROCESSES)
+
+
 # def cast(value):
 #     if value.isdigit():
 #         return int(value)
@@ -10,6 +10,7 @@ from django.db.models.query import QuerySet
 from django.http import HttpRequest
 
 from events.util import resolve
+from events.planner import FieldUsage
 from events.models import Query, Event
 from .decorators import search_command
 
@@ -22,7 +23,10 @@ parser.add_argument(
     help="The field to extract the values from",
 )
 
-@search_command(parser)
+def value_list_fields(args: argparse.Namespace) -> FieldUsage:
+    return FieldUsage((args.field,), projects=True)
+
+@search_command(parser, fields=value_list_fields)
 def value_list(request: HttpRequest, events: Union[QuerySet, List[Dict[str, Any]]], argv: List[str], environment: Dict[str, Any]) -> List[Any]:
     """
     Reduce the result set to include the values from a given field.
@@ -16,6 +16,7 @@ from rest_framework.fields import CurrentUserDefault
 from .models import (
     Event,
     Query,
+    QueryJob,
     GlobalContext,
     LocalContext,
     FileUpload,
@@ -111,6 +112,30 @@ class QuerySerializer(serializers.ModelSerializer):
             'user',
         ]
 
+class QueryJobSerializer(serializers.ModelSerializer):
+    pages = serializers.ReadOnlyField()
+
+    class Meta:
+        model = QueryJob
+        fields = [
+            'id',
+            'created',
+            'started',
+            'finished',
+            'name',
+            'text',
+            'status',
+            'stages_total',
+            'stages_done',
+            'current_stage',
+            'rows',
+            'result_count',
+            'page_size',
+            'pages',
+            'error',
+        ]
+        read_only_fields = fields
+
 class BulkEventSerializer(serializers.ListSerializer):
     def create(self, validated_data):
         log = logging.getLogger("delve")
@@ -0,0 +1,272 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+"""
+Server-side tables: the rows of large tables (see the table search
+command) are kept in a columnar ResultSet in the memory of the process
+which ran the query, and DataTables requests them one page at a time
+(see events.api.TablePageView), sorted and searched on the server.
+
+Tables are only kept in memory, so they are only readable from the
+process which made them, and are dropped once DELVE_TABLE_STORE_SIZE
+more recently read tables are kept or DELVE_TABLE_STORE_TIMEOUT seconds
+after they were last read.
+"""
+import json
+import time
+import secrets
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import compress, repeat
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+from .util import ResultSet
+
+# The number of sort orders, searches and their combinations each table
+# keeps the row indices of, so that paging through them is cheap
+INDEX_CACHE_SIZE = 8
+FLIP = bytes.maketrans(b"\x00\x01", b"\x01\x00")
+
+_enabled: ContextVar[bool] = ContextVar("server_side_tables", default=True)
+
+
+@contextmanager
+def disabled() -> Iterator[None]:
+    """
+    Make tables client-side in this context, ie. while resolving queries
+    whose results are read by another process (asynchronous query jobs).
+    """
+    token = _enabled.set(False)
+    try:
+        yield
+    finally:
+        _enabled.reset(token)
+
+
+def enabled() -> bool:
+    return _enabled.get() and settings.DELVE_TABLE_STORE_SIZE > 0
+
+
+def is_server_side(results: Any) -> bool:
+    """
+    Return whether results are the configuration of a server-side table,
+    which is only valid in this process for a limited time.
+    """
+    return isinstance(results, dict) and results.get("serverSide") is True
+
+
+def search_text(value: Any) -> str:
+    """
+    Return the lower case text searched for the words of a search:
+    strings themselves and the JSON encoding of everything else.
+    """
+    if isinstance(value, str):
+        return value.lower()
+    if value is None:
+        return "null"
+    if type(value) in (int, float):
+        return repr(value).lower()
+    return json.dumps(value, default=str).lower()
+
+
+def _and(first: bytes, second: bytes) -> bytes:
+    # Masks hold 0 or 1 per row, so they are combined as integers
+    return (int.from_bytes(first, "little") & int.from_bytes(second, "little")).to_bytes(len(first), "little")
+
+
+def _or(first: bytes, second: bytes) -> bytes:
+    return (int.from_bytes(first, "little") | int.from_bytes(second, "little")).to_bytes(len(first), "little")
+
+
+def _cached(cache: "OrderedDict[Hashable, Any]", key: Hashable, compute: Callable[[], Any]) -> Any:
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache[key] = value
+        while len(cache) > INDEX_CACHE_SIZE:
+            cache.popitem(last=False)
+    else:
+        cache.move_to_end(key)
+    return value
+
+
+class StoredTable:
+    """
+    The rows of a server-side table.
+
+    Args:
+        results (ResultSet): The rows.
+        fields (Sequence[str]): The fields shown, one per column of the table.
+        owner (Any): The primary key of the user allowed to read the table.
+    """
+    def __init__(self, results: ResultSet, fields: Sequence[str], owner: Any) -> None:
+        self.results = results
+        self.fields = list(fields)
+        self.owner = owner
+        self.accessed = time.monotonic()
+        self._lock = threading.Lock()
+        self._orders: "OrderedDict[Hashable, List[int]]" = OrderedDict()
+        self._masks: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._texts: Dict[str, List[str]] = {}
+        self._codes: Dict[str, bytes] = {}
+        self._indices: "OrderedDict[Hashable, Sequence[int]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+    def _order(self, order: Tuple[Tuple[int, bool], ...]) -> Sequence[int]:
+        if not order:
+            return range(len(self.results))
+        return self.results.argsort(
+            [self.fields[column] for column, _ in order],
+            [descending for _, descending in order],
+        )
+
+    def _text(self, field: str) -> List[str]:
+        """
+        Return the search_text of every value of field, computed on the
+        first search of the column.
+        """
+        texts = self._texts.get(field)
+        if texts is None:
+            column = self.results.get_column(field)
+            if column.kind in ("int", "float") and not any(column.nulls):
+                texts = list(map(repr, column.data))
+            else:
+                texts = list(map(search_text, column.values()))
+            self._texts[field] = texts
+        return texts
+
+    def _matches(self, word: str, field: str) -> bytes:
+        """
+        Return a mask of the rows where word appears in field. Dictionary
+        encoded columns search each distinct string once.
+        """
+        column = self.results.get_column(field)
+        if column.kind != "str":
+            return bytes(map(str.__contains__, self._text(field), repeat(word)))
+        found = bytes(word in value.lower() for value in column.dictionary)
+        if len(found) <= 256:
+            # Codes fit in a byte, which bytes.translate maps to the hits
+            codes = self._codes.get(field)
+            if codes is None:
+                codes = self._codes[field] = bytes(column.data.tolist())
+            hits = codes.translate(found.ljust(256, b"\x00"))
+        else:
+            hits = bytes(map(found.__getitem__, column.data))
+        if any(column.nulls):
+            hits = _and(hits, bytes(column.nulls).translate(FLIP))
+            if word in "null":
+                hits = _or(hits, bytes(column.nulls))
+        return hits
+
+    def _mask(self, search: Tuple[Tuple[Optional[int], str], ...], searchable: Tuple[int, ...]) -> bytes:
+        mask = b"\x01" * len(self.results)
+        for column, value in search:
+            # Smart search: every word must appear in the row (or column)
+            for word in value.lower().split():
+                found = bytes(len(self.results))
+                for index in (searchable if column is None else (column,)):
+                    found = _or(found, self._matches(word, self.fields[index]))
+                mask = _and(mask, found)
+        return mask
+
+    def _select(self, order: Tuple[Tuple[int, bool], ...], search: Tuple[Tuple[Optional[int], str], ...], searchable: Tuple[int, ...]) -> Sequence[int]:
+        ordered = _cached(self._orders, order, lambda: self._order(order))
+        if not search:
+            return ordered
+        mask = _cached(self._masks, (search, searchable), lambda: self._mask(search, searchable))
+        if isinstance(ordered, range):
+            return list(compress(ordered, mask))
+        return [index for index in ordered if mask[index]]
+
+    def page(
+        self,
+        start: int,
+        length: int,
+        order: Sequence[Tuple[int, bool]] = (),
+        search: Sequence[Tuple[Optional[int], str]] = (),
+        searchable: Optional[Sequence[int]] = None,
+    ) -> Tuple[int, List[List[Any]]]:
+        """
+        Return the number of rows matching search and the values of the
+        rows of one page of them, in order.
+
+        The row indices of the last few orders, searches and their
+        combinations are kept, so reading the next page of the same
+        order and search only reads the rows of that page.
+
+        Args:
+            start (int): The index of the first row of the page.
+            length (int): The number of rows of the page, -1 for every row.
+            order (Sequence[Tuple[int, bool]]): (column, descending) pairs.
+            search (Sequence[Tuple[Optional[int], str]]): (column, value)
+                pairs, column None searching every searchable column.
+            searchable (Optional[Sequence[int]]): The columns searched by
+                searches of every column, None for all of them.
+        """
+        order = tuple(order)
+        search = tuple((column, value) for column, value in search if value.split())
+        searchable = tuple(range(len(self.fields)) if searchable is None else searchable)
+        with self._lock:
+            indices = _cached(self._indices, (order, search, searchable), lambda: self._select(order, search, searchable))
+        rows = indices[start:] if length < 0 else indices[start:start + length]
+        columns = [self.results.get_column(field) for field in self.fields]
+        return len(indices), [[column.get(index) for column in columns] for index in rows]
+
+
+class TableStore:
+    """
+    The server-side tables of this process, by token, least recently
+    read first.
+    """
+    def __init__(self) -> None:
+        self._tables: "OrderedDict[str, StoredTable]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self) -> None:
+        deadline = time.monotonic() - settings.DELVE_TABLE_STORE_TIMEOUT
+        while self._tables:
+            token, table = next(iter(self._tables.items()))
+            if table.accessed >= deadline and len(self._tables) <= settings.DELVE_TABLE_STORE_SIZE:
+                break
+            del self._tables[token]
+
+    def put(self, results: ResultSet, fields: Sequence[str], owner: Any) -> str:
+        """
+        Keep a table and return the token its pages are read with.
+        """
+        token = secrets.token_urlsafe(16)
+        with self._lock:
+            self._tables[token] = StoredTable(results, fields, owner)
+            self._expire()
+        return token
+
+    def get(self, token: str, owner: Any) -> Optional[StoredTable]:
+        """
+        Return the table of token, None if it was dropped or belongs to
+        another user.
+        """
+        with self._lock:
+            self._expire()
+            table = self._tables.get(token)
+            if table is None or table.owner != owner:
+                return None
+            table.accessed = time.monotonic()
+            self._tables.move_to_end(token)
+        return table
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tables.clear()
+
+    def __len__(self) -> int:
+        return len(self._tables)
+
+
+tables = TableStore()
@@ -4,11 +4,14 @@
 
 import json
 from django import template
+from django.conf import settings
+from django.urls import reverse
 import logging
 from uuid import uuid4
 
 from events.models import Query
-from events.util import resolve
+from events.util import resolve, ResultSet
+from events import table_store
 
 register = template.Library()
 
@@ -29,6 +32,17 @@ def query_table(context, query_string, form=None, **kwargs):
     query_obj = Query(text=query_string)
     log.debug(f"Query object: {query_obj}")
     results = query_obj.resolve(request=context["request"], context=ctx)
+    results = resolve(results, columnar=True)
+    threshold = settings.DELVE_TABLE_SERVER_SIDE_ROWS
+    if isinstance(results, ResultSet) and 0 < threshold < len(results) and table_store.enabled():
+        # Too many rows to render, fl-table.js reads them a page at a time
+        owner = getattr(context["request"].user, "pk", None)
+        token = table_store.tables.put(results, results.fields, owner)
+        return {
+            "fields": results.fields,
+            "results": [],
+            "server_side": reverse("api_table_page", args=[token]),
+        }
     results = resolve(results)
     if results:
         fields = [key for key in results[0].keys()]
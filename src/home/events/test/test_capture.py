@@ -0,0 +1,56 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+"""This test module is meant to test the per-query output capture,
+located at events.capture.
+"""
+import io
+import sys
+import threading
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from events.capture import (
+    ContextStream,
+    capture,
+)
+
+class CaptureTests(SimpleTestCase):
+    def test_concurrent_captures_are_isolated(self) -> None:
+        """Each thread only captures its own output."""
+        barrier = threading.Barrier(4)
+        captured = {}
+
+        def work(number):
+            with capture() as output:
+                for _ in range(3):
+                    # Interleave the writes of every thread
+                    barrier.wait()
+                    print(f"stdout {number}")
+                    print(f"stderr {number}", file=sys.stderr)
+            captured[number] = output
+
+        threads = [threading.Thread(target=work, args=(number,)) for number in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for number, output in captured.items():
+            self.assertEqual(output.stdout.getvalue(), f"stdout {number}\n" * 3)
+            self.assertEqual(output.stderr.getvalue(), f"stderr {number}\n" * 3)
+
+    def test_output_outside_of_captures_is_passed_through(self) -> None:
+        """Without a capture, writes reach the original stream and captures nest."""
+        original = io.StringIO()
+        with patch.object(sys, "stdout", original):
+            with capture() as outer:
+                self.assertIsInstance(sys.stdout, ContextStream)
+                print("outer")
+                with capture() as inner:
+                    print("inner")
+            print("uncaptured")
+        self.assertEqual(outer.stdout.getvalue(), "outer\n")
+        self.assertEqual(inner.stdout.getvalue(), "inner\n")
+        self.assertEqual(original.getvalue(), "uncaptured\n")
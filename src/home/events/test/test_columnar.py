@@ -0,0 +1,152 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+"""This test module is meant to test the columnar ResultSet,
+located at events.util.
+"""
+import json
+import tracemalloc
+from unittest.mock import MagicMock
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+
+from events.models import (
+    Event,
+    Query,
+)
+from events.util import Column, ResultSet, resolve
+
+ROWS = [
+    {"id": 1, "host": "web", "status": 200, "ratio": 0.5, "ok": True, "meta": {"a": 1}},
+    {"id": 2, "host": "db", "status": None, "ratio": 1.5, "ok": False},
+    {"host": "web", "status": 500, "ratio": 2.5, "ok": True, "extra": "x"},
+]
+
+class ResultSetTests(SimpleTestCase):
+    def test_round_trip_fills_missing_fields(self) -> None:
+        """Rows come back with every field, missing values as None."""
+        result_set = ResultSet.from_rows(ROWS)
+        self.assertEqual(len(result_set), 3)
+        self.assertEqual(result_set.fields, ["id", "host", "status", "ratio", "ok", "meta", "extra"])
+        self.assertEqual(result_set.to_dicts(), resolve([dict(row) for row in ROWS]))
+        self.assertEqual(result_set[-1]["extra"], "x")
+        self.assertIs(result_set[1]["ok"], False)
+
+    def test_column_kinds(self) -> None:
+        """Values are stored in typed arrays and strings are dictionary encoded."""
+        result_set = ResultSet.from_rows(ROWS)
+        kinds = {field: column.kind for field, column in result_set.columns.items()}
+        self.assertEqual(
+            kinds,
+            {
+                "id": "int",
+                "host": "str",
+                "status": "int",
+                "ratio": "float",
+                "ok": "bool",
+                "meta": "object",
+                "extra": "str",
+            },
+        )
+        self.assertEqual(result_set.columns["host"].dictionary, ["web", "db"])
+        # Mixed kinds fall back to a list, keeping every value as-is
+        mixed = ResultSet.from_rows([{"a": 1}, {"a": 1.5}, {"a": "x"}])
+        self.assertEqual(mixed.columns["a"].kind, "object")
+        self.assertEqual(mixed.column("a"), [1, 1.5, "x"])
+
+    def test_column_from_values(self) -> None:
+        """Building a column at once is the same as appending each value."""
+        for values in (
+            [1, None, 3],
+            [1.5, 2.5],
+            [True, None, False],
+            ["a", None, "b", "a"],
+            [f"text {index}" for index in range(100)],
+            [1, 2 ** 64],
+            [1, "a", None],
+            [None, None],
+            [],
+        ):
+            with self.subTest(values=values):
+                appended = Column()
+                for value in values:
+                    appended.append(value)
+                appended.finish()
+                column = Column.from_values(values)
+                self.assertEqual((column.kind, column.values()), (appended.kind, appended.values()))
+                self.assertEqual(column.dictionary, appended.dictionary)
+
+    def test_sort_take_and_compress(self) -> None:
+        """Sorting is stable and matches sorting the dict rows."""
+        rows = [{"host": host, "n": n} for n, host in enumerate("cabcab")]
+        result_set = ResultSet.from_rows(rows)
+        expected = sorted(resolve([dict(row) for row in rows]), key=lambda row: row["host"], reverse=True)
+        self.assertEqual(result_set.sort(["host"], reverse=True).to_dicts(), expected)
+        self.assertEqual(result_set[1:3].column("n"), [1, 2])
+        self.assertEqual(result_set.compress([1, 0, 0, 0, 0, 1]).column("host"), ["c", "b"])
+
+    def test_resolve_columnar(self) -> None:
+        """resolve builds ResultSets from dict rows only and converts them back."""
+        result_set = resolve((row for row in ROWS), columnar=True)
+        self.assertIsInstance(result_set, ResultSet)
+        self.assertIs(resolve(result_set, columnar=True), result_set)
+        self.assertEqual(resolve(result_set), result_set.to_dicts())
+        self.assertEqual(list(resolve(result_set, lazy=True)), result_set.to_dicts())
+        self.assertEqual(resolve([1, 2, 3], columnar=True), [1, 2, 3])
+
+    def test_memory(self) -> None:
+        """A ResultSet takes a fraction of the memory of the same list of dicts."""
+        def rows():
+            for number in range(20000):
+                yield {"id": number, "host": f"host{number % 10}", "status": 200, "ok": True}
+        tracemalloc.start()
+        try:
+            as_dicts = list(rows())
+            dicts_size = tracemalloc.get_traced_memory()[0]
+            del as_dicts
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            result_set = ResultSet.from_rows(rows())
+            columnar_size = tracemalloc.get_traced_memory()[0] - baseline
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(len(result_set), 20000)
+        self.assertLess(columnar_size * 4, dicts_size)
+
+class ColumnarPipelineTests(TestCase):
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            username='testuser',
+            email='testuser@test.com',
+            password='testuser',
+        )
+        for i in range(10):
+            Event.objects.create(
+                index="test",
+                host=f"host{i % 3}",
+                source="test",
+                sourcetype="json",
+                user=self.user,
+                text=json.dumps({"foo": i}),
+            )
+
+    def resolve(self, text):
+        query = Query(name="test", text=text, user=self.user)
+        return query.resolve(request=MagicMock(user=self.user))
+
+    def test_filter_after_sort_is_columnar(self) -> None:
+        """filter on the ResultSet returned by sort matches streaming filter."""
+        terms = "host__in='[\"host1\", \"host2\"]' !host=host2"
+        # eval makes the rows dicts, so sort is not pushed down into the database
+        columnar = self.resolve(f"search index=test | eval x=1 | sort host | filter {terms}")
+        streamed = self.resolve(f"search index=test | eval x=1 | filter {terms}")
+        self.assertEqual(len(columnar), 3)
+        self.assertEqual([row["host"] for row in columnar], ["host1"] * 3)
+        self.assertEqual(columnar, streamed)
+
+    def test_dedup_and_table(self) -> None:
+        """dedup and table read the (sorted) QuerySet into a ResultSet."""
+        results = self.resolve("search index=test | sort host | dedup host | table -f host")
+        self.assertEqual(results["data"], [['"host0"'], ['"host1"'], ['"host2"']])
@@ -0,0 +1,133 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+"""This test module is meant to test the expression language of eval,
+located at events.expressions.
+"""
+import datetime
+
+from django.test import SimpleTestCase
+
+from events.expressions import compile_expression, substitute_fields
+
+ROW = {
+    "bytes": 2048,
+    "host": "Web.example",
+    "status": 503,
+    "user": None,
+    "tags": ["a", "b"],
+    "time": "2025-01-02T03:04:05Z",
+    "extracted_fields": {"request": {"path": "/index.html"}},
+}
+
+def evaluate(text, row=ROW, now=None):
+    expression = compile_expression(text)
+    by_row, by_values = expression.bind(now)
+    result = by_row(row)
+    if "__" not in text:
+        # Both compiled functions give the same result
+        assert by_values(*(row.get(field) for field in expression.fields)) == result
+    return result
+
+class ExpressionTests(SimpleTestCase):
+    def test_fields(self) -> None:
+        """$name references are replaced outside of strings only."""
+        self.assertEqual(substitute_fields('$a + "$b" + $a'), (' _0  + "$b" +  _0 ', ["a"]))
+        self.assertEqual(evaluate("$extracted_fields__request__path"), "/index.html")
+        self.assertIsNone(evaluate("$extracted_fields__request__missing"))
+        self.assertEqual(evaluate("$tags[1] + $host[0:3]"), "bWeb")
+
+    def test_arithmetic_and_nulls(self) -> None:
+        """Operations involving None, or failing at run time, give None."""
+        self.assertEqual(evaluate("round($bytes / 1024, 1)"), 2.0)
+        self.assertEqual(evaluate("$bytes // 1000 + $status % 10 * 2 ** 2"), 14)
+        self.assertIsNone(evaluate("$user + 1"))
+        self.assertIsNone(evaluate("$bytes / 0"))
+        self.assertIsNone(evaluate("$host - 1"))
+        self.assertIsNone(evaluate("-$host"))
+        self.assertIsNone(evaluate("$user < 1"))
+
+    def test_conversions_failing_give_none(self) -> None:
+        """Functions and literals which fail for a value give None rather than an error."""
+        row = {"big": 2 ** 20000, "tags": ["a", "b"], "path": "a/b"}
+        self.assertIsNone(evaluate('extract($path, "(a)", 5)', row))
+        self.assertIsNone(evaluate('extract($path, "(a)", "name")', row))
+        for function in ("join([$big])", "concat($big)", "tostring($big)", "len($big)", "upper($big)"):
+            with self.subTest(function=function):
+                self.assertIsNone(evaluate(function, row))
+        self.assertIsNone(evaluate("{$tags: 1}", row))
+        self.assertEqual(evaluate('{$path: 1, "b": $tags}', row), {"a/b": 1, "b": ["a", "b"]})
+
+    def test_results_are_bounded(self) -> None:
+        """Strings, lists and integer powers which would be too large to
+        build give None instead.
+        """
+        self.assertEqual(evaluate('"%05d-%s" % [7]'), None)
+        self.assertEqual(evaluate('"%05d" % 7'), "00007")
+        self.assertEqual(evaluate('"%(a)s-%(a)s" % {"a": $host}'), "Web.example-Web.example")
+        self.assertIsNone(evaluate('"%0100000000d" % 1'))
+        self.assertIsNone(evaluate('"%.100000000f" % 1'))
+        self.assertIsNone(evaluate('"x" * 10000000'))
+        self.assertEqual(evaluate("2 ** 100"), 1 << 100)
+        self.assertEqual(evaluate("2 ** -1"), 0.5)
+        self.assertIsNone(evaluate("(9 ** 9999) ** 9999"))
+        self.assertIsNone(evaluate("10 ** 10000000"))
+
+    def test_functions(self) -> None:
+        self.assertEqual(evaluate("lower($host) + upper(\"x\")"), "web.exampleX")
+        self.assertEqual(evaluate("coalesce($user, $missing, $host)"), "Web.example")
+        self.assertEqual(evaluate("concat($host, \":\", $status, $user)"), "Web.example:503")
+        self.assertEqual(evaluate("substr($host, 4, 3) + replace($host, \"Web\", \"db\")"), "exadb.example")
+        self.assertEqual(evaluate("len(split($host, \".\")) + len($tags)"), 4)
+        self.assertEqual(evaluate("join($tags, \"|\")"), "a|b")
+        self.assertEqual(evaluate("extract($extracted_fields__request__path, \"/(\\\\w+)\")"), "index")
+        self.assertIs(evaluate("match($host, \"^W\") and startswith($host, \"Web\")"), True)
+        self.assertEqual(evaluate("tonumber(\"1.5\") + tonumber($status)"), 504.5)
+        self.assertIsNone(evaluate("tonumber(\"x\")"))
+        self.assertEqual(evaluate("typeof($tags) + typeof($user)"), "listnull")
+        self.assertEqual(evaluate("greatest($status, 100, $user)"), 503)
+
+    def test_conditionals(self) -> None:
+        """case and conditional expressions only evaluate the branch taken."""
+        text = 'case($status >= 500, "error", $status >= 400, "warning", "ok")'
+        self.assertEqual(evaluate(text), "error")
+        self.assertEqual(evaluate(text, {"status": 404}), "warning")
+        self.assertEqual(evaluate(text, {"status": 200}), "ok")
+        self.assertIsNone(evaluate('case($status >= 500, "error")', {"status": 200}))
+        self.assertEqual(evaluate('"yes" if $status in [500, 503] else "no"'), "yes")
+        self.assertIs(evaluate("200 <= $status < 600 and not isnull($host)"), True)
+
+    def test_time(self) -> None:
+        now = datetime.datetime(2025, 6, 1, tzinfo=datetime.timezone.utc)
+        self.assertEqual(evaluate("epoch($time)"), 1735787045.0)
+        self.assertEqual(evaluate("strftime($time, \"%Y-%m\")"), "2025-01")
+        self.assertEqual(evaluate("from_epoch(0)"), datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc))
+        self.assertEqual(evaluate("strptime(\"02/01/2025\", \"%d/%m/%Y\")"), datetime.datetime(2025, 1, 2))
+        self.assertEqual(evaluate("round((epoch(now()) - epoch($time)) / 86400)", now=now), 150)
+
+    def test_invalid(self) -> None:
+        """Anything outside the language, or statically mistyped, is rejected when compiled."""
+        for text in (
+            "foo",
+            "$host.upper()",
+            "open(\"/etc/passwd\")",
+            "$x.__class__",
+            "_0",
+            "lower()",
+            "substr($host)",
+            "lower($host, key=1)",
+            "[x for x in $tags]",
+            "lambda: 1",
+            "\"a\" - 1",
+            "join(1)",
+            "1 < \"a\"",
+            "$",
+            "$host +",
+        ):
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    compile_expression(text)
+
+    def test_compiled_once(self) -> None:
+        self.assertIs(compile_expression("$a + 1"), compile_expression("$a + 1"))
@@ -0,0 +1,70 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+"""This test module is meant to test the external merge sort,
+located at events.external_sort.
+"""
+import random
+import datetime
+
+from django.test import SimpleTestCase
+
+from events.external_sort import external_sort, row_sort_key, top_k
+from events.util import ResultSet
+
+VALUES = [3, None, "b", 1.5, True, "a", {"x": 1}, [1], datetime.date(2025, 1, 1), -2, "a", None]
+
+def make_rows(count, seed=0):
+    generator = random.Random(seed)
+    return [
+        {"value": generator.choice(VALUES), "group": generator.randint(0, 3), "index": index}
+        for index in range(count)
+    ]
+
+def reference_sort(rows, fields, descending):
+    """Stable sorts, least significant field first."""
+    rows = list(rows)
+    for field, reverse in reversed(list(zip(fields, descending))):
+        rows.sort(key=lambda row: row_sort_key([field], [False])(row), reverse=reverse)
+    return rows
+
+class ExternalSortTests(SimpleTestCase):
+    def test_mixed_types_and_nulls(self) -> None:
+        """Values of any type sort without raising, nulls first."""
+        rows = [{"value": value} for value in VALUES]
+        result = [row["value"] for row in external_sort(rows, ["value"], [False])]
+        self.assertEqual(result[:2], [None, None])
+        self.assertEqual(result[2:6], [-2, True, 1.5, 3])
+        self.assertEqual(result[6:10], ["a", "a", "b", datetime.date(2025, 1, 1)])
+        self.assertEqual(result[-2:], [[1], {"x": 1}])
+
+    def test_spilled_runs_match_in_memory_sort(self) -> None:
+        """Sorting in spilled runs gives the same, stable, order as sorting in memory."""
+        rows = make_rows(500)
+        for fields, descending in (
+            (["value"], [False]),
+            (["value"], [True]),
+            (["group", "value"], [True, False]),
+            (["missing", "value"], [False, True]),
+        ):
+            with self.subTest(fields=fields, descending=descending):
+                expected = reference_sort(rows, fields, descending)
+                in_memory = external_sort(rows, fields, descending, memory_limit=10 ** 9)
+                self.assertIsInstance(in_memory, ResultSet)
+                self.assertEqual([row["index"] for row in in_memory], [row["index"] for row in expected])
+                spilled = external_sort(iter(rows), fields, descending, memory_limit=5000)
+                self.assertNotIsInstance(spilled, ResultSet)
+                self.assertEqual([row["index"] for row in spilled], [row["index"] for row in expected])
+
+    def test_top_k(self) -> None:
+        """The heap selects the same rows as sorting everything."""
+        rows = make_rows(300)
+        for limit in (0, 1, 10, 1000):
+            with self.subTest(limit=limit):
+                expected = reference_sort(rows, ["group", "value"], [False, True])[:limit]
+                self.assertEqual(top_k(iter(rows), ["group", "value"], [False, True], limit), expected)
+                result_set = ResultSet.from_rows(rows)
+                for descending in (False, True):
+                    expected = reference_sort(rows, ["value"], [descending])[:limit]
+                    self.assertEqual(result_set.sort(["value"], descending, limit=limit).to_dicts(), expected)
@@ -0,0 +1,112 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+"""This test module is meant to test the query resource governor,
+located at events.governor.
+"""
+import json
+import tracemalloc
+from contextvars import copy_context
+from unittest.mock import MagicMock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from events.models import (
+    Event,
+    Query,
+)
+from events.governor import (
+    QueryBudgetExceeded,
+    QueryGovernor,
+    current_governor,
+)
+
+class QueryGovernorTests(TestCase):
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            username='testuser',
+            email='testuser@test.com',
+            password='testuser',
+        )
+        for i in range(10):
+            event = Event.objects.create(
+                index="test",
+                host="127.0.0.1",
+                source="test",
+                sourcetype="json",
+                user=self.user,
+                text=json.dumps({"foo": i}),
+            )
+            event.extract_fields()
+            event.process()
+            event.save()
+
+    def resolve(self, text):
+        query = Query(name="test", text=text, user=self.user)
+        return query.resolve(request=MagicMock(user=self.user))
+
+    def test_unlimited_budget_has_no_governor(self) -> None:
+        """No governor is created when every budget is unlimited."""
+        self.assertIsNone(QueryGovernor.for_user(self.user))
+        results = self.resolve("search index=test | eval bar=foo")
+        self.assertEqual(len(results), 10)
+
+    @override_settings(DELVE_QUERY_MAX_ROWS=5, DELVE_STREAMING_BATCH_SIZE=2)
+    def test_row_budget_names_the_stage(self) -> None:
+        """Exceeding the row budget returns a structured error for the stage."""
+        results = self.resolve("search index=test | eval bar=foo")
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]["budget"]["budget"], "rows")
+        self.assertEqual(results[0]["budget"]["limit"], 5)
+        self.assertEqual(results[0]["budget"]["stage"], "eval bar=foo")
+        self.assertIn("eval bar=foo", results[0]["exception"])
+        self.assertIsNone(current_governor.get())
+
+    @override_settings(DELVE_QUERY_MAX_ROWS=5)
+    def test_row_budget_is_not_exceeded_by_small_results(self) -> None:
+        """Queries within their budget are unaffected."""
+        results = self.resolve("search index=test | head -n 3")
+        self.assertEqual(len(results), 3)
+
+    @override_settings(DELVE_QUERY_MAX_ROWS=5)
+    def test_user_budget_overrides_settings(self) -> None:
+        """Limits on the user's profile take precedence, 0 means unlimited."""
+        self.user.profile.query_max_rows = 0
+        self.user.profile.save()
+        self.assertIsNone(QueryGovernor.for_user(self.user))
+        results = self.resolve("search index=test | eval bar=foo")
+        self.assertEqual(len(results), 10)
+
+        self.user.profile.query_max_rows = 2
+        self.user.profile.save()
+        self.assertEqual(QueryGovernor.for_user(self.user).rows, 2)
+
+    def test_time_budget(self) -> None:
+        """The wall time budget is checked between batches."""
+        governor = QueryGovernor(seconds=1)
+        governor.start(None)
+        try:
+            self.assertIs(current_governor.get(), governor)
+            governor.started -= 5
+            with self.assertRaises(QueryBudgetExceeded) as context:
+                list(governor.govern(range(10), "sleep"))
+        finally:
+            governor.stop()
+        self.assertEqual(context.exception.budget, "seconds")
+        self.assertEqual(context.exception.stage, "sleep")
+        self.assertIsNone(current_governor.get())
+
+    def test_concurrent_queries_share_tracemalloc(self) -> None:
+        """A query which finishes does not stop tracemalloc under the others."""
+        first, second = copy_context(), copy_context()
+        governors = [QueryGovernor(memory=1024 * 1024 * 1024) for _ in range(2)]
+        with override_settings(DELVE_QUERY_MEMORY_METHOD="tracemalloc"):
+            first.run(governors[0].start, None)
+            second.run(governors[1].start, None)
+            first.run(governors[0].stop)
+            self.assertTrue(tracemalloc.is_tracing())
+            second.run(governors[1].check)
+            second.run(governors[1].stop)
+        self.assertFalse(tracemalloc.is_tracing())
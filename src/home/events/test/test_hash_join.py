@@ -0,0 +1,98 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+"""This test module is meant to test the hash join engine,
+located at events.hash_join.
+"""
+from django.test import SimpleTestCase
+
+from events.hash_join import hash_join
+
+LEFT = [
+    {"host": "a", "port": 80, "left": 1},
+    {"host": "a", "port": 443, "left": 2},
+    {"host": "b", "port": 80, "left": 3},
+    {"host": "c", "port": 80, "left": 4},
+    {"port": 80, "left": 5},
+]
+RIGHT = [
+    {"name": "a", "port": 80, "right": 1},
+    {"name": "a", "port": 80, "right": 2},
+    {"name": "b", "port": 22, "right": 3},
+    {"name": "d", "port": 80, "right": 4},
+]
+
+def nested_loop(left, right, left_fields, right_fields, how):
+    """The reference implementation, a nested loop over both sides."""
+    def matches(left_row, right_row):
+        return all(
+            left_field in left_row and right_field in right_row and left_row[left_field] == right_row[right_field]
+            for left_field, right_field in zip(left_fields, right_fields)
+        )
+    ret = []
+    matched_right = set()
+    outer, inner = (right, left) if how == "right" else (left, right)
+    for outer_row in outer:
+        match = False
+        for index, inner_row in enumerate(inner):
+            left_row, right_row = (inner_row, outer_row) if how == "right" else (outer_row, inner_row)
+            if matches(left_row, right_row):
+                if how == "right":
+                    row = right_row.copy()
+                    row.update({k: v for k, v in left_row.items() if k not in left_fields})
+                else:
+                    row = left_row.copy()
+                    row.update({k: v for k, v in right_row.items() if k not in right_fields})
+                ret.append(row)
+                matched_right.add(index)
+                match = True
+        if not match and how != "inner":
+            ret.append(outer_row)
+    if how == "full":
+        ret.extend(row for index, row in enumerate(right) if index not in matched_right)
+    return ret
+
+class HashJoinTests(SimpleTestCase):
+    def assertJoinsLikeNestedLoop(self, left_fields, right_fields, **kwargs) -> None:
+        for how in ("left", "right", "inner", "full"):
+            for build in ("left", "right"):
+                with self.subTest(how=how, build=build):
+                    expected = nested_loop(LEFT, RIGHT, left_fields, right_fields, how)
+                    actual = list(hash_join(LEFT, RIGHT, left_fields, right_fields, how=how, build=build, **kwargs))
+                    self.assertEqual(actual, expected)
+
+    def test_single_key(self) -> None:
+        """Every join type matches a nested loop join, rows in the same
+        order, whichever side is built.
+        """
+        self.assertJoinsLikeNestedLoop(["host"], ["name"])
+
+    def test_multiple_keys(self) -> None:
+        """Rows only match if every key matches."""
+        self.assertJoinsLikeNestedLoop(["host", "port"], ["name", "port"])
+        inner = list(hash_join(LEFT, RIGHT, ["host", "port"], ["name", "port"], how="inner"))
+        self.assertEqual([(row["left"], row["right"]) for row in inner], [(1, 1), (1, 2)])
+
+    def test_spill_to_disk(self) -> None:
+        """Joins whose build side exceeds the memory limit are partitioned
+        to disk, and their rows merged back in order.
+        """
+        self.assertJoinsLikeNestedLoop(["host"], ["name"], memory_limit=1, partitions=3)
+        self.assertJoinsLikeNestedLoop(["host", "port"], ["name", "port"], memory_limit=1, partitions=3)
+
+    def test_left_order_is_kept(self) -> None:
+        """Rows are returned in the order of the left side, even when it is built."""
+        for build in ("left", "right"):
+            for kwargs in ({}, {"memory_limit": 1, "partitions": 3}):
+                with self.subTest(build=build, **kwargs):
+                    left = list(hash_join(LEFT, RIGHT, ["host"], ["name"], how="left", build=build, **kwargs))
+                    self.assertEqual([row["left"] for row in left], [1, 1, 2, 2, 3, 4, 5])
+                    self.assertEqual([row.get("right") for row in left], [1, 2, 1, 2, 3, None, None])
+
+    def test_unhashable_keys(self) -> None:
+        """Dicts and lists can be joined on."""
+        left = [{"key": {"a": [1, 2]}, "left": 1}]
+        right = [{"key": {"a": [1, 2]}, "right": 1}, {"key": {"a": [2]}, "right": 2}]
+        joined = list(hash_join(left, right, ["key"], ["key"], how="inner"))
+        self.assertEqual(joined, [{"key": {"a": [1, 2]}, "left": 1, "right": 1}])
@@ -0,0 +1,113 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+"""This test module is meant to test the query planner,
+located at events.planner.
+"""
+from django.test import SimpleTestCase
+
+from events.models import Query
+from events.planner import (
+    compile_query,
+    render_stage,
+    split_search_commands,
+)
+from events.search_commands import (
+    dedup,
+    echo,
+    eval,
+    head,
+    rex,
+    search,
+    sort,
+)
+
+class CompileQueryTests(SimpleTestCase):
+    def setUp(self) -> None:
+        compile_query.cache_clear()
+
+    def test_split_search_commands_respects_escaped_pipes(self) -> None:
+        """A double pipe is a literal pipe and must not split the query."""
+        self.assertEqual(
+            split_search_commands("echo 'a||b' | head"),
+            ["echo 'a|b' ", " head"],
+        )
+
+    def test_compile_query_resolves_operations(self) -> None:
+        """Each stage should carry the imported search command."""
+        stages = compile_query("search index=test | head -n 5")
+        self.assertEqual([stage.operation for stage in stages], [search, head])
+
+    def test_compile_query_is_cached(self) -> None:
+        """Compiling the same text twice should return the cached plan."""
+        first = compile_query("search index=test | head -n 5")
+        second = compile_query("search index=test | head -n 5")
+        self.assertIs(first, second)
+        self.assertEqual(compile_query.cache_info().hits, 1)
+
+    def test_static_stages_skip_templates(self) -> None:
+        """Stages without template syntax are pre-split and never rendered."""
+        stage, = compile_query("head -n 5")
+        self.assertIsNone(stage.template)
+        self.assertEqual(render_stage(stage, {}), ["head", "-n", "5"])
+
+    def test_head_is_folded_into_sort(self) -> None:
+        """sort followed by a literal head receives the head's number as --limit."""
+        sort_stage, head_stage = compile_query("sort foo | head -n 5")
+        self.assertIs(sort_stage.operation, sort)
+        self.assertEqual(sort_stage.argv, ("sort", "foo", "--limit", "5"))
+        self.assertEqual(head_stage.argv, ("head", "-n", "5"))
+        sort_stage, _ = compile_query("sort --limit 3 foo | head -n 5")
+        self.assertEqual(sort_stage.argv[-2:], ("--limit", "3"))
+        for text in ("sort foo | head -n -1", "sort foo | head -n {{ n }}", "sort foo | echo | head"):
+            with self.subTest(text=text):
+                self.assertNotIn("--limit", compile_query(text)[0].argv)
+
+    def test_head_is_propagated_through_one_to_one_stages(self) -> None:
+        """A literal head is copied in front of the stages before it which
+        return one event per event, and from there folded into sort.
+        """
+        stages = compile_query("search index=test | rex -f text 'a(?P<b>.)' | eval c=1 | head -n 5")
+        self.assertEqual([stage.operation for stage in stages], [search, head, rex, eval, head])
+        self.assertEqual(stages[1].argv, ("head", "-n", "5"))
+        self.assertEqual([stage.synthetic for stage in stages], [False, True, False, False, False])
+        query = Query(name="test", text="search index=test | rex -f text 'a(?P<b>.)' | eval c=1 | head -n 5")
+        self.assertEqual([operation for _, operation in query.get_search_commands()], [search, rex, eval, head])
+        stages = compile_query("sort foo | eval c=1 | head -n 5")
+        self.assertEqual([stage.operation for stage in stages], [sort, head, eval, head])
+        self.assertEqual(stages[0].argv, ("sort", "foo", "--limit", "5"))
+        for text in (
+            "search index=test | dedup foo | head -n 5",
+            "search index=test | eval c=1 | head -n -1",
+            "search index=test | eval c=1 | head -n {{ n }}",
+            "eval c=1 | head -n 5",
+            "head -n 5 | eval c=1 | head -n 3",
+        ):
+            with self.subTest(text=text):
+                self.assertEqual(len(compile_query(text)), len(split_search_commands(text)))
+
+    def test_render_stage_returns_a_fresh_argv(self) -> None:
+        """Search commands mutate argv, so the cached argv must not be shared."""
+        stage, = compile_query("head -n 5")
+        argv = render_stage(stage, {})
+        argv.pop(0)
+        self.assertEqual(render_stage(stage, {}), ["head", "-n", "5"])
+
+    def test_templated_stages_render_context_over_globals(self) -> None:
+        """Local context takes precedence over the user's global context."""
+        stage, = compile_query("echo {{ greeting }} {{ name }}")
+        self.assertIs(stage.operation, echo)
+        self.assertIsNotNone(stage.template)
+        argv = render_stage(
+            stage,
+            {"name": "local"},
+            {"name": "global", "greeting": "hello"},
+        )
+        self.assertEqual(argv, ["echo", "hello", "local"])
+
+    def test_unknown_search_command_raises(self) -> None:
+        """Unrecognized search commands are rejected and not cached."""
+        with self.assertRaises(ValueError):
+            compile_query("not_a_command foo")
+        self.assertEqual(compile_query.cache_info().currsize, 0)
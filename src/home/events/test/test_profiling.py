@@ -0,0 +1,103 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+"""This test module is meant to test the per-stage query profiler,
+located at events.profiling.
+"""
+import json
+import tracemalloc
+from unittest.mock import MagicMock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from events.models import (
+    Event,
+    Query,
+)
+from events.profiling import QueryProfile, start_peak, stop_peak
+
+class QueryProfileTests(TestCase):
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            username='testuser',
+            email='testuser@test.com',
+            password='testuser',
+        )
+        for i in range(10):
+            event = Event.objects.create(
+                index="test",
+                host="127.0.0.1",
+                source="test",
+                sourcetype="json",
+                user=self.user,
+                text=json.dumps({"foo": i}),
+            )
+            event.extract_fields()
+            event.process()
+            event.save()
+
+    def test_profile_records_each_stage(self) -> None:
+        """Every stage is recorded with its row counts and SQL queries."""
+        query = Query(
+            name="test",
+            text="search index=test | eval bar=foo | head -n 3",
+            user=self.user,
+        )
+        profile = QueryProfile()
+        results = query.resolve(request=MagicMock(user=self.user), profile=profile)
+        self.assertEqual(len(results), 3)
+        profile = profile.as_dict()
+        self.assertEqual(
+            [stage["command"] for stage in profile["stages"]],
+            ["search", "eval", "head"],
+        )
+        self.assertEqual(
+            [(stage["rows_in"], stage["rows_out"]) for stage in profile["stages"]],
+            [(0, 10), (10, 3), (3, 3)],
+        )
+        # search returns a lazy QuerySet (it only queries permissions), the
+        # head propagated ahead of eval becomes its LIMIT as part of eval,
+        # and the SQL for the events runs when eval consumes it.
+        self.assertEqual(profile["stages"][1]["sql_queries"], 1)
+        self.assertEqual(profile["stages"][2]["sql_queries"], 0)
+        for stage in profile["stages"]:
+            self.assertIsNone(stage["error"])
+            self.assertGreaterEqual(stage["wall_time"], 0)
+            self.assertGreaterEqual(stage["peak_memory"], 0)
+        self.assertGreaterEqual(profile["total_time"], profile["stages"][-1]["start"])
+
+    def test_profile_records_failing_stage(self) -> None:
+        """A stage which raises is recorded along with its exception."""
+        query = Query(
+            name="test",
+            text="search index=test | head -n not-a-number",
+            user=self.user,
+        )
+        profile = QueryProfile()
+        results = query.resolve(request=MagicMock(user=self.user), profile=profile)
+        self.assertIn("exception", results[0])
+        stages = profile.as_dict()["stages"]
+        self.assertEqual(len(stages), 2)
+        self.assertIsNotNone(stages[-1]["error"])
+        self.assertIsNone(stages[-1]["rows_out"])
+
+    def test_concurrent_profiles_share_tracemalloc(self) -> None:
+        """Profiles share one tracemalloc session, which stays on until the
+        last one stops, and only the first of overlapping stages resets
+        the peak.
+        """
+        self.assertFalse(tracemalloc.is_tracing())
+        first, second = QueryProfile(), QueryProfile()
+        first.start()
+        second.start()
+        first.stop()
+        self.assertTrue(tracemalloc.is_tracing())
+        outer = start_peak()
+        inner = start_peak()
+        self.assertIsNone(inner)
+        self.assertIsNone(stop_peak(inner))
+        self.assertIsNotNone(stop_peak(outer))
+        second.stop()
+        self.assertFalse(tracemalloc.is_tracing())
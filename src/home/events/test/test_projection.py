@@ -0,0 +1,127 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+"""This test module is meant to test projection pushdown,
+events.planner.plan_projections and events.planner.project.
+"""
+from unittest.mock import MagicMock
+from typing import Any
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from events.models import (
+    Event,
+    Query,
+)
+from events.planner import compile_query, project
+
+VALUES = [1, 1.5, "abc", "123", '{"a": 1}', "null", None, True, [1, "2"], {"b": {"c": 2}}, ""]
+
+class ProjectionTests(TestCase):
+    def setUp(self, *args: Any, **kwargs: Any) -> None:
+        """For preparation, we are going to setup a user and add an Event
+        for each value of VALUES, plus one without the key.
+        """
+        self.user = get_user_model().objects.create_user(
+            username='testuser',
+            email='testuser@test.com',
+            password='testuser',
+        )
+        for i, value in enumerate(VALUES):
+            Event.objects.create(
+                index="test",
+                host=f"host{i % 3}",
+                user=self.user,
+                text=f"event {i}",
+                extracted_fields={"key": value, "number": i},
+            )
+        Event.objects.create(
+            index="test",
+            host="host0",
+            user=self.user,
+            text="event",
+            extracted_fields={"other": 1},
+        )
+        compile_query.cache_clear()
+        super().setUp(*args, **kwargs)
+
+    def resolve(self, text: str) -> Any:
+        query = Query(name="test", text=text, user=self.user)
+        return query.resolve(request=MagicMock(user=self.user))
+
+    def test_fields_are_planned(self) -> None:
+        """Each stage records the fields read from its input by it and the
+        stages after it, up to the last stage which projects its events
+        (search reads no events and does not declare any).
+        """
+        stages = compile_query(
+            "search index=test | eval x='$extracted_fields__number * 2' | filter host=host1 "
+            "| stats aggregate 'avg(x)' --by extracted_fields__key --reduce"
+        )
+        self.assertEqual(
+            [stage.fields for stage in stages],
+            [
+                None,
+                frozenset({"extracted_fields__number", "x", "host", "extracted_fields__key"}),
+                frozenset({"x", "host", "extracted_fields__key"}),
+                frozenset({"x", "extracted_fields__key"}),
+            ],
+        )
+        # The results include every field, or a stage may read any field
+        for text in (
+            "search index=test | eval x=1",
+            "search index=test | dedup | select host",
+            "search index=test | eval x={{ y }} | select host",
+        ):
+            with self.subTest(text=text):
+                self.assertIsNone(compile_query(text)[1].fields)
+
+    def test_project_reads_keys_as_json(self) -> None:
+        """Keys of extracted_fields are decoded like the whole field, and
+        keys which are missing stay missing.
+        """
+        expected = list(Event.objects.values("host", "extracted_fields"))
+        rows = list(project(Event.objects.all(), frozenset({"host", "extracted_fields__key", "missing"})))
+        self.assertEqual(
+            rows,
+            [
+                {
+                    "host": row["host"],
+                    "extracted_fields": {
+                        key: value for key, value in row["extracted_fields"].items() if key == "key"
+                    },
+                }
+                for row in expected
+            ],
+        )
+        rows = list(project(Event.objects.all(), frozenset({"extracted_fields", "extracted_fields__key"})))
+        self.assertEqual(rows, [{"extracted_fields": row["extracted_fields"]} for row in expected])
+
+    def test_projected_queries_read_fewer_columns(self) -> None:
+        """Queries give the same results with and without projection, and
+        only read the columns they use.
+        """
+        for text in (
+            "search index=test | eval x='$extracted_fields__number * 2' | stats aggregate count 'max(x)' --by host --reduce",
+            "search index=test | rex -f host 'host(?P<n>\\d)' | distinct n extracted_fields__key",
+            "search index=test | filter extracted_fields__number__gte=3 | sort extracted_fields__number:desc | table -f host extracted_fields__key",
+            "search index=test | head -n 4 | value_list host",
+            # Reading only an indexed column keeps the order of events
+            "search | eval x=$host | select x",
+            "search | rex -f host 'host(?P<n>\\d)' | value_list n",
+        ):
+            with self.subTest(text=text):
+                with override_settings(DELVE_QUERY_PROJECTION=False):
+                    expected = self.resolve(text)
+                with CaptureQueriesContext(connection) as context:
+                    results = self.resolve(text)
+                self.assertEqual(results, expected)
+                queries = [query["sql"] for query in context.captured_queries if "events_event" in query["sql"]]
+                self.assertTrue(queries)
+                for sql in queries:
+                    self.assertNotIn('"events_event"."text"', sql)
+                    self.assertNotIn('"events_event"."extracted_fields" AS', sql)
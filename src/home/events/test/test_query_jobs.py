@@ -0,0 +1,142 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+"""This test module is meant to test asynchronous query jobs,
+located at events.jobs and served by events.api.QueryJobViewSet.
+
+The Q cluster is not running during tests, so enqueuing is patched
+out and the job is run in-process with events.jobs.run.
+"""
+import json
+from unittest.mock import patch
+
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from events import jobs
+from events.models import (
+    Event,
+    QueryJob,
+)
+
+@override_settings(DELVE_QUERY_JOB_PAGE_SIZE=3, DELVE_QUERY_JOB_PREVIEW_SIZE=2)
+class QueryJobTests(APITestCase):
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_superuser(
+            username='testuser',
+            email='testuser@test.com',
+            password='testuser',
+        )
+        for i in range(10):
+            Event.objects.create(
+                index="test",
+                host="127.0.0.1",
+                source="test",
+                sourcetype="json",
+                user=self.user,
+                text=json.dumps({"foo": i}),
+            )
+        self.client.login(username='testuser', password='testuser')
+
+    def submit(self, text: str) -> dict:
+        with patch("events.jobs.async_task") as async_task:
+            response = self.client.post(
+                reverse('api_query'),
+                data={"text": text, "async": True},
+            )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        async_task.assert_called_once()
+        return response.json()
+
+    def test_submit_returns_queued_job(self) -> None:
+        """Submitting asynchronously returns a queued job immediately."""
+        job = self.submit("search index=test | head -n 5")
+        self.assertEqual(job["status"], QueryJob.QUEUED)
+        self.assertEqual(job["stages_total"], 2)
+        self.assertEqual(job["stages_done"], 0)
+        # The head the plan copies in front of eval is not a stage of its own
+        job = self.submit("search index=test | eval bar=1 | head -n 5")
+        self.assertEqual(job["stages_total"], 3)
+        jobs.run(job["id"])
+        detail = self.client.get(reverse('queryjob-detail', args=[job["id"]])).json()
+        self.assertEqual((detail["stages_done"], detail["result_count"]), (3, 5))
+
+    def test_finished_job_results_are_paged(self) -> None:
+        """Results of a finished job are stored in pages of DELVE_QUERY_JOB_PAGE_SIZE rows."""
+        job = self.submit("search index=test | eval bar=1")
+        jobs.run(job["id"])
+        detail = self.client.get(reverse('queryjob-detail', args=[job["id"]])).json()
+        self.assertEqual(detail["status"], QueryJob.FINISHED)
+        self.assertEqual(detail["stages_done"], 2)
+        self.assertEqual(detail["result_count"], 10)
+        self.assertEqual(detail["pages"], 4)
+        url = reverse('queryjob-results', args=[job["id"]])
+        rows = []
+        for number in range(1, 5):
+            page = self.client.get(url, {"page": number}).json()
+            rows.extend(page["results"])
+        self.assertEqual(sorted(row["extracted_fields"]["foo"] for row in rows), list(range(10)))
+        response = self.client.get(url, {"page": 5})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_partial_results_track_latest_stage(self) -> None:
+        """Progress reports the rows and a preview of the latest completed stage."""
+        job = self.submit("search index=test | head -n 4")
+        jobs.run(job["id"])
+        partial = self.client.get(reverse('queryjob-partial', args=[job["id"]])).json()
+        self.assertEqual(partial["stages_done"], 2)
+        self.assertEqual(partial["rows"], 4)
+        self.assertEqual(len(partial["results"]), 2)
+
+    def test_results_of_unfinished_job_conflict(self) -> None:
+        """Results are only available once the job has finished."""
+        job = self.submit("search index=test")
+        response = self.client.get(reverse('queryjob-results', args=[job["id"]]))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_cancelled_job_is_not_run(self) -> None:
+        """A job cancelled while queued never runs, and cannot be cancelled twice."""
+        job = self.submit("search index=test")
+        url = reverse('queryjob-cancel', args=[job["id"]])
+        response = self.client.post(url)
+        self.assertEqual(response.json()["status"], QueryJob.CANCELLED)
+        jobs.run(job["id"])
+        self.assertEqual(QueryJob.objects.get(pk=job["id"]).stages_done, 0)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_running_job_stops_between_stages_once_cancelled(self) -> None:
+        """The tracker refuses to start another stage of a cancelled job."""
+        job = QueryJob.objects.create(text="search", status=QueryJob.RUNNING, user=self.user)
+        tracker = jobs.JobTracker(job)
+        self.assertEqual(tracker.run_stage("search", lambda: [{"foo": 1}]), [{"foo": 1}])
+        jobs.cancel(job)
+        with self.assertRaises(jobs.QueryCancelled):
+            tracker.run_stage("head", lambda: [])
+
+    def test_failing_job_records_error(self) -> None:
+        """A stage which raises fails the job with its error."""
+        job = self.submit("search index=test | head -n not-a-number")
+        jobs.run(job["id"])
+        job = QueryJob.objects.get(pk=job["id"])
+        self.assertEqual(job.status, QueryJob.FAILED)
+        self.assertNotEqual(job.error, "")
+        self.assertEqual(job.stages_done, 1)
+
+    def test_job_aborted_by_governor_fails(self) -> None:
+        """A job whose query exceeds its budget fails with the governor's error."""
+        self.user.profile.query_max_rows = 2
+        self.user.profile.save()
+        for text in ("search index=test | eval bar=1", "search index=test | head -n 5"):
+            with self.subTest(text=text):
+                job = self.submit(text)
+                jobs.run(job["id"])
+                job = QueryJob.objects.get(pk=job["id"])
+                self.assertEqual(job.status, QueryJob.FAILED)
+                self.assertIn("budget", job.error)
+                self.assertFalse(job.result_pages.exists())
@@ -88,6 +88,36 @@ class ResolveQueryViewTests(APITestCase):
         # This view does not save the queries by default
         self.assertEqual(Query.objects.count(), 0)
 
+    def test_profile_is_returned_next_to_results(self):
+        """When profile is requested, the results and the profile are
+        returned together.
+        """
+        Event.objects.create(
+            index='default',
+            host='127.0.0.1',
+            source='system',
+            sourcetype='json',
+            text='{"foo": "bar"}',
+            user=self.admin_user,
+        )
+        self.client.login(username='testadmin', password='testadmin')
+        query_response = self.client.post(
+            reverse('api_query'),
+            data={
+                'name': 'test-profile',
+                'text': 'search | head -n 1',
+                'profile': True,
+            },
+        )
+        self.client.logout()
+        self.assertEqual(query_response.status_code, status.HTTP_200_OK)
+        data = query_response.json()
+        self.assertEqual(len(data['results']), 1)
+        self.assertEqual(
+            [stage['command'] for stage in data['profile']['stages']],
+            ['search', 'head'],
+        )
+
     # def test_cannot_retrieve_other_users_events_through_query(self):
     #     query_url = reverse('api_query')
     #     query_data = {
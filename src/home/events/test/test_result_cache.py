@@ -0,0 +1,122 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+"""This test module is meant to test the query result cache,
+located at events.result_cache.
+"""
+import json
+from unittest.mock import MagicMock
+
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from events import result_cache
+from events.models import (
+    Event,
+    Query,
+)
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'query_results': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'test-query-results',
+    },
+}
+
+@override_settings(DELVE_RESULT_CACHE=True, CACHES=TEST_CACHES)
+class ResultCacheTests(TestCase):
+    def setUp(self) -> None:
+        result_cache.get_cache().clear()
+        self.user = get_user_model().objects.create_user(
+            username='testuser',
+            email='testuser@test.com',
+            password='testuser',
+        )
+        for i in range(5):
+            self.create_event("test", i)
+
+    def create_event(self, index: str, foo: int) -> Event:
+        return Event.objects.create(
+            index=index,
+            host="127.0.0.1",
+            source="test",
+            sourcetype="json",
+            user=self.user,
+            text=json.dumps({"foo": foo}),
+        )
+
+    def resolve(self, text: str, user=None) -> list:
+        query = Query(name="test", text=text, user=self.user)
+        return query.resolve(request=MagicMock(user=user or self.user))
+
+    def test_repeated_query_is_a_hit(self) -> None:
+        """The second execution of a query is served from the cache,
+        regardless of whitespace.
+        """
+        first = self.resolve("search index=test | sort -d created")
+        with self.assertNumQueries(1):
+            # Only the high water mark is queried
+            second = self.resolve("search   index=test |   sort -d created")
+        self.assertEqual(first, second)
+        self.assertEqual(result_cache.stats()["hits"], 1)
+        self.assertEqual(result_cache.stats()["misses"], 1)
+
+    def test_new_events_in_index_invalidate(self) -> None:
+        """Adding an event to a searched index invalidates the cached results."""
+        self.assertEqual(len(self.resolve("search index=test")), 5)
+        self.create_event("test", 5)
+        self.assertEqual(len(self.resolve("search index=test")), 6)
+        self.assertEqual(result_cache.stats()["invalidations"], 1)
+
+    def test_new_events_in_other_index_do_not_invalidate(self) -> None:
+        """Adding an event to an index which was not searched keeps the cached results."""
+        self.resolve("search index=test")
+        self.create_event("other", 5)
+        self.assertEqual(len(self.resolve("search index=test")), 5)
+        self.assertEqual(result_cache.stats()["hits"], 1)
+        self.assertEqual(result_cache.stats()["invalidations"], 0)
+
+    def test_users_do_not_share_results(self) -> None:
+        """Results are cached per user."""
+        other = get_user_model().objects.create_superuser(
+            username='otheruser',
+            email='otheruser@test.com',
+            password='otheruser',
+        )
+        self.resolve("search index=test")
+        self.resolve("search index=test", user=other)
+        self.assertEqual(result_cache.stats()["hits"], 0)
+        self.assertEqual(result_cache.stats()["misses"], 2)
+
+    def test_uncacheable_commands_bypass_cache(self) -> None:
+        """Queries with search commands not in DELVE_RESULT_CACHE_COMMANDS are never cached."""
+        self.resolve("search index=test | fake_data")
+        self.resolve("search index=test | fake_data")
+        self.assertEqual(result_cache.stats()["misses"], 0)
+        self.assertEqual(result_cache.stats()["hits"], 0)
+
+    def test_eval_of_now_bypasses_cache(self) -> None:
+        """eval is cached unless an expression depends on the time of the search."""
+        first = self.resolve("search index=test | eval 't=now()'")
+        second = self.resolve("search index=test | eval 't=now()'")
+        self.assertNotEqual(first[0]["t"], second[0]["t"])
+        self.assertEqual(result_cache.stats()["misses"], 0)
+        self.resolve("search index=test | eval 'double=$foo * 2'")
+        self.resolve("search index=test | eval 'double=$foo * 2'")
+        self.assertEqual(result_cache.stats()["hits"], 1)
+
+    def test_stats_require_staff(self) -> None:
+        """Only staff can read the cache statistics."""
+        self.client.login(username='testuser', password='testuser')
+        response = self.client.get(reverse('api_result_cache'))
+        self.assertEqual(response.status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('api_result_cache'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["hits"], 0)
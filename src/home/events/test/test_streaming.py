@@ -0,0 +1,146 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+"""This test module is meant to test streaming pipelines,
+events.util.stream, events.util.EventStream and the streaming
+mode of events.models.Query.resolve.
+"""
+import json
+from unittest.mock import MagicMock
+from typing import Any
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from events.models import (
+    Event,
+    Query,
+)
+from events.util import (
+    EventStream,
+    resolve,
+    stream,
+)
+from events.search_commands import (
+    eval as eval_command,
+    filter,
+    rex,
+    sort,
+    stats,
+)
+
+class StreamingTests(TestCase):
+    def setUp(self, *args: Any, **kwargs: Any) -> None:
+        """For preparation, we are going to setup a user and add ten Events."""
+        self.user = get_user_model().objects.create_user(
+            username='testuser',
+            email='testuser@test.com',
+            password='testuser',
+        )
+        for i in range(10):
+            Event.objects.create(
+                index="test",
+                host="127.0.0.1",
+                source="test",
+                sourcetype="json",
+                user=self.user,
+                text=json.dumps({"foo": i}),
+            )
+        super().setUp(*args, **kwargs)
+
+    def test_search_commands_declare_streaming(self) -> None:
+        """Row-wise commands are streaming, blocking commands are not."""
+        self.assertTrue(filter.streaming)
+        self.assertTrue(rex.streaming)
+        self.assertFalse(sort.streaming)
+        self.assertFalse(stats.streaming)
+
+    def test_stream_queryset_yields_dicts_lazily(self) -> None:
+        """A QuerySet is wrapped, not evaluated, and yields value dicts."""
+        events = stream(Event.objects.filter(index="test"), batch_size=3)
+        self.assertIsInstance(events, EventStream)
+        rows = list(events)
+        self.assertEqual(len(rows), 10)
+        self.assertIsInstance(rows[0], dict)
+        self.assertIn("extracted_fields", rows[0])
+
+    def test_resolve_leaves_streams_alone_only_when_lazy(self) -> None:
+        """resolve(lazy=True) passes an EventStream through, otherwise it is listed."""
+        events = stream([{"foo": 1}, {"bar": 2}])
+        self.assertIs(resolve(events, lazy=True), events)
+        self.assertEqual(
+            resolve(stream([{"foo": 1}, {"bar": 2}])),
+            [{"foo": 1, "bar": None}, {"foo": None, "bar": 2}],
+        )
+
+    def test_streaming_and_materialized_pipelines_agree(self) -> None:
+        """The streaming mode must not change the results of a query."""
+        query = Query(
+            text="search index=test | explode extracted_fields "
+                 "| filter foo__gte=5 | eval bar=1 | rename -f bar -t baz "
+                 "| sort foo",
+            user=self.user,
+        )
+        streamed = query.resolve(request=MagicMock(user=self.user), streaming=True)
+        materialized = query.resolve(request=MagicMock(user=self.user), streaming=False)
+        self.assertEqual(len(streamed), 5)
+        self.assertEqual(streamed, materialized)
+        self.assertEqual([event["foo"] for event in streamed], [5, 6, 7, 8, 9])
+        self.assertEqual({event["baz"] for event in streamed}, {1})
+
+    def test_streaming_treats_missing_fields_as_none(self) -> None:
+        """Fields missing from some events are None in both modes, as they
+        are once every event has the columns of the others.
+        """
+        for fields in ({"a": 1, "s": "x"}, {"b": 2}):
+            Event.objects.create(
+                index="mixed",
+                host="127.0.0.1",
+                source="test",
+                sourcetype="json",
+                user=self.user,
+                text=json.dumps(fields),
+            )
+        for text in (
+            "eval c=$a",
+            "eval c=$a d=$missing | rename -f b -t e",
+            "eval c='$a + 1'",
+        ):
+            with self.subTest(text=text):
+                query = Query(
+                    text=f"search index=mixed | explode extracted_fields | {text}",
+                    user=self.user,
+                )
+                streamed = query.resolve(request=MagicMock(user=self.user), streaming=True)
+                materialized = query.resolve(request=MagicMock(user=self.user), streaming=False)
+                self.assertEqual(streamed, materialized)
+        # Both fail the same way on a missing string
+        query = Query(text="search index=mixed | explode extracted_fields | replace -f s x y", user=self.user)
+        streamed = query.resolve(request=MagicMock(user=self.user), streaming=True)
+        materialized = query.resolve(request=MagicMock(user=self.user), streaming=False)
+        self.assertEqual(streamed[0]["exception"], materialized[0]["exception"])
+        results = Query(
+            text="search index=mixed | explode extracted_fields | eval c=$a d=$missing",
+            user=self.user,
+        ).resolve(request=MagicMock(user=self.user), streaming=True)
+        self.assertEqual([(event["c"], event["d"]) for event in results], [(1, "$missing"), (None, "$missing")])
+
+    def test_eval_copies_fields_lazily(self) -> None:
+        """eval streams the events which have the fields it copies, and
+        holds back one missing a field only until another event has it.
+        """
+        read = []
+
+        def events():
+            for event in ({"b": 2}, {"a": 1}, {"a": 3}, {"b": 4}):
+                read.append(event)
+                yield dict(event)
+
+        results = eval_command(MagicMock(user=self.user), stream(events()), ["eval", "c=$a"], {})
+        self.assertEqual(next(results), {"b": 2, "c": None})
+        self.assertEqual(len(read), 2)
+        self.assertEqual(next(results), {"a": 1, "c": 1})
+        self.assertEqual(next(results), {"a": 3, "c": 3})
+        self.assertEqual(len(read), 3)
+        self.assertEqual(list(results), [{"b": 4, "c": None}])
@@ -0,0 +1,140 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+"""This test module is meant to test server-side tables, made by the
+table search command, kept by events.table_store and read a page at a
+time from events.api.TablePageView.
+"""
+import json
+from typing import Any, Dict
+
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from events import table_store
+from events.models import Event
+from events.search_commands.table import encode
+
+HOSTS = ["alpha", "beta", "gamma"]
+SEARCH = "search index=test | select host extracted_fields__number extracted_fields__word | sort extracted_fields__number"
+
+@override_settings(DELVE_TABLE_SERVER_SIDE_ROWS=10)
+class TableStoreTests(APITestCase):
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_superuser(
+            username='testuser',
+            email='testuser@test.com',
+            password='testuser',
+        )
+        for i in range(30):
+            Event.objects.create(
+                index="test",
+                host=HOSTS[i % 3],
+                source="test",
+                sourcetype="json",
+                user=self.user,
+                text=json.dumps({"number": i, "word": f"Word{i % 7}"}),
+            )
+        self.client.login(username='testuser', password='testuser')
+        table_store.tables.clear()
+
+    def query(self, text: str) -> Any:
+        response = self.client.post(reverse('api_query'), data={"text": text})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def page(self, url: str, **params: Any) -> Dict[str, Any]:
+        response = self.client.get(url, {"draw": 3, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["draw"], 3)
+        return response.json()
+
+    def test_large_tables_are_server_side(self) -> None:
+        """Tables of more than DELVE_TABLE_SERVER_SIDE_ROWS rows leave out
+        their data, unless told otherwise with --no-server-side.
+        """
+        config = self.query(f"{SEARCH} | table -f host extracted_fields__number")
+        self.assertTrue(config["serverSide"])
+        self.assertNotIn("data", config)
+        self.assertEqual(config["columns"], [{"title": "host"}, {"title": "extracted_fields__number"}])
+        self.assertEqual(len(table_store.tables), 1)
+        config = self.query(f"{SEARCH} | table -f host extracted_fields__number --no-server-side")
+        self.assertNotIn("serverSide", config)
+        self.assertEqual(len(config["data"]), 30)
+        config = self.query("search index=test | head -n 5 | table -f host")
+        self.assertEqual(config["data"], [[encode(HOSTS[i % 3])] for i in range(5)])
+        config = self.query("search index=test | head -n 5 | table -f host --server-side")
+        self.assertTrue(config["serverSide"])
+
+    def test_pages_are_sorted_and_searched(self) -> None:
+        """Pages hold the encoded cells of the rows matching the searches,
+        in the requested order.
+        """
+        url = self.query(f"{SEARCH} | table")["ajax"]
+        page = self.page(url, start=0, length=5)
+        self.assertEqual(page["recordsTotal"], 30)
+        self.assertEqual(page["recordsFiltered"], 30)
+        self.assertEqual(
+            page["data"],
+            [[encode(HOSTS[i % 3]), encode(i), encode(f"Word{i % 7}")] for i in range(5)],
+        )
+        # Descending by host, then ascending by number
+        page = self.page(
+            url, start=2, length=3,
+            **{"order[0][column]": 0, "order[0][dir]": "desc", "order[1][column]": 1, "order[1][dir]": "asc"},
+        )
+        self.assertEqual([row[1] for row in page["data"]], [encode(i) for i in (8, 11, 14)])
+        # Every word of the search must match a column, ignoring case
+        page = self.page(url, start=0, length=-1, **{"search[value]": "BETA word3"})
+        self.assertEqual(page["recordsFiltered"], 1)
+        self.assertEqual([row[1] for row in page["data"]], [encode(10)])
+        # Column searches only match their column
+        page = self.page(url, start=0, length=-1, **{"columns[1][data]": 1, "columns[0][data]": 0, "columns[1][search][value]": "2"})
+        self.assertEqual([row[1] for row in page["data"]], [encode(i) for i in (2, 12, 20, 21, 22, 23, 24, 25, 26, 27, 28, 29)])
+
+    def test_reordered_columns(self) -> None:
+        """Orders refer to the columns as displayed, mapped to the columns
+        of the table by their data index.
+        """
+        url = self.query(f"{SEARCH} | table -f host extracted_fields__number")["ajax"]
+        page = self.page(
+            url, start=0, length=1,
+            **{"columns[0][data]": 1, "columns[1][data]": 0, "order[0][column]": 0, "order[0][dir]": "desc"},
+        )
+        self.assertEqual(page["data"], [[encode("gamma"), encode(29)]])
+        response = self.client.get(url, {"columns[0][data]": 5})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tables_are_private_and_expire(self) -> None:
+        """Only the user who ran the query reads its table, which is
+        dropped when more recent tables exceed DELVE_TABLE_STORE_SIZE.
+        """
+        url = self.query("search index=test | table")["ajax"]
+        get_user_model().objects.create_user(username='other', password='other')
+        self.client.login(username='other', password='other')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIn("error", response.json())
+        self.client.login(username='testuser', password='testuser')
+        self.assertEqual(self.page(url)["recordsTotal"], 30)
+        with override_settings(DELVE_TABLE_STORE_SIZE=1):
+            self.query("search index=test | table")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_disabled(self) -> None:
+        """Tables are client-side in queries resolved with tables disabled
+        (ie. asynchronous query jobs) and when the store has no room.
+        """
+        with table_store.disabled():
+            config = self.query("search index=test | table --server-side")
+        self.assertEqual(len(config["data"]), 30)
+        with override_settings(DELVE_TABLE_STORE_SIZE=0):
+            config = self.query("search index=test | table --server-side")
+        self.assertEqual(len(config["data"]), 30)
+        self.assertEqual(len(table_store.tables), 0)
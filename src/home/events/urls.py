@@ -16,9 +16,12 @@ from .views import (
 )
 from .api import (
     ResolveQueryView,
+    ResultCacheStatsView,
+    TablePageView,
     SearchCommandViewSet,
     EventViewSet,
     QueryView,
+    QueryJobViewSet,
     GlobalContextViewSet,
     LocalContextViewSet,
     FileUploadViewSet,
@@ -29,6 +32,7 @@ router = routers.DefaultRouter()
 router.register(r'events', EventViewSet)
 router.register(r'search_commands', SearchCommandViewSet, basename="SearchCommands")
 router.register(r'queries', QueryView)
+router.register(r'jobs', QueryJobViewSet)
 router.register(r'globals', GlobalContextViewSet)
 router.register(r'locals', LocalContextViewSet)
 router.register(r'files', FileUploadViewSet)
@@ -37,6 +41,8 @@ router.register(r'files', FileUploadViewSet)
 urlpatterns = [
     path('explore/', explore, name='explore'),
     path('api/query/', ResolveQueryView.as_view(), name='api_query'),
+    path('api/result_cache/', ResultCacheStatsView.as_view(), name='api_result_cache'),
+    path('api/tables/<str:token>/', TablePageView.as_view(), name='api_table_page'),
     path('api/', include(router.urls)),
     path('globals/', edit_global_context, name='globals'),
     path('docs/<str:manual>/<str:filename>', docs, name='docs'),
@@ -4,14 +4,19 @@
 
 import sys
 import ast
+import json
+import heapq
 import logging
 import inspect
-from io import StringIO
-from itertools import chain
+from array import array
+from itertools import chain, compress
 from types import GeneratorType
 from collections.abc import Mapping
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 import django.core.exceptions
 
+from django.conf import settings
+
 from django.db.models.query import (
     QuerySet,
     ValuesIterable,
@@ -20,6 +25,8 @@ from django.db.models.query import (
 from django.db.models import Model
 from django.forms.models import model_to_dict
 
+from events.capture import capture
+
 def deep_update(d, u, depth=-1):
     """
     Recursively merge or update dict-like objects. 
@@ -102,16 +109,609 @@ def custom_model_to_dict(instance):
         data[f.name] = f.value_from_object(instance)
     return data
 
-def resolve(events):
+def canonical(value: Any) -> bytes:
+    """
+    Return an encoding of value which is the same in every process, and
+    equal for values which Python considers equal: numbers are encoded by
+    value (so 1, 1.0 and True are the same), strings apart from any other
+    type (so a datetime differs from its string form) and dicts whatever
+    the order of their keys.
+    """
+    if value is None:
+        return b"z"
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int):
+        return b"n" + str(value).encode()
+    if isinstance(value, float):
+        return b"n" + (str(int(value)) if value.is_integer() else repr(value)).encode()
+    if isinstance(value, str):
+        return b"s" + value.encode("utf-8", "surrogatepass")
+    if isinstance(value, (list, tuple)):
+        return b"l" + b"".join(_framed(item) for item in value)
+    if isinstance(value, Mapping):
+        return b"d" + b"".join(sorted(_framed(key) + _framed(item) for key, item in value.items()))
+    return b"o" + type(value).__qualname__.encode() + b":" + str(value).encode("utf-8", "surrogatepass")
+
+def _framed(value: Any) -> bytes:
+    # Prefixed with its length, so items of containers can't run together
+    encoded = canonical(value)
+    return str(len(encoded)).encode() + b":" + encoded
+
+def freeze(value: Any) -> Hashable:
+    """
+    Return value if it is hashable, otherwise a hashable stand-in which is
+    equal for equal values (ie. for dicts and lists extracted from JSON,
+    see canonical).
+    """
+    try:
+        hash(value)
+    except TypeError:
+        return ("__unhashable__", canonical(value))
+    return value
+
+def sort_key(value: Any) -> Tuple[Any, ...]:
+    """
+    Return a key which orders values of any type without raising: None
+    first, then numbers, strings, other comparable values (ie. datetimes)
+    grouped by type and finally dicts and lists by their JSON encoding.
+    """
+    if value is None:
+        return (0,)
+    if isinstance(value, (bool, int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, (dict, list, tuple)):
+        return (4, json.dumps(value, sort_keys=True, default=str))
+    return (3, type(value).__name__, value)
+
+def field_value(row: Dict[str, Any], field: str) -> Any:
+    """
+    Return the value of field in row. Fields which are not keys of row
+    are looked up as paths into nested dicts, ie. extracted_fields__status.
+
+    Raises:
+        KeyError: If field is missing from row.
+    """
+    if field in row or "__" not in field:
+        return row[field]
+    value = row
+    for segment in field.split("__"):
+        if not isinstance(value, dict):
+            raise KeyError(field)
+        value = value[segment]
+    return value
+
+class EventStream:
+    """
+    A lazy, single-pass iterator over a result set.
+
+    EventStreams are handed to search commands which declare themselves
+    as streaming, so that row-wise pipelines never hold the full result
+    set in memory.
+    """
+    def __init__(self, iterable: Iterable[Any]) -> None:
+        self._iterator = iter(iterable)
+
+    def __iter__(self) -> "EventStream":
+        return self
+
+    def __next__(self) -> Any:
+        return next(self._iterator)
+
+    def close(self) -> None:
+        """Close the underlying iterator, if it supports closing."""
+        close = getattr(self._iterator, "close", None)
+        if close is not None:
+            close()
+
+def _stream_items(items: Iterable[Any]) -> Iterator[Any]:
     from events.models import BaseEvent
+    try:
+        for item in items:
+            if isinstance(item, BaseEvent):
+                yield custom_model_to_dict(item)
+            else:
+                yield item
+    finally:
+        # Closing the stream early closes the stage which produced it
+        close = getattr(items, "close", None)
+        if close is not None:
+            close()
+
+def stream(events: Any, batch_size: Optional[int] = None) -> Any:
+    """
+    Wrap a result set in an EventStream without materializing it.
+
+    QuerySets are read from the database in chunks of batch_size rows
+    (default settings.DELVE_STREAMING_BATCH_SIZE) and model instances are
+    converted to dicts as they are consumed. Values which are not result
+    sets are returned unchanged.
+
+    Args:
+        events: The result set to wrap.
+        batch_size (Optional[int]): The number of rows to fetch per database round trip.
+
+    Returns:
+        EventStream: The lazy result set, or events unchanged.
+    """
+    if isinstance(events, EventStream):
+        return events
+    if batch_size is None:
+        batch_size = settings.DELVE_STREAMING_BATCH_SIZE
+    if isinstance(events, QuerySet):
+        if events._iterable_class != ValuesIterable:
+            events = events.values()
+        return EventStream(events.iterator(chunk_size=batch_size))
+    elif isinstance(events, Model):
+        return EventStream([custom_model_to_dict(events)])
+    elif isinstance(events, (list, tuple, GeneratorType)):
+        return EventStream(_stream_items(events))
+    return events
+
+# Typecodes of the arrays backing each kind of Column, values of any
+# other kind (dicts, lists, datetimes, mixed types, etc.) are kept in a list.
+COLUMN_TYPECODES = {
+    "int": "q",
+    "float": "d",
+    "bool": "b",
+    "str": "i",
+}
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+# The kind of values of each exact type (see _kind), for Column.from_values
+KINDS = {type(None): "null", bool: "bool", int: "int", float: "float", str: "str"}
+# String columns with more distinct values than this fraction of their
+# rows (ie. free text) are not worth dictionary encoding.
+MAX_DICTIONARY_RATIO = 0.5
+
+def _kind(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int" if INT64_MIN <= value <= INT64_MAX else "object"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, str):
+        return "str"
+    return "object"
+
+class Column:
+    """
+    The values of one field of a ResultSet.
+
+    Integers, floats and booleans are stored in typed arrays and strings
+    are dictionary encoded: each distinct string is stored once and the
+    column holds an array of codes into the dictionary. Nulls (including
+    missing fields) are tracked in a separate mask. Columns holding any
+    other kind of value, or a mix of kinds, fall back to a list.
+    """
+    __slots__ = ("kind", "data", "nulls", "dictionary", "_codes")
+
+    def __init__(self, length: int = 0) -> None:
+        self.kind = "null"
+        self.data: Any = None
+        self.nulls = bytearray(b"\x01" * length)
+        self.dictionary: Optional[List[str]] = None
+        self._codes: Optional[Dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.nulls)
+
+    def _allocate(self, kind: str, length: int) -> None:
+        self.kind = kind
+        if kind == "object":
+            self.data = [None] * length
+        else:
+            self.data = array(COLUMN_TYPECODES[kind], bytes(length * array(COLUMN_TYPECODES[kind]).itemsize))
+        if kind == "str":
+            self.dictionary = []
+            self._codes = {}
+
+    def _to_object(self) -> None:
+        values = self.values()
+        self.kind = "object"
+        self.data = values
+        self.dictionary = self._codes = None
+
+    def append(self, value: Any) -> None:
+        kind = _kind(value)
+        if kind == "null":
+            if self.data is not None:
+                self.data.append(None if self.kind == "object" else 0)
+            self.nulls.append(1)
+            return
+        if self.kind == "null":
+            self._allocate(kind, len(self.nulls))
+        elif kind != self.kind and self.kind != "object":
+            self._to_object()
+        if self.kind == "str":
+            code = self._codes.get(value)
+            if code is None:
+                code = self._codes[value] = len(self.dictionary)
+                self.dictionary.append(value)
+            self.data.append(code)
+        else:
+            self.data.append(value)
+        self.nulls.append(0)
+
+    @classmethod
+    def from_values(cls, values: Sequence[Any]) -> "Column":
+        """
+        Return a finished Column of values, the same as appending each of
+        them, but building columns of a single kind of value at once.
+        """
+        column = cls()
+        kinds = {KINDS.get(value_type, "object") for value_type in set(map(type, values))}
+        has_nulls = "null" in kinds
+        kinds.discard("null")
+        if kinds == {"int"}:
+            present = [value for value in values if value is not None] if has_nulls else values
+            if min(present) < INT64_MIN or max(present) > INT64_MAX:
+                kinds = {"object"}
+        if len(kinds) != 1 or kinds == {"object"}:
+            for value in values:
+                column.append(value)
+            return column.finish()
+        kind = kinds.pop()
+        column.kind = kind
+        column.nulls = bytearray(value is None for value in values) if has_nulls else bytearray(len(values))
+        if kind == "str":
+            column.dictionary = list(dict.fromkeys(value for value in values if value is not None))
+            codes = {value: code for code, value in enumerate(column.dictionary)}
+            column._codes = codes
+            values = [0 if value is None else codes[value] for value in values] if has_nulls else list(map(codes.__getitem__, values))
+        elif has_nulls:
+            values = [0 if value is None else value for value in values]
+        column.data = array(COLUMN_TYPECODES[kind], values)
+        return column.finish()
+
+    def finish(self) -> "Column":
+        """
+        Called once the column is complete, drops the dictionary of
+        columns with too many distinct strings to benefit from it.
+        """
+        if self.kind == "str":
+            self._codes = None
+            if len(self.dictionary) > 64 and len(self.dictionary) > len(self) * MAX_DICTIONARY_RATIO:
+                self._to_object()
+        return self
+
+    def get(self, index: int) -> Any:
+        if self.nulls[index]:
+            return None
+        if self.kind == "str":
+            return self.dictionary[self.data[index]]
+        if self.kind == "bool":
+            return bool(self.data[index])
+        return self.data[index]
+
+    def values(self) -> List[Any]:
+        """
+        Return the values of the column as a list, with None for nulls.
+        """
+        if self.kind == "null":
+            return [None] * len(self)
+        if self.kind == "object":
+            return list(self.data)
+        if self.kind == "str":
+            dictionary = self.dictionary
+            values = [dictionary[code] for code in self.data]
+        elif self.kind == "bool":
+            values = [bool(value) for value in self.data]
+        else:
+            values = self.data.tolist()
+        if any(self.nulls):
+            for index in compress(range(len(values)), self.nulls):
+                values[index] = None
+        return values
+
+    def map(self, function: Callable[[Any], Any], indices: Optional[Iterable[int]] = None) -> List[Any]:
+        """
+        Return function(value) for every row (or every row in indices).
+
+        For dictionary encoded columns, function is only called once per
+        distinct value (and once for nulls).
+        """
+        if indices is None:
+            indices = range(len(self))
+        if self.kind != "str":
+            return [function(self.get(index)) for index in indices]
+        results: Dict[int, Any] = {}
+        ret = []
+        for index in indices:
+            code = -1 if self.nulls[index] else self.data[index]
+            if code not in results:
+                results[code] = function(None if code == -1 else self.dictionary[code])
+            ret.append(results[code])
+        return ret
+
+    def sort_keys(self) -> List[Any]:
+        """
+        Return keys which sort the rows the same way sort_key sorts their
+        values. Dictionary encoded columns are ranked, so strings are only
+        compared once per distinct value, and typed columns without nulls
+        are sorted on their values.
+        """
+        if self.kind == "null":
+            return [0] * len(self)
+        if self.kind == "str":
+            ranks = [0] * len(self.dictionary)
+            for rank, code in enumerate(sorted(range(len(self.dictionary)), key=self.dictionary.__getitem__)):
+                ranks[code] = rank
+            if not any(self.nulls):
+                return [ranks[code] for code in self.data]
+            return [-1 if null else ranks[code] for code, null in zip(self.data, self.nulls)]
+        if self.kind != "object" and not any(self.nulls):
+            return self.data.tolist()
+        return [sort_key(value) for value in self.values()]
+
+    def take(self, indices: Sequence[int]) -> "Column":
+        """
+        Return a new Column holding the rows at indices, in that order.
+        """
+        column = Column()
+        column.kind = self.kind
+        column.nulls = bytearray(self.nulls[index] for index in indices)
+        if self.kind == "object":
+            column.data = [self.data[index] for index in indices]
+        elif self.data is not None:
+            column.data = array(self.data.typecode, (self.data[index] for index in indices))
+        # The dictionary is shared, it is never modified once a column is finished
+        column.dictionary = self.dictionary
+        return column
+
+    def nbytes(self) -> int:
+        """
+        Return an estimate of the memory used by the column, in bytes.
+        """
+        size = sys.getsizeof(self.nulls)
+        if self.kind == "object":
+            size += sys.getsizeof(self.data) + sum(sys.getsizeof(value) for value in self.data)
+        elif self.data is not None:
+            size += sys.getsizeof(self.data)
+        if self.dictionary is not None:
+            size += sys.getsizeof(self.dictionary) + sum(sys.getsizeof(value) for value in self.dictionary)
+        return size
+
+class ResultSet:
+    """
+    A columnar result set: one Column per field instead of one dict per
+    row. Every dict in a list of dicts repeats every key (and resolve()
+    adds the missing ones with None), whereas a ResultSet stores each
+    key once, numbers in typed arrays and repeated strings once.
+
+    ResultSets are returned by resolve(events, columnar=True) to the
+    search commands which operate on columns (sort, dedup, filter, table,
+    chart and stats). Iterating or indexing a ResultSet produces dict
+    rows, so everything else sees the usual list of dicts.
+
+    Args:
+        columns (Dict[str, Column]): The columns, by field name.
+        length (int): The number of rows.
+    """
+    def __init__(self, columns: Optional[Dict[str, Column]] = None, length: int = 0) -> None:
+        self.columns = columns if columns is not None else {}
+        self.length = length
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]]) -> "ResultSet":
+        """
+        Build a ResultSet from dict rows, consuming them one at a time.
+        Fields missing from a row are null.
+
+        Raises:
+            TypeError: If a row is not a dict.
+        """
+        columns: Dict[str, Column] = {}
+        length = 0
+        for row in rows:
+            if not isinstance(row, dict):
+                raise TypeError(f"ResultSet rows must be dicts, found {type(row)}")
+            for field, value in row.items():
+                column = columns.get(field)
+                if column is None:
+                    column = columns[field] = Column(length)
+                column.append(value)
+            length += 1
+            if len(row) != len(columns):
+                for field, column in columns.items():
+                    if len(column) != length:
+                        column.append(None)
+        for column in columns.values():
+            column.finish()
+        return cls(columns, length)
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self.columns)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __bool__(self) -> bool:
+        return self.length > 0
+
+    def __repr__(self) -> str:
+        return f"<ResultSet: {self.length} rows, fields {self.fields}>"
+
+    def row(self, index: int) -> Dict[str, Any]:
+        return {field: column.get(index) for field, column in self.columns.items()}
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Dict[str, Any], "ResultSet"]:
+        if isinstance(index, slice):
+            return self.take(range(self.length)[index])
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("ResultSet index out of range")
+        return self.row(index)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        fields = self.fields
+        return (dict(zip(fields, values)) for values in self.tuples(fields))
+
+    def tuples(self, fields: Sequence[str]) -> Iterator[Tuple[Any, ...]]:
+        """
+        Return an iterator of tuples of the values of fields, one per row.
+        Fields which are not in the ResultSet are None.
+        """
+        return zip(*(self.column(field) for field in fields)) if fields else iter([()] * self.length)
+
+    def column(self, field: str) -> List[Any]:
+        """
+        Return the values of field as a list, None where it is null or missing.
+        """
+        column = self.columns.get(field)
+        if column is None:
+            return [None] * self.length
+        return column.values()
+
+    def get_column(self, field: str) -> Column:
+        """
+        Return the Column of field, an all null Column if it is missing.
+        """
+        column = self.columns.get(field)
+        return Column(self.length) if column is None else column
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """
+        Return the rows as a list of dicts, every row having every field.
+        """
+        return list(self)
+
+    def take(self, indices: Sequence[int]) -> "ResultSet":
+        """
+        Return a new ResultSet with the rows at indices, in that order.
+        """
+        indices = list(indices)
+        return ResultSet(
+            {field: column.take(indices) for field, column in self.columns.items()},
+            len(indices),
+        )
+
+    def compress(self, mask: Iterable[Any]) -> "ResultSet":
+        """
+        Return a new ResultSet with the rows for which mask is truthy.
+        """
+        return self.take(list(compress(range(self.length), mask)))
+
+    def argsort(self, fields: Sequence[str], reverse: Union[bool, Sequence[bool]] = False, limit: Optional[int] = None) -> List[int]:
+        """
+        Return the indices of the rows in the order sort() puts them in.
+        """
+        if isinstance(reverse, bool):
+            reverse = [reverse] * len(fields)
+        keys = [self.get_column(field).sort_keys() for field in fields]
+        if len(set(reverse)) > 1:
+            # Stable sorts, least significant field first
+            indices = list(range(self.length))
+            for field_keys, descending in reversed(list(zip(keys, reverse))):
+                indices.sort(key=field_keys.__getitem__, reverse=descending)
+            return indices[:limit]
+        keys = keys[0] if len(keys) == 1 else list(zip(*keys))
+        descending = bool(reverse) and reverse[0]
+        if limit is not None and 0 <= limit < self.length:
+            select = heapq.nlargest if descending else heapq.nsmallest
+            return select(limit, range(self.length), key=keys.__getitem__)
+        return sorted(range(self.length), key=keys.__getitem__, reverse=descending)
+
+    def sort(self, fields: Sequence[str], reverse: Union[bool, Sequence[bool]] = False, limit: Optional[int] = None) -> "ResultSet":
+        """
+        Return a new ResultSet sorted by fields, ordering values of mixed
+        types and nulls like sort_key. The sort is stable.
+
+        Args:
+            fields (Sequence[str]): The fields to sort by.
+            reverse (Union[bool, Sequence[bool]]): Whether to sort in
+                descending order, either for every field or per field.
+            limit (Optional[int]): If given, only the first limit rows are
+                kept, which are selected with a heap instead of a full sort.
+        """
+        return self.take(self.argsort(fields, reverse, limit))
+
+    def with_column(self, field: str, values: Union[Column, Iterable[Any]], first: bool = False) -> "ResultSet":
+        """
+        Return a new ResultSet sharing the existing columns, with field set to values.
+
+        Args:
+            field (str): The field to add or replace.
+            values (Union[Column, Iterable[Any]]): A finished Column or one value per row.
+            first (bool): If True, field is moved before the other fields.
+        """
+        if isinstance(values, Column):
+            column = values
+        else:
+            column = Column.from_values(values if isinstance(values, list) else list(values))
+        columns = {field: column} if first else {}
+        columns.update((name, existing) for name, existing in self.columns.items() if name != field)
+        columns[field] = column
+        return ResultSet(columns, self.length)
+
+    def nbytes(self) -> int:
+        """
+        Return an estimate of the memory used by the ResultSet, in bytes.
+        """
+        return sum(sys.getsizeof(field) + column.nbytes() for field, column in self.columns.items())
+
+def _columnar(events: Iterable[Any]) -> Any:
+    """
+    Return events as a ResultSet if every item is a dict, otherwise as a list.
+    """
+    iterator = iter(events)
+    rejected = []
+    def dict_rows():
+        for row in iterator:
+            if not isinstance(row, dict):
+                rejected.append(row)
+                return
+            yield row
+    result_set = ResultSet.from_rows(dict_rows())
+    if rejected:
+        # Not every item is a dict, fall back to a list
+        return result_set.to_dicts() + rejected + list(iterator)
+    return result_set
+
+def resolve(events, lazy=False, columnar=False):
+    """
+    Resolve any QuerySets, generators, model instances, etc. into a list.
+
+    If lazy is True and events is an EventStream it is returned as-is so
+    that streaming search commands can consume it one row at a time.
+
+    If columnar is True, dict rows are returned as a ResultSet instead
+    (rows from QuerySets and generators are added to it as they are read,
+    without building a list of dicts first). ResultSets are returned
+    as-is if columnar is True, streamed as dicts if lazy is True and
+    converted to a list of dicts otherwise.
+    """
+    from events.models import BaseEvent
+    from events.governor import governed, QueryBudgetExceeded
     log = logging.getLogger(__name__)
+    if lazy and isinstance(events, EventStream):
+        log.debug("Found EventStream, leaving unresolved")
+        return events
+    if isinstance(events, ResultSet):
+        if columnar:
+            return events
+        if lazy:
+            return EventStream(iter(events))
+        log.debug(f"Converting {events} to dicts")
+        return events.to_dicts()
+    if columnar and isinstance(events, QuerySet):
+        log.debug(f"Reading {type(events)} into a ResultSet")
+        if events._iterable_class != ValuesIterable:
+            events = events.values()
+        return ResultSet.from_rows(governed(events))
     # if isinstance(events, QuerySet):
     #     log.debug(f"Casting matching events, detected {type(events)}")
     #     events = list(events.values())
     if hasattr(events, "_iterable_class") and events._iterable_class == ValuesIterable:
         log.debug(f"Casting matching events, detected {type(events)}")
         # log.info(f"Found {type(events)=}")
-        events = list(events)
+        events = list(governed(events))
     elif isinstance(events, Model):
         log.debug(f"Casting matching events, detected {type(events)}")
         # log.info(f"Found {type(events)=}")
@@ -120,38 +720,29 @@ def resolve(events):
     elif isinstance(events, QuerySet):
         log.debug(f"Casting matching events, detected {type(events)}")
         log.info(f"Found {type(events)=}")
-        events = list(events.values())
-    while isinstance(events, GeneratorType) or inspect.isgeneratorfunction(events):
+        events = list(governed(events.values()))
+    while isinstance(events, (GeneratorType, EventStream)) or inspect.isgeneratorfunction(events):
         log.debug(f"Casting matching events, detected {type(events)}({events})")
-        log.debug("swapping stdout and stderr")
-        orig_stderr = sys.stderr
-        orig_stdout = sys.stdout
-        sys.stderr = StringIO()
-        sys.stdout = StringIO()
-        try:
-            log.debug(f"Attempting to cast events to list")
-            events = list(events)
-            log.debug(f"Successfully cast events as list, {len(events)} events found")
-        except (Exception, SystemExit) as exception:
-            log.exception("An unhandled exception occurred")
+        with capture() as captured:
             try:
-                sys.stderr.seek(0)
-                sys.stdout.seek(0)
-            except:
-                log.exception("An Unhandled exception occurred.")
-            return [
-                {
-                    "stdout": sys.stdout.read(),
-                    "stderr": sys.stderr.read(),
-                    "exception": str(exception),
-                    "matching_events": events,
-                },
-            ]
-        finally:
-            log.debug("replacing original stdout and stderr")
-            sys.stderr = orig_stderr
-            sys.stdout = orig_stdout
+                log.debug(f"Attempting to cast events to list")
+                events = _columnar(_stream_items(events)) if columnar else list(events)
+                log.debug(f"Successfully cast events as list, {len(events)} events found")
+            except QueryBudgetExceeded:
+                raise
+            except (Exception, SystemExit) as exception:
+                log.exception("An unhandled exception occurred")
+                return [
+                    {
+                        "stdout": captured.stdout.getvalue(),
+                        "stderr": captured.stderr.getvalue(),
+                        "exception": str(exception),
+                        "matching_events": events,
+                    },
+                ]
 
+    if columnar and isinstance(events, list):
+        events = _columnar(_stream_items(events))
     if isinstance(events, list):
         log.debug(f"Found matching_events: {events}")
         # Peek at the data type of the first item
@@ -0,0 +1,32 @@
+# Copyright (C) 2025 All rights reserved.
+# This file is part of the Delve project, which is licensed under the GNU Affero General Public License v3.0 (AGPL-3.0).
+# See the LICENSE file in the root of this repository for details.
+
+# Generated by Django 5.2.18 on 2026-10-18 03:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='query_max_memory',
+            field=models.PositiveIntegerField(blank=True, help_text='Maximum memory growth of a query in MiB.', null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='query_max_rows',
+            field=models.PositiveIntegerField(blank=True, help_text='Maximum number of rows output by any stage of a query.', null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='query_max_seconds',
+            field=models.PositiveIntegerField(blank=True, help_text='Maximum wall time of a query in seconds.', null=True),
+        ),
+    ]
@@ -39,6 +39,23 @@ class UserProfile(models.Model):
         choices=ModeEnum,
     )
 
+    # Query budgets, None means the DELVE_QUERY_MAX_* setting applies and 0 means unlimited
+    query_max_seconds = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Maximum wall time of a query in seconds.",
+    )
+    query_max_rows = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Maximum number of rows output by any stage of a query.",
+    )
+    query_max_memory = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Maximum memory growth of a query in MiB.",
+    )
+
     user = models.OneToOneField(
         User,
         on_delete=models.CASCADE,
@@ -649,7 +649,15 @@ var application = {
       event.parent().append(spinner);
       application.data = await application.resolve_query( event );
     //   console.log("application.data", application.data)
+      var profile = null;
+      if ( application.data !== null && typeof application.data === "object" && "profile" in application.data ){
+          profile = application.data.profile;
+          application.data = application.data.results;
+      }
       await application.redrawResult( event );
+      if ( profile !== null ){
+          await application.draw_profile( profile );
+      }
       await application.retrieve_saved_queries();
       $( "form#queryForm > div > input#id__save" ).attr('checked', true)
       spinner.remove()
@@ -664,6 +672,7 @@ var application = {
           currentContext = "{}";
       }
       var _save = $( "form#queryForm > div > div > input#id__save" ).prop( "checked" )
+      var profile = $( "form#queryForm input#id_profile" ).prop( "checked" )
     //   console.log("name: ", name)
     //   console.log("text: ", text)
     //   console.log("_save: ", _save)
@@ -679,6 +688,7 @@ var application = {
                   name: name,
                   local_context: currentContext,
                   _save: _save,
+                  profile: profile,
               }
           ),
       };
@@ -776,6 +786,42 @@ var application = {
       }
   },
 
+  draw_profile: async function( profile ){
+      // Draw the per-stage profile as a waterfall, each bar starts at the
+      // offset the stage started at and is as wide as its wall time.
+      var total = Math.max( profile.total_time, 0.000001 );
+      var table = $( "<table class='table table-sm table-bordered'></table>" );
+      table.append(
+          $( "<thead><tr><th>Stage</th><th class='w-50'>Wall time (total " + ( profile.total_time * 1000 ).toFixed( 1 ) + " ms)</th><th>CPU (ms)</th><th>Rows in</th><th>Rows out</th><th>SQL queries</th><th>SQL (ms)</th><th>Peak memory (KiB)</th></tr></thead>" )
+      );
+      var body = $( "<tbody></tbody>" );
+      $.each(
+          profile.stages,
+          function( index, stage ){
+              var offset = 100 * stage.start / total;
+              var width = Math.max( 100 * stage.wall_time / total, 0.5 );
+              var bar = $( "<div class='progress'></div>" ).append(
+                  $( "<div class='progress-bar'></div>" )
+                      .addClass( stage.error === null ? "bg-primary" : "bg-danger" )
+                      .css( { "margin-left": offset + "%", "width": width + "%" } )
+                      .attr( "title", ( stage.wall_time * 1000 ).toFixed( 1 ) + " ms" )
+              );
+              var row = $( "<tr></tr>" );
+              row.append( $( "<td></td>" ).text( stage.stage ).attr( "title", stage.error || "" ) );
+              row.append( $( "<td></td>" ).append( bar ) );
+              row.append( $( "<td></td>" ).text( ( stage.cpu_time * 1000 ).toFixed( 1 ) ) );
+              row.append( $( "<td></td>" ).text( stage.rows_in ) );
+              row.append( $( "<td></td>" ).text( stage.rows_out ) );
+              row.append( $( "<td></td>" ).text( stage.sql_queries ) );
+              row.append( $( "<td></td>" ).text( ( stage.sql_time * 1000 ).toFixed( 1 ) ) );
+              row.append( $( "<td></td>" ).text( ( stage.peak_memory / 1024 ).toFixed( 1 ) ) );
+              body.append( row );
+          },
+      );
+      table.append( body );
+      $( "#report" ).prepend( $( "<div class='mb-2'><h5>Profile</h5></div>" ).append( table ) );
+  },
+
   draw_list_of_values: async function( event ){
       var list  = $( "<ul class='list-group'></ul>" );
       $( "#report" ).append(list);
@@ -27,51 +27,62 @@ DataTable.Buttons.jszip(JSZip);
 
 $( document ).ready(
     function(){
-        $( '.fl-table' ).DataTable(
-            {
-                autowidth: true,
-                colReorder: true,
-                // rowReorder: true,
-                order: [],
-                columnDefs: [
-                    {
-                        targets: "_all",
-                        className: 'dt-body-left'
-                    }
-                ],
-                layout: {
-                    topEnd: null,
-                    topStart: {
-                        buttons: [
-                            'colvis',
-                            'print',
-                            'copy',
-                            'csv',
-                            'excel',
-                            {
-                                text: 'JSON',
-                                action: function (e, dt, button, config) {
-                                    var data = dt.buttons.exportData();
-                
-                                    DataTable.fileSave(new Blob([JSON.stringify(data)]), 'Export.json');
-                                },
-                            },
-                        ]
-                    },
-                    top: [
-                        'pageLength',
-                        'info',
-                        'paging',
-                        'search',
-                    ],
-                    bottom: [
-                        'paging',
+        $( '.fl-table' ).each(
+            function(){
+                var options = {
+                    autowidth: true,
+                    colReorder: true,
+                    // rowReorder: true,
+                    order: [],
+                    columnDefs: [
+                        {
+                            targets: "_all",
+                            className: 'dt-body-left'
+                        }
                     ],
-                    bottomStart: null,
-                    bottomEnd: null,
+                    layout: {
+                        topEnd: null,
+                        topStart: {
+                            buttons: [
+                                'colvis',
+                                'print',
+                                'copy',
+                                'csv',
+                                'excel',
+                                {
+                                    text: 'JSON',
+                                    action: function (e, dt, button, config) {
+                                        var data = dt.buttons.exportData();
+                    
+                                        DataTable.fileSave(new Blob([JSON.stringify(data)]), 'Export.json');
+                                    },
+                                },
+                            ]
+                        },
+                        top: [
+                            'pageLength',
+                            'info',
+                            'paging',
+                            'search',
+                        ],
+                        bottom: [
+                            'paging',
+                        ],
+                        bottomStart: null,
+                        bottomEnd: null,
+                    }
+                };
+                // Tables with too many rows to render are read from the
+                // server a page at a time, sorted and searched there
+                var url = $( this ).data( 'server-side' );
+                if ( url ) {
+                    options.serverSide = true;
+                    options.processing = true;
+                    options.searchDelay = 400;
+                    options.ajax = url;
                 }
+                $( this ).DataTable( options );
             }
         );
     }
   );
-  
\ No newline at end of file